@@ -1,24 +1,55 @@
 """
 Endpoints da API para gerenciamento de sessões de estudo
 """
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Body, Request
+from typing import Dict, Any, List, Optional
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Body, Request, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse, JSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy.sql import func
 from app.db.database import get_db
-from app.db.models import SessaoEstudo
-from app.db.schemas import SessionStartResponse, SessionSubmitResponse
+from app.core.config import settings
+from app.db.models import SessaoEstudo, CorrecaoTurma
+from app.db.schemas import (
+    SessionStartResponse, SessionSubmitResponse, TurmaSubmitResponse, JobCriadoResponse, JobStatusResponse
+)
 from app.services.ocr_service import ocr_service
-from app.services.agent_service import agent_service
+from app.services.session_service import session_service
+from app.services.job_service import job_service
+from app.services.uso_llm_service import uso_llm_service
+import asyncio
+import json
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
-@router.post("/start", response_model=SessionStartResponse)
+async def _extrair_texto_questao(file: UploadFile) -> str:
+    """Extrai o texto da questão original de um arquivo texto ou imagem (OCR mock)."""
+    # Se recebermos um arquivo de texto (enviado pelo Streamlit), usamos o conteúdo diretamente.
+    if getattr(file, "content_type", None) == "text/plain":
+        raw_bytes = await file.read()
+        questao_texto = raw_bytes.decode("utf-8", errors="ignore").strip()
+        logger.info("Texto recebido diretamente (text/plain)")
+    else:
+        # Caso contrário, usa o OCR mock (MVP)
+        questao_texto = await ocr_service.extrair_texto_questao(file.file)
+        logger.info("Texto extraído via OCR (mock)")
+    logger.info(f"Texto extraído: {questao_texto[:100]}...")
+    return questao_texto
+
+
+@router.post(
+    "/start",
+    response_model=SessionStartResponse,
+    responses={202: {"model": JobCriadoResponse, "description": "Job criado (assincrono=true)"}},
+)
 async def start_session(
     file: UploadFile = File(..., description="Imagem da questão original"),
+    assincrono: bool = Query(False, description="Se true, responde 202 com job_id e executa o pipeline em background"),
+    prazo_s: Optional[float] = Query(None, gt=0, description="Orçamento de latência (s); questões que não couberem são anexadas depois"),
     db: Session = Depends(get_db)
 ):
     """
@@ -29,72 +60,45 @@ async def start_session(
     2. Extrai texto (OCR mock quando imagem)
     3. Agente Interpretador identifica habilidades BNCC
     4. Pipeline Criador → Solver → Validação gera 3 questões aprovadas
-    5. Agente Resolução cria gabarito mestre final das aprovadas
+    5. Gabarito mestre montado a partir das resoluções da validação (+ distratores)
     6. Salva tudo no banco e retorna session_id + questões
+
+    Com `assincrono=true`, os passos 3-6 rodam em background: a resposta é 202 com
+    `job_id` e o andamento pode ser consultado em GET /session/jobs/{job_id}.
+    Com JOBS_BACKEND=fila, o job é gravado na fila durável e executado pelos
+    workers (python -m app.worker).
+
+    Com `prazo_s`, o pipeline degrada para responder dentro do prazo (menos rodadas,
+    sem juiz LLM, distratores heurísticos) e pode retornar menos de 3 questões;
+    `questoes_pendentes` indica quantas serão anexadas à sessão em segundo plano.
+    Combinado com `assincrono=true`, o prazo vale para o job e conta a partir do
+    início da execução (não inclui a espera na fila).
     """
     try:
         logger.info("=== Iniciando nova sessão ===")
         
         # 1. Extrai texto da imagem (OCR Mock)
         logger.info("Passo 1: Extraindo texto da questão")
-        # Se recebermos um arquivo de texto (enviado pelo Streamlit), usamos o conteúdo diretamente.
-        if getattr(file, "content_type", None) == "text/plain":
-            raw_bytes = await file.read()
-            questao_texto = raw_bytes.decode("utf-8", errors="ignore").strip()
-            logger.info("Texto recebido diretamente (text/plain)")
-        else:
-            # Caso contrário, usa o OCR mock (MVP)
-            questao_texto = await ocr_service.extrair_texto_questao(file.file)
-            logger.info("Texto extraído via OCR (mock)")
-        logger.info(f"Texto extraído: {questao_texto[:100]}...")
-        
-        # 2. Agente Interpretador: Identifica habilidades BNCC
-        logger.info("Passo 2: Identificando habilidades BNCC")
-        analise = await agent_service.interpretar_questao(questao_texto)
-        logger.info(f"Habilidades identificadas: {len(analise.get('habilidades_identificadas', []))}")
-        
-        # 3. Pipeline Criador → Solver → Validação: gera 3 questões aprovadas
-        logger.info("Passo 3: Gerando e validando questões (alvo=3)")
-        aprovadas, gabarito = await agent_service.gerar_questoes_validadas(
-            questao_original=questao_texto,
-            habilidades_identificadas=analise.get('habilidades_identificadas', []),
-            conceitos_principais=analise.get('conceitos_principais', []),
-            ano_escolar=analise.get('ano_recomendado', 'Não especificado'),
-            alvo=3,
-            max_tentativas=3,
-        )
-        logger.info(f"Questões aprovadas: {len(aprovadas)}")
-
-        # Converte para lista de strings para resposta (mantém objetos no banco)
-        questoes_strings = []
-        for i, q in enumerate(aprovadas, start=1):
-            if isinstance(q, dict):
-                num = q.get('numero', i)
-                enun = q.get('enunciado', '')
-                questoes_strings.append(f"{num}. {enun}")
-            else:
-                questoes_strings.append(str(q))
-
-        # 4. Cria sessão no banco
-        logger.info("Passo 4: Criando sessão no banco")
-        sessao = SessaoEstudo(
-            questao_original=questao_texto,
-            habilidades_identificadas=analise,
-            lista_questoes=aprovadas,
-            gabarito_mestre=gabarito
-        )
-        db.add(sessao)
-        db.commit()
-        db.refresh(sessao)
-        logger.info(f"Sessão criada: {sessao.session_id}")
+        questao_texto = await _extrair_texto_questao(file)
+
+        if assincrono:
+            job_id = job_service.criar_job_sessao(questao_texto, prazo_s=prazo_s)
+            logger.info(f"=== Sessão agendada no job {job_id} ===")
+            return JSONResponse(
+                status_code=202,
+                content=JobCriadoResponse(
+                    job_id=job_id,
+                    status="pendente",
+                    status_url=f"/api/v1/session/jobs/{job_id}",
+                ).model_dump(),
+            )
+
+        # 2-4. Interpretador → pipeline de questões → persistência
+        resposta = await session_service.criar_sessao(questao_texto, db=db, prazo_s=prazo_s)
 
         # 5. Retorna resposta
         logger.info("=== Sessão iniciada com sucesso ===")
-        return SessionStartResponse(
-            session_id=sessao.session_id,
-            lista_de_questoes=questoes_strings,
-            questoes_geradas=aprovadas  # Retorna objetos completos com alternativas
-        )
+        return SessionStartResponse(**resposta)
         
     except Exception as e:
         logger.error(f"Erro ao iniciar sessão: {e}", exc_info=True)
@@ -105,11 +109,84 @@ async def start_session(
         )
 
 
-@router.post("/{session_id}/submit", response_model=SessionSubmitResponse)
+@router.post("/start/stream")
+async def start_session_stream(
+    file: UploadFile = File(..., description="Imagem da questão original"),
+    prazo_s: Optional[float] = Query(None, gt=0, description="Orçamento de latência (s), como em POST /start"),
+):
+    """
+    Variante em streaming de POST /start (NDJSON, uma linha JSON por evento).
+
+    Eventos, na ordem em que acontecem:
+    - texto_extraido: {"questao_texto": ...}
+    - habilidades: análise do Agente Interpretador
+    - questao: cada questão aprovada, já com alternativas (pode chegar fora de ordem)
+    - sessao: payload final no formato de SessionStartResponse
+    - erro: {"detail": ...} se o pipeline falhar
+    """
+    logger.info("=== Iniciando nova sessão (streaming) ===")
+    # O arquivo precisa ser lido antes da resposta começar (o upload é fechado depois)
+    questao_texto = await _extrair_texto_questao(file)
+
+    fila: asyncio.Queue = asyncio.Queue()
+
+    async def _on_evento(evento: str, dados: Dict[str, Any]) -> None:
+        if evento == "sessao":
+            dados = SessionStartResponse(**dados).model_dump()
+        await fila.put({"evento": evento, "dados": dados})
+
+    async def _executar() -> None:
+        try:
+            await _on_evento("texto_extraido", {"questao_texto": questao_texto})
+            await session_service.criar_sessao(questao_texto, on_evento=_on_evento, prazo_s=prazo_s)
+            logger.info("=== Sessão iniciada com sucesso (streaming) ===")
+        except Exception as e:
+            logger.error(f"Erro ao iniciar sessão (streaming): {e}", exc_info=True)
+            await fila.put({"evento": "erro", "dados": {"detail": f"Erro ao processar questão: {str(e)}"}})
+        finally:
+            await fila.put(None)
+
+    async def _gerar_linhas():
+        tarefa = asyncio.create_task(_executar())
+        try:
+            while True:
+                item = await fila.get()
+                if item is None:
+                    break
+                yield json.dumps(jsonable_encoder(item), ensure_ascii=False) + "\n"
+        finally:
+            # Cliente desconectou: interrompe o pipeline
+            if not tarefa.done():
+                tarefa.cancel()
+
+    return StreamingResponse(_gerar_linhas(), media_type="application/x-ndjson")
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str):
+    """
+    Retorna a etapa atual, os resultados parciais e (quando concluído) o resultado
+    final de um job de geração criado com POST /start?assincrono=true.
+    """
+    job = job_service.obter(job_id)
+    if not job:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Job {job_id} não encontrado"
+        )
+    return job
+
+
+@router.post(
+    "/{session_id}/submit",
+    response_model=SessionSubmitResponse,
+    responses={202: {"model": JobCriadoResponse, "description": "Job criado (assincrono=true)"}},
+)
 async def submit_answers(
     session_id: str,
     request: Request,
     file: UploadFile = File(None, description="Imagem/arquivo de respostas do aluno (opcional)"),
+    assincrono: bool = Query(False, description="Se true, responde 202 com job_id e corrige em background"),
     db: Session = Depends(get_db)
 ):
     """
@@ -118,6 +195,9 @@ async def submit_answers(
     Aceita duas formas de entrada:
     - JSON com {"respostas": {"1":"A","2":"C","3":"B"}}
     - Arquivo (texto ou imagem) com respostas livres (MVP legado)
+
+    Com `assincrono=true`, a correção roda em background (job) e o relatório
+    fica disponível em GET /session/jobs/{job_id} e na própria sessão.
     """
     try:
         logger.info(f"=== Submetendo respostas para sessão {session_id} ===")
@@ -145,11 +225,7 @@ async def submit_answers(
 
         if payload and isinstance(payload, dict) and payload.get("respostas"):
             # Converte mapa de alternativas para texto legível pelo agente de correção
-            mapa = payload.get("respostas") or {}
-            linhas = []
-            for k, v in mapa.items():
-                linhas.append(f"Questão {k}: {str(v).upper()}")
-            respostas_texto = "\n".join(linhas)
+            respostas_texto = session_service.respostas_em_texto(payload.get("respostas") or {})
             logger.info("Respostas recebidas em JSON (alternativas)")
         elif file is not None:
             # 3. Extrai texto das respostas (OCR Mock)
@@ -167,29 +243,29 @@ async def submit_answers(
 
         logger.info(f"Respostas processadas (preview): {(respostas_texto or '')[:100]}...")
 
-        # 3. Agente Correção: Corrige e gera relatório
-        logger.info("Passo 3: Corrigindo respostas")
-        relatorio = await agent_service.corrigir_respostas(
+        if assincrono:
+            job_id = job_service.criar_job_correcao(session_id, respostas_texto or "", payload)
+            logger.info(f"=== Correção agendada no job {job_id} ===")
+            return JSONResponse(
+                status_code=202,
+                content=JobCriadoResponse(
+                    job_id=job_id,
+                    status="pendente",
+                    status_url=f"/api/v1/session/jobs/{job_id}",
+                ).model_dump(),
+            )
+
+        # 3-4. Agente Correção → atualiza sessão no banco
+        resposta = await session_service.corrigir_sessao(
             session_id=session_id,
-            respostas_aluno=respostas_texto or ""
+            respostas_texto=respostas_texto or "",
+            respostas_payload=payload,
+            db=db,
         )
-        logger.info("Relatório diagnóstico gerado")
-
-        # 4. Atualiza sessão no banco
-        logger.info("Passo 4: Atualizando sessão no banco")
-        sessao.respostas_aluno = payload if payload else {"texto": respostas_texto}
-        sessao.relatorio_diagnostico = relatorio
-        sessao.submitted_at = func.now()
-        sessao.updated_at = func.now()
-        db.commit()
-        logger.info("Sessão atualizada")
 
         # 5. Retorna resposta
         logger.info("=== Respostas submetidas com sucesso ===")
-        return SessionSubmitResponse(
-            session_id=session_id,
-            relatorio_diagnostico=relatorio
-        )
+        return SessionSubmitResponse(**resposta)
 
     except HTTPException:
         raise
@@ -202,6 +278,107 @@ async def submit_answers(
         )
 
 
+async def _extrair_texto_respostas(file: UploadFile) -> str:
+    """Extrai as respostas de um aluno de um arquivo texto ou imagem (OCR mock)."""
+    if getattr(file, "content_type", None) == "text/plain":
+        raw_bytes = await file.read()
+        return raw_bytes.decode("utf-8", errors="ignore").strip()
+    return await ocr_service.extrair_texto_respostas(file.file)
+
+
+@router.post("/{session_id}/submit/turma", response_model=TurmaSubmitResponse)
+async def submit_turma(
+    session_id: str,
+    request: Request,
+    arquivos: List[UploadFile] = File(None, description="Um arquivo de respostas por aluno (o nome do arquivo identifica o aluno)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Corrige as respostas de uma turma inteira para a mesma sessão.
+
+    Aceita duas formas de entrada:
+    - JSON com {"alunos": [{"aluno": "Ana", "respostas": {"1": "A", "2": "C"}}, ...]}
+      (ou {"alunos": {"Ana": {"1": "A"}, ...}})
+    - Vários arquivos (texto ou imagem), um por aluno, no campo `arquivos`
+
+    Retorna o relatório de cada aluno e o resumo da turma; o resultado fica
+    disponível em GET /session/{session_id}/turma/{correcao_id}.
+    """
+    try:
+        logger.info(f"=== Correção de turma para sessão {session_id} ===")
+        payload = None
+        try:
+            if request.headers.get("content-type", "").startswith("application/json"):
+                payload = await request.json()
+        except Exception:
+            payload = None
+
+        alunos: List[Dict[str, Any]] = []
+        if isinstance(payload, dict) and payload.get("alunos"):
+            entradas = payload["alunos"]
+            if isinstance(entradas, dict):
+                entradas = [{"aluno": nome, "respostas": respostas} for nome, respostas in entradas.items()]
+            for i, entrada in enumerate(entradas, start=1):
+                if not isinstance(entrada, dict) or not (isinstance(entrada.get("respostas"), dict) or entrada.get("texto")):
+                    raise HTTPException(status_code=400, detail=f"Aluno {i}: envie 'respostas' (mapa) ou 'texto'.")
+                alunos.append({
+                    "aluno": str(entrada.get("aluno") or f"aluno_{i}"),
+                    "respostas": entrada.get("respostas") if isinstance(entrada.get("respostas"), dict) else None,
+                    "texto": entrada.get("texto"),
+                })
+        elif arquivos:
+            for i, arquivo in enumerate(arquivos, start=1):
+                nome = os.path.splitext(os.path.basename(arquivo.filename or ""))[0]
+                alunos.append({"aluno": nome or f"aluno_{i}", "texto": await _extrair_texto_respostas(arquivo)})
+        else:
+            raise HTTPException(status_code=400, detail="Envie um JSON com 'alunos' ou arquivos de respostas.")
+
+        if len(alunos) > settings.TURMA_MAX_ALUNOS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Máximo de {settings.TURMA_MAX_ALUNOS} alunos por correção de turma (recebidos {len(alunos)})."
+            )
+
+        resposta = await session_service.corrigir_turma(session_id=session_id, alunos=alunos, db=db)
+        logger.info("=== Turma corrigida com sucesso ===")
+        return TurmaSubmitResponse(**resposta)
+
+    except HTTPException:
+        raise
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Erro ao corrigir turma: {e}", exc_info=True)
+        db.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro ao processar respostas da turma: {str(e)}"
+        )
+
+
+@router.get("/{session_id}/turma/{correcao_id}", response_model=TurmaSubmitResponse)
+async def get_correcao_turma(
+    session_id: str,
+    correcao_id: str,
+    db: Session = Depends(get_db)
+):
+    """
+    Retorna uma correção de turma (com as recomendações geradas em segundo plano, se houver).
+    """
+    correcao = db.query(CorrecaoTurma).filter(
+        CorrecaoTurma.correcao_id == correcao_id,
+        CorrecaoTurma.session_id == session_id,
+    ).first()
+    if not correcao:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Correção de turma {correcao_id} não encontrada"
+        )
+    return TurmaSubmitResponse(**session_service.formatar_correcao_turma(
+        correcao.correcao_id, correcao.session_id, correcao.alunos or [], correcao.resumo_turma or {}
+    ))
+
+
 @router.get("/{session_id}")
 async def get_session(
     session_id: str,
@@ -229,6 +406,8 @@ async def get_session(
         "habilidades_identificadas": sessao.habilidades_identificadas,
         "created_at": sessao.created_at,
         "submitted_at": sessao.submitted_at,
-        "has_relatorio": sessao.relatorio_diagnostico is not None
+        "has_relatorio": sessao.relatorio_diagnostico is not None,
+        "relatorio_diagnostico": sessao.relatorio_diagnostico,
+        "uso_llm": uso_llm_service.obter(db, session_id),
     }
 
@@ -11,7 +11,7 @@ class Settings(BaseSettings):
     
     # API Keys
     OPENAI_API_KEY: Optional[str] = Field(None, description="Chave da API OpenAI")
-    GOOGLE_API_KEY: str = Field(..., description="Chave da API Google")
+    GOOGLE_API_KEY: Optional[str] = Field(None, description="Chave da API Google (obrigatória com o provedor google)")
     
     # Database
     DATABASE_URL: str = Field(
@@ -33,7 +33,7 @@ class Settings(BaseSettings):
     # LLM Configurations
     DEFAULT_LLM_PROVIDER: str = Field(
         default="google",
-        description="Provedor de LLM padrão (openai ou google)"
+        description="Provedor de LLM padrão (openai, google ou offline: fake, record, replay)"
     )
     DEFAULT_MODEL: str = Field(
         default="gemini-2.5-flash",
@@ -48,10 +48,224 @@ class Settings(BaseSettings):
         description="Número máximo de tokens na resposta"
     )
     
+    # Provedores offline (fake / record / replay)
+    LLM_FAKE_FIXTURES: Optional[str] = Field(
+        default=None,
+        description="Arquivo JSON com respostas por agente que substituem as fixtures padrão do provedor fake"
+    )
+    LLM_CASSETE_PATH: str = Field(
+        default="./cassetes/kora.jsonl",
+        description="Cassete de requisições/respostas gravadas (modos record e replay)"
+    )
+    LLM_CASSETE_PROVEDOR: str = Field(
+        default="google",
+        description="Provedor real chamado no modo record (google ou openai)"
+    )
+    LLM_LATENCIA_SIMULADA_S: float = Field(
+        default=0.0,
+        description="Latência artificial de cada chamada nos modos fake e replay"
+    )
+    
+    # Escalonador global de chamadas de LLM (0 = sem limite)
+    LLM_MAX_EM_VOO: int = Field(
+        default=8,
+        description="Número máximo de chamadas simultâneas ao provedor de LLM"
+    )
+    LLM_RPM: int = Field(
+        default=0,
+        description="Orçamento de requisições por minuto ao provedor de LLM"
+    )
+    LLM_TPM: int = Field(
+        default=0,
+        description="Orçamento de tokens (estimados) por minuto ao provedor de LLM"
+    )
+    LLM_TOKENS_SAIDA_ESTIMADOS: int = Field(
+        default=1024,
+        description="Tokens de saída previstos por chamada na estimativa do orçamento TPM"
+    )
+    LLM_PAUSA_RATE_LIMIT_S: float = Field(
+        default=10.0,
+        description="Pausa nos despachos após o provedor responder 429"
+    )
+    
+    # Cache de respostas de LLM (memória + tabela cache_respostas)
+    LLM_CACHE_AGENTES: str = Field(
+        default="",
+        description="Agentes/chamadas com cache de respostas, separados por vírgula (vazio = desativado; ex: interpretador,julgamento)"
+    )
+    LLM_CACHE_TTL_S: int = Field(
+        default=7 * 24 * 3600,
+        description="Validade das respostas em cache (0 = sem expiração)"
+    )
+    LLM_CACHE_MAX_MEMORIA: int = Field(
+        default=512,
+        description="Entradas mantidas no LRU em memória de cada processo"
+    )
+    LLM_CACHE_MAX_DISCO: int = Field(
+        default=20000,
+        description="Entradas mantidas na tabela cache_respostas (0 = sem camada em disco)"
+    )
+
+    # Cache de embeddings das consultas do RAG
+    EMBEDDING_CACHE_ATIVO: bool = Field(
+        default=True,
+        description="Reaproveita o embedding de consultas repetidas (mesmo provedor, modelo e texto normalizado)"
+    )
+    EMBEDDING_CACHE_TTL_S: int = Field(
+        default=30 * 24 * 3600,
+        description="Validade dos embeddings em cache (0 = sem expiração)"
+    )
+    EMBEDDING_CACHE_MAX_MEMORIA: int = Field(
+        default=2048,
+        description="Embeddings mantidos no LRU em memória de cada processo"
+    )
+    EMBEDDING_CACHE_MAX_DISCO: int = Field(
+        default=50000,
+        description="Embeddings mantidos na tabela cache_respostas (0 = sem camada em disco)"
+    )
+    
+    # Roteamento adaptativo das cadeias de fallback (resolução e correção)
+    ROTEADOR_FALLBACK_ATIVO: bool = Field(
+        default=True,
+        description="Ordena os caminhos de fallback pela taxa de sucesso observada (False = ordem fixa)"
+    )
+    ROTEADOR_MIN_TENTATIVAS: int = Field(
+        default=5,
+        description="Tentativas de um caminho antes de a taxa de sucesso dele ser usada no roteamento"
+    )
+    ROTEADOR_EXPLORACAO: float = Field(
+        default=0.05,
+        description="Fração das chamadas que seguem a ordem padrão para continuar medindo todos os caminhos"
+    )
+
+    # Banco de questões (reaproveita análise e questões aprovadas de questões já enviadas)
+    BANCO_QUESTOES_ATIVO: bool = Field(
+        default=True,
+        description="Atende /session/start de uma questão já processada com questões do banco, sem chamar o LLM"
+    )
+    BANCO_QUESTOES_VALIDADE_S: int = Field(
+        default=2592000,
+        description="Idade máxima (s) da análise e das questões do banco; mais antigas são geradas de novo (0 = sem validade)"
+    )
+    BANCO_QUESTOES_MAX_VARIANTES: int = Field(
+        default=12,
+        description="Questões aprovadas guardadas por questão original (as mais antigas saem primeiro)"
+    )
+    BANCO_QUESTOES_REEMBARALHAR: bool = Field(
+        default=True,
+        description="Reembaralha as alternativas de cada questão servida pelo banco"
+    )
+
+    # Cache semântico do Interpretador (questões quase idênticas reaproveitam a análise)
+    INTERPRETACAO_CACHE_ATIVO: bool = Field(
+        default=True,
+        description="Reaproveita a análise de uma questão com embedding próximo em vez de rodar o Interpretador"
+    )
+    INTERPRETACAO_CACHE_LIMIAR: float = Field(
+        default=0.97,
+        description="Similaridade de cosseno mínima entre as questões para reaproveitar a análise"
+    )
+    INTERPRETACAO_CACHE_MAX: int = Field(
+        default=5000,
+        description="Análises guardadas por provedor/modelo de embeddings (as mais antigas saem primeiro)"
+    )
+    INTERPRETACAO_CACHE_AUDITORIA: float = Field(
+        default=0.05,
+        description="Fração dos reaproveitamentos auditados rodando o Interpretador em segundo plano"
+    )
+    INTERPRETACAO_CACHE_JACCARD_MIN: float = Field(
+        default=0.5,
+        description="Na auditoria, Jaccard mínimo entre os códigos BNCC reaproveitados e os novos para contar como concordante"
+    )
+
+    # Agente Interpretador
+    INTERPRETADOR_MODO: str = Field(
+        default="agente",
+        description="agente (laço de ferramentas de busca BNCC) ou direto (habilidades candidatas do RAG no prompt + uma chamada estruturada; volta ao agente se falhar)"
+    )
+    INTERPRETADOR_CANDIDATOS: int = Field(
+        default=8,
+        description="No modo direto, habilidades candidatas recuperadas do RAG e injetadas no prompt"
+    )
+
+    # Pipeline de geração de questões
+    VALIDACAO_CONCORRENCIA: int = Field(
+        default=3,
+        description="Número máximo de questões candidatas validadas simultaneamente"
+    )
+    PIPELINE_CONCORRENCIA_GABARITO: int = Field(
+        default=3,
+        description="Número máximo de questões aprovadas na etapa de gabarito simultaneamente"
+    )
+    PIPELINE_CONCORRENCIA_DISTRATORES: int = Field(
+        default=3,
+        description="Número máximo de questões aprovadas na etapa de distratores simultaneamente"
+    )
+    PRAZO_FRACAO_DEGRADACAO: float = Field(
+        default=0.5,
+        description="No modo prazo (prazo_s), fração do orçamento restante abaixo da qual o pipeline degrada (sem novas rodadas, sem juiz LLM, distratores heurísticos)"
+    )
+
+    # Correção de respostas por alternativa (POST /session/{id}/submit com JSON)
+    CORRECAO_RECOMENDACOES: str = Field(
+        default="segundo_plano",
+        description="Recomendações narrativas da correção local: segundo_plano (LLM após devolver a nota), sincrono (LLM antes de responder) ou local (texto determinístico, sem LLM)"
+    )
+    TURMA_MAX_ALUNOS: int = Field(
+        default=100,
+        description="Número máximo de alunos por requisição de correção de turma"
+    )
+    TURMA_CONCORRENCIA_AGENTE: int = Field(
+        default=4,
+        description="Alunos com respostas livres corrigidos pelo Agente Correção simultaneamente na correção de turma"
+    )
+    
+    # Jobs em segundo plano (POST /session/start?assincrono=true)
+    JOBS_MAX_CONCORRENTES: int = Field(
+        default=4,
+        description="Número máximo de jobs de geração executando simultaneamente"
+    )
+    JOBS_MAX_RETIDOS: int = Field(
+        default=500,
+        description="Número máximo de jobs finalizados mantidos para consulta de status"
+    )
+    JOBS_BACKEND: str = Field(
+        default="memoria",
+        description="Onde os jobs executam: memoria (processo da API) ou fila (fila SQLite + python -m app.worker)"
+    )
+    FILA_LEASE_S: int = Field(
+        default=120,
+        description="Duração do lease de um trabalho da fila (renovado enquanto o worker executa)"
+    )
+    FILA_MAX_TENTATIVAS: int = Field(
+        default=3,
+        description="Tentativas por trabalho da fila antes de marcá-lo como erro"
+    )
+    WORKER_PROCESSOS: int = Field(
+        default=2,
+        description="Número padrão de processos do worker da fila"
+    )
+    WORKER_JOBS_POR_PROCESSO: int = Field(
+        default=2,
+        description="Trabalhos executados simultaneamente em cada processo do worker"
+    )
+    WORKER_INTERVALO_POLL_S: float = Field(
+        default=1.0,
+        description="Intervalo entre consultas à fila quando não há trabalhos"
+    )
+    
     # RAG Configurations
     EMBEDDING_PROVIDER: str = Field(
         default="google",
-        description="Provedor de embeddings (openai ou google)"
+        description="Provedor de embeddings (openai, google ou offline: fake, record, replay)"
+    )
+    EMBEDDING_CASSETE_PROVEDOR: str = Field(
+        default="google",
+        description="Provedor real de embeddings chamado no modo record (google ou openai)"
+    )
+    EMBEDDING_FAKE_DIMENSAO: int = Field(
+        default=768,
+        description="Dimensão dos embeddings do provedor fake"
     )
     EMBEDDING_MODEL: str = Field(
         default="models/embedding-001",
@@ -69,6 +283,34 @@ class Settings(BaseSettings):
         default=5,
         description="Número de resultados a retornar na busca RAG"
     )
+    RAG_INDICE: str = Field(
+        default="chroma",
+        description="Backend de busca do RAG: chroma (cliente persistente) ou numpy (matriz em memória carregada no startup)"
+    )
+    RAG_INDICE_ARQUIVO: str = Field(
+        default="./indice_bncc.npz",
+        description="Arquivo do índice NumPy (gerado no primeiro start a partir do Chroma ou dos JSON da BNCC)"
+    )
+    BNCC_DATA_DIR: str = Field(
+        default="data/Matemática",
+        description="Pasta com os JSON das habilidades BNCC"
+    )
+    RAG_MODO: str = Field(
+        default="hibrido",
+        description="Modo de busca do RAG: vetorial, lexical (BM25 local, sem embeddings) ou hibrido (fusão RRF dos dois)"
+    )
+    RAG_LEXICO_ARQUIVO: str = Field(
+        default="./indice_bncc_bm25.json",
+        description="Arquivo do índice lexical BM25 (gerado na ingestão ou no primeiro uso)"
+    )
+    RAG_HIBRIDO_CANDIDATOS: int = Field(
+        default=20,
+        description="Candidatos de cada busca (vetorial e lexical) antes da fusão no modo hibrido"
+    )
+    RAG_RRF_K: int = Field(
+        default=60,
+        description="Constante k da fusão por posição recíproca (RRF): 1/(k + posição)"
+    )
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,227 @@
+"""
+Métricas no formato de exposição do Prometheus (GET /metrics)
+
+Registro simples, sem dependências externas: contadores e histogramas com rótulos,
+mais coletores chamados no momento da leitura (ex: estado do escalonador de LLM).
+"""
+from typing import Dict, Any, List, Tuple, Callable, Optional, Sequence
+import threading
+import time
+
+BUCKETS_PADRAO = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+Rotulos = Tuple[Tuple[str, str], ...]
+
+
+def _escapar(valor: Any) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_rotulos(rotulos: Rotulos, extra: Optional[Tuple[str, str]] = None) -> str:
+    pares = list(rotulos) + ([extra] if extra else [])
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+
+def _formatar_valor(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nome: str, descricao: str, rotulos: Sequence[str] = ()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+
+    def _chave(self, valores: Dict[str, Any]) -> Rotulos:
+        return tuple((r, str(valores.get(r, ""))) for r in self.rotulos)
+
+    def exportar(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Contador(_Metrica):
+    """Contador monotônico com rótulos."""
+    tipo = "counter"
+
+    def __init__(self, nome: str, descricao: str, rotulos: Sequence[str] = ()):
+        super().__init__(nome, descricao, rotulos)
+        self._valores: Dict[Rotulos, float] = {}
+
+    def inc(self, valor: float = 1.0, **rotulos: Any) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0.0) + valor
+
+    def valor(self, **rotulos: Any) -> float:
+        return self._valores.get(self._chave(rotulos), 0.0)
+
+    def exportar(self) -> List[str]:
+        with self._lock:
+            itens = list(self._valores.items())
+        return [f"{self.nome}{_formatar_rotulos(k)} {_formatar_valor(v)}" for k, v in itens]
+
+
+class Histograma(_Metrica):
+    """Histograma cumulativo (buckets, _sum e _count) com rótulos."""
+    tipo = "histogram"
+
+    def __init__(self, nome: str, descricao: str, rotulos: Sequence[str] = (), buckets: Sequence[float] = BUCKETS_PADRAO):
+        super().__init__(nome, descricao, rotulos)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[Rotulos, Dict[str, Any]] = {}
+
+    def observar(self, valor: float, **rotulos: Any) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            serie = self._series.setdefault(chave, {"contagens": [0] * len(self.buckets), "soma": 0.0, "n": 0})
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie["contagens"][i] += 1
+            serie["soma"] += valor
+            serie["n"] += 1
+
+    def cronometrar(self, **rotulos: Any) -> "_Cronometro":
+        """Context manager que observa a duração do bloco."""
+        return _Cronometro(self, rotulos)
+
+    def exportar(self) -> List[str]:
+        linhas = []
+        with self._lock:
+            itens = [(k, dict(v, contagens=list(v["contagens"]))) for k, v in self._series.items()]
+        for chave, serie in itens:
+            for limite, contagem in zip(self.buckets, serie["contagens"]):
+                linhas.append(f"{self.nome}_bucket{_formatar_rotulos(chave, ('le', _formatar_valor(limite)))} {contagem}")
+            linhas.append(f"{self.nome}_sum{_formatar_rotulos(chave)} {_formatar_valor(serie['soma'])}")
+            linhas.append(f"{self.nome}_count{_formatar_rotulos(chave)} {serie['n']}")
+        return linhas
+
+
+class _Cronometro:
+    def __init__(self, histograma: Histograma, rotulos: Dict[str, Any]):
+        self._histograma = histograma
+        self._rotulos = rotulos
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histograma.observar(time.perf_counter() - self._t0, **self._rotulos)
+        return False
+
+
+# Coletor: devolve (nome, tipo, descrição, [(rótulos, valor)]) no momento da leitura
+Coletor = Callable[[], List[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]]
+
+
+class RegistroMetricas:
+    """Registro das métricas da aplicação e geração do texto de exposição."""
+
+    def __init__(self):
+        self._metricas: Dict[str, _Metrica] = {}
+        self._coletores: List[Coletor] = []
+
+    def contador(self, nome: str, descricao: str, rotulos: Sequence[str] = ()) -> Contador:
+        return self._registrar(Contador(nome, descricao, rotulos))
+
+    def histograma(self, nome: str, descricao: str, rotulos: Sequence[str] = (), buckets: Sequence[float] = BUCKETS_PADRAO) -> Histograma:
+        return self._registrar(Histograma(nome, descricao, rotulos, buckets))
+
+    def _registrar(self, metrica: _Metrica) -> Any:
+        if metrica.nome in self._metricas:
+            return self._metricas[metrica.nome]
+        self._metricas[metrica.nome] = metrica
+        return metrica
+
+    def registrar_coletor(self, coletor: Coletor) -> None:
+        self._coletores.append(coletor)
+
+    def exportar(self) -> str:
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)."""
+        linhas: List[str] = []
+        for m in self._metricas.values():
+            linhas.append(f"# HELP {m.nome} {m.descricao}")
+            linhas.append(f"# TYPE {m.nome} {m.tipo}")
+            linhas.extend(m.exportar())
+        for coletor in self._coletores:
+            try:
+                familias = coletor()
+            except Exception:
+                continue
+            for nome, tipo, descricao, amostras in familias:
+                linhas.append(f"# HELP {nome} {descricao}")
+                linhas.append(f"# TYPE {nome} {tipo}")
+                for rotulos, valor in amostras:
+                    chave = tuple((k, str(v)) for k, v in rotulos.items())
+                    linhas.append(f"{nome}{_formatar_rotulos(chave)} {_formatar_valor(valor)}")
+        return "\n".join(linhas) + "\n"
+
+
+# Registro global
+registro = RegistroMetricas()
+
+# ==== HTTP
+http_requisicoes = registro.contador(
+    "kora_http_requisicoes_total", "Requisições HTTP por rota, método e status", ("metodo", "rota", "status")
+)
+http_duracao = registro.histograma(
+    "kora_http_duracao_segundos", "Latência das requisições HTTP por rota", ("metodo", "rota")
+)
+
+# ==== LLM (por agente)
+llm_chamadas = registro.contador(
+    "kora_llm_chamadas_total",
+    "Chamadas de LLM por agente, tipo (grafo ou estruturado) e resultado (ok, erro, cache)",
+    ("agente", "tipo", "resultado"),
+)
+llm_duracao = registro.histograma(
+    "kora_llm_duracao_segundos", "Latência das chamadas de LLM por agente (sem a espera na fila)", ("agente", "tipo")
+)
+llm_espera_fila = registro.histograma(
+    "kora_llm_espera_fila_segundos", "Espera no escalonador de LLM por prioridade", ("prioridade",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0),
+)
+
+# ==== Pipeline
+fallbacks = registro.contador(
+    "kora_fallback_total", "Caminho usado em cada etapa com cadeia de fallback", ("etapa", "caminho")
+)
+validacoes = registro.contador(
+    "kora_validacao_total", "Questões candidatas por resultado da validação", ("resultado",)
+)
+equivalencia = registro.contador(
+    "kora_equivalencia_total",
+    "Decisões de equivalência de respostas por caminho (motor local ou juiz LLM) e resultado",
+    ("caminho", "resultado"),
+)
+banco_questoes = registro.contador(
+    "kora_banco_questoes_total",
+    "Consultas ao banco de questões por resultado (acerto, ausente, expirado, insuficiente)",
+    ("resultado",),
+)
+cache_interpretacao = registro.contador(
+    "kora_cache_interpretacao_total",
+    "Consultas ao cache semântico do Interpretador por resultado (acerto, falta, erro)",
+    ("resultado",),
+)
+cache_interpretacao_auditoria = registro.contador(
+    "kora_cache_interpretacao_auditoria_total",
+    "Auditorias de reaproveitamento do cache semântico por resultado (concordante, divergente)",
+    ("resultado",),
+)
+rag_buscas = registro.contador(
+    "kora_rag_buscas_total",
+    "Buscas no RAG BNCC por modo efetivo (vetorial, lexical, hibrido, lexical_sem_embeddings)",
+    ("modo",),
+)
+rag_duracao = registro.histograma(
+    "kora_rag_duracao_segundos", "Latência das consultas ao RAG BNCC", ("operacao",),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
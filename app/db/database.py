@@ -1,7 +1,7 @@
 """
 Configuração do SQLAlchemy e gerenciamento de sessões do banco de dados
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
@@ -9,10 +9,18 @@ from app.core.config import settings
 # Engine do SQLAlchemy
 engine = create_engine(
     settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {},
+    connect_args={"check_same_thread": False, "timeout": 30} if "sqlite" in settings.DATABASE_URL else {},
     echo=settings.DEBUG
 )
 
+if "sqlite" in settings.DATABASE_URL:
+    @event.listens_for(engine, "connect")
+    def _configurar_sqlite(dbapi_connection, connection_record):
+        """WAL permite que a API leia enquanto os workers da fila escrevem."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
 # SessionLocal para criar sessões do banco
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -37,5 +45,6 @@ def init_db():
     Inicializa o banco de dados criando todas as tabelas.
     Deve ser chamado no startup da aplicação.
     """
+    from app.db import models  # noqa: F401 - registra os modelos no metadata
     Base.metadata.create_all(bind=engine)
 
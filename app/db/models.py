@@ -1,7 +1,7 @@
 """
 Modelos SQLAlchemy para o banco de dados
 """
-from sqlalchemy import Column, String, Text, DateTime, JSON
+from sqlalchemy import Column, String, Text, DateTime, JSON, Integer, Float, ForeignKey
 from sqlalchemy.sql import func
 from app.db.database import Base
 import uuid
@@ -59,3 +59,236 @@ class SessaoEstudo(Base):
     def __repr__(self):
         return f"<SessaoEstudo(session_id={self.session_id})>"
 
+
+
+class TrabalhoFila(Base):
+    """
+    Modelo da fila durável de trabalhos (geração de sessões e correções).
+
+    O processo da API apenas enfileira e consulta; os workers (python -m app.worker)
+    reivindicam trabalhos com lease, renovam o lease enquanto executam e gravam o
+    resultado. Trabalhos com lease expirado (worker morto) voltam a ser reivindicáveis.
+    """
+    __tablename__ = "fila_trabalhos"
+
+    # ID do trabalho (também usado como job_id na API)
+    job_id = Column(
+        String(36),
+        primary_key=True,
+        default=generate_uuid,
+        index=True
+    )
+
+    # Tipo do trabalho: "sessao_start" ou "correcao"
+    tipo = Column(String(32), nullable=False, index=True)
+
+    # Entrada do trabalho (ex: {"questao_texto": "..."})
+    payload = Column(JSON, nullable=False)
+
+    # pendente → executando → concluido | erro
+    status = Column(String(16), nullable=False, default="pendente", index=True)
+
+    # Etapa atual do pipeline e resultados parciais
+    etapa = Column(String(32), nullable=False, default="na_fila")
+    parciais = Column(JSON, nullable=True)
+
+    # Resultado final ou mensagem de erro
+    resultado = Column(JSON, nullable=True)
+    erro = Column(Text, nullable=True)
+
+    # Controle de reivindicação (lease) e recuperação de falhas
+    tentativas = Column(Integer, nullable=False, default=0)
+    max_tentativas = Column(Integer, nullable=False, default=3)
+    lease_owner = Column(String(64), nullable=True)
+    lease_expira_em = Column(DateTime, nullable=True, index=True)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<TrabalhoFila(job_id={self.job_id}, tipo={self.tipo}, status={self.status})>"
+
+
+class EntradaCache(Base):
+    """
+    Camada em disco do cache de respostas (app/services/cache.py).
+
+    A chave é um hash do namespace e das entradas da chamada (modelo, temperatura,
+    prompt renderizado, schema). Entradas expiram por TTL e as menos acessadas são
+    descartadas quando o namespace passa do tamanho máximo.
+    """
+    __tablename__ = "cache_respostas"
+
+    # "<namespace>:<sha256>"
+    chave = Column(String(96), primary_key=True)
+
+    # Agrupa as entradas por uso (ex: "llm") para o limite de tamanho
+    namespace = Column(String(32), nullable=False, index=True)
+
+    # Valor serializável em JSON
+    valor = Column(JSON, nullable=False)
+
+    # Expiração (TTL) e último acesso (despejo LRU)
+    expira_em = Column(DateTime, nullable=True)
+    acessado_em = Column(DateTime, nullable=False, index=True)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<EntradaCache(chave={self.chave})>"
+
+
+class EstatisticaRoteamento(Base):
+    """
+    Tentativas e sucessos de cada caminho das cadeias de fallback
+    (app/services/roteador_fallback.py), por etapa, provedor e modelo.
+
+    Carregada na primeira decisão de roteamento de cada processo e atualizada a
+    cada tentativa, para que o roteador não recomece do zero após um restart.
+    """
+    __tablename__ = "estatisticas_roteamento"
+
+    etapa = Column(String(32), primary_key=True)
+    provedor = Column(String(32), primary_key=True)
+    modelo = Column(String(64), primary_key=True)
+    caminho = Column(String(32), primary_key=True)
+
+    tentativas = Column(Integer, nullable=False, default=0)
+    sucessos = Column(Integer, nullable=False, default=0)
+    latencia_total_s = Column(Float, nullable=False, default=0.0)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<EstatisticaRoteamento({self.etapa}/{self.caminho}: {self.sucessos}/{self.tentativas})>"
+
+
+class CorrecaoTurma(Base):
+    """
+    Correção de uma turma inteira sobre a mesma sessão (POST /session/{id}/submit/turma).
+
+    Os relatórios individuais ficam em JSON, na ordem de envio; o resumo da turma
+    (acerto por questão, alternativas escolhidas, habilidades com mais erros e
+    recomendações ao professor) fica em uma coluna própria.
+    """
+    __tablename__ = "correcoes_turma"
+
+    correcao_id = Column(
+        String(36),
+        primary_key=True,
+        default=generate_uuid,
+        index=True
+    )
+    session_id = Column(
+        String(36),
+        ForeignKey("sessoes_estudo.session_id"),
+        nullable=False,
+        index=True,
+    )
+
+    # [{"aluno": "...", "respostas": {...}, "relatorio_diagnostico": {...}, "erro": null}]
+    alunos = Column(JSON, nullable=False)
+    resumo_turma = Column(JSON, nullable=True)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<CorrecaoTurma(correcao_id={self.correcao_id}, session_id={self.session_id})>"
+
+
+class BancoQuestoes(Base):
+    """
+    Banco de questões endereçado pelo conteúdo (app/services/banco_questoes.py).
+
+    A chave é o sha256 da questão original normalizada. Guarda a análise do
+    Interpretador e as questões aprovadas, cada uma com o item do gabarito mestre,
+    para que um /session/start repetido seja atendido sem chamar o LLM.
+    """
+    __tablename__ = "banco_questoes"
+
+    chave = Column(String(64), primary_key=True)
+
+    # Primeiro texto recebido com esta chave (referência para inspeção)
+    questao_original = Column(Text, nullable=False)
+
+    # Análise do Interpretador e momento em que foi gerada (epoch, para a validade)
+    analise = Column(JSON, nullable=False)
+    analise_em = Column(Float, nullable=False)
+
+    # [{"questao": {...}, "item": {...}, "criada_em": epoch}], mais antigas primeiro
+    variantes = Column(JSON, nullable=False)
+
+    # Sessões atendidas pelo banco
+    usos = Column(Integer, nullable=False, default=0)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<BancoQuestoes(chave={self.chave[:12]}, variantes={len(self.variantes or [])})>"
+
+
+class InterpretacaoCache(Base):
+    """
+    Cache semântico do Agente Interpretador (app/services/cache_interpretacao.py).
+
+    Guarda o embedding da questão original e a análise produzida; questões com
+    embedding suficientemente próximo reaproveitam habilidades, conceitos e ano.
+    Os vetores valem só para o provedor e modelo de embeddings que os gerou.
+    """
+    __tablename__ = "cache_interpretacoes"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    provedor = Column(String(32), nullable=False, index=True)
+    modelo = Column(String(64), nullable=False, index=True)
+
+    texto = Column(Text, nullable=False)
+    vetor = Column(JSON, nullable=False)
+    analise = Column(JSON, nullable=False)
+
+    # Vezes em que a análise foi reaproveitada por outra questão
+    reutilizacoes = Column(Integer, nullable=False, default=0)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<InterpretacaoCache(id={self.id}, provedor={self.provedor}, modelo={self.modelo})>"
+
+
+class UsoLLMSessao(Base):
+    """
+    Uso de LLM acumulado por sessão de estudo (app/services/uso_llm_service.py).
+
+    Os totais ficam em colunas para consultas agregadas (sessões mais caras, cota
+    do provedor); o resumo por agente, os caminhos de fallback e o detalhe de cada
+    chamada ficam em JSON por fase ("start", "submit").
+    """
+    __tablename__ = "uso_llm_sessoes"
+
+    session_id = Column(
+        String(36),
+        ForeignKey("sessoes_estudo.session_id"),
+        primary_key=True,
+    )
+
+    # Totais das fases registradas
+    chamadas = Column(Integer, nullable=False, default=0)
+    tokens_entrada = Column(Integer, nullable=False, default=0)
+    tokens_saida = Column(Integer, nullable=False, default=0)
+    latencia_llm_s = Column(Float, nullable=False, default=0.0)
+
+    # {"start": {...resumo, "detalhes": [chamadas]}, "submit": {...}}
+    fases = Column(JSON, nullable=True)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<UsoLLMSessao(session_id={self.session_id}, chamadas={self.chamadas})>"
@@ -29,6 +29,8 @@ class SessionStartResponse(BaseModel):
     session_id: str = Field(..., description="ID único da sessão")
     lista_de_questoes: List[str] = Field(..., description="Lista de questões geradas (strings)")
     questoes_geradas: List[Dict] = Field(..., description="Lista de questões completas com alternativas")
+    questoes_pendentes: int = Field(0, description="Questões que não couberam no prazo (prazo_s) e serão anexadas à sessão em segundo plano")
+    origem: str = Field("pipeline", description="pipeline (questões geradas pelos agentes) ou banco (questões aprovadas reaproveitadas, sem LLM)")
 
     class Config:
         json_schema_extra = {
@@ -81,6 +83,14 @@ class RelatorioDiagnostico(BaseModel):
         description="Habilidades BNCC que precisam ser revisadas"
     )
     recomendacoes: str = Field(..., description="Recomendações pedagógicas personalizadas")
+    origem_correcao: Optional[str] = Field(
+        None,
+        description="local (alternativas comparadas com o gabarito mestre) ou agente (correção por LLM)"
+    )
+    recomendacoes_status: Optional[str] = Field(
+        None,
+        description="Na correção local: pendente (LLM em segundo plano), concluido (texto do LLM) ou local (texto determinístico)"
+    )
 
 
 class SessionSubmitResponse(BaseModel):
@@ -115,6 +125,50 @@ class SessionSubmitResponse(BaseModel):
         }
 
 
+class RelatorioAluno(BaseModel):
+    """Resultado de um aluno na correção de turma"""
+    aluno: str = Field(..., description="Identificação do aluno (nome, matrícula ou nome do arquivo)")
+    relatorio_diagnostico: Optional[RelatorioDiagnostico] = Field(None, description="Relatório do aluno")
+    erro: Optional[str] = Field(None, description="Mensagem de erro (quando a correção do aluno falhou)")
+
+
+class TurmaSubmitResponse(BaseModel):
+    """Response ao submeter as respostas de uma turma"""
+    correcao_id: str = Field(..., description="ID da correção da turma")
+    session_id: str = Field(..., description="ID da sessão")
+    alunos: List[RelatorioAluno] = Field(..., description="Relatórios individuais, na ordem de envio")
+    resumo_turma: Dict[str, Any] = Field(
+        ...,
+        description="Média, acerto por questão, alternativas escolhidas, habilidades com mais erros e recomendações ao professor"
+    )
+
+
+class JobCriadoResponse(BaseModel):
+    """Response (202) ao criar um job (start ou submit com assincrono=true)"""
+    job_id: str = Field(..., description="ID do job de geração")
+    status: str = Field(..., description="Status inicial do job")
+    status_url: str = Field(..., description="URL para consultar o andamento do job")
+
+
+class JobStatusResponse(BaseModel):
+    """Estado de um job de geração de sessão ou de correção"""
+    job_id: str = Field(..., description="ID do job")
+    tipo: str = Field(..., description="Tipo do job (sessao_start ou correcao)")
+    status: str = Field(..., description="pendente, executando, concluido ou erro")
+    etapa: str = Field(..., description="Etapa atual do pipeline")
+    parciais: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="Resultados parciais (habilidades e questões já aprovadas)"
+    )
+    resultado: Optional[Dict[str, Any]] = Field(
+        None,
+        description="Resultado final quando concluído (SessionStartResponse ou SessionSubmitResponse)"
+    )
+    erro: Optional[str] = Field(None, description="Mensagem de erro (quando falhou)")
+    criado_em: str = Field(..., description="Data de criação (ISO 8601)")
+    atualizado_em: str = Field(..., description="Última atualização (ISO 8601)")
+
+
 # ============================================================================
 # Schemas Internos (Uso interno dos agentes)
 # ============================================================================
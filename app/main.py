@@ -1,12 +1,19 @@
 """
 Aplicação principal FastAPI - KORA
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.core import metrics
 from app.db.database import init_db
 from app.api.v1.api import api_router
+from app.services.llm_scheduler import llm_scheduler
+from app.services.cache import llm_cache, embedding_cache
+from app.services.roteador_fallback import roteador_fallback
+from app.services.cache_interpretacao import cache_interpretacao
 import logging
+import time
 
 # Configuração de logging
 logging.basicConfig(
@@ -62,6 +69,21 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def medir_requisicoes(request: Request, call_next):
+    """Registra contagem e latência de cada requisição por rota (template do path)."""
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        rota = getattr(request.scope.get("route"), "path", None) or "nao_roteada"
+        metrics.http_duracao.observar(time.perf_counter() - t0, metodo=request.method, rota=rota)
+        metrics.http_requisicoes.inc(metodo=request.method, rota=rota, status=status)
+
+
 @app.on_event("startup")
 async def startup_event():
     """Evento executado ao iniciar a aplicação"""
@@ -90,6 +112,7 @@ async def startup_event():
 async def shutdown_event():
     """Evento executado ao encerrar a aplicação"""
     logger.info("Encerrando aplicação...")
+    roteador_fallback.descarregar()
 
 
 @app.get("/")
@@ -102,8 +125,12 @@ async def root():
         "docs": "/docs",
         "endpoints": {
             "start_session": "POST /api/v1/session/start",
+            "start_session_stream": "POST /api/v1/session/start/stream",
+            "start_session_async": "POST /api/v1/session/start?assincrono=true",
+            "get_job_status": "GET /api/v1/session/jobs/{job_id}",
             "submit_answers": "POST /api/v1/session/{session_id}/submit",
-            "get_session": "GET /api/v1/session/{session_id}"
+            "get_session": "GET /api/v1/session/{session_id}",
+            "metrics": "GET /metrics"
         }
     }
 
@@ -114,10 +141,21 @@ async def health_check():
     return {
         "status": "healthy",
         "app": settings.APP_NAME,
-        "version": settings.APP_VERSION
+        "version": settings.APP_VERSION,
+        "llm_scheduler": llm_scheduler.metricas(),
+        "llm_cache": llm_cache.metricas(),
+        "embedding_cache": embedding_cache.metricas(),
+        "roteador_fallback": roteador_fallback.metricas(),
+        "cache_interpretacao": cache_interpretacao.metricas()
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Métricas no formato de exposição do Prometheus"""
+    return PlainTextResponse(metrics.registro.exportar(), media_type="text/plain; version=0.0.4")
+
+
 # Inclui as rotas da API v1
 app.include_router(
     api_router,
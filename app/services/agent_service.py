@@ -1,14 +1,29 @@
 """
 Serviço de Agentes LangChain com Tool Calling
 """
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable
 from pydantic import BaseModel
 from langchain_openai import ChatOpenAI
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.agents import create_agent
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage
 from app.core.config import settings
+from app.core import metrics
 from app.prompts.prompt_loader import prompt_loader
+from app.services.llm_scheduler import llm_scheduler
+from app.services.cache import llm_cache
+from app.services.uso_llm_service import uso_llm_service, ContadorTokens
+from app.services.equivalencia import motor_equivalencia
+from app.services.rag_service import rag_service
+from app.services.roteador_fallback import roteador_fallback
+from app.services.cache_interpretacao import cache_interpretacao
+from app.services.llm_offline import (
+    PROVEDORES_OFFLINE,
+    CasseteChatModel,
+    criar_fake_chat_model,
+    obter_cassete,
+)
 from app.services.tools import (
     INTERPRETADOR_TOOLS,
     CRIADOR_TOOLS,
@@ -23,13 +38,64 @@ import re
 import asyncio
 import uuid
 import random
+import time
+from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
 
+# Callback de progresso: recebe (nome_do_evento, dados) — usado pelo modo streaming
+EventoCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+class Prazo:
+    """
+    Orçamento de latência de uma requisição (modo prazo de POST /session/start).
+
+    Abaixo de settings.PRAZO_FRACAO_DEGRADACAO do orçamento restante o pipeline
+    degrada: não abre novas rodadas do criador, não chama o juiz LLM e usa
+    distratores heurísticos. Ao esgotar, devolve só as questões prontas; as que
+    ainda estavam em andamento ficam em `itens_pendentes` para o chamador concluir.
+    """
+
+    def __init__(self, segundos: float, fracao_degradacao: Optional[float] = None):
+        self.segundos = segundos
+        self.limite = time.monotonic() + segundos
+        self.fracao_degradacao = settings.PRAZO_FRACAO_DEGRADACAO if fracao_degradacao is None else fracao_degradacao
+        self.degradacoes: List[str] = []
+        # (questão aprovada, tarefa que produz o item do gabarito)
+        self.itens_pendentes: List[Tuple[Dict[str, Any], "asyncio.Task"]] = []
+
+    def restante(self) -> float:
+        return max(0.0, self.limite - time.monotonic())
+
+    def esgotado(self) -> bool:
+        return self.restante() <= 0
+
+    def apertado(self) -> bool:
+        return self.restante() < self.segundos * self.fracao_degradacao
+
+    def degradar(self, motivo: str) -> None:
+        """Registra uma degradação aplicada (uma vez por motivo)."""
+        if motivo not in self.degradacoes:
+            self.degradacoes.append(motivo)
+            logger.info(f"Prazo: degradação '{motivo}' ({self.restante():.1f}s restantes de {self.segundos}s)")
+
 
 # =========================
 # Modelos estruturados (Pydantic) para saída JSON
 # =========================
+class HabilidadeIdentificada(BaseModel):
+    codigo_bncc: str
+    habilidade: str
+    ano: str
+    justificativa: str
+
+class AnaliseQuestao(BaseModel):
+    habilidades_identificadas: List[HabilidadeIdentificada]
+    conceitos_principais: List[str]
+    ano_recomendado: str
+    analise_geral: str
+
 class QuestaoMCItem(BaseModel):
     numero: int
     enunciado: str
@@ -85,10 +151,32 @@ class RelatorioDiagnostico(BaseModel):
     pontos_fortes: List[str]
     recomendacoes: str
 
+class RecomendacoesSaida(BaseModel):
+    pontos_fortes: List[str]
+    recomendacoes: str
+
 class Consistencia(BaseModel):
     equivalentes: bool
     justificativa: str
 
+# Nome do agente nas métricas para as chamadas estruturadas auxiliares
+AGENTES_METRICAS = {
+    "resolucao_item": "resolucao",
+    "julgamento": "juiz",
+}
+
+# Schema de saída de cada chamada estruturada (faz parte da chave do cache de LLM)
+SCHEMAS_ESTRUTURADOS = {
+    "interpretador": AnaliseQuestao,
+    "criador": QuestoesMC,
+    "resolucao": GabaritoMestre,
+    "resolucao_item": GabaritoItem,
+    "correcao": RelatorioDiagnostico,
+    "julgamento": Consistencia,
+    "distratores": DistratoresSaida,
+    "recomendacoes": RecomendacoesSaida,
+}
+
 
 class AgentService:
     """
@@ -102,26 +190,11 @@ class AgentService:
     def __init__(self):
         """Inicializa o serviço de agentes"""
         # Seleciona o provedor de LLM
-        if settings.DEFAULT_LLM_PROVIDER == "google":
-            self.llm = ChatGoogleGenerativeAI(
-                model=settings.DEFAULT_MODEL,
-                temperature=settings.TEMPERATURE,
-                max_output_tokens=settings.MAX_TOKENS,
-                google_api_key=settings.GOOGLE_API_KEY,
-                convert_system_message_to_human=True  # Gemini não suporta SystemMessage nativamente
-            )
-            logger.info(f"Usando Google Gemini: {settings.DEFAULT_MODEL}")
-        else:
-            self.llm = ChatOpenAI(
-                model=settings.DEFAULT_MODEL,
-                temperature=settings.TEMPERATURE,
-                max_tokens=settings.MAX_TOKENS,
-                openai_api_key=settings.OPENAI_API_KEY
-            )
-            logger.info(f"Usando OpenAI: {settings.DEFAULT_MODEL}")
+        self.llm = self._criar_llm(settings.DEFAULT_LLM_PROVIDER)
 
         # LLMs estruturados para garantir JSON (evita MAX_TOKENS com pensamento oculto)
         try:
+            self.llm_interpretador_json = self.llm.with_structured_output(AnaliseQuestao, method="json_schema")
             self.llm_criador_json = self.llm.with_structured_output(QuestoesMC, method="json_schema")
             self.llm_resolucao_json = self.llm.with_structured_output(GabaritoMestre, method="json_schema")
             self.llm_item_json = self.llm.with_structured_output(GabaritoItem, method="json_schema")
@@ -129,12 +202,16 @@ class AgentService:
             self.llm_julgamento_json = self.llm.with_structured_output(Consistencia, method="json_schema")
         except Exception as e:
             logger.warning(f"Falha ao configurar structured output: {e}")
+            self.llm_interpretador_json = None
             self.llm_criador_json = None
             self.llm_resolucao_json = None
             self.llm_item_json = None
             self.llm_correcao_json = None
             self.llm_julgamento_json = None
 
+        # Ferramentas de cada agente (fazem parte da chave do cache de LLM)
+        self._ferramentas_agentes: Dict[str, List[str]] = {}
+
         # Carrega os prompts
         self.prompts = {
             'interpretador': prompt_loader.get_agent_prompts('interpretador'),
@@ -143,6 +220,8 @@ class AgentService:
             'correcao': prompt_loader.get_agent_prompts('correcao'),
             'distratores': prompt_loader.get_agent_prompts('distratores')
         }
+        # Modo direto do Interpretador: candidatas do RAG já no prompt, sem ferramentas
+        self.prompts['interpretador']['direto'] = prompt_loader.load_prompt('agente_interpretador_direto_human.txt')
 
         # Inicializa os agentes
         self.agente_interpretador = self._create_agent(
@@ -170,6 +249,39 @@ class AgentService:
             self.llm_distratores_json = self.llm.with_structured_output(DistratoresSaida, method="json_schema")
         except Exception:
             self.llm_distratores_json = None
+        try:
+            self.llm_recomendacoes_json = self.llm.with_structured_output(RecomendacoesSaida, method="json_schema")
+        except Exception:
+            self.llm_recomendacoes_json = None
+
+    def _criar_llm(self, provedor: str) -> Any:
+        """
+        Cria o chat model do provedor: google, openai ou um dos modos offline
+        (fake, record, replay — ver app/services/llm_offline.py).
+        """
+        if provedor == "fake":
+            logger.info("Usando provedor fake (fixtures, sem rede)")
+            return criar_fake_chat_model()
+        if provedor in ("record", "replay"):
+            interno = self._criar_llm(settings.LLM_CASSETE_PROVEDOR) if provedor == "record" else None
+            logger.info(f"Usando cassete de LLM ({provedor}): {settings.LLM_CASSETE_PATH}")
+            return CasseteChatModel(cassete=obter_cassete(), modo=provedor, interno=interno)
+        if provedor == "google":
+            logger.info(f"Usando Google Gemini: {settings.DEFAULT_MODEL}")
+            return ChatGoogleGenerativeAI(
+                model=settings.DEFAULT_MODEL,
+                temperature=settings.TEMPERATURE,
+                max_output_tokens=settings.MAX_TOKENS,
+                google_api_key=settings.GOOGLE_API_KEY,
+                convert_system_message_to_human=True  # Gemini não suporta SystemMessage nativamente
+            )
+        logger.info(f"Usando OpenAI: {settings.DEFAULT_MODEL}")
+        return ChatOpenAI(
+            model=settings.DEFAULT_MODEL,
+            temperature=settings.TEMPERATURE,
+            max_tokens=settings.MAX_TOKENS,
+            openai_api_key=settings.OPENAI_API_KEY
+        )
 
     def _create_agent(self, agent_name: str, tools: List) -> Any:
         """
@@ -196,18 +308,118 @@ class AgentService:
             tools=tools,
             system_prompt=prompts['system'],
             debug=settings.DEBUG,
+            name=agent_name,
         )
 
+        self._ferramentas_agentes[agent_name] = [getattr(t, "name", str(t)) for t in tools]
         logger.info(f"Agente {agent_name} criado com sucesso")
         return agent_graph
 
+    @contextmanager
+    def _instrumentar_llm(self, agente: str, tipo: str, espera_fila_s: float = 0.0, tokens_previstos: int = 0):
+        """
+        Conta e cronometra uma chamada de LLM nas métricas por agente e na
+        contabilidade da sessão. Produz o ContadorTokens a passar como callback;
+        sem usage_metadata do provedor, registra tokens_previstos como estimativa.
+        """
+        rotulo = AGENTES_METRICAS.get(agente, agente)
+        contador = ContadorTokens()
+        resultado: Optional[str] = "ok"
+        t0 = time.perf_counter()
+        try:
+            yield contador
+        except Exception:
+            resultado = "erro"
+            raise
+        except BaseException:
+            resultado = None
+            raise
+        finally:
+            duracao = time.perf_counter() - t0
+            metrics.llm_duracao.observar(duracao, agente=rotulo, tipo=tipo)
+            if resultado is not None:
+                metrics.llm_chamadas.inc(agente=rotulo, tipo=tipo, resultado=resultado)
+                estimado = contador.respostas == 0
+                uso_llm_service.registrar_chamada(
+                    rotulo, tipo, resultado,
+                    tokens_entrada=tokens_previstos if estimado else contador.tokens_entrada,
+                    tokens_saida=contador.tokens_saida,
+                    latencia_s=duracao,
+                    espera_fila_s=espera_fila_s,
+                    tokens_estimados=estimado,
+                )
+
+    def _registrar_acerto_cache(self, agente: str, tipo: str) -> None:
+        rotulo = AGENTES_METRICAS.get(agente, agente)
+        metrics.llm_chamadas.inc(agente=rotulo, tipo=tipo, resultado="cache")
+        uso_llm_service.registrar_chamada(rotulo, tipo, "cache")
+
+    def _registrar_fallback(self, etapa: str, caminho: str) -> None:
+        metrics.fallbacks.inc(etapa=etapa, caminho=caminho)
+        uso_llm_service.registrar_fallback(etapa, caminho)
+
     async def _run_agent(self, agent, human_template: str, variables: Dict[str, Any]) -> Dict[str, Any]:
         """Formata a mensagem humana e executa o agente retornando o estado."""
         prompt = ChatPromptTemplate.from_messages([
             ("human", human_template)
         ])
         messages = prompt.format_messages(**variables)
-        return await agent.ainvoke({"messages": messages})
+        nome = getattr(agent, "name", None) or "agente"
+        sistema = self.prompts.get(nome, {}).get('system', '')
+        texto = sistema + "".join(str(m.content) for m in messages)
+
+        chave = None
+        if llm_cache.habilitado(nome):
+            chave = llm_cache.chave_chamada(
+                nome, texto, schema="ferramentas:" + ",".join(self._ferramentas_agentes.get(nome, []))
+            )
+            em_cache = await llm_cache.obter_async(chave, rotulo=nome)
+            if em_cache is not None:
+                self._registrar_acerto_cache(nome, "grafo")
+                return {"messages": list(messages) + [AIMessage(content=em_cache)]}
+
+        async with llm_scheduler.reservar(nome, llm_scheduler.estimar_tokens(texto)) as reserva:
+            with self._instrumentar_llm(nome, "grafo", reserva.espera_s, len(texto) // 4) as contador:
+                result = await agent.ainvoke({"messages": messages}, config={"callbacks": [contador]})
+            # Agentes com ferramentas fazem várias chamadas ao modelo: registra o uso real
+            respostas = [m for m in result.get("messages", []) if getattr(m, "type", None) == "ai"]
+            tokens = contador.tokens_entrada + contador.tokens_saida if contador.respostas else None
+            reserva.registrar_uso(tokens=tokens, requisicoes=max(1, len(respostas)))
+
+        if chave is not None:
+            saida = self._extract_output_text(result)
+            if saida:
+                await llm_cache.gravar_async(chave, saida, rotulo=nome)
+        return result
+
+    async def _invocar_estruturado(self, agente: str, prompt: ChatPromptTemplate, llm: Any, variaveis: Dict[str, Any]) -> Any:
+        """
+        Executa prompt | llm (saída estruturada) passando pelo escalonador global de LLM.
+
+        Com o cache habilitado para o agente, respostas em cache são devolvidas como dict.
+        """
+        texto = prompt.format(**variaveis)
+
+        chave = None
+        if llm_cache.habilitado(agente):
+            schema = SCHEMAS_ESTRUTURADOS.get(agente)
+            chave = llm_cache.chave_chamada(
+                agente, texto, schema=json.dumps(schema.model_json_schema(), sort_keys=True) if schema else None
+            )
+            em_cache = await llm_cache.obter_async(chave, rotulo=agente)
+            if em_cache is not None:
+                self._registrar_acerto_cache(agente, "estruturado")
+                return em_cache
+
+        async with llm_scheduler.reservar(agente, llm_scheduler.estimar_tokens(texto)) as reserva:
+            with self._instrumentar_llm(agente, "estruturado", reserva.espera_s, len(texto) // 4) as contador:
+                data = await (prompt | llm).ainvoke(variaveis, config={"callbacks": [contador]})
+
+        if chave is not None:
+            payload = data.model_dump() if hasattr(data, "model_dump") else data
+            if isinstance(payload, (dict, list)) and payload:
+                await llm_cache.gravar_async(chave, payload, rotulo=agente)
+        return data
 
     def _extract_output_text(self, result: Dict[str, Any]) -> str:
         """Extrai o texto do último AIMessage não vazio do resultado do agente."""
@@ -276,14 +488,39 @@ class AgentService:
         """
         Agente Interpretador: Analisa questão e identifica habilidades BNCC
 
+        Questões quase idênticas a uma já analisada reaproveitam a análise pelo
+        cache semântico (app/services/cache_interpretacao.py), sem chamar o LLM.
+
         Args:
             questao_texto: Texto da questão original
 
         Returns:
             Dicionário com habilidades identificadas e análise
         """
+        reaproveitada, vetor = await cache_interpretacao.consultar(questao_texto)
+        if reaproveitada is not None:
+            self._registrar_fallback("interpretador", "cache_semantico")
+            cache_interpretacao.auditar(questao_texto, vetor, reaproveitada, self._interpretar)
+            return reaproveitada
+
+        analise = await self._interpretar(questao_texto)
+        if vetor is not None:
+            await cache_interpretacao.guardar(questao_texto, vetor, analise)
+        return analise
+
+    async def _interpretar(self, questao_texto: str) -> Dict[str, Any]:
+        """Executa o Interpretador (modo direto ou agente com ferramentas, conforme INTERPRETADOR_MODO)."""
         logger.info("Executando Agente Interpretador")
 
+        if settings.INTERPRETADOR_MODO == "direto" and self.llm_interpretador_json is not None:
+            try:
+                analise = await self._interpretar_direto(questao_texto)
+                self._registrar_fallback("interpretador", "direto")
+                logger.info("Agente Interpretador concluído (modo direto)")
+                return analise
+            except Exception as e:
+                logger.warning(f"Interpretador direto falhou, usando o agente com ferramentas: {e}")
+
         try:
             result = await self._run_agent(
                 self.agente_interpretador,
@@ -307,6 +544,7 @@ class AgentService:
                     "analise_geral": output
                 }
 
+            self._registrar_fallback("interpretador", "agente")
             logger.info("Agente Interpretador concluído")
             return analise
 
@@ -314,6 +552,29 @@ class AgentService:
             logger.error(f"Erro no Agente Interpretador: {e}")
             raise
 
+    async def _interpretar_direto(self, questao_texto: str) -> Dict[str, Any]:
+        """
+        Interpretador sem o laço de ferramentas: busca as habilidades candidatas no RAG
+        com o texto da questão e faz uma única chamada estruturada.
+        """
+        documentos = await asyncio.to_thread(
+            rag_service.buscar_habilidades, questao_texto, settings.INTERPRETADOR_CANDIDATOS
+        )
+        candidatas = rag_service.formatar_habilidades(documentos)
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", self.prompts['interpretador']['system']),
+            ("human", self.prompts['interpretador']['direto']),
+        ])
+        data = await self._invocar_estruturado("interpretador", prompt, self.llm_interpretador_json, {
+            "questao_texto": questao_texto,
+            "habilidades_candidatas": json.dumps(candidatas, ensure_ascii=False, indent=2) if candidatas
+            else "(nenhuma encontrada; identifique as habilidades pelo seu conhecimento da BNCC)",
+        })
+        analise = data.model_dump() if hasattr(data, "model_dump") else data
+        if not isinstance(analise, dict) or not analise.get("habilidades_identificadas"):
+            raise ValueError("Análise sem habilidades identificadas")
+        return analise
+
     async def criar_questoes(
         self,
         questao_original: str,
@@ -363,7 +624,7 @@ class AgentService:
                     ("human", prompts['human'])
                 ])
                 try:
-                    data = await (prompt | self.llm_criador_json).ainvoke({
+                    data = await self._invocar_estruturado("criador", prompt, self.llm_criador_json, {
                         "questao_original": questao_original,
                         "habilidades_identificadas": habilidades_str,
                         "conceitos_principais": conceitos_str,
@@ -382,8 +643,11 @@ class AgentService:
                 except Exception as e:
                     logger.warning(f"Criador estruturado falhou: {e}")
 
+            caminho = "estruturado"
+
             # 2) Fallback: usar agente com ferramentas e parsear a saida textual
             if not questoes_objs:
+                caminho = "agente"
                 result = await self._run_agent(
                     self.agente_criador,
                     self.prompts['criador']['human'],
@@ -407,6 +671,7 @@ class AgentService:
 
             # 3) Ultimo recurso: converte texto em skeleton
             if not questoes_objs:
+                caminho = "esqueleto"
                 linhas = [
                     line.strip() for line in (output or "").split('\n')
                     if line.strip() and any(c.isdigit() for c in line[:3])
@@ -423,6 +688,8 @@ class AgentService:
                         "habilidades_combinadas": [c.strip() for c in conceitos_str.split(',') if c.strip()][:2] or ["habilidade_1", "habilidade_2"],
                     })
 
+            self._registrar_fallback("criador", caminho)
+
             # Normaliza e garante campos
             norm: List[Dict[str, Any]] = []
             for i, q in enumerate(questoes_objs[:3], start=1):
@@ -459,8 +726,8 @@ class AgentService:
         """
         Agente Resolução: Resolve questões e salva gabarito.
 
-        Resolve de forma independente (sem gabarito de entrada). Usa fallback por item
-        caso o JSON completo falhe.
+        Resolve de forma independente (sem gabarito de entrada). Os caminhos (agente,
+        JSON estruturado, item a item) são tentados na ordem do roteador de fallback.
         """
         logger.info("Executando Agente Resolução")
 
@@ -476,53 +743,39 @@ class AgentService:
                 blocos.append(f"{i}. {_enun(q)}")
             questoes_str = "\n\n".join(blocos)
 
-            # 1) Tenta via agente (com tool calling)
-            result = await self._run_agent(
-                self.agente_resolucao,
-                self.prompts['resolucao']['human'],
-                {
-                    "session_id": session_id,
-                    "questoes": questoes_str
-                }
-            )
-
-            output = self._extract_output_text(result)
-            output = self._maybe_unfence_json(output)
-
-            gabarito: Dict[str, Any] = {}
-
-            # 1a) Parse direto do output do agente
-            if output:
-                try:
-                    parsed = json.loads(output)
-                    if isinstance(parsed, dict) and parsed.get("gabarito"):
-                        gabarito = parsed
-                except json.JSONDecodeError:
-                    pass
+            variaveis = {"session_id": session_id, "questoes": questoes_str}
+            output = ""
 
-            # 2) Fallback estruturado (JSON) se necessário
-            if not gabarito and self.llm_resolucao_json is not None:
-                logger.info("Fallback estruturado: gerando gabarito com JSON schema")
+            # 1) Via agente (com tool calling)
+            async def _via_agente() -> Dict[str, Any]:
+                nonlocal output
+                result = await self._run_agent(self.agente_resolucao, self.prompts['resolucao']['human'], variaveis)
+                output = self._maybe_unfence_json(self._extract_output_text(result))
+                if output:
+                    try:
+                        parsed = json.loads(output)
+                        if isinstance(parsed, dict) and parsed.get("gabarito"):
+                            return parsed
+                    except json.JSONDecodeError:
+                        pass
+                return {}
+
+            # 2) Estruturado (JSON schema)
+            async def _via_estruturado() -> Dict[str, Any]:
+                logger.info("Resolução estruturada: gerando gabarito com JSON schema")
                 prompts = self.prompts['resolucao']
                 prompt = ChatPromptTemplate.from_messages([
                     ("system", prompts['system']),
                     ("human", prompts['human'])
                 ])
-                try:
-                    data = await (prompt | self.llm_resolucao_json).ainvoke({
-                        "session_id": session_id,
-                        "questoes": questoes_str
-                    })
-                    if hasattr(data, "model_dump"):
-                        gabarito = data.model_dump()
-                    elif isinstance(data, dict):
-                        gabarito = data
-                except Exception as e:
-                    logger.warning(f"Falha no fallback estruturado do gabarito: {e}")
-
-            # 2b) Fallback por questão (divide e conquista) para reduzir tokens
-            if not gabarito and getattr(self, "llm_item_json", None) is not None:
-                logger.info("Fallback item a item: resolvendo cada questão separadamente")
+                data = await self._invocar_estruturado("resolucao", prompt, self.llm_resolucao_json, variaveis)
+                if hasattr(data, "model_dump"):
+                    return data.model_dump()
+                return data if isinstance(data, dict) else {}
+
+            # 3) Por questão (divide e conquista) para reduzir tokens
+            async def _via_item_a_item() -> Dict[str, Any]:
+                logger.info("Resolução item a item: resolvendo cada questão separadamente")
                 items: List[Dict[str, Any]] = []
                 prompts = self.prompts['resolucao']
                 item_prompt = ChatPromptTemplate.from_messages([
@@ -539,7 +792,7 @@ class AgentService:
                     try:
                         questao_txt = _enun(q)
 
-                        data = await (item_prompt | self.llm_item_json).ainvoke({
+                        data = await self._invocar_estruturado("resolucao_item", item_prompt, self.llm_item_json, {
                             "numero": idx,
                             "questao": questao_txt,
                         })
@@ -572,10 +825,29 @@ class AgentService:
                         items.append(base)
                     except Exception as e:
                         logger.warning(f"Falha no item {idx} do gabarito: {e}")
-                if items:
-                    gabarito = {"gabarito": items}
+                return {"gabarito": items} if items else {}
+
+            caminhos = {"agente": _via_agente}
+            if self.llm_resolucao_json is not None:
+                caminhos["estruturado"] = _via_estruturado
+            if getattr(self, "llm_item_json", None) is not None:
+                caminhos["item_a_item"] = _via_item_a_item
 
-            # 3) Último recurso: texto livre
+            gabarito: Dict[str, Any] = {}
+            caminho = "texto_livre"
+            for nome in roteador_fallback.ordenar("resolucao", list(caminhos)):
+                with roteador_fallback.tentativa("resolucao", nome) as tentativa:
+                    try:
+                        gabarito = await caminhos[nome]()
+                    except Exception as e:
+                        logger.warning(f"Falha no caminho '{nome}' da resolução: {e}")
+                        gabarito = {}
+                    tentativa.sucesso = bool(gabarito)
+                if gabarito:
+                    caminho = nome
+                    break
+
+            # 4) Último recurso: texto livre
             if not gabarito:
                 gabarito = {
                     "gabarito": [],
@@ -583,6 +855,8 @@ class AgentService:
                     "texto_completo": output or ""
                 }
 
+            self._registrar_fallback("resolucao", caminho)
+
             # 4) Persiste no banco diretamente (independente do LLM/tool)
             try:
                 self._save_gabarito_to_db(session_id, gabarito)
@@ -596,32 +870,6 @@ class AgentService:
             logger.error(f"Erro no Agente Resolução: {e}")
             raise
 
-    def _parse_number(self, s: Any) -> Optional[float]:
-        try:
-            if s is None:
-                return None
-            if isinstance(s, (int, float)):
-                return float(s)
-            txt = str(s).strip()
-            txt = txt.replace("%", "")
-            txt = txt.replace(",", ".")
-            m = re.findall(r"[-+]?[0-9]*\.?[0-9]+", txt)
-            if not m:
-                return None
-            return float(m[0])
-        except Exception:
-            return None
-
-    def _numeric_equiv(self, a: Any, b: Any, tol: float = 1e-2) -> Optional[bool]:
-        va = self._parse_number(a)
-        vb = self._parse_number(b)
-        if va is None or vb is None:
-            return None
-        try:
-            return abs(va - vb) <= tol
-        except Exception:
-            return None
-
     async def _julgar_equivalencia(self, questao: str, resp_a: str, resp_b: str) -> bool:
         try:
             from langchain_core.prompts import ChatPromptTemplate
@@ -634,7 +882,7 @@ class AgentService:
                     "Diga se são equivalentes."
                 )),
             ])
-            data = await (prompt | self.llm_julgamento_json).ainvoke({
+            data = await self._invocar_estruturado("julgamento", prompt, self.llm_julgamento_json, {
                 "questao": questao,
                 "a": str(resp_a),
                 "b": str(resp_b),
@@ -666,7 +914,7 @@ class AgentService:
         try:
             if getattr(self, "llm_item_json", None) is None:
                 raise RuntimeError("llm_item_json indisponível")
-            data = await (item_prompt | self.llm_item_json).ainvoke({
+            data = await self._invocar_estruturado("resolucao_item", item_prompt, self.llm_item_json, {
                 "numero": numero,
                 "questao": questao_txt,
                 "variante": variante,
@@ -700,33 +948,40 @@ class AgentService:
             base["alternativa_correta_letra"] = "A"
         return base
 
-    async def gerar_distratores(self, enunciado: str, resposta_final: str, n: int = 4) -> List[str]:
-        """Gera n distratores plausíveis para a questão, evitando a resposta correta."""
+    async def gerar_distratores(self, enunciado: str, resposta_final: str, n: int = 4, usar_llm: bool = True) -> List[str]:
+        """
+        Gera n distratores plausíveis para a questão, evitando a resposta correta.
+
+        Com usar_llm=False (modo prazo apertado), vai direto para a heurística.
+        """
         candidatos: List[str] = []
-        try:
-            # 1) Tenta via agente (texto -> JSON)
-            result = await self._run_agent(
-                self.agente_distratores,
-                self.prompts['distratores']['human'],
-                {
-                    "enunciado": enunciado,
-                    "resposta_correta": str(resposta_final),
-                    "n": n,
-                }
-            )
-            output = self._extract_output_text(result)
-            output = self._maybe_unfence_json(output)
+        caminho = "agente"
+        if usar_llm:
             try:
-                parsed = json.loads(output)
-                if isinstance(parsed, dict) and isinstance(parsed.get("distratores"), list):
-                    candidatos = [str(x).strip() for x in parsed["distratores"] if str(x).strip()]
+                # 1) Tenta via agente (texto -> JSON)
+                result = await self._run_agent(
+                    self.agente_distratores,
+                    self.prompts['distratores']['human'],
+                    {
+                        "enunciado": enunciado,
+                        "resposta_correta": str(resposta_final),
+                        "n": n,
+                    }
+                )
+                output = self._extract_output_text(result)
+                output = self._maybe_unfence_json(output)
+                try:
+                    parsed = json.loads(output)
+                    if isinstance(parsed, dict) and isinstance(parsed.get("distratores"), list):
+                        candidatos = [str(x).strip() for x in parsed["distratores"] if str(x).strip()]
+                except Exception:
+                    pass
             except Exception:
                 pass
-        except Exception:
-            pass
 
         # 2) Fallback estruturado (JSON schema)
-        if not candidatos and getattr(self, "llm_distratores_json", None) is not None:
+        if usar_llm and not candidatos and getattr(self, "llm_distratores_json", None) is not None:
+            caminho = "estruturado"
             from langchain_core.prompts import ChatPromptTemplate
             prompts = self.prompts['distratores']
             prompt = ChatPromptTemplate.from_messages([
@@ -734,7 +989,7 @@ class AgentService:
                 ("human", prompts['human'])
             ])
             try:
-                data = await (prompt | self.llm_distratores_json).ainvoke({
+                data = await self._invocar_estruturado("distratores", prompt, self.llm_distratores_json, {
                     "enunciado": enunciado,
                     "resposta_correta": str(resposta_final),
                     "n": n,
@@ -761,6 +1016,7 @@ class AgentService:
             return cleaned if cleaned else ""
 
         if len(candidatos) < n:
+            caminho = "heuristica"
             base_n = _num(resposta_final)
             extras: List[str] = []
             if base_n is not None:
@@ -790,6 +1046,8 @@ class AgentService:
                 if str(e).strip() and str(e).strip().lower() != str(resposta_final).strip().lower():
                     candidatos.append(str(e).strip())
 
+        self._registrar_fallback("distratores", caminho)
+
         # Dedup e corta
         seen = set()
         out = []
@@ -818,8 +1076,9 @@ class AgentService:
             dedup.append(f"opção {len(dedup)+1}")
         # Limita a 5: 1 correta + 4 distratores
         dedup = dedup[:5]
-        # Embaralha
-        random.shuffle(dedup)
+        # Embaralha (nos provedores offline, com semente derivada do conteúdo para execuções reprodutíveis)
+        rng = random.Random("|".join(dedup)) if settings.DEFAULT_LLM_PROVIDER in PROVEDORES_OFFLINE else random
+        rng.shuffle(dedup)
         letras = ["A","B","C","D","E"]
         alt_map = {letras[i]: dedup[i] for i in range(5)}
         # Encontra a letra correta
@@ -830,6 +1089,62 @@ class AgentService:
             letra_certa = "A"
         return alt_map, letra_certa
 
+    async def _completar_alternativas_item(
+        self,
+        idx: int,
+        questao: Optional[Dict[str, Any]],
+        item: Dict[str, Any],
+        tempos: Optional[Dict[str, Any]] = None,
+        usar_llm: bool = True,
+    ) -> None:
+        """Garante 5 alternativas (A–E) embaralhadas em um item do gabarito e as replica na questão.
+
+        Se `tempos` for informado, registra a duração das etapas de distratores e embaralhamento.
+        Com usar_llm=False, os distratores vêm só da heurística.
+        """
+        alt_map = item.get("alternativas") or {}
+        tem_5 = isinstance(alt_map, dict) and len(alt_map.keys()) >= 5
+        resp_correta = item.get("resposta_final", "")
+        logger.info(f"Questão {idx+1}: tem_5={tem_5}, resposta_correta='{resp_correta}'")
+
+        if not resp_correta:
+            logger.warning(f"Questão {idx+1}: sem resposta_final, pulando")
+            return
+
+        if not tem_5:
+            # Gera distratores
+            enun = (questao or {}).get("enunciado") or item.get("questao", "")
+
+            logger.info(f"Questão {idx+1}: gerando 4 distratores para '{resp_correta}'")
+            t0 = time.perf_counter()
+            distr = await self.gerar_distratores(enun or "", resp_correta, n=4, usar_llm=usar_llm)
+            if tempos is not None:
+                tempos["distratores_s"] = round(time.perf_counter() - t0, 3)
+            logger.info(f"Questão {idx+1}: distratores gerados: {distr}")
+
+            t0 = time.perf_counter()
+            alt_map, letra = self._embaralhar_alternativas(resp_correta, distr)
+            if tempos is not None:
+                tempos["embaralhamento_s"] = round(time.perf_counter() - t0, 3)
+            logger.info(f"Questão {idx+1}: alternativas embaralhadas, correta={letra}")
+
+            item["alternativas"] = alt_map
+            item["alternativa_correta_letra"] = letra
+        else:
+            # Já existe, apenas normaliza letra
+            letra = item.get("alternativa_correta_letra")
+            if str(letra).upper() not in ["A","B","C","D","E"]:
+                # tenta inferir
+                alvo = str(resp_correta).strip().lower()
+                letra = next((L for L, v in alt_map.items() if str(v).strip().lower() == alvo), "A")
+                item["alternativa_correta_letra"] = letra
+
+        # ADICIONA alternativas à questão correspondente
+        if questao is not None:
+            questao["alternativas"] = alt_map
+            questao["alternativa_correta_letra"] = letra
+            logger.info(f"Questão {idx+1}: alternativas adicionadas à questão")
+
     async def _completar_e_embaralhar_alternativas(self, questoes: List[Dict[str, Any]], gabarito: Dict[str, Any]) -> Dict[str, Any]:
         """Garante que cada item do gabarito tenha 5 alternativas (A–E) com a correta embaralhada.
         TAMBÉM adiciona as alternativas às questões para o Streamlit."""
@@ -842,52 +1157,8 @@ class AgentService:
 
         for idx, item in enumerate(itens):
             try:
-                alt_map = item.get("alternativas") or {}
-                tem_5 = isinstance(alt_map, dict) and len(alt_map.keys()) >= 5
-                resp_correta = item.get("resposta_final", "")
-                logger.info(f"Questão {idx+1}: tem_5={tem_5}, resposta_correta='{resp_correta}'")
-
-                if not resp_correta:
-                    logger.warning(f"Questão {idx+1}: sem resposta_final, pulando")
-                    continue
-
-                if not tem_5:
-                    # Gera distratores
-                    enun = None
-                    if idx < len(questoes):
-                        enun = (questoes[idx] or {}).get("enunciado")
-                    if not enun:
-                        enun = item.get("questao", "")
-
-                    logger.info(f"Questão {idx+1}: gerando 4 distratores para '{resp_correta}'")
-                    distr = await self.gerar_distratores(enun or "", resp_correta, n=4)
-                    logger.info(f"Questão {idx+1}: distratores gerados: {distr}")
-
-                    alt_map, letra = self._embaralhar_alternativas(resp_correta, distr)
-                    logger.info(f"Questão {idx+1}: alternativas embaralhadas, correta={letra}")
-
-                    item["alternativas"] = alt_map
-                    item["alternativa_correta_letra"] = letra
-
-                    # ADICIONA alternativas à questão correspondente
-                    if idx < len(questoes):
-                        questoes[idx]["alternativas"] = alt_map
-                        questoes[idx]["alternativa_correta_letra"] = letra
-                        logger.info(f"Questão {idx+1}: alternativas adicionadas à questão")
-                else:
-                    # Já existe, apenas normaliza letra
-                    letra = item.get("alternativa_correta_letra")
-                    if str(letra).upper() not in ["A","B","C","D","E"]:
-                        # tenta inferir
-                        alvo = str(resp_correta).strip().lower()
-                        letra = next((L for L, v in alt_map.items() if str(v).strip().lower() == alvo), "A")
-                        item["alternativa_correta_letra"] = letra
-
-                    # ADICIONA alternativas à questão correspondente
-                    if idx < len(questoes):
-                        questoes[idx]["alternativas"] = alt_map
-                        questoes[idx]["alternativa_correta_letra"] = letra
-                        logger.info(f"Questão {idx+1}: alternativas já existentes adicionadas à questão")
+                questao = questoes[idx] if idx < len(questoes) else None
+                await self._completar_alternativas_item(idx, questao, item)
             except Exception as e:
                 logger.warning(f"Falha ao completar alternativas do item {idx+1}: {e}")
                 import traceback
@@ -896,8 +1167,164 @@ class AgentService:
         logger.info("Completamento de alternativas finalizado")
         return gabarito
 
+    def _item_gabarito_completo(self, item: Optional[Dict[str, Any]]) -> bool:
+        """Verifica se um item resolvido pode ser usado diretamente no gabarito mestre."""
+        if not isinstance(item, dict):
+            return False
+        passos = item.get("passos_resolucao")
+        return bool(str(item.get("resposta_final") or "").strip()) and isinstance(passos, list) and bool(passos)
+
+    async def _processar_aprovada(
+        self,
+        questao: Dict[str, Any],
+        item_validado: Optional[Dict[str, Any]],
+        limites: Dict[str, asyncio.Semaphore],
+        tempos: Dict[str, Any],
+        t_inicio: float,
+        on_evento: Optional[EventoCallback] = None,
+        prazo: Optional[Prazo] = None,
+    ) -> Dict[str, Any]:
+        """
+        Leva uma questão aprovada pelas etapas seguintes do pipeline, sem esperar as demais:
+        gabarito → distratores → embaralhamento. Retorna o item do gabarito mestre.
+
+        O item resolvido durante a validação é reaproveitado como gabarito; a questão só é
+        resolvida de novo (resolver_questoes) quando esse item estiver incompleto. Com o
+        prazo apertado, os distratores vêm da heurística.
+        """
+        numero = questao["numero"]
+        enun = questao.get("enunciado", "")
+        item: Dict[str, Any] = {}
+
+        # Etapa 1: gabarito do item
+        t0 = time.perf_counter()
+        if self._item_gabarito_completo(item_validado):
+            item = dict(item_validado)
+            # A letra do resolvedor não corresponde a nenhuma alternativa ainda
+            if not item.get("alternativas"):
+                item["alternativa_correta_letra"] = None
+            tempos["gabarito_origem"] = "validacao"
+        else:
+            tempos["gabarito_origem"] = "resolucao"
+            logger.info(f"Questão {numero}: item da validação incompleto, resolvendo novamente")
+            try:
+                async with limites["gabarito"]:
+                    gb = await self.resolver_questoes(session_id=str(uuid.uuid4()), questoes=[questao])
+                itens = gb.get("gabarito") if isinstance(gb, dict) else None
+                if isinstance(itens, list) and itens and isinstance(itens[0], dict):
+                    item = dict(itens[0])
+            except Exception as e:
+                logger.warning(f"Falha ao gerar gabarito da questão {numero}: {e}")
+        tempos["gabarito_s"] = round(time.perf_counter() - t0, 3)
+        if not item:
+            item = {
+                "questao": enun,
+                "resposta_final": "",
+                "passos_resolucao": [],
+                "conceitos_aplicados": [],
+                "erros_comuns": [],
+                "criterios_correcao": "",
+                "alternativas": {},
+            }
+        item["numero_questao"] = numero
+
+        # Etapas 2 e 3: distratores e embaralhamento
+        try:
+            async with limites["distratores"]:
+                usar_llm = prazo is None or not prazo.apertado()
+                if not usar_llm:
+                    prazo.degradar("distratores_heuristicos")
+                await self._completar_alternativas_item(numero - 1, questao, item, tempos=tempos, usar_llm=usar_llm)
+        except Exception as e:
+            logger.warning(f"Falha ao completar alternativas do item {numero}: {e}")
+
+        tempos["concluida_em_s"] = round(time.perf_counter() - t_inicio, 3)
+        logger.info(f"Pipeline da questão {numero} concluído: {tempos}")
+        if on_evento is not None:
+            try:
+                await on_evento("questao", dict(questao))
+            except Exception as e:
+                logger.warning(f"Falha ao notificar questão {numero}: {e}")
+        return item
+
+    async def _comparar_respostas(self, enun: str, resp_a: Any, resp_b: Any, prazo: Optional[Prazo] = None) -> bool:
+        """
+        Equivalência de duas respostas: motor local primeiro; o juiz LLM só é chamado
+        quando o motor fica indeciso. Com o prazo apertado, indecisão conta como diferença.
+        """
+        local, caminho = motor_equivalencia.comparar(resp_a, resp_b)
+        if local is not None:
+            logger.info(f"  {'✓' if local else '✗'} Validação local ({caminho}): {resp_a} × {resp_b}")
+            return local
+        if prazo is not None and prazo.apertado():
+            prazo.degradar("sem_juiz_llm")
+            metrics.equivalencia.inc(caminho="degradado", resultado="diferente")
+            return False
+        logger.info(f"  Motor local indeciso, tentando validação semântica (LLM)...")
+        consistente = await self._julgar_equivalencia(enun, resp_a, resp_b)
+        metrics.equivalencia.inc(caminho="llm", resultado=motor_equivalencia.rotulo(consistente))
+        logger.info(f"  Validação semântica: {consistente}")
+        return consistente
+
+    async def _validar_candidata(self, q: Dict[str, Any], prazo: Optional[Prazo] = None) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Valida a solvabilidade de uma questão candidata do criador.
 
+        Compara a solução independente com o gabarito do criador (sem expô-lo ao resolvedor)
+        ou, se o criador não forneceu gabarito, compara duas resoluções independentes (A vs B)
+        executadas simultaneamente. As respostas são comparadas pelo motor local de
+        equivalência (app/services/equivalencia.py); o juiz LLM só decide o que ele não decidir.
 
+        Returns:
+            (consistente, item do resolvedor) — o item é reaproveitado como gabarito mestre
+        """
+        enun = str(q.get("enunciado", "")).strip()
+        numero = q.get("numero", 1)
+        logger.info(f"Validando questão {numero}: {enun[:80]}...")
+
+        # Preferencia: comparar solucao independente com o gabarito do criador (sem expor ao resolvedor)
+        resposta_criador = str(q.get("resposta_correta_criador") or q.get("resposta_correta") or "").strip()
+        consistente = False
+        item_validado: Optional[Dict[str, Any]] = None
+
+        if resposta_criador:
+            logger.info(f"  Criador forneceu gabarito: {resposta_criador}")
+            item_s = await self._resolver_item_independente(numero, enun, variante="S")
+            item_validado = item_s
+            resp_solver = item_s.get("resposta_final", "")
+            logger.info(f"  Solver resolveu: {resp_solver}")
+
+            consistente = await self._comparar_respostas(enun, resposta_criador, resp_solver, prazo)
+        else:
+            logger.info(f"  Criador NÃO forneceu gabarito, usando dupla resolução independente")
+            # Fallback: dupla resolucao independente A vs B (em paralelo)
+            item_a, item_b = await asyncio.gather(
+                self._resolver_item_independente(numero, enun, variante="A"),
+                self._resolver_item_independente(numero, enun, variante="B"),
+            )
+            item_validado = item_a
+            # 1) Letras iguais
+            letra_a = (item_a.get("alternativa_correta_letra") or "").upper()
+            letra_b = (item_b.get("alternativa_correta_letra") or "").upper()
+            logger.info(f"  Solver A: letra={letra_a}, resposta={item_a.get('resposta_final', '')}")
+            logger.info(f"  Solver B: letra={letra_b}, resposta={item_b.get('resposta_final', '')}")
+
+            if letra_a in ["A","B","C","D","E"] and letra_a == letra_b:
+                logger.info(f"  ✓ Letras iguais: {letra_a}")
+                consistente = True
+            else:
+                # 2) Motor local de equivalência e, se indeciso, juiz LLM
+                consistente = await self._comparar_respostas(
+                    enun, item_a.get("resposta_final", ""), item_b.get("resposta_final", ""), prazo
+                )
+
+        if consistente:
+            metrics.validacoes.inc(resultado="aprovada")
+            logger.info(f"  ✓✓ Questão {numero} APROVADA")
+        else:
+            metrics.validacoes.inc(resultado="rejeitada")
+            logger.warning(f"  ✗✗ Questão {numero} REJEITADA (validação falhou)")
+        return consistente, item_validado
 
     async def gerar_questoes_validadas(
         self,
@@ -907,107 +1334,417 @@ class AgentService:
         ano_escolar: str,
         alvo: int = 3,
         max_tentativas: int = 3,
+        on_evento: Optional[EventoCallback] = None,
+        prazo: Optional[Prazo] = None,
     ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
         """
         Gera questões (criador) com gabarito do criador (oculto ao resolvedor), valida solvabilidade
         comparando a resposta do Agente de Resolução (independente) com a resposta do criador
         usando equivalência numérica/semântica. Se o criador não fornecer gabarito, cai no
         fallback de dupla resolução independente. Retorna até `alvo` questões aprovadas + gabarito mestre.
+
+        As candidatas de cada rodada são validadas em paralelo (limite em
+        settings.VALIDACAO_CONCORRENCIA) e as validações pendentes são canceladas
+        assim que `alvo` questões forem aprovadas. As aprovadas mantêm a ordem das
+        candidatas (uma validação rápida espera as anteriores da rodada antes de ser
+        numerada), como na validação sequencial. Cada questão aprovada segue na hora
+        para gabarito → distratores → embaralhamento (limites em settings.PIPELINE_CONCORRENCIA_*),
+        e os tempos por item ficam em gabarito["tempos_pipeline"]. O gabarito de cada item é a
+        própria resolução feita na validação; só há nova resolução quando ela vier incompleta.
+
+        Se `on_evento` for informado, cada questão concluída (com alternativas) é enviada como
+        evento "questao" assim que fica pronta.
+
+        Com `prazo`, o pipeline degrada quando o orçamento aperta (ver Prazo) e, ao esgotar,
+        retorna só as questões prontas (menos que `alvo`, renumeradas); as aprovadas ainda em
+        andamento ficam em prazo.itens_pendentes e não emitem mais eventos.
         """
         aprovadas: List[Dict[str, Any]] = []
         tentativa = 0
-        while len(aprovadas) < alvo and tentativa < max_tentativas:
-            tentativa += 1
-            batch = await self.criar_questoes(
-                questao_original=questao_original,
-                habilidades_identificadas=habilidades_identificadas,
-                conceitos_principais=conceitos_principais,
-                ano_escolar=ano_escolar,
-            )
-            for q in batch:
-                if len(aprovadas) >= alvo:
+        t_inicio = time.perf_counter()
+        duracao_rodada = 0.0
+        encerrado = False
+        if prazo is not None and on_evento is not None:
+            on_evento_original = on_evento
+
+            async def on_evento(evento: str, dados: Dict[str, Any]) -> None:
+                # Itens concluídos depois do prazo são entregues pelo preenchimento em segundo plano
+                if not encerrado:
+                    await on_evento_original(evento, dados)
+        limite = asyncio.Semaphore(max(1, settings.VALIDACAO_CONCORRENCIA))
+        limites_etapas = {
+            "gabarito": asyncio.Semaphore(max(1, settings.PIPELINE_CONCORRENCIA_GABARITO)),
+            "distratores": asyncio.Semaphore(max(1, settings.PIPELINE_CONCORRENCIA_DISTRATORES)),
+        }
+        # Cada questão aprovada segue imediatamente para as etapas seguintes
+        tarefas_itens: List[asyncio.Task] = []
+        tempos_itens: List[Dict[str, Any]] = []
+
+        async def _validar_limitado(q: Dict[str, Any]) -> Tuple[bool, Optional[Dict[str, Any]], float]:
+            async with limite:
+                t0 = time.perf_counter()
+                consistente, item_validado = await self._validar_candidata(q, prazo=prazo)
+                return consistente, item_validado, round(time.perf_counter() - t0, 3)
+
+        def _aprovar(q: Dict[str, Any], item_validado: Optional[Dict[str, Any]], duracao: float) -> None:
+            """Numera a candidata aprovada e dispara gabarito → distratores → embaralhamento."""
+            questao = {
+                "numero": len(aprovadas) + 1,
+                "enunciado": str(q.get("enunciado", "")).strip(),
+                "habilidades_combinadas": q.get("habilidades_combinadas", [])[:3],
+            }
+            aprovadas.append(questao)
+            tempos = {
+                "numero": questao["numero"],
+                "rodada": tentativa,
+                "validacao_s": duracao,
+                "aprovada_em_s": round(time.perf_counter() - t_inicio, 3),
+            }
+            tempos_itens.append(tempos)
+            tarefas_itens.append(asyncio.create_task(
+                self._processar_aprovada(
+                    questao, item_validado, limites_etapas, tempos, t_inicio, on_evento, prazo=prazo
+                )
+            ))
+
+        try:
+            while len(aprovadas) < alvo and tentativa < max_tentativas:
+                if prazo is not None and (prazo.esgotado() or (tentativa > 0 and (prazo.apertado() or prazo.restante() < duracao_rodada))):
+                    prazo.degradar("sem_novas_rodadas")
                     break
-                enun = str(q.get("enunciado", "")).strip()
-                if not enun:
-                    logger.warning(f"Questão {q.get('numero', '?')} sem enunciado, pulando")
-                    continue
-
-                logger.info(f"Validando questão {q.get('numero', '?')}: {enun[:80]}...")
-
-                # Preferencia: comparar solucao independente com o gabarito do criador (sem expor ao resolvedor)
-                resposta_criador = str(q.get("resposta_correta_criador") or q.get("resposta_correta") or "").strip()
-                consistente = False
-
-                if resposta_criador:
-                    logger.info(f"  Criador forneceu gabarito: {resposta_criador}")
-                    item_s = await self._resolver_item_independente(q.get("numero", len(aprovadas)+1), enun, variante="S")
-                    resp_solver = item_s.get("resposta_final", "")
-                    logger.info(f"  Solver resolveu: {resp_solver}")
-
-                    num_eq = self._numeric_equiv(resposta_criador, resp_solver)
-                    if num_eq is True:
-                        logger.info(f"  ✓ Validação numérica OK")
-                        consistente = True
-                    elif num_eq is False:
-                        logger.warning(f"  ✗ Validação numérica falhou: {resposta_criador} ≠ {resp_solver}")
-                        consistente = False
-                    else:
-                        # Julgamento semantico/algebrico
-                        logger.info(f"  Tentando validação semântica...")
-                        consistente = await self._julgar_equivalencia(enun, resposta_criador, resp_solver)
-                        logger.info(f"  Validação semântica: {consistente}")
-                else:
-                    logger.info(f"  Criador NÃO forneceu gabarito, usando dupla resolução independente")
-                    # Fallback: dupla resolucao independente A vs B
-                    item_a = await self._resolver_item_independente(q.get("numero", len(aprovadas)+1), enun, variante="A")
-                    item_b = await self._resolver_item_independente(q.get("numero", len(aprovadas)+1), enun, variante="B")
-                    # 1) Letras iguais
-                    letra_a = (item_a.get("alternativa_correta_letra") or "").upper()
-                    letra_b = (item_b.get("alternativa_correta_letra") or "").upper()
-                    logger.info(f"  Solver A: letra={letra_a}, resposta={item_a.get('resposta_final', '')}")
-                    logger.info(f"  Solver B: letra={letra_b}, resposta={item_b.get('resposta_final', '')}")
-
-                    if letra_a in ["A","B","C","D","E"] and letra_a == letra_b:
-                        logger.info(f"  ✓ Letras iguais: {letra_a}")
-                        consistente = True
-                    else:
-                        # 2) Numerica
-                        num_eq = self._numeric_equiv(item_a.get("resposta_final"), item_b.get("resposta_final"))
-                        if num_eq is True:
-                            logger.info(f"  ✓ Validação numérica OK")
-                            consistente = True
-                        elif num_eq is False:
-                            logger.warning(f"  ✗ Validação numérica falhou")
-                            consistente = False
-                        else:
-                            # 3) Julgamento via LLM
-                            logger.info(f"  Tentando validação semântica...")
-                            consistente = await self._julgar_equivalencia(enun, item_a.get("resposta_final", ""), item_b.get("resposta_final", ""))
-                            logger.info(f"  Validação semântica: {consistente}")
-
-                if consistente:
-                    logger.info(f"  ✓✓ Questão APROVADA")
-                    aprovadas.append({
-                        "numero": len(aprovadas) + 1,
-                        "enunciado": enun,
-                        "habilidades_combinadas": q.get("habilidades_combinadas", [])[:3],
-                    })
-                else:
-                    logger.warning(f"  ✗✗ Questão REJEITADA (validação falhou)")
+                tentativa += 1
+                t_rodada = time.perf_counter()
+                batch = await self.criar_questoes(
+                    questao_original=questao_original,
+                    habilidades_identificadas=habilidades_identificadas,
+                    conceitos_principais=conceitos_principais,
+                    ano_escolar=ano_escolar,
+                )
+                tarefas: Dict[asyncio.Task, Dict[str, Any]] = {}
+                for q in batch:
+                    if not str(q.get("enunciado", "")).strip():
+                        logger.warning(f"Questão {q.get('numero', '?')} sem enunciado, pulando")
+                        continue
+                    tarefas[asyncio.create_task(_validar_limitado(q))] = q
+
+                # Valida todas as candidatas em paralelo; cancela o restante ao atingir o alvo.
+                # As aprovações seguem a ordem das candidatas: cada resultado só é aceito
+                # depois que as candidatas anteriores da rodada terminaram.
+                ordem = list(tarefas)
+                resultados: Dict[asyncio.Task, Tuple[bool, Optional[Dict[str, Any]], float]] = {}
+                proxima = 0
+                pendentes = set(tarefas)
+                try:
+                    while pendentes and len(aprovadas) < alvo:
+                        if prazo is not None and prazo.esgotado():
+                            prazo.degradar("validacoes_interrompidas")
+                            break
+                        concluidas, pendentes = await asyncio.wait(
+                            pendentes,
+                            timeout=prazo.restante() if prazo is not None else None,
+                            return_when=asyncio.FIRST_COMPLETED,
+                        )
+                        for t in concluidas:
+                            try:
+                                resultados[t] = t.result()
+                            except Exception as e:
+                                metrics.validacoes.inc(resultado="erro")
+                                logger.warning(f"Falha ao validar questão {tarefas[t].get('numero', '?')}: {e}")
+                                resultados[t] = (False, None, 0.0)
+                        while proxima < len(ordem) and ordem[proxima] in resultados and len(aprovadas) < alvo:
+                            t = ordem[proxima]
+                            proxima += 1
+                            if resultados[t][0]:
+                                _aprovar(tarefas[t], *resultados[t][1:])
+                    if pendentes and len(aprovadas) < alvo:
+                        # Prazo esgotado: as já validadas entram na ordem, pulando as pendentes
+                        for t in ordem[proxima:]:
+                            if t in resultados and resultados[t][0] and len(aprovadas) < alvo:
+                                _aprovar(tarefas[t], *resultados[t][1:])
+                finally:
+                    for t in pendentes:
+                        t.cancel()
+                    if pendentes:
+                        logger.info(f"Alvo atingido: cancelando {len(pendentes)} validações pendentes")
+                        await asyncio.gather(*pendentes, return_exceptions=True)
+
+                duracao_rodada = time.perf_counter() - t_rodada
+                # Evita loop apertado
+                if len(aprovadas) < alvo:
+                    await asyncio.sleep(0)
+
+            # Aguarda as questões aprovadas terminarem gabarito, distratores e embaralhamento
+            if prazo is None:
+                itens = await asyncio.gather(*tarefas_itens) if tarefas_itens else []
+            else:
+                if tarefas_itens:
+                    await asyncio.wait(tarefas_itens, timeout=prazo.restante())
+                encerrado = True
+                prontas: List[Dict[str, Any]] = []
+                itens = []
+                for questao, t in zip(aprovadas, tarefas_itens):
+                    if t.done() and not t.cancelled() and t.exception() is None:
+                        prontas.append(questao)
+                        itens.append(t.result())
+                    elif not t.done():
+                        prazo.itens_pendentes.append((questao, t))
+                if len(prontas) < len(aprovadas):
+                    prazo.degradar("questoes_em_segundo_plano")
+                for n, (questao, item) in enumerate(zip(prontas, itens), start=1):
+                    questao["numero"] = n
+                    item["numero_questao"] = n
+                aprovadas = prontas
+        except BaseException:
+            # Cancelamento/erro: não deixa etapas de itens aprovados rodando órfãs
+            for t in tarefas_itens:
+                t.cancel()
+            raise
 
-            # Evita loop apertado
-            if len(aprovadas) < alvo:
-                await asyncio.sleep(0)
+        gabarito: Dict[str, Any] = {"gabarito": list(itens)}
 
-        # Gera gabarito mestre final para aprovadas
-        gabarito = await self.resolver_questoes(session_id=str(uuid.uuid4()), questoes=aprovadas)
-        # Completa alternativas (distratores) e embaralha
-        try:
-            gabarito = await self._completar_e_embaralhar_alternativas(aprovadas, gabarito)
-        except Exception as e:
-            logger.warning(f"Falha ao completar alternativas: {e}")
+        total_s = round(time.perf_counter() - t_inicio, 3)
+        critico = max(tempos_itens, key=lambda t: t.get("concluida_em_s", 0.0), default=None)
+        gabarito["tempos_pipeline"] = {
+            "total_s": total_s,
+            "rodadas": tentativa,
+            "caminho_critico": critico.get("numero") if critico else None,
+            "itens": tempos_itens,
+        }
+        if prazo is not None:
+            gabarito["tempos_pipeline"]["prazo"] = {
+                "prazo_s": prazo.segundos,
+                "degradacoes": list(prazo.degradacoes),
+                "itens_pendentes": len(prazo.itens_pendentes),
+            }
+        logger.info(
+            f"Pipeline concluído em {total_s}s ({len(aprovadas)} aprovadas, {tentativa} rodadas); "
+            f"caminho crítico: questão {gabarito['tempos_pipeline']['caminho_critico']}"
+        )
         return aprovadas, gabarito
 
+    def preparar_correcao_alternativas(
+        self,
+        lista_questoes: List[Dict[str, Any]],
+        gabarito_mestre: Dict[str, Any],
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Monta, uma vez por sessão, o que a correção por alternativa precisa
+
+        Para cada questão: letra correta, alternativas, habilidades e o feedback de
+        cada alternativa possível (inclusive em branco), vindo dos erros comuns e
+        passos de resolução já gravados. Uma turma inteira reaproveita o resultado.
+
+        Args:
+            lista_questoes: Questões da sessão (numero, enunciado, habilidades_combinadas)
+            gabarito_mestre: Gabarito mestre da sessão
+
+        Returns:
+            Questões preparadas, ou None se alguma não tiver a alternativa correta no gabarito
+        """
+        itens: Dict[int, Dict[str, Any]] = {}
+        for item in (gabarito_mestre or {}).get("gabarito") or []:
+            try:
+                itens[int(item.get("numero_questao"))] = item
+            except (TypeError, ValueError):
+                continue
+
+        questoes = sorted(
+            (q for q in lista_questoes or [] if isinstance(q, dict)),
+            key=lambda q: q.get("numero", 0),
+        )
+        if not questoes:
+            return None
+
+        preparadas: List[Dict[str, Any]] = []
+        for q in questoes:
+            numero = q.get("numero")
+            item = itens.get(numero)
+            correta = str((item or {}).get("alternativa_correta_letra") or "").strip().upper()
+            if not re.fullmatch(r"[A-E]", correta):
+                return None
+            alternativas = item.get("alternativas") or q.get("alternativas") or {}
+            conceitos = item.get("conceitos_aplicados") or []
+            erros = item.get("erros_comuns") or []
+            passos = item.get("passos_resolucao") or []
+
+            dica = f" A resposta correta é {correta}) {alternativas.get(correta, item.get('resposta_final', ''))}."
+            if erros:
+                dica += f" Atenção a um erro comum: {erros[0]}."
+            if passos:
+                dica += f" Comece por: {passos[0]}"
+            feedback = {letra: "Incorreto." + dica for letra in "ABCDE"}
+            feedback[""] = "Questão não respondida." + dica
+            feedback[correta] = "Correto!" + (f" Você aplicou: {', '.join(conceitos)}." if conceitos else "")
+
+            preparadas.append({
+                "numero": numero,
+                "enunciado": q.get("enunciado", ""),
+                "habilidades": list(q.get("habilidades_combinadas") or []),
+                "conceitos": conceitos,
+                "correta": correta,
+                "alternativas": alternativas,
+                "feedback": feedback,
+            })
+        return preparadas
+
+    def corrigir_alternativas(
+        self,
+        lista_questoes: List[Dict[str, Any]],
+        gabarito_mestre: Dict[str, Any],
+        respostas: Dict[str, Any],
+        preparadas: Optional[List[Dict[str, Any]]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Correção determinística de respostas por alternativa (sem LLM)
+
+        Compara a letra escolhida em cada questão com alternativa_correta_letra do
+        gabarito mestre; as habilidades a revisar vêm das questões erradas e as
+        recomendações, de um texto padrão (ver gerar_recomendacoes para a versão do LLM).
+
+        Args:
+            lista_questoes: Questões da sessão (numero, enunciado, habilidades_combinadas)
+            gabarito_mestre: Gabarito mestre da sessão
+            respostas: Mapa número da questão → letra (ex: {"1": "A", "2": "C"})
+            preparadas: Resultado de preparar_correcao_alternativas (evita refazê-lo
+                a cada aluno de uma turma)
+
+        Returns:
+            Relatório diagnóstico, ou None se alguma resposta não for uma letra ou
+            alguma questão não tiver a alternativa correta no gabarito
+        """
+        escolhas: Dict[int, str] = {}
+        for chave, valor in (respostas or {}).items():
+            m = re.search(r"\d+", str(chave))
+            letra = str(valor or "").strip().upper().rstrip(").")
+            if not m or (letra and not re.fullmatch(r"[A-E]", letra)):
+                return None
+            escolhas[int(m.group())] = letra
+
+        if preparadas is None:
+            preparadas = self.preparar_correcao_alternativas(lista_questoes, gabarito_mestre)
+        if not preparadas:
+            return None
+
+        correcao: List[Dict[str, Any]] = []
+        habilidades_a_revisar: List[str] = []
+        pontos_fortes: List[str] = []
+        acertos = 0
+        for q in preparadas:
+            correta = q["correta"]
+            alternativas = q["alternativas"]
+            letra = escolhas.get(q["numero"], "")
+            acertou = letra == correta
+
+            if acertou:
+                acertos += 1
+                for c in q["conceitos"]:
+                    if c not in pontos_fortes:
+                        pontos_fortes.append(c)
+            else:
+                for h in q["habilidades"]:
+                    if h not in habilidades_a_revisar:
+                        habilidades_a_revisar.append(h)
+
+            correcao.append({
+                "numero": q["numero"],
+                "questao": f"{q['numero']}. {q['enunciado']}",
+                "alternativa_escolhida": letra,
+                "sua_resposta": f"{letra}) {alternativas.get(letra, '')}" if letra else "(não respondida)",
+                "gabarito_correto": f"{correta}) {alternativas.get(correta, '')}",
+                "feedback": q["feedback"][letra],
+                "acertou": acertou,
+                "tipo_erro": "" if acertou else ("em_branco" if not letra else "alternativa_incorreta"),
+            })
+
+        total = len(preparadas)
+        percentual = round(acertos / total * 100, 1)
+        if habilidades_a_revisar:
+            recomendacoes = (
+                f"Revise as habilidades {', '.join(habilidades_a_revisar)} e refaça as questões "
+                "erradas acompanhando os passos da resolução no gabarito."
+            )
+        else:
+            recomendacoes = "Você acertou todas as questões. Siga praticando as mesmas habilidades com problemas mais desafiadores."
+
+        self._registrar_fallback("correcao", "local")
+        return {
+            "resumo": f"Você acertou {acertos} de {total} questões ({percentual:.1f}%).",
+            "total_questoes": total,
+            "total_acertos": acertos,
+            "percentual_acerto": percentual,
+            "correcao_detalhada": correcao,
+            "habilidades_a_revisar": habilidades_a_revisar,
+            "pontos_fortes": pontos_fortes,
+            "recomendacoes": recomendacoes,
+            "origem_correcao": "local",
+            "recomendacoes_status": "local",
+        }
+
+    async def gerar_recomendacoes(self, relatorio: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Agente Correção restrito à parte narrativa de uma correção já feita
+
+        Args:
+            relatorio: Relatório diagnóstico da correção local
+
+        Returns:
+            Dicionário com pontos_fortes e recomendacoes
+        """
+        if self.llm_recomendacoes_json is None:
+            raise RuntimeError("Saída estruturada indisponível para as recomendações")
+        logger.info("Gerando recomendações da correção local")
+        correcao = {k: v for k, v in relatorio.items() if k not in ("recomendacoes", "recomendacoes_status")}
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", self.prompts['correcao']['system']),
+            ("human", (
+                "A correção abaixo já foi feita a partir do gabarito mestre e não deve ser alterada. "
+                "Escreva apenas os pontos fortes do aluno e recomendações pedagógicas personalizadas "
+                "(próximos passos de estudo), relacionando os erros às habilidades BNCC a revisar.\n\n"
+                "Correção (JSON):\n{correcao}"
+            )),
+        ])
+        data = await self._invocar_estruturado("recomendacoes", prompt, self.llm_recomendacoes_json, {
+            "correcao": json.dumps(correcao, ensure_ascii=False, indent=2)
+        })
+        if hasattr(data, "model_dump"):
+            data = data.model_dump()
+        if not isinstance(data, dict) or not data.get("recomendacoes"):
+            raise ValueError("Recomendações vazias")
+        return data
+
+    async def gerar_recomendacoes_turma(self, resumo_turma: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Recomendações narrativas para a turma inteira em uma única chamada
+
+        Args:
+            resumo_turma: Resumo agregado da correção da turma (sem os relatórios individuais)
+
+        Returns:
+            Dicionário com pontos_fortes e recomendacoes
+        """
+        if self.llm_recomendacoes_json is None:
+            raise RuntimeError("Saída estruturada indisponível para as recomendações")
+        logger.info("Gerando recomendações da turma")
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", self.prompts['correcao']['system']),
+            ("human", (
+                "Abaixo está o resultado agregado de uma turma na mesma lista de questões: acerto por "
+                "questão, alternativas mais escolhidas e habilidades BNCC com mais erros. Escreva os "
+                "pontos fortes da turma e recomendações para o professor (o que retomar em aula e com "
+                "quais exemplos), sem alterar os números.\n\n"
+                "Resumo da turma (JSON):\n{resumo_turma}"
+            )),
+        ])
+        resumo = {k: v for k, v in resumo_turma.items() if k not in ("recomendacoes", "recomendacoes_status")}
+        data = await self._invocar_estruturado("recomendacoes", prompt, self.llm_recomendacoes_json, {
+            "resumo_turma": json.dumps(resumo, ensure_ascii=False, indent=2)
+        })
+        if hasattr(data, "model_dump"):
+            data = data.model_dump()
+        if not isinstance(data, dict) or not data.get("recomendacoes"):
+            raise ValueError("Recomendações vazias")
+        return data
+
     async def corrigir_respostas(
         self,
         session_id: str,
@@ -1027,59 +1764,65 @@ class AgentService:
         logger.info("Executando Agente Correção")
 
         try:
-            # 1) Tenta via agente (com tool calling)
-            result = await self._run_agent(
-                self.agente_correcao,
-                self.prompts['correcao']['human'],
-                {
-                    "session_id": session_id,
-                    "respostas_aluno": respostas_aluno
-                }
-            )
-
-            output = self._extract_output_text(result)
-            output = self._maybe_unfence_json(output)
+            variaveis = {"session_id": session_id, "respostas_aluno": respostas_aluno}
+            output = ""
+
+            # 1) Via agente (com tool calling)
+            async def _via_agente() -> Dict[str, Any]:
+                nonlocal output
+                result = await self._run_agent(self.agente_correcao, self.prompts['correcao']['human'], variaveis)
+                output = self._maybe_unfence_json(self._extract_output_text(result))
+                if output:
+                    try:
+                        parsed = json.loads(output)
+                        if isinstance(parsed, dict):
+                            return parsed
+                    except json.JSONDecodeError:
+                        pass
+                return {}
+
+            # 2) Estruturado (JSON) passando o gabarito mestre explicitamente
+            async def _via_estruturado() -> Dict[str, Any]:
+                logger.info("Correção estruturada: gerando relatório com JSON schema")
+                gb_dict = self._get_gabarito_from_db(session_id)
+                if not isinstance(gb_dict, dict):
+                    try:
+                        gb_dict = json.loads(gb_dict)
+                    except Exception:
+                        gb_dict = {}
+                gb_json = json.dumps(gb_dict, ensure_ascii=False, indent=2)
 
-            relatorio: Dict[str, Any] = {}
+                prompts = self.prompts['correcao']
+                prompt = ChatPromptTemplate.from_messages([
+                    ("system", prompts['system']),
+                    ("human", prompts['human']),
+                    ("human", "Gabarito Mestre (JSON):\n{gabarito_mestre}")
+                ])
+                data = await self._invocar_estruturado("correcao", prompt, self.llm_correcao_json, {
+                    **variaveis,
+                    "gabarito_mestre": gb_json
+                })
+                if hasattr(data, "model_dump"):
+                    return data.model_dump()
+                return data if isinstance(data, dict) else {}
 
-            # 1a) Parse direto
-            if output:
-                try:
-                    relatorio = json.loads(output)
-                except json.JSONDecodeError:
-                    pass
+            caminhos = {"agente": _via_agente}
+            if self.llm_correcao_json is not None:
+                caminhos["estruturado"] = _via_estruturado
 
-            # 2) Fallback estruturado (JSON) passando o gabarito mestre explicitamente
-            if (not relatorio) and self.llm_correcao_json is not None:
-                logger.info("Fallback estruturado: gerando relatório com JSON schema")
-                try:
-                    # Recupera gabarito do banco e injeta no prompt
-                    gb_dict = self._get_gabarito_from_db(session_id)
-                    if not isinstance(gb_dict, dict):
-                        try:
-                            gb_dict = json.loads(gb_dict)
-                        except Exception:
-                            gb_dict = {}
-                    gb_json = json.dumps(gb_dict, ensure_ascii=False, indent=2)
-
-                    prompts = self.prompts['correcao']
-                    prompt = ChatPromptTemplate.from_messages([
-                        ("system", prompts['system']),
-                        ("human", prompts['human']),
-                        ("human", "Gabarito Mestre (JSON):\n{gabarito_mestre}")
-                    ])
-
-                    data = await (prompt | self.llm_correcao_json).ainvoke({
-                        "session_id": session_id,
-                        "respostas_aluno": respostas_aluno,
-                        "gabarito_mestre": gb_json
-                    })
-                    if hasattr(data, "model_dump"):
-                        relatorio = data.model_dump()
-                    elif isinstance(data, dict):
-                        relatorio = data
-                except Exception as e:
-                    logger.warning(f"Falha no fallback estruturado da correção: {e}")
+            relatorio: Dict[str, Any] = {}
+            caminho = "ultimo_recurso"
+            for nome in roteador_fallback.ordenar("correcao", list(caminhos)):
+                with roteador_fallback.tentativa("correcao", nome) as tentativa:
+                    try:
+                        relatorio = await caminhos[nome]()
+                    except Exception as e:
+                        logger.warning(f"Falha no caminho '{nome}' da correção: {e}")
+                        relatorio = {}
+                    tentativa.sucesso = bool(relatorio)
+                if relatorio:
+                    caminho = nome
+                    break
 
             # 3) Último recurso
             if not relatorio:
@@ -1093,6 +1836,8 @@ class AgentService:
                     "texto_completo": output or ""
                 }
 
+            relatorio.setdefault("origem_correcao", "agente")
+            self._registrar_fallback("correcao", caminho)
             logger.info("Agente Correção concluído")
             return relatorio
 
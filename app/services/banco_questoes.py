@@ -0,0 +1,185 @@
+"""
+Banco de questões endereçado pelo conteúdo da questão original
+
+Professores costumam enviar as mesmas questões (ENEM, vestibulares). A chave do banco
+é o sha256 do texto normalizado (sem acentos, caixa e espaços, que variam com o OCR)
+e cada entrada guarda a análise do Interpretador e as questões aprovadas, cada uma
+com o seu item do gabarito mestre. Um /session/start repetido é atendido sorteando
+questões do banco e reembaralhando as alternativas, sem nenhuma etapa de LLM; as
+sessões que passam pelo pipeline acrescentam as questões novas ao banco.
+
+Controles: BANCO_QUESTOES_VALIDADE_S (idade máxima da análise e de cada questão) e
+BANCO_QUESTOES_MAX_VARIANTES (questões guardadas por questão original).
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from app.core.config import settings
+from app.core import metrics
+from app.db.database import SessionLocal
+from app.db.models import BancoQuestoes as EntradaBanco
+import copy
+import hashlib
+import logging
+import random
+import re
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+LETRAS = ["A", "B", "C", "D", "E"]
+
+
+class BancoQuestoes:
+    """Consulta e alimentação do banco de questões por questão original."""
+
+    @staticmethod
+    def normalizar(texto: str) -> str:
+        """Texto sem acentos, em minúsculas e sem espaços (quebras de linha do OCR não mudam a chave)."""
+        decomposto = unicodedata.normalize("NFKD", texto or "")
+        sem_acentos = "".join(c for c in decomposto if not unicodedata.combining(c))
+        return re.sub(r"\s+", "", sem_acentos.lower())
+
+    def chave(self, questao_texto: str) -> str:
+        """sha256 da questão original normalizada."""
+        return hashlib.sha256(self.normalizar(questao_texto).encode("utf-8")).hexdigest()
+
+    def _fresca(self, criada_em: float, agora: float) -> bool:
+        validade = settings.BANCO_QUESTOES_VALIDADE_S
+        return validade <= 0 or agora - (criada_em or 0.0) <= validade
+
+    @staticmethod
+    def _reembaralhar(questao: Dict[str, Any], item: Dict[str, Any]) -> None:
+        """Permuta as alternativas A–E e atualiza a letra correta na questão e no item."""
+        alternativas = item.get("alternativas") or {}
+        correta = str(item.get("alternativa_correta_letra") or "").strip().upper()
+        if sorted(alternativas) != LETRAS or correta not in alternativas:
+            return
+        ordem = list(range(len(LETRAS)))
+        random.shuffle(ordem)
+        novas = {LETRAS[i]: alternativas[LETRAS[j]] for i, j in enumerate(ordem)}
+        nova_correta = LETRAS[ordem.index(LETRAS.index(correta))]
+        for alvo in (questao, item):
+            alvo["alternativas"] = dict(novas)
+            alvo["alternativa_correta_letra"] = nova_correta
+
+    def servir(self, questao_texto: str, alvo: int) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any]]]:
+        """
+        Monta uma sessão com questões do banco.
+
+        Args:
+            questao_texto: Texto da questão original
+            alvo: Número de questões da sessão
+
+        Returns:
+            (análise, questões, gabarito mestre) ou None se o banco não tiver a questão,
+            se a análise tiver expirado ou se faltarem questões válidas para o alvo
+        """
+        if not settings.BANCO_QUESTOES_ATIVO:
+            return None
+        chave = self.chave(questao_texto)
+        db = SessionLocal()
+        try:
+            entrada = db.get(EntradaBanco, chave)
+            if entrada is None:
+                metrics.banco_questoes.inc(resultado="ausente")
+                return None
+            agora = time.time()
+            if not self._fresca(entrada.analise_em, agora):
+                metrics.banco_questoes.inc(resultado="expirado")
+                return None
+            variantes = [v for v in entrada.variantes or [] if self._fresca(v.get("criada_em"), agora)]
+            if len(variantes) < alvo:
+                metrics.banco_questoes.inc(resultado="insuficiente")
+                logger.info(f"Banco de questões: {len(variantes)}/{alvo} questão(ões) válidas para {chave[:12]}")
+                return None
+            entrada.usos = EntradaBanco.usos + 1
+            db.commit()
+            analise = copy.deepcopy(entrada.analise)
+        except Exception as erro:
+            db.rollback()
+            logger.warning(f"Banco de questões indisponível: {erro}")
+            return None
+        finally:
+            db.close()
+
+        questoes: List[Dict[str, Any]] = []
+        itens: List[Dict[str, Any]] = []
+        for numero, variante in enumerate(random.sample(variantes, alvo), start=1):
+            questao = copy.deepcopy(variante["questao"])
+            item = copy.deepcopy(variante["item"])
+            if settings.BANCO_QUESTOES_REEMBARALHAR:
+                self._reembaralhar(questao, item)
+            questao["numero"] = numero
+            item["numero_questao"] = numero
+            questoes.append(questao)
+            itens.append(item)
+
+        metrics.banco_questoes.inc(resultado="acerto")
+        logger.info(f"Banco de questões: sessão atendida com {alvo} de {len(variantes)} questão(ões) de {chave[:12]}")
+        gabarito = {
+            "gabarito": itens,
+            "origem": "banco",
+            "banco": {"chave": chave, "variantes_disponiveis": len(variantes)},
+        }
+        return analise, questoes, gabarito
+
+    def guardar(
+        self,
+        questao_texto: str,
+        analise: Dict[str, Any],
+        questoes: List[Dict[str, Any]],
+        itens: List[Dict[str, Any]],
+    ) -> None:
+        """
+        Acrescenta ao banco as questões aprovadas de uma sessão gerada pelo pipeline.
+
+        Só entram questões com as 5 alternativas e a letra correta no gabarito; as
+        repetidas (mesmo enunciado) são ignoradas e, passado o limite de variantes,
+        as mais antigas saem. A análise é substituída pela mais recente.
+        """
+        if not settings.BANCO_QUESTOES_ATIVO:
+            return
+        por_numero = {it.get("numero_questao"): it for it in itens if isinstance(it, dict)}
+        agora = time.time()
+        novas = []
+        for questao in questoes:
+            item = por_numero.get(questao.get("numero")) if isinstance(questao, dict) else None
+            if not item:
+                continue
+            alternativas = item.get("alternativas") or {}
+            correta = str(item.get("alternativa_correta_letra") or "").strip().upper()
+            if sorted(alternativas) != LETRAS or correta not in alternativas:
+                continue
+            novas.append({"questao": copy.deepcopy(questao), "item": copy.deepcopy(item), "criada_em": agora})
+        if not novas:
+            return
+
+        chave = self.chave(questao_texto)
+        db = SessionLocal()
+        try:
+            entrada = db.get(EntradaBanco, chave)
+            if entrada is None:
+                entrada = EntradaBanco(chave=chave, questao_original=questao_texto, variantes=[], usos=0)
+                db.add(entrada)
+            variantes = [v for v in entrada.variantes or [] if self._fresca(v.get("criada_em"), agora)]
+            vistos = {self.normalizar(v["questao"].get("enunciado", "")) for v in variantes}
+            for v in novas:
+                enunciado = self.normalizar(v["questao"].get("enunciado", ""))
+                if enunciado not in vistos:
+                    vistos.add(enunciado)
+                    variantes.append(v)
+            # Reatribui as colunas JSON para o SQLAlchemy detectar a alteração
+            entrada.variantes = variantes[-max(1, settings.BANCO_QUESTOES_MAX_VARIANTES):]
+            entrada.analise = copy.deepcopy(analise)
+            entrada.analise_em = agora
+            db.commit()
+            logger.info(f"Banco de questões: {len(entrada.variantes)} questão(ões) guardadas para {chave[:12]}")
+        except Exception as erro:
+            db.rollback()
+            logger.warning(f"Falha ao gravar no banco de questões: {erro}")
+        finally:
+            db.close()
+
+
+# Instância global do banco de questões
+banco_questoes = BancoQuestoes()
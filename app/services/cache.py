@@ -0,0 +1,343 @@
+"""
+Cache em camadas para respostas determinísticas
+
+Duas camadas: LRU em memória (por processo) e tabela cache_respostas no banco
+SQLite (compartilhada entre a API e os workers), ambas com TTL e limite de tamanho.
+Usado pelo AgentService para evitar chamadas repetidas ao provedor de LLM quando a
+entrada é idêntica (mesmo modelo, temperatura, prompt renderizado e schema) e pelo
+RAGService para não recalcular o embedding de consultas repetidas.
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from app.core.config import settings
+from app.core import metrics
+from app.db.database import SessionLocal
+from app.db.models import EntradaCache
+from langchain_core.embeddings import Embeddings
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# acessado_em (ordem de despejo do disco) é atualizado no máximo uma vez por intervalo,
+# para que um acerto em disco seja só uma leitura
+INTERVALO_ACESSO = timedelta(hours=1)
+
+
+def _agora() -> datetime:
+    """Horário atual em UTC (naive, como armazenado no SQLite)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class CacheEmCamadas:
+    """
+    Cache chave → valor JSON com camada em memória (LRU) e em disco (SQLite).
+
+    Contadores por rótulo (ex: nome do agente): acertos em memória, acertos em
+    disco, faltas e gravações.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl_s: int,
+        max_memoria: int,
+        max_disco: int,
+    ):
+        """
+        Args:
+            namespace: Prefixo das chaves e grupo para o limite em disco
+            ttl_s: Validade das entradas em segundos (0 = sem expiração)
+            max_memoria: Entradas mantidas no LRU em memória (0 = desativa a camada)
+            max_disco: Entradas mantidas em disco para o namespace (0 = desativa a camada)
+        """
+        self.namespace = namespace
+        self.ttl_s = ttl_s
+        self.max_memoria = max_memoria
+        self.max_disco = max_disco
+        self._memoria: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disco_ok = max_disco > 0
+        self._falhas_disco = 0
+        self._gravacoes_desde_limpeza = 0
+        self._contadores: Dict[str, Dict[str, int]] = {}
+
+    def chave(self, **partes: Any) -> str:
+        """Gera a chave estável (sha256) a partir das partes da chamada."""
+        bruto = json.dumps(partes, sort_keys=True, ensure_ascii=False, default=str)
+        return f"{self.namespace}:{hashlib.sha256(bruto.encode('utf-8')).hexdigest()}"
+
+    def _contar(self, rotulo: str, evento: str) -> None:
+        c = self._contadores.setdefault(
+            rotulo, {"acertos_memoria": 0, "acertos_disco": 0, "faltas": 0, "gravacoes": 0}
+        )
+        c[evento] += 1
+
+    # ==== Camada em memória
+    def _obter_memoria(self, chave: str) -> Optional[Any]:
+        with self._lock:
+            entrada = self._memoria.get(chave)
+            if entrada is None:
+                return None
+            valor, expira = entrada
+            if expira is not None and expira < time.monotonic():
+                self._memoria.pop(chave, None)
+                return None
+            self._memoria.move_to_end(chave)
+            return valor
+
+    def _gravar_memoria(self, chave: str, valor: Any, ttl_s: Optional[float]) -> None:
+        if self.max_memoria <= 0:
+            return
+        expira = time.monotonic() + ttl_s if ttl_s else None
+        with self._lock:
+            self._memoria[chave] = (valor, expira)
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+
+    # ==== Camada em disco
+    def _falha_disco(self, operacao: str, erro: Exception) -> None:
+        """Só registra: a próxima chamada tenta o disco de novo (ex.: "database is locked" passageiro)."""
+        self._falhas_disco += 1
+        logger.warning(f"Cache {self.namespace}: falha ao {operacao} no disco ({erro})")
+
+    def _obter_disco(self, chave: str) -> Optional[tuple]:
+        """Retorna (valor, segundos_restantes_ou_None) ou None."""
+        db = SessionLocal()
+        try:
+            e = db.query(EntradaCache).filter(EntradaCache.chave == chave).first()
+            if e is None:
+                return None
+            agora = _agora()
+            if e.expira_em is not None and e.expira_em < agora:
+                db.delete(e)
+                db.commit()
+                return None
+            if e.acessado_em is None or agora - e.acessado_em >= INTERVALO_ACESSO:
+                e.acessado_em = agora
+                db.commit()
+            restante = (e.expira_em - agora).total_seconds() if e.expira_em else None
+            return e.valor, restante
+        except Exception as erro:
+            db.rollback()
+            self._falha_disco("ler", erro)
+            return None
+        finally:
+            db.close()
+
+    def _gravar_disco(self, chave: str, valor: Any) -> None:
+        db = SessionLocal()
+        try:
+            agora = _agora()
+            db.merge(EntradaCache(
+                chave=chave,
+                namespace=self.namespace,
+                valor=valor,
+                expira_em=agora + timedelta(seconds=self.ttl_s) if self.ttl_s else None,
+                acessado_em=agora,
+            ))
+            db.commit()
+            self._gravacoes_desde_limpeza += 1
+            if self._gravacoes_desde_limpeza >= 50:
+                self._gravacoes_desde_limpeza = 0
+                self._limpar_disco(db)
+        except Exception as erro:
+            db.rollback()
+            self._falha_disco("gravar", erro)
+        finally:
+            db.close()
+
+    def _limpar_disco(self, db) -> None:
+        """Remove expirados e as entradas menos acessadas acima de max_disco."""
+        db.query(EntradaCache).filter(
+            EntradaCache.namespace == self.namespace,
+            EntradaCache.expira_em < _agora(),
+        ).delete(synchronize_session=False)
+        total = db.query(EntradaCache).filter(EntradaCache.namespace == self.namespace).count()
+        excesso = total - self.max_disco
+        if excesso > 0:
+            antigas = db.query(EntradaCache.chave).filter(
+                EntradaCache.namespace == self.namespace
+            ).order_by(EntradaCache.acessado_em).limit(excesso)
+            db.query(EntradaCache).filter(
+                EntradaCache.chave.in_([row.chave for row in antigas])
+            ).delete(synchronize_session=False)
+            logger.info(f"Cache {self.namespace}: {excesso} entrada(s) despejada(s) do disco")
+        db.commit()
+
+    # ==== API
+    def _de_memoria(self, chave: str, rotulo: str) -> Optional[Any]:
+        valor = self._obter_memoria(chave)
+        if valor is not None:
+            self._contar(rotulo, "acertos_memoria")
+        return valor
+
+    def _de_disco(self, chave: str, achado: Optional[tuple], rotulo: str) -> Optional[Any]:
+        """Promove um acerto em disco para a memória e conta o resultado da consulta."""
+        if achado is None:
+            self._contar(rotulo, "faltas")
+            return None
+        valor, restante = achado
+        self._gravar_memoria(chave, valor, restante)
+        self._contar(rotulo, "acertos_disco")
+        return valor
+
+    def obter(self, chave: str, rotulo: str = "geral") -> Optional[Any]:
+        """Busca na memória e depois no disco (promovendo para a memória)."""
+        valor = self._de_memoria(chave, rotulo)
+        if valor is not None:
+            return valor
+        return self._de_disco(chave, self._obter_disco(chave) if self._disco_ok else None, rotulo)
+
+    async def obter_async(self, chave: str, rotulo: str = "geral") -> Optional[Any]:
+        """obter() para código assíncrono: a consulta ao disco roda fora do event loop."""
+        valor = self._de_memoria(chave, rotulo)
+        if valor is not None:
+            return valor
+        achado = await asyncio.to_thread(self._obter_disco, chave) if self._disco_ok else None
+        return self._de_disco(chave, achado, rotulo)
+
+    def gravar(self, chave: str, valor: Any, rotulo: str = "geral") -> None:
+        """Grava nas duas camadas (valor deve ser serializável em JSON)."""
+        self._gravar_memoria(chave, valor, self.ttl_s)
+        if self._disco_ok:
+            self._gravar_disco(chave, valor)
+        self._contar(rotulo, "gravacoes")
+
+    async def gravar_async(self, chave: str, valor: Any, rotulo: str = "geral") -> None:
+        """gravar() para código assíncrono: a escrita no disco roda fora do event loop."""
+        self._gravar_memoria(chave, valor, self.ttl_s)
+        if self._disco_ok:
+            await asyncio.to_thread(self._gravar_disco, chave, valor)
+        self._contar(rotulo, "gravacoes")
+
+    def metricas(self) -> Dict[str, Any]:
+        """Contadores de acertos/faltas e taxa de acerto por rótulo e tamanho da camada em memória."""
+        por_rotulo = {}
+        for rotulo, c in self._contadores.items():
+            acertos = c["acertos_memoria"] + c["acertos_disco"]
+            consultas = acertos + c["faltas"]
+            por_rotulo[rotulo] = {**c, "taxa_acerto": round(acertos / consultas, 4) if consultas else None}
+        return {
+            "entradas_memoria": len(self._memoria),
+            "disco_ativo": self._disco_ok,
+            "falhas_disco": self._falhas_disco,
+            "por_rotulo": por_rotulo,
+        }
+
+    def coletar_metricas(self) -> List[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]:
+        """Coletor do /metrics: eventos do cache por rótulo."""
+        amostras = [
+            ({"namespace": self.namespace, "rotulo": rotulo, "evento": evento}, valor)
+            for rotulo, contadores in self._contadores.items()
+            for evento, valor in contadores.items()
+        ]
+        return [
+            ("kora_cache_eventos_total", "counter", "Acertos, faltas e gravações do cache por rótulo", amostras),
+            ("kora_cache_falhas_disco_total", "counter", "Falhas de leitura/gravação na camada em disco do cache",
+             [({"namespace": self.namespace}, self._falhas_disco)]),
+        ]
+
+
+class CacheLLM(CacheEmCamadas):
+    """Cache de respostas de LLM, habilitado por agente (settings.LLM_CACHE_AGENTES)."""
+
+    def __init__(self):
+        """Inicializa com os limites das configurações"""
+        super().__init__(
+            namespace="llm",
+            ttl_s=settings.LLM_CACHE_TTL_S,
+            max_memoria=settings.LLM_CACHE_MAX_MEMORIA,
+            max_disco=settings.LLM_CACHE_MAX_DISCO,
+        )
+
+    @staticmethod
+    def agentes() -> set:
+        """Agentes com cache (lido a cada chamada: mudanças na configuração valem na hora)."""
+        return {a.strip() for a in settings.LLM_CACHE_AGENTES.split(",") if a.strip()}
+
+    def habilitado(self, agente: str) -> bool:
+        """Indica se as chamadas do agente usam o cache."""
+        return agente in self.agentes()
+
+    def chave_chamada(self, agente: str, prompt: str, schema: Optional[str] = None) -> str:
+        """Chave de uma chamada: modelo, temperatura, prompt renderizado e schema de saída."""
+        return self.chave(
+            agente=agente,
+            provedor=settings.DEFAULT_LLM_PROVIDER,
+            modelo=settings.DEFAULT_MODEL,
+            temperatura=settings.TEMPERATURE,
+            prompt=prompt,
+            schema=schema,
+        )
+
+
+class CacheEmbeddings(CacheEmCamadas):
+    """Cache de embeddings de consultas do RAG, por provedor, modelo e texto normalizado."""
+
+    def __init__(self):
+        """Inicializa com os limites das configurações"""
+        super().__init__(
+            namespace="embedding",
+            ttl_s=settings.EMBEDDING_CACHE_TTL_S,
+            max_memoria=settings.EMBEDDING_CACHE_MAX_MEMORIA,
+            max_disco=settings.EMBEDDING_CACHE_MAX_DISCO,
+        )
+
+    @staticmethod
+    def normalizar(texto: str) -> str:
+        """Unicode NFC, minúsculas e espaços colapsados (variações que não mudam a busca)."""
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFC", texto or "")).strip().lower()
+
+    def chave_consulta(self, texto: str) -> str:
+        return self.chave(
+            provedor=settings.EMBEDDING_PROVIDER,
+            modelo=settings.EMBEDDING_MODEL,
+            texto=self.normalizar(texto),
+        )
+
+
+class EmbeddingsComCache(Embeddings):
+    """
+    Embeddings com cache das consultas (embed_query).
+
+    Os documentos (ingestão, montagem do índice) passam direto para o provedor.
+    """
+
+    def __init__(self, interno: Embeddings, cache: CacheEmbeddings):
+        self.interno = interno
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.interno.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        chave = self.cache.chave_consulta(text)
+        vetor = self.cache.obter(chave, rotulo="consulta")
+        if vetor is None:
+            vetor = self.interno.embed_query(text)
+            self.cache.gravar(chave, [float(x) for x in vetor], rotulo="consulta")
+        return vetor
+
+
+# Instâncias globais dos caches de LLM e de embeddings
+llm_cache = CacheLLM()
+embedding_cache = CacheEmbeddings()
+
+
+def _coletar_metricas_caches() -> List[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]:
+    """Coletor único do /metrics para todos os caches (uma família kora_cache_eventos_total)."""
+    familias = [c.coletar_metricas()[0] for c in (llm_cache, embedding_cache)]
+    nome, tipo, descricao, _ = familias[0]
+    return [(nome, tipo, descricao, [amostra for f in familias for amostra in f[3]])]
+
+
+metrics.registro.registrar_coletor(_coletar_metricas_caches)
@@ -0,0 +1,316 @@
+"""
+Cache semântico do Agente Interpretador
+
+Questões que diferem só por ruído de OCR ou por pequenas mudanças numéricas mapeiam
+para as mesmas habilidades BNCC. Cada análise do Interpretador é indexada pelo
+embedding da questão (mesmo provedor de embeddings do RAG); uma questão nova com
+similaridade de cosseno acima de INTERPRETACAO_CACHE_LIMIAR reaproveita
+habilidades_identificadas, conceitos_principais e ano_recomendado sem rodar o agente.
+
+Uma fração dos reaproveitamentos (INTERPRETACAO_CACHE_AUDITORIA) roda o Interpretador
+em segundo plano e compara os códigos BNCC: os divergentes são contados, ficam
+listados em metricas() e a análise nova passa a valer para a questão auditada.
+"""
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable, Set
+from collections import deque
+from app.core.config import settings
+from app.core import metrics
+from app.db.database import SessionLocal
+from app.db.models import InterpretacaoCache
+from app.services.rag_service import rag_service
+from app.services.llm_scheduler import prioridade_llm
+from app.services.uso_llm_service import contabilidade_llm
+import numpy as np
+import asyncio
+import copy
+import logging
+import random
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_REAPROVEITADOS = ("habilidades_identificadas", "conceitos_principais", "ano_recomendado")
+
+
+def _codigos(analise: Dict[str, Any]) -> Set[str]:
+    return {
+        str(h.get("codigo_bncc") or h.get("codigo") or "").strip().upper()
+        for h in (analise or {}).get("habilidades_identificadas") or []
+        if isinstance(h, dict)
+    } - {""}
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class CacheInterpretacao:
+    """Índice em memória (matriz de embeddings normalizados) com persistência em cache_interpretacoes."""
+
+    def __init__(self):
+        """Inicializa o cache (as análises gravadas são carregadas no primeiro uso)"""
+        self._ids: List[int] = []
+        self._textos: List[str] = []
+        self._analises: List[Dict[str, Any]] = []
+        self._matriz: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self._carregado = False
+        self._tarefas: Set[asyncio.Task] = set()
+        self._contadores = {"acertos": 0, "faltas": 0, "erros": 0, "gravacoes": 0, "falhas_persistencia": 0}
+        self._auditorias = {"concordantes": 0, "divergentes": 0, "jaccard_total": 0.0}
+        self._divergencias: deque = deque(maxlen=20)
+
+    @staticmethod
+    def _normalizar_texto(texto: str) -> str:
+        return re.sub(r"\s+", " ", texto or "").strip()
+
+    @staticmethod
+    def _vetor_unitario(vetor: List[float]) -> np.ndarray:
+        v = np.asarray(vetor, dtype=np.float32)
+        norma = float(np.linalg.norm(v))
+        return v / norma if norma > 0 else v
+
+    # ==== Persistência
+    def _carregar(self) -> None:
+        """Lê as análises do provedor/modelo de embeddings atual (uma vez; tenta de novo se o banco ainda não existir)."""
+        if self._carregado:
+            return
+        db = SessionLocal()
+        try:
+            linhas = (
+                db.query(InterpretacaoCache)
+                .filter(
+                    InterpretacaoCache.provedor == settings.EMBEDDING_PROVIDER,
+                    InterpretacaoCache.modelo == settings.EMBEDDING_MODEL,
+                )
+                .order_by(InterpretacaoCache.id.desc())
+                .limit(max(1, settings.INTERPRETACAO_CACHE_MAX))
+                .all()
+            )
+        except Exception as erro:
+            logger.debug(f"Cache semântico do Interpretador: análises indisponíveis ({erro})")
+            return
+        finally:
+            db.close()
+        linhas.reverse()
+        with self._lock:
+            self._ids = [e.id for e in linhas]
+            self._textos = [e.texto for e in linhas]
+            self._analises = [e.analise for e in linhas]
+            self._matriz = np.vstack([self._vetor_unitario(e.vetor) for e in linhas]) if linhas else None
+        self._carregado = True
+        if linhas:
+            logger.info(f"Cache semântico do Interpretador: {len(linhas)} análise(s) carregada(s)")
+
+    def _falha_persistencia(self, operacao: str, erro: Exception) -> None:
+        """Só registra: a próxima gravação tenta de novo (ex.: "database is locked" passageiro)."""
+        self._contadores["falhas_persistencia"] += 1
+        logger.warning(f"Cache semântico do Interpretador: falha ao {operacao} ({erro})")
+
+    def _gravar(self, texto: str, vetor: List[float], analise: Dict[str, Any]) -> Optional[int]:
+        """Insere a análise no banco e descarta as mais antigas além do limite."""
+        db = SessionLocal()
+        try:
+            entrada = InterpretacaoCache(
+                provedor=settings.EMBEDDING_PROVIDER, modelo=settings.EMBEDDING_MODEL,
+                texto=texto, vetor=[float(x) for x in vetor], analise=analise, reutilizacoes=0,
+            )
+            db.add(entrada)
+            db.flush()
+            excedentes = (
+                db.query(InterpretacaoCache.id)
+                .filter(
+                    InterpretacaoCache.provedor == settings.EMBEDDING_PROVIDER,
+                    InterpretacaoCache.modelo == settings.EMBEDDING_MODEL,
+                )
+                .order_by(InterpretacaoCache.id.desc())
+                .offset(max(1, settings.INTERPRETACAO_CACHE_MAX))
+                .all()
+            )
+            if excedentes:
+                db.query(InterpretacaoCache).filter(
+                    InterpretacaoCache.id.in_([e.id for e in excedentes])
+                ).delete(synchronize_session=False)
+            db.commit()
+            return entrada.id
+        except Exception as erro:
+            db.rollback()
+            self._falha_persistencia("gravar análise", erro)
+            return None
+        finally:
+            db.close()
+
+    def _contar_reutilizacao(self, entrada_id: int) -> None:
+        db = SessionLocal()
+        try:
+            db.query(InterpretacaoCache).filter(InterpretacaoCache.id == entrada_id).update(
+                {InterpretacaoCache.reutilizacoes: InterpretacaoCache.reutilizacoes + 1},
+                synchronize_session=False,
+            )
+            db.commit()
+        except Exception as erro:
+            db.rollback()
+            self._falha_persistencia("contar reutilização", erro)
+        finally:
+            db.close()
+
+    # ==== Consulta e gravação
+    async def consultar(self, questao_texto: str) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]]]:
+        """
+        Procura uma análise de questão próxima.
+
+        Args:
+            questao_texto: Texto da questão original
+
+        Returns:
+            (análise reaproveitada ou None, embedding da questão para gravar depois);
+            (None, None) com o cache desativado ou se o embedding falhar
+        """
+        if not settings.INTERPRETACAO_CACHE_ATIVO:
+            return None, None
+        texto = self._normalizar_texto(questao_texto)
+        try:
+            with metrics.rag_duracao.cronometrar(operacao="embedding_interpretacao"):
+                vetor = await asyncio.to_thread(rag_service.embeddings.embed_query, texto)
+        except Exception as erro:
+            self._contadores["erros"] += 1
+            metrics.cache_interpretacao.inc(resultado="erro")
+            logger.warning(f"Cache semântico do Interpretador: falha no embedding ({erro})")
+            return None, None
+
+        await asyncio.to_thread(self._carregar)
+        consulta = self._vetor_unitario(vetor)
+        with self._lock:
+            if self._matriz is None or self._matriz.shape[1] != consulta.shape[0]:
+                melhor, similaridade = None, 0.0
+            else:
+                similaridades = self._matriz @ consulta
+                melhor = int(np.argmax(similaridades))
+                similaridade = float(similaridades[melhor])
+            if melhor is not None and similaridade >= settings.INTERPRETACAO_CACHE_LIMIAR:
+                entrada_id, texto_origem = self._ids[melhor], self._textos[melhor]
+                analise = copy.deepcopy(self._analises[melhor])
+            else:
+                analise = None
+
+        if analise is None:
+            self._contadores["faltas"] += 1
+            metrics.cache_interpretacao.inc(resultado="falta")
+            return None, vetor
+
+        self._contadores["acertos"] += 1
+        metrics.cache_interpretacao.inc(resultado="acerto")
+        if entrada_id is not None:
+            await asyncio.to_thread(self._contar_reutilizacao, entrada_id)
+        logger.info(f"Cache semântico do Interpretador: análise reaproveitada (similaridade {similaridade:.4f})")
+        reaproveitada = {campo: analise.get(campo) for campo in CAMPOS_REAPROVEITADOS if campo in analise}
+        reaproveitada["reaproveitamento"] = {
+            "similaridade": round(similaridade, 4),
+            "questao_origem": texto_origem[:200],
+        }
+        return reaproveitada, vetor
+
+    async def guardar(self, questao_texto: str, vetor: List[float], analise: Dict[str, Any]) -> None:
+        """Indexa a análise pelo embedding da questão (análises sem habilidades não entram)."""
+        if not settings.INTERPRETACAO_CACHE_ATIVO or not (analise or {}).get("habilidades_identificadas"):
+            return
+        texto = self._normalizar_texto(questao_texto)
+        analise = {campo: copy.deepcopy(analise[campo]) for campo in CAMPOS_REAPROVEITADOS if campo in analise}
+        entrada_id = await asyncio.to_thread(self._gravar, texto, vetor, analise)
+        unitario = self._vetor_unitario(vetor)
+        limite = max(1, settings.INTERPRETACAO_CACHE_MAX)
+        with self._lock:
+            if self._matriz is not None and self._matriz.shape[1] != unitario.shape[0]:
+                self._ids, self._textos, self._analises, self._matriz = [], [], [], None
+            self._ids.append(entrada_id)
+            self._textos.append(texto)
+            self._analises.append(analise)
+            linha = unitario[np.newaxis, :]
+            self._matriz = linha if self._matriz is None else np.vstack([self._matriz, linha])
+            if len(self._ids) > limite:
+                excesso = len(self._ids) - limite
+                del self._ids[:excesso], self._textos[:excesso], self._analises[:excesso]
+                self._matriz = self._matriz[excesso:]
+        self._contadores["gravacoes"] += 1
+
+    # ==== Auditoria de reaproveitamentos
+    def auditar(
+        self,
+        questao_texto: str,
+        vetor: List[float],
+        reaproveitada: Dict[str, Any],
+        interpretar: Callable[[str], Awaitable[Dict[str, Any]]],
+    ) -> None:
+        """Sorteia o reaproveitamento para auditoria (Interpretador em segundo plano, prioridade de lote)."""
+        if random.random() >= settings.INTERPRETACAO_CACHE_AUDITORIA:
+            return
+        tarefa = asyncio.create_task(self._auditar(questao_texto, vetor, reaproveitada, interpretar))
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._tarefas.discard)
+
+    async def _auditar(
+        self,
+        questao_texto: str,
+        vetor: List[float],
+        reaproveitada: Dict[str, Any],
+        interpretar: Callable[[str], Awaitable[Dict[str, Any]]],
+    ) -> None:
+        # O custo da auditoria não entra no uso de LLM da sessão que reaproveitou
+        prioridade_llm.set("lote")
+        contabilidade_llm.set(None)
+        try:
+            nova = await interpretar(questao_texto)
+        except Exception as erro:
+            logger.warning(f"Auditoria do cache semântico falhou: {erro}")
+            return
+        jaccard = _jaccard(_codigos(reaproveitada), _codigos(nova))
+        self._auditorias["jaccard_total"] += jaccard
+        if jaccard >= settings.INTERPRETACAO_CACHE_JACCARD_MIN:
+            self._auditorias["concordantes"] += 1
+            metrics.cache_interpretacao_auditoria.inc(resultado="concordante")
+            return
+        self._auditorias["divergentes"] += 1
+        metrics.cache_interpretacao_auditoria.inc(resultado="divergente")
+        self._divergencias.append({
+            "questao": self._normalizar_texto(questao_texto)[:200],
+            "questao_origem": (reaproveitada.get("reaproveitamento") or {}).get("questao_origem"),
+            "similaridade": (reaproveitada.get("reaproveitamento") or {}).get("similaridade"),
+            "jaccard_codigos": round(jaccard, 4),
+            "codigos_reaproveitados": sorted(_codigos(reaproveitada)),
+            "codigos_novos": sorted(_codigos(nova)),
+        })
+        logger.warning(
+            f"Cache semântico do Interpretador: reaproveitamento divergente (Jaccard {jaccard:.2f}); "
+            "a análise nova passa a valer para a questão"
+        )
+        await self.guardar(questao_texto, vetor, nova)
+
+    # ==== Métricas
+    def metricas(self) -> Dict[str, Any]:
+        """Acertos, faltas, taxa de reaproveitamento e resultado das auditorias."""
+        c = self._contadores
+        consultas = c["acertos"] + c["faltas"]
+        a = self._auditorias
+        auditadas = a["concordantes"] + a["divergentes"]
+        return {
+            "ativo": settings.INTERPRETACAO_CACHE_ATIVO,
+            "entradas": len(self._ids),
+            "limiar": settings.INTERPRETACAO_CACHE_LIMIAR,
+            **c,
+            "taxa_acerto": round(c["acertos"] / consultas, 4) if consultas else None,
+            "auditoria": {
+                "auditadas": auditadas,
+                "concordantes": a["concordantes"],
+                "divergentes": a["divergentes"],
+                "taxa_divergencia": round(a["divergentes"] / auditadas, 4) if auditadas else None,
+                "jaccard_medio": round(a["jaccard_total"] / auditadas, 4) if auditadas else None,
+                "ultimas_divergencias": list(self._divergencias),
+            },
+        }
+
+
+# Instância global do cache semântico do Interpretador
+cache_interpretacao = CacheInterpretacao()
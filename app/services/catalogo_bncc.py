@@ -0,0 +1,106 @@
+"""
+Catálogo das habilidades BNCC para consultas exatas
+
+Buscar uma habilidade pelo código ou listar as de um ano não precisa de busca
+vetorial: o catálogo guarda os documentos ingeridos uma única vez, com um dict por
+código e partições pré-calculadas por ano e por unidade temática. As consultas não
+chamam o provedor de embeddings e as listagens vêm completas (sem corte em k).
+
+As chaves são normalizadas porque os JSON da BNCC variam na grafia: "1°" e "1º",
+unidades temáticas com espaços, ponto final ou caixa diferentes.
+"""
+from typing import Dict, Any, List, Optional
+from langchain_core.documents import Document
+from app.services.indice_vetorial import ler_habilidades_bncc, documento_bncc
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogoBNCC:
+    """Habilidades por código, ano e unidade temática (consultas O(1))."""
+
+    def __init__(self, textos: List[str], metadados: List[Dict[str, Any]], fonte: str):
+        """
+        Args:
+            textos: page_content de cada habilidade
+            metadados: metadata de cada habilidade (codigo_bncc, ano, unidade_tematica, ...)
+            fonte: De onde o catálogo foi lido ("indice", "chroma", "json")
+        """
+        self.textos = list(textos)
+        self.metadados = [dict(m or {}) for m in metadados]
+        self.fonte = fonte
+        self._por_codigo: Dict[str, List[int]] = {}
+        self._por_ano: Dict[str, List[int]] = {}
+        self._por_unidade: Dict[str, List[int]] = {}
+        for posicao, m in enumerate(self.metadados):
+            self._por_codigo.setdefault(self.normalizar_codigo(m.get("codigo_bncc")), []).append(posicao)
+            self._por_ano.setdefault(self.normalizar_ano(m.get("ano")), []).append(posicao)
+            self._por_unidade.setdefault(self.normalizar_unidade(m.get("unidade_tematica")), []).append(posicao)
+
+    def __len__(self) -> int:
+        return len(self.textos)
+
+    # ==== Normalização das chaves
+    @staticmethod
+    def normalizar_codigo(codigo: Optional[str]) -> str:
+        return re.sub(r"\s+", "", str(codigo or "")).upper()
+
+    @staticmethod
+    def normalizar_ano(ano: Optional[str]) -> str:
+        """Sinal de grau (°) e indicador ordinal (º) são a mesma coisa nos JSON."""
+        return str(ano or "").strip().replace("°", "º")
+
+    @staticmethod
+    def normalizar_unidade(unidade: Optional[str]) -> str:
+        return re.sub(r"\s+", " ", str(unidade or "")).strip(" .").casefold()
+
+    # ==== Consultas
+    def _documento(self, posicao: int) -> Document:
+        return Document(page_content=self.textos[posicao], metadata=dict(self.metadados[posicao]))
+
+    def codigo(self, codigo_bncc: str) -> Optional[Document]:
+        """Habilidade pelo código (códigos do Ensino Médio repetidos entre séries: a primeira)."""
+        posicoes = self._por_codigo.get(self.normalizar_codigo(codigo_bncc))
+        return self._documento(posicoes[0]) if posicoes else None
+
+    def ano(self, ano: str) -> List[Document]:
+        """Todas as habilidades do ano, na ordem da ingestão."""
+        return [self._documento(p) for p in self._por_ano.get(self.normalizar_ano(ano), [])]
+
+    def unidade_tematica(self, unidade: str, ano: Optional[str] = None) -> List[Document]:
+        """Todas as habilidades da unidade temática (opcionalmente só de um ano)."""
+        posicoes = self._por_unidade.get(self.normalizar_unidade(unidade), [])
+        if ano is not None:
+            do_ano = set(self._por_ano.get(self.normalizar_ano(ano), []))
+            posicoes = [p for p in posicoes if p in do_ano]
+        return [self._documento(p) for p in posicoes]
+
+    def anos(self) -> List[str]:
+        return sorted(a for a in self._por_ano if a)
+
+    # ==== Construção
+    @classmethod
+    def carregar(cls, indice=None, vectorstore=None, pasta_json: Optional[str] = None) -> "CatalogoBNCC":
+        """
+        Lê os documentos já ingeridos: do índice NumPy, da coleção do Chroma ou,
+        sem nenhum dos dois, dos JSON da BNCC.
+        """
+        if indice is not None and len(indice):
+            catalogo = cls(indice.textos, indice.metadados, "indice")
+        else:
+            catalogo = None
+            if vectorstore is not None:
+                try:
+                    dados = vectorstore.get(include=["documents", "metadatas"])
+                    if dados.get("documents"):
+                        catalogo = cls(dados["documents"], dados["metadatas"], "chroma")
+                except Exception as erro:
+                    logger.warning(f"Catálogo BNCC: coleção do Chroma indisponível ({erro})")
+            if catalogo is None:
+                documentos = [documento_bncc(h) for h in ler_habilidades_bncc(pasta_json)] if pasta_json else []
+                catalogo = cls([d.page_content for d in documentos], [d.metadata for d in documentos], "json")
+        logger.info(f"Catálogo BNCC ({catalogo.fonte}): {len(catalogo)} habilidades, "
+                    f"{len(catalogo._por_codigo)} códigos, {len(catalogo.anos())} anos")
+        return catalogo
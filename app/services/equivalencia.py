@@ -0,0 +1,457 @@
+"""
+Motor local de equivalência de respostas
+
+Decide, sem chamar o LLM, se duas respostas finais (criador × resolvedor ou
+resolvedor A × B) são equivalentes. Entende:
+- decimais em pt-BR e separadores de milhar ("4,18", "1.672", "1 672"); um literal
+  ambíguo ("1,000") vale pela leitura pt-BR quando a outra resposta não é ambígua
+- arredondamento: a tolerância é meia unidade da última casa decimal escrita na
+  resposta menos precisa ("3,14" × "3,1416"); inteiros precisam bater exatamente
+- frações, razões e porcentagens ("1/2", "1:200", "50%")
+- unidades e mudança de escala ("4,18 cm²" × "0,000418 m²")
+- pares ordenados e tuplas ("V(2, -1)", "(2; -1)")
+- conjuntos de raízes ("x₁ = 1 e x₂ = 3", "S = {3, 1}")
+- expressões algébricas ("2x + 4" × "4 + 2x"), com SymPy quando instalado ou,
+  sem ele, por avaliação numérica em pontos de amostragem; variáveis têm uma letra,
+  e palavras ("sim", "crescente", "alternativa c") deixam a resposta para o juiz
+
+`comparar` devolve (True | False | None, caminho); None significa indeciso, e só
+nesse caso o AgentService recorre ao juiz LLM. Cada decisão é contada em
+kora_equivalencia_total por caminho e resultado.
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from app.core import metrics
+import ast
+import logging
+import math
+import random
+import re
+
+try:
+    import sympy
+except ImportError:  # SymPy é opcional: sem ele, expressões são comparadas por amostragem
+    sympy = None
+
+logger = logging.getLogger(__name__)
+
+# Comparação na unidade base: além da meia unidade da última casa escrita, só a
+# folga de ponto flutuante (relativa, e absoluta para valores praticamente nulos)
+TOLERANCIA = 1e-9
+TOLERANCIA_ABSOLUTA = 1e-15
+
+# unidade → (grandeza, fator para a unidade base)
+UNIDADES: Dict[str, Tuple[str, float]] = {
+    "mm": ("comprimento", 1e-3), "cm": ("comprimento", 1e-2), "dm": ("comprimento", 1e-1),
+    "m": ("comprimento", 1.0), "km": ("comprimento", 1e3),
+    "mm²": ("area", 1e-6), "cm²": ("area", 1e-4), "dm²": ("area", 1e-2),
+    "m²": ("area", 1.0), "km²": ("area", 1e6), "ha": ("area", 1e4),
+    "mm³": ("volume", 1e-9), "cm³": ("volume", 1e-6), "dm³": ("volume", 1e-3),
+    "m³": ("volume", 1.0), "km³": ("volume", 1e9), "l": ("volume", 1e-3), "ml": ("volume", 1e-6),
+    "mg": ("massa", 1e-3), "g": ("massa", 1.0), "kg": ("massa", 1e3), "t": ("massa", 1e6),
+    "s": ("tempo", 1.0), "min": ("tempo", 60.0), "h": ("tempo", 3600.0),
+    "°": ("angulo", 1.0), "rad": ("angulo", 180.0 / math.pi),
+}
+_SINONIMOS_UNIDADE = {"graus": "°", "grau": "°", "litros": "l", "litro": "l", "ha": "ha"}
+
+_RE_UNIDADE = re.compile(
+    r"^(?P<valor>.*?(?:[\d)]|pi))\s*(?P<unidade>km|cm|mm|dm|m|ha|ml|l|mg|kg|g|t|min|s|h|rad|°|graus?|litros?)"
+    r"\s*(?P<exp>[²³]|\^?[23])?$"
+)
+_RE_NUMERO = re.compile(r"^[+-]?\d+(?:[.,\s]\d+)*$")
+_RE_ATRIBUICAO = re.compile(r"([a-z])\s*[0-9']*\s*=\s*")
+_FUNCOES = {"sqrt": math.sqrt, "sin": math.sin, "sen": math.sin, "cos": math.cos, "tan": math.tan,
+            "tg": math.tan, "log": math.log10, "ln": math.log, "exp": math.exp}
+_CONSTANTES = {"pi": math.pi}
+
+
+def _normalizar(texto: Any) -> str:
+    """Minúsculas, símbolos unicode para ASCII e espaços colapsados."""
+    t = str(texto or "").strip().lower()
+    trocas = {
+        "−": "-", "–": "-", "×": "*", "·": "*", "÷": "/", "π": "pi",
+        "₀": "0", "₁": "1", "₂": "2", "₃": "3", "₄": "4", "⁰": "0",
+        "¹": "1", "r$": "", "reais": "", "real": "",
+    }
+    for de, para in trocas.items():
+        t = t.replace(de, para)
+    t = re.sub(r"√\s*\(", "sqrt(", t)
+    t = re.sub(r"√\s*([\w.,]+)", r"sqrt(\1)", t)
+    t = re.sub(r"\s+", " ", t).strip().rstrip(".")
+    return t
+
+
+class _Numero:
+    """
+    Valor numérico com candidatos (separadores ambíguos), unidade e marca de porcentagem.
+
+    Cada candidato é (valor, casas decimais escritas); casas None = valor exato
+    (fração, constante, expressão avaliada), sem arredondamento a considerar.
+    """
+
+    def __init__(self, candidatos: List[Tuple[float, Optional[int]]], unidade: Optional[str] = None,
+                 percentual: bool = False):
+        self.candidatos = candidatos
+        self.unidade = unidade
+        self.percentual = percentual
+
+
+def _perto(x: float, y: float, tol: float = TOLERANCIA) -> bool:
+    return math.isclose(x, y, rel_tol=tol, abs_tol=TOLERANCIA_ABSOLUTA)
+
+
+def _meia_unidade(casas: Optional[int], escala: float) -> Optional[float]:
+    """Meia unidade da última casa escrita, na unidade base (None para valores exatos)."""
+    return None if casas is None else 0.5 * 10.0 ** -casas * escala
+
+
+def _tolerancia_arredondamento(a: Tuple[Optional[int], float], b: Tuple[Optional[int], float]) -> float:
+    """
+    Tolerância dada pela resposta menos precisa, cada lado como (casas, escala):
+    meia unidade da sua última casa decimal, ou zero se ela for um inteiro.
+    """
+    lados = [(_meia_unidade(casas, escala), casas) for casas, escala in (a, b) if casas is not None]
+    if not lados:
+        return 0.0
+    meia, casas = max(lados)
+    return meia if casas > 0 else 0.0
+
+
+class MotorEquivalencia:
+    """Comparação local de respostas; ver o docstring do módulo."""
+
+    def __init__(self, tolerancia: float = TOLERANCIA, amostras: int = 6):
+        self.tolerancia = tolerancia
+        self.amostras = amostras
+
+    # ==== API
+    def comparar(self, resposta_a: Any, resposta_b: Any) -> Tuple[Optional[bool], str]:
+        """
+        Compara duas respostas.
+
+        Returns:
+            (equivalentes ou None se indeciso, caminho da decisão)
+        """
+        try:
+            resultado, caminho = self._comparar(_normalizar(resposta_a), _normalizar(resposta_b))
+        except Exception as e:
+            logger.debug(f"Motor de equivalência falhou ({resposta_a!r} × {resposta_b!r}): {e}")
+            resultado, caminho = None, "indeciso"
+        metrics.equivalencia.inc(caminho=caminho, resultado=self.rotulo(resultado))
+        return resultado, caminho
+
+    @staticmethod
+    def rotulo(resultado: Optional[bool]) -> str:
+        return "indeciso" if resultado is None else ("equivalente" if resultado else "diferente")
+
+    def _comparar(self, a: str, b: str) -> Tuple[Optional[bool], str]:
+        if not a or not b:
+            return None, "indeciso"
+        if a == b or a.replace(" ", "") == b.replace(" ", ""):
+            return True, "texto"
+        va, vb = self._interpretar(a), self._interpretar(b)
+        if va is None or vb is None:
+            return None, "indeciso"
+        return self._comparar_valores(va, vb)
+
+    # ==== Interpretação
+    def _interpretar(self, t: str) -> Optional[Tuple[str, Any]]:
+        """Classifica a resposta: numero, tupla, conjunto ou expressao (None = não reconhecida)."""
+        # Conjunto entre chaves (opcionalmente "S = {...}")
+        m = re.fullmatch(r"(?:[a-z]\s*=\s*)?\{(.*)\}", t)
+        if m:
+            return self._colecao("conjunto", m.group(1))
+
+        # Várias atribuições: "x1 = 1 e x2 = 3" (raízes, sem ordem) ou "x = 2 e y = 3" (solução por variável)
+        variaveis = _RE_ATRIBUICAO.findall(t)
+        if len(variaveis) >= 2:
+            partes = [p.strip(" ,;") for p in _RE_ATRIBUICAO.split(t)[2::2]]
+            partes = [re.sub(r"\s+(?:e|ou)$", "", p).strip() for p in partes]
+            if len(set(variaveis)) == 1:
+                return self._colecao_de_partes("conjunto", partes)
+            if len(set(variaveis)) == len(variaveis):
+                return self._colecao_de_partes("tupla", [p for _, p in sorted(zip(variaveis, partes))])
+            return None
+
+        # Ponto/tupla: "(2, -1)", "v(2; -1)", "p = (1, 2)"
+        m = re.fullmatch(r"(?:[a-z]\s*=\s*)?[a-z]?\s*\((.*)\)", t)
+        if m and ("; " in m.group(1) or ";" in m.group(1) or "," in m.group(1)):
+            return self._colecao("tupla", m.group(1))
+
+        # "1 e 3", "1 ou 3"
+        if re.search(r"\s(?:e|ou)\s", t):
+            return self._colecao_de_partes("conjunto", re.split(r"\s+(?:e|ou)\s+", t))
+
+        # Atribuição única: compara o lado direito ("x = 5", "área = 4,18 cm²")
+        m = re.fullmatch(r"[a-zà-ú ]{1,20}=\s*(.+)", t)
+        if m and "=" not in m.group(1):
+            t = m.group(1).strip()
+
+        return self._escalar(t)
+
+    def _colecao(self, tipo: str, interior: str) -> Optional[Tuple[str, Any]]:
+        separador = ";" if ";" in interior else ","
+        return self._colecao_de_partes(tipo, interior.split(separador))
+
+    def _colecao_de_partes(self, tipo: str, partes: List[str]) -> Optional[Tuple[str, Any]]:
+        itens = [self._escalar(p.strip()) for p in partes if p.strip()]
+        if not itens or any(i is None for i in itens):
+            return None
+        return tipo, itens
+
+    def _escalar(self, t: str) -> Optional[Tuple[str, Any]]:
+        """Número (com unidade/porcentagem/fração) ou expressão."""
+        t = t.strip()
+        unidade = None
+        m = _RE_UNIDADE.match(t)
+        if m and not re.search(r"[a-z]", m.group("valor").replace("pi", "").replace("sqrt", "")):
+            base = _SINONIMOS_UNIDADE.get(m.group("unidade"), m.group("unidade"))
+            expoente = (m.group("exp") or "").lstrip("^").replace("2", "²").replace("3", "³")
+            unidade = base + expoente if base not in ("°", "ha", "l", "ml") else base
+            if unidade not in UNIDADES:
+                return None
+            t = m.group("valor").strip()
+
+        percentual = t.endswith("%")
+        if percentual:
+            t = t[:-1].strip()
+
+        candidatos = self._numero(t)
+        if candidatos is None:
+            m = re.fullmatch(r"(.+?)\s*[/:]\s*(.+)", t)
+            if m:
+                num, den = self._numero(m.group(1)), self._numero(m.group(2))
+                if num and den and all(d != 0 for d, _ in den):
+                    candidatos = [(n / d, None) for n, _ in num for d, _ in den]
+        if candidatos is None:
+            expr = self._expressao(t)
+            if expr is None:
+                return None
+            if not expr[1]:
+                # Expressão sem variáveis (ex: "sqrt(2)/2", "2pi"): avalia
+                valor = self._avaliar(expr[0], {})
+                if valor is None:
+                    return None
+                candidatos = [(valor, None)]
+            elif unidade is None and not percentual:
+                return "expressao", expr
+            else:
+                return None
+        return "numero", _Numero(candidatos, unidade, percentual)
+
+    def _numero(self, t: str) -> Optional[List[Tuple[float, Optional[int]]]]:
+        """
+        Candidatos (valor, casas decimais) para um literal numérico em pt-BR (ou en),
+        mais de um se for ambíguo.
+        """
+        t = t.strip()
+        if not _RE_NUMERO.fullmatch(t):
+            return None
+        sinal = -1.0 if t.startswith("-") else 1.0
+        t = t.lstrip("+-")
+        # Espaço só como separador de milhar ("1 672")
+        if " " in t:
+            if not re.fullmatch(r"\d{1,3}(?: \d{3})+(?:[.,]\d+)?", t):
+                return None
+            t = t.replace(" ", "")
+        tem_ponto, tem_virgula = "." in t, "," in t
+        if tem_ponto and tem_virgula:
+            decimal = "," if t.rfind(",") > t.rfind(".") else "."
+            milhar = "." if decimal == "," else ","
+            casas = len(t) - t.rfind(decimal) - 1
+            return [(sinal * float(t.replace(milhar, "").replace(decimal, ".")), casas)]
+        sep = "," if tem_virgula else ("." if tem_ponto else None)
+        if sep is None:
+            return [(sinal * float(t), 0)]
+        if t.count(sep) > 1:
+            if not re.fullmatch(rf"\d{{1,3}}(?:\{sep}\d{{3}})+", t):
+                return None
+            return [(sinal * float(t.replace(sep, "")), 0)]
+        inteiro, frac = t.split(sep)
+        decimal = (sinal * float(f"{inteiro}.{frac}"), len(frac))
+        if len(frac) == 3 and 1 <= len(inteiro) <= 3:
+            # "1.672" / "1,672": milhar ou decimal conforme a convenção de quem escreveu;
+            # a leitura pt-BR (vírgula decimal, ponto de milhar) vem primeiro
+            milhar = (sinal * float(inteiro + frac), 0)
+            return [decimal, milhar] if sep == "," else [milhar, decimal]
+        return [decimal]
+
+    def _expressao(self, t: str) -> Optional[Tuple[str, List[str]]]:
+        """Converte para sintaxe Python (potência, multiplicação implícita) e valida a AST."""
+        e = t.replace("^", "**").replace("²", "**2").replace("³", "**3")
+        e = re.sub(r"(\d),(\d)", r"\1.\2", e)
+        if "=" in e:
+            if e.count("=") != 1:
+                return None
+            lhs, rhs = e.split("=")
+            e = f"({lhs})-({rhs})"
+        # Palavras que não são função nem constante ("sim", "crescente", "alternativa c")
+        # são texto livre, não produto de variáveis: fica para o juiz
+        if any(len(p) > 1 and p not in _FUNCOES and p not in _CONSTANTES for p in re.findall(r"[a-zà-ú]+", e)):
+            return None
+        e = re.sub(r"\s+", "", e)
+        # Multiplicação implícita: 2x, 2(x+1), (x+1)(x-1), x(x+1)
+        e = re.sub(r"(\d)([a-z(])", r"\1*\2", e)
+        e = re.sub(r"\)([a-z\d(])", r")*\1", e)
+        e = re.sub(r"(?<![a-z])([a-z])\(", r"\1*(", e)
+        try:
+            arvore = ast.parse(e, mode="eval")
+        except SyntaxError:
+            return None
+        variaveis = set()
+        for no in ast.walk(arvore):
+            if isinstance(no, ast.Name):
+                if no.id in _FUNCOES or no.id in _CONSTANTES:
+                    continue
+                if len(no.id) != 1:
+                    return None
+                variaveis.add(no.id)
+            elif isinstance(no, ast.Call):
+                if not isinstance(no.func, ast.Name) or no.func.id not in _FUNCOES or len(no.args) != 1:
+                    return None
+            elif not isinstance(no, (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Load,
+                                     ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd)):
+                return None
+        return e, sorted(variaveis)
+
+    def _avaliar(self, expr: str, valores: Dict[str, float]) -> Optional[float]:
+        """Avalia uma expressão já validada por _expressao."""
+        def _ev(no: ast.AST) -> float:
+            if isinstance(no, ast.Expression):
+                return _ev(no.body)
+            if isinstance(no, ast.Constant) and isinstance(no.value, (int, float)):
+                return float(no.value)
+            if isinstance(no, ast.Name):
+                return _CONSTANTES[no.id] if no.id in _CONSTANTES else valores[no.id]
+            if isinstance(no, ast.UnaryOp):
+                v = _ev(no.operand)
+                return -v if isinstance(no.op, ast.USub) else v
+            if isinstance(no, ast.Call):
+                return _FUNCOES[no.func.id](_ev(no.args[0]))
+            if isinstance(no, ast.BinOp):
+                x, y = _ev(no.left), _ev(no.right)
+                if isinstance(no.op, ast.Add):
+                    return x + y
+                if isinstance(no.op, ast.Sub):
+                    return x - y
+                if isinstance(no.op, ast.Mult):
+                    return x * y
+                if isinstance(no.op, ast.Div):
+                    return x / y
+                if isinstance(no.op, ast.Pow):
+                    if abs(y) > 64:
+                        raise ValueError("expoente grande demais")
+                    return x ** y
+            raise ValueError(f"nó não suportado: {type(no).__name__}")
+        try:
+            valor = _ev(ast.parse(expr, mode="eval"))
+            return float(valor) if isinstance(valor, (int, float)) and math.isfinite(valor) else None
+        except (ValueError, ZeroDivisionError, OverflowError, KeyError, TypeError):
+            return None
+
+    # ==== Comparação
+    def _comparar_valores(self, va: Tuple[str, Any], vb: Tuple[str, Any]) -> Tuple[Optional[bool], str]:
+        tipo_a, tipo_b = va[0], vb[0]
+        # Conjunto/tupla de um elemento equivale ao próprio elemento
+        if tipo_a in ("conjunto", "tupla") and len(va[1]) == 1 and tipo_b not in ("conjunto", "tupla"):
+            return self._comparar_valores(va[1][0], vb)
+        if tipo_b in ("conjunto", "tupla") and len(vb[1]) == 1 and tipo_a not in ("conjunto", "tupla"):
+            return self._comparar_valores(va, vb[1][0])
+
+        if tipo_a == tipo_b == "numero":
+            return self._comparar_numeros(va[1], vb[1])
+        if tipo_a == tipo_b == "expressao":
+            return self._comparar_expressoes(va[1], vb[1])
+        if tipo_a == tipo_b == "tupla":
+            if len(va[1]) != len(vb[1]):
+                return False, "tupla"
+            resultados = [self._comparar_valores(x, y)[0] for x, y in zip(va[1], vb[1])]
+            if all(r is True for r in resultados):
+                return True, "tupla"
+            return (False, "tupla") if any(r is False for r in resultados) else (None, "indeciso")
+        if tipo_a == tipo_b == "conjunto":
+            return self._comparar_conjuntos(va[1], vb[1])
+        return None, "indeciso"
+
+    def _comparar_numeros(self, a: _Numero, b: _Numero) -> Tuple[Optional[bool], str]:
+        caminho = "numerico"
+        fator_a = fator_b = 1.0
+        if a.unidade and b.unidade:
+            grandeza_a, fator_a = UNIDADES[a.unidade]
+            grandeza_b, fator_b = UNIDADES[b.unidade]
+            if grandeza_a != grandeza_b:
+                return False, "unidade"
+            # Os dois lados vão para a unidade base da grandeza
+            caminho = "unidade"
+
+        escalas_a = [fator_a]
+        escalas_b = [fator_b]
+        if a.percentual != b.percentual:
+            # "50%" equivale a "0,5" e, em geral, a "50"
+            if a.percentual:
+                escalas_a = [fator_a, fator_a * 0.01]
+            else:
+                escalas_b = [fator_b, fator_b * 0.01]
+            caminho = "percentual"
+
+        # Literal ambíguo contra um não ambíguo: só a leitura pt-BR
+        candidatos_a, candidatos_b = a.candidatos, b.candidatos
+        if len(candidatos_a) > 1 and len(candidatos_b) == 1:
+            candidatos_a = candidatos_a[:1]
+        elif len(candidatos_b) > 1 and len(candidatos_a) == 1:
+            candidatos_b = candidatos_b[:1]
+
+        for x, casas_x in candidatos_a:
+            for y, casas_y in candidatos_b:
+                for ea in escalas_a:
+                    for eb in escalas_b:
+                        arredondamento = _tolerancia_arredondamento((casas_x, ea), (casas_y, eb))
+                        if abs(x * ea - y * eb) <= arredondamento or _perto(x * ea, y * eb, self.tolerancia):
+                            return True, caminho
+        return False, caminho
+
+    def _comparar_conjuntos(self, a: List[Any], b: List[Any]) -> Tuple[Optional[bool], str]:
+        if len(a) != len(b):
+            return False, "conjunto"
+        restantes = list(b)
+        indeciso = False
+        for x in a:
+            achou = None
+            for i, y in enumerate(restantes):
+                r = self._comparar_valores(x, y)[0]
+                if r is True:
+                    achou = i
+                    break
+                if r is None:
+                    indeciso = True
+            if achou is None:
+                return (None, "indeciso") if indeciso else (False, "conjunto")
+            restantes.pop(achou)
+        return True, "conjunto"
+
+    def _comparar_expressoes(self, a: Tuple[str, List[str]], b: Tuple[str, List[str]]) -> Tuple[Optional[bool], str]:
+        expr_a, expr_b = a[0], b[0]
+        if sympy is not None:
+            try:
+                if sympy.simplify(sympy.sympify(expr_a) - sympy.sympify(expr_b)) == 0:
+                    return True, "algebrico"
+            except Exception:
+                pass
+        # Avaliação em pontos de amostragem (determinística)
+        variaveis = sorted(set(a[1]) | set(b[1]))
+        rng = random.Random(f"{expr_a}|{expr_b}")
+        validos = 0
+        for _ in range(self.amostras * 3):
+            valores = {v: rng.uniform(0.5, 3.5) for v in variaveis}
+            x, y = self._avaliar(expr_a, valores), self._avaliar(expr_b, valores)
+            if x is None or y is None:
+                continue
+            if not math.isclose(x, y, rel_tol=1e-7, abs_tol=1e-9):
+                return False, "algebrico"
+            validos += 1
+            if validos >= self.amostras:
+                return True, "algebrico"
+        return None, "indeciso"
+
+
+# Instância global do motor de equivalência
+motor_equivalencia = MotorEquivalencia()
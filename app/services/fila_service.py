@@ -0,0 +1,211 @@
+"""
+Fila durável de trabalhos em SQLite (tabela fila_trabalhos)
+
+Usada quando settings.JOBS_BACKEND == "fila": a API apenas enfileira e consulta,
+e os processos de `python -m app.worker` reivindicam e executam os trabalhos.
+A reivindicação é um UPDATE condicional (compare-and-set), seguro entre processos.
+"""
+from typing import Dict, Any, Optional, List
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import or_, and_, case
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import TrabalhoFila
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _agora() -> datetime:
+    """Horário atual em UTC (naive, como armazenado no SQLite)."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class FilaService:
+    """
+    Operações sobre a fila durável: enfileirar, reivindicar com lease, renovar,
+    registrar progresso, concluir/falhar e consultar.
+    """
+
+    def _para_dict(self, t: TrabalhoFila) -> Dict[str, Any]:
+        """Converte um trabalho no mesmo formato de estado usado pelo JobService."""
+        return {
+            "job_id": t.job_id,
+            "tipo": t.tipo,
+            "status": t.status,
+            "etapa": t.etapa,
+            "parciais": t.parciais or {},
+            "resultado": t.resultado,
+            "erro": t.erro,
+            "tentativas": t.tentativas,
+            "criado_em": t.created_at.isoformat() if t.created_at else "",
+            "atualizado_em": t.updated_at.isoformat() if t.updated_at else "",
+        }
+
+    def enfileirar(self, tipo: str, payload: Dict[str, Any]) -> str:
+        """
+        Grava um novo trabalho pendente na fila.
+
+        Returns:
+            job_id do trabalho
+        """
+        db = SessionLocal()
+        try:
+            trabalho = TrabalhoFila(
+                tipo=tipo,
+                payload=payload,
+                status="pendente",
+                etapa="na_fila",
+                parciais={},
+                max_tentativas=settings.FILA_MAX_TENTATIVAS,
+            )
+            db.add(trabalho)
+            db.commit()
+            logger.info(f"Trabalho {trabalho.job_id} enfileirado ({tipo})")
+            return trabalho.job_id
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def reivindicar(self, worker_id: str, tipos: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Reivindica o trabalho disponível mais antigo (pendente ou com lease expirado).
+
+        Args:
+            worker_id: Identificador do worker que recebe o lease
+            tipos: Restringe aos tipos informados (None = todos)
+
+        Returns:
+            {"job_id", "tipo", "payload", "tentativas"} ou None se a fila estiver vazia
+        """
+        db = SessionLocal()
+        try:
+            self._descartar_esgotados(db)
+            agora = _agora()
+            disponivel = or_(
+                TrabalhoFila.status == "pendente",
+                and_(TrabalhoFila.status == "executando", TrabalhoFila.lease_expira_em < agora),
+            )
+            consulta = db.query(TrabalhoFila.job_id).filter(disponivel)
+            if tipos:
+                consulta = consulta.filter(TrabalhoFila.tipo.in_(tipos))
+            candidatos = [row.job_id for row in consulta.order_by(TrabalhoFila.created_at).limit(5)]
+
+            for job_id in candidatos:
+                # Compare-and-set: só um worker consegue mudar o lease deste trabalho
+                atualizados = db.query(TrabalhoFila).filter(
+                    TrabalhoFila.job_id == job_id, disponivel
+                ).update({
+                    TrabalhoFila.status: "executando",
+                    TrabalhoFila.lease_owner: worker_id,
+                    TrabalhoFila.lease_expira_em: agora + timedelta(seconds=settings.FILA_LEASE_S),
+                    TrabalhoFila.tentativas: TrabalhoFila.tentativas + 1,
+                    TrabalhoFila.updated_at: agora,
+                }, synchronize_session=False)
+                db.commit()
+                if atualizados == 1:
+                    t = db.query(TrabalhoFila).filter(TrabalhoFila.job_id == job_id).first()
+                    if t.tentativas > 1:
+                        logger.warning(f"Trabalho {job_id} recuperado (tentativa {t.tentativas})")
+                    return {"job_id": t.job_id, "tipo": t.tipo, "payload": t.payload, "tentativas": t.tentativas}
+            return None
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _descartar_esgotados(self, db) -> None:
+        """Marca como erro os trabalhos com lease expirado que já esgotaram as tentativas."""
+        esgotados = db.query(TrabalhoFila).filter(
+            TrabalhoFila.status == "executando",
+            TrabalhoFila.lease_expira_em < _agora(),
+            TrabalhoFila.tentativas >= TrabalhoFila.max_tentativas,
+        ).update({
+            TrabalhoFila.status: "erro",
+            TrabalhoFila.erro: "Worker interrompido repetidamente (tentativas esgotadas)",
+            TrabalhoFila.lease_owner: None,
+            TrabalhoFila.lease_expira_em: None,
+        }, synchronize_session=False)
+        if esgotados:
+            logger.warning(f"{esgotados} trabalho(s) descartado(s) após esgotar tentativas")
+        db.commit()
+
+    def _atualizar_com_lease(self, job_id: str, worker_id: str, campos: Dict[str, Any]) -> bool:
+        """Atualiza um trabalho apenas se o worker ainda detiver o lease."""
+        db = SessionLocal()
+        try:
+            campos = dict(campos)
+            campos[TrabalhoFila.updated_at] = _agora()
+            atualizados = db.query(TrabalhoFila).filter(
+                TrabalhoFila.job_id == job_id,
+                TrabalhoFila.lease_owner == worker_id,
+                TrabalhoFila.status == "executando",
+            ).update(campos, synchronize_session=False)
+            db.commit()
+            if not atualizados:
+                logger.warning(f"Worker {worker_id} perdeu o lease do trabalho {job_id}")
+            return atualizados == 1
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def renovar_lease(self, job_id: str, worker_id: str) -> bool:
+        """Estende o lease de um trabalho em execução (heartbeat)."""
+        return self._atualizar_com_lease(job_id, worker_id, {
+            TrabalhoFila.lease_expira_em: _agora() + timedelta(seconds=settings.FILA_LEASE_S),
+        })
+
+    def registrar_progresso(
+        self,
+        job_id: str,
+        worker_id: str,
+        etapa: str,
+        parciais: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """Atualiza etapa e resultados parciais de um trabalho em execução."""
+        campos: Dict[Any, Any] = {TrabalhoFila.etapa: etapa}
+        if parciais is not None:
+            campos[TrabalhoFila.parciais] = parciais
+        return self._atualizar_com_lease(job_id, worker_id, campos)
+
+    def concluir(self, job_id: str, worker_id: str, resultado: Dict[str, Any]) -> bool:
+        """Grava o resultado final e libera o lease."""
+        return self._atualizar_com_lease(job_id, worker_id, {
+            TrabalhoFila.status: "concluido",
+            TrabalhoFila.etapa: "concluido",
+            TrabalhoFila.resultado: resultado,
+            TrabalhoFila.lease_owner: None,
+            TrabalhoFila.lease_expira_em: None,
+        })
+
+    def falhar(self, job_id: str, worker_id: str, erro: str) -> bool:
+        """
+        Registra uma falha: devolve o trabalho à fila se ainda houver tentativas
+        (max_tentativas do próprio trabalho), senão marca como erro definitivo.
+        """
+        definitivo = TrabalhoFila.tentativas >= TrabalhoFila.max_tentativas
+        return self._atualizar_com_lease(job_id, worker_id, {
+            TrabalhoFila.status: case((definitivo, "erro"), else_="pendente"),
+            TrabalhoFila.etapa: case((definitivo, TrabalhoFila.etapa), else_="na_fila"),
+            TrabalhoFila.erro: erro,
+            TrabalhoFila.lease_owner: None,
+            TrabalhoFila.lease_expira_em: None,
+        })
+
+    def obter(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Retorna o estado de um trabalho ou None se não existir."""
+        db = SessionLocal()
+        try:
+            t = db.query(TrabalhoFila).filter(TrabalhoFila.job_id == job_id).first()
+            return self._para_dict(t) if t else None
+        finally:
+            db.close()
+
+
+# Instância global da fila
+fila_service = FilaService()
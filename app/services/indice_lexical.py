@@ -0,0 +1,151 @@
+"""
+Índice lexical BM25 das habilidades BNCC (100% local)
+
+Embeddings genéricos casam mal códigos ("EF09MA06") e termos curtos de Matemática
+("escala", "vértice"), e toda busca vetorial depende do provedor de embeddings. O
+índice BM25 cobre os dois casos: os textos são tokenizados sem acentos (parte dos
+JSON da BNCC já vem sem acentuação), sem stopwords e com um stemmer leve de
+português (plural, sufixos derivacionais e vogal final), e códigos BNCC viram um
+token único. A busca é a soma de listas invertidas com pesos BM25 pré-calculados.
+
+O índice é gerado na ingestão (scripts/ingest_bncc.py) em RAG_LEXICO_ARQUIVO; sem
+arquivo válido, o RAGService o monta a partir do catálogo BNCC e grava.
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from collections import Counter
+from pathlib import Path
+from app.services.indice_vetorial import IndiceMetadados
+import numpy as np
+import json
+import math
+import re
+import unicodedata
+
+# Muda quando a tokenização muda (arquivos antigos são reconstruídos)
+VERSAO_TOKENIZACAO = 1
+
+STOPWORDS = frozenset("""
+a ao aos as com como da das de do dos e em entre na nas no nos o os ou para pela pelas
+pelo pelos por que se sem seu seus sua suas um uma umas uns
+""".split())
+
+# Sufixos derivacionais, do mais longo para o mais curto (texto já sem acentos)
+SUFIXOS = (
+    "amentos", "imentos", "amento", "imento", "adoras", "adores", "amente", "idades",
+    "acoes", "icoes", "adora", "ador", "acao", "icao", "ativa", "ativo", "itiva", "itivo",
+    "idade", "mente", "avel", "ivel", "ismo", "ista", "ncia",
+    "ado", "ada", "ido", "ida", "ico", "ica", "oso", "osa", "ar", "er", "ir",
+)
+
+# Plural → singular
+PLURAIS = (("coes", "cao"), ("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"),
+           ("ois", "ol"), ("res", "r"), ("ns", "m"))
+
+RADICAL_MINIMO = 3
+
+
+def dobrar_acentos(texto: str) -> str:
+    """Minúsculas e sem acentos/cedilha."""
+    decomposto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+
+def radical(palavra: str) -> str:
+    """Stemmer leve de português: plural, um sufixo derivacional e a vogal final."""
+    for final, troca in PLURAIS:
+        if palavra.endswith(final) and len(palavra) - len(final) >= RADICAL_MINIMO:
+            palavra = palavra[: -len(final)] + troca
+            break
+    else:
+        if palavra.endswith("s") and len(palavra) > RADICAL_MINIMO + 1:
+            palavra = palavra[:-1]
+    for sufixo in SUFIXOS:
+        if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= RADICAL_MINIMO:
+            palavra = palavra[: -len(sufixo)]
+            break
+    if palavra[-1:] in ("a", "e", "o") and len(palavra) > RADICAL_MINIMO:
+        palavra = palavra[:-1]
+    return palavra
+
+
+def tokenizar(texto: str) -> List[str]:
+    """Termos do texto; tokens com dígitos (códigos BNCC, números) não passam pelo stemmer."""
+    termos = []
+    for token in re.findall(r"[a-z0-9]+", dobrar_acentos(texto)):
+        if token in STOPWORDS or (len(token) < 2 and not token.isdigit()):
+            continue
+        termos.append(token if any(c.isdigit() for c in token) else radical(token))
+    return termos
+
+
+class IndiceBM25(IndiceMetadados):
+    """Listas invertidas com pesos BM25 + textos e metadata, com busca top-k filtrada."""
+
+    def __init__(
+        self,
+        textos: List[str],
+        metadados: List[Dict[str, Any]],
+        tokens: Optional[List[List[str]]] = None,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        """
+        Args:
+            textos: page_content de cada documento
+            metadados: metadata de cada documento
+            tokens: Termos de cada documento (lidos do arquivo; None = tokeniza os textos)
+            k1: Saturação da frequência do termo
+            b: Normalização pelo tamanho do documento
+        """
+        super().__init__(textos, metadados)
+        self.tokens = tokens if tokens is not None else [tokenizar(t) for t in self.textos]
+        n = len(self.tokens)
+        comprimentos = np.array([len(t) for t in self.tokens], dtype=np.float32)
+        media = float(comprimentos.mean()) if n else 0.0
+        normalizacao = k1 * (1 - b + b * comprimentos / media) if media else np.full(n, k1, dtype=np.float32)
+
+        ocorrencias: Dict[str, List[Tuple[int, int]]] = {}
+        for posicao, termos in enumerate(self.tokens):
+            for termo, tf in Counter(termos).items():
+                ocorrencias.setdefault(termo, []).append((posicao, tf))
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for termo, lista in ocorrencias.items():
+            posicoes = np.array([p for p, _ in lista], dtype=np.int64)
+            tf = np.array([f for _, f in lista], dtype=np.float32)
+            idf = math.log(1 + (n - len(lista) + 0.5) / (len(lista) + 0.5))
+            pesos = idf * tf * (k1 + 1) / (tf + normalizacao[posicoes])
+            self._postings[termo] = (posicoes, pesos.astype(np.float32))
+
+    def pontuar(self, consulta: str) -> np.ndarray:
+        """Pontuação BM25 de todos os documentos para a consulta."""
+        pontuacoes = np.zeros(len(self), dtype=np.float32)
+        for termo in set(tokenizar(consulta)):
+            lista = self._postings.get(termo)
+            if lista is not None:
+                pontuacoes[lista[0]] += lista[1]
+        return pontuacoes
+
+    def buscar(self, consulta: str, k: int, filtros: Optional[Dict[str, Any]] = None) -> List[Tuple[int, float]]:
+        """
+        Top-k por BM25 (só documentos com algum termo da consulta).
+
+        Returns:
+            Pares (posição do documento, pontuação), da maior para a menor
+        """
+        return self._topo(self.pontuar(consulta), k, filtros, minimo=0.0)
+
+    # ==== Persistência
+    def salvar(self, caminho: str) -> None:
+        dados = {"versao": VERSAO_TOKENIZACAO, "textos": self.textos, "metadados": self.metadados, "tokens": self.tokens}
+        Path(caminho).parent.mkdir(parents=True, exist_ok=True)
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump(dados, f, ensure_ascii=False)
+
+    @classmethod
+    def abrir(cls, caminho: str) -> Optional["IndiceBM25"]:
+        """Índice gravado, ou None se o arquivo for de outra versão da tokenização."""
+        with open(caminho, encoding="utf-8") as f:
+            dados = json.load(f)
+        if dados.get("versao") != VERSAO_TOKENIZACAO:
+            return None
+        return cls(dados["textos"], dados["metadados"], dados["tokens"])
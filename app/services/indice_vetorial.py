@@ -0,0 +1,294 @@
+"""
+Índice vetorial em memória (NumPy) das habilidades BNCC
+
+A coleção de Matemática tem ~380 habilidades; em vez de passar cada busca pelo
+cliente persistente do Chroma, todos os embeddings ficam em uma matriz float32
+contígua (linhas normalizadas) e a busca top-k por cosseno é um produto
+matriz-vetor. Os filtros de metadata mais usados (ano, unidade_tematica,
+codigo_bncc) têm máscaras booleanas pré-calculadas; os demais campos são
+filtrados na hora. Aceita o mesmo formato de filtro do Chroma: {"ano": "8º"},
+{"ano": {"$in": [...]}}, {"$and": [...]}, {"$or": [...]}.
+
+O índice é gravado em RAG_INDICE_ARQUIVO (.npz) e recarregado nos próximos
+starts. Sem arquivo válido, é exportado da coleção do Chroma ou, sem Chroma,
+montado a partir dos JSON da BNCC com o provedor de embeddings configurado.
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from pathlib import Path
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+import numpy as np
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Campos com máscaras pré-calculadas
+CAMPOS_MASCARA = ("ano", "unidade_tematica", "codigo_bncc")
+
+# Embeddings por chamada ao montar o índice a partir dos JSON
+LOTE_EMBEDDINGS = 64
+
+
+def ler_habilidades_bncc(pasta: str) -> List[Dict[str, Any]]:
+    """Habilidades de todos os JSON da pasta (ordem dos arquivos)."""
+    habilidades: List[Dict[str, Any]] = []
+    for arquivo in sorted(Path(pasta).glob("*.json")):
+        with open(arquivo, encoding="utf-8") as f:
+            habilidades.extend(json.load(f))
+    return habilidades
+
+
+def documento_bncc(hab: Dict[str, Any]) -> Document:
+    """Documento de uma habilidade (mesmo conteúdo e metadata de scripts/ingest_bncc.py)."""
+    page_content = f"""
+Ano: {hab.get('ano', 'N/A')}
+Unidade Temática: {hab.get('unidades_tematicas', 'N/A')}
+Objeto de Conhecimento: {hab.get('objetos_de_conhecimento', 'N/A')}
+Código BNCC: {hab.get('codigo_bncc', 'N/A')}
+Habilidade: {hab.get('habilidade_bncc', 'N/A')}
+    """.strip()
+    metadata = {
+        "componente": hab.get('componente', 'Matemática'),
+        "ano": hab.get('ano', 'N/A'),
+        "unidade_tematica": hab.get('unidades_tematicas', 'N/A'),
+        "objeto_conhecimento": hab.get('objetos_de_conhecimento', 'N/A'),
+        "codigo_bncc": hab.get('codigo_bncc', 'N/A'),
+    }
+    if hab.get('competencias_especificas'):
+        metadata['competencias_especificas'] = hab['competencias_especificas']
+    if hab.get('competencias_gerais'):
+        metadata['competencias_gerais'] = hab['competencias_gerais']
+    return Document(page_content=page_content, metadata=metadata)
+
+
+class IndiceMetadados:
+    """Documentos com filtros de metadata no formato do Chroma e seleção top-k por pontuação."""
+
+    def __init__(self, textos: List[str], metadados: List[Dict[str, Any]]):
+        self.textos = list(textos)
+        self.metadados = [dict(m or {}) for m in metadados]
+        self._todos = np.ones(len(self.textos), dtype=bool)
+        self._mascaras: Dict[str, Dict[str, np.ndarray]] = {}
+        for campo in CAMPOS_MASCARA:
+            valores = np.array([str(m.get(campo, "")) for m in self.metadados], dtype=object)
+            self._mascaras[campo] = {v: valores == v for v in set(valores)}
+
+    def __len__(self) -> int:
+        return len(self.textos)
+
+    # ==== Filtros
+    def _mascara_campo(self, campo: str, condicao: Any) -> np.ndarray:
+        if isinstance(condicao, dict):
+            if "$in" in condicao:
+                mascara = np.zeros(len(self), dtype=bool)
+                for valor in condicao["$in"]:
+                    mascara |= self._mascara_campo(campo, valor)
+                return mascara
+            if "$eq" in condicao:
+                return self._mascara_campo(campo, condicao["$eq"])
+            if "$ne" in condicao:
+                return ~self._mascara_campo(campo, condicao["$ne"])
+            raise ValueError(f"Operador de filtro não suportado: {condicao}")
+        por_valor = self._mascaras.get(campo)
+        if por_valor is not None:
+            mascara = por_valor.get(str(condicao))
+            return mascara if mascara is not None else np.zeros(len(self), dtype=bool)
+        return np.array([m.get(campo) == condicao for m in self.metadados], dtype=bool)
+
+    def mascara(self, filtros: Optional[Dict[str, Any]]) -> np.ndarray:
+        """Máscara booleana dos documentos que atendem ao filtro (formato do Chroma)."""
+        if not filtros:
+            return self._todos
+        mascara = self._todos.copy()
+        for chave, condicao in filtros.items():
+            if chave == "$and":
+                for sub in condicao:
+                    mascara &= self.mascara(sub)
+            elif chave == "$or":
+                alguma = np.zeros(len(self), dtype=bool)
+                for sub in condicao:
+                    alguma |= self.mascara(sub)
+                mascara &= alguma
+            else:
+                mascara &= self._mascara_campo(chave, condicao)
+        return mascara
+
+    # ==== Seleção
+    def _topo(
+        self,
+        pontuacoes: np.ndarray,
+        k: int,
+        filtros: Optional[Dict[str, Any]],
+        minimo: Optional[float] = None,
+    ) -> List[Tuple[int, float]]:
+        """Top-k de um vetor de pontuações (todas as posições), restrito ao filtro e acima de minimo."""
+        if filtros or minimo is not None:
+            mascara = self.mascara(filtros)
+            if minimo is not None:
+                mascara = mascara & (pontuacoes > minimo)
+            candidatos = np.flatnonzero(mascara)
+            pontuacoes = pontuacoes[candidatos]
+        else:
+            candidatos = None
+        k = min(k, pontuacoes.shape[0])
+        if k <= 0:
+            return []
+        topo = np.argpartition(-pontuacoes, k - 1)[:k]
+        topo = topo[np.argsort(-pontuacoes[topo], kind="stable")]
+        posicoes = candidatos[topo] if candidatos is not None else topo
+        return [(int(p), float(pontuacoes[t])) for p, t in zip(posicoes, topo)]
+
+    def documento(self, posicao: int) -> Document:
+        return Document(page_content=self.textos[posicao], metadata=dict(self.metadados[posicao]))
+
+
+class IndiceNumpy(IndiceMetadados):
+    """Matriz de embeddings normalizados + textos e metadata, com busca top-k filtrada."""
+
+    def __init__(self, vetores: np.ndarray, textos: List[str], metadados: List[Dict[str, Any]], origem: Dict[str, Any]):
+        """
+        Args:
+            vetores: Embeddings dos documentos (n × d)
+            textos: page_content de cada documento
+            metadados: metadata de cada documento
+            origem: Provedor, modelo e fonte do índice (gravados junto com o arquivo)
+        """
+        super().__init__(textos, metadados)
+        matriz = np.ascontiguousarray(vetores, dtype=np.float32)
+        normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+        normas[normas == 0] = 1.0
+        self.matriz = np.ascontiguousarray(matriz / normas)
+        self.origem = dict(origem)
+
+    # ==== Busca
+    @staticmethod
+    def _unitario(vetor: List[float]) -> np.ndarray:
+        consulta = np.asarray(vetor, dtype=np.float32)
+        norma = float(np.linalg.norm(consulta))
+        return consulta / norma if norma > 0 else consulta
+
+    def buscar(self, vetor: List[float], k: int, filtros: Optional[Dict[str, Any]] = None) -> List[Tuple[int, float]]:
+        """
+        Top-k por similaridade de cosseno.
+
+        Args:
+            vetor: Embedding da consulta
+            k: Número de resultados
+            filtros: Filtro de metadata (formato do Chroma)
+
+        Returns:
+            Pares (posição do documento, similaridade), do mais para o menos similar
+        """
+        return self._topo(self.matriz @ self._unitario(vetor), k, filtros)
+
+    def buscar_lote(
+        self,
+        vetores: List[List[float]],
+        k: int,
+        filtros: Optional[List[Optional[Dict[str, Any]]]] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Top-k de várias consultas com um único produto de matrizes.
+
+        Args:
+            vetores: Embeddings das consultas
+            k: Número de resultados por consulta
+            filtros: Filtro de cada consulta (mesma ordem; None = sem filtro)
+
+        Returns:
+            Para cada consulta, pares (posição do documento, similaridade)
+        """
+        if not vetores:
+            return []
+        consultas = np.vstack([self._unitario(v) for v in vetores])
+        similaridades = self.matriz @ consultas.T
+        filtros = filtros or [None] * len(vetores)
+        return [self._topo(similaridades[:, j], k, f) for j, f in enumerate(filtros)]
+
+    # ==== Persistência e construção
+    def salvar(self, caminho: str) -> None:
+        """Grava matriz e documentos em .npz (sem pickle)."""
+        dados = json.dumps({"origem": self.origem, "textos": self.textos, "metadados": self.metadados}, ensure_ascii=False)
+        Path(caminho).parent.mkdir(parents=True, exist_ok=True)
+        with open(caminho, "wb") as f:
+            np.savez(f, matriz=self.matriz, dados=np.array(dados))
+
+    @classmethod
+    def abrir(cls, caminho: str) -> "IndiceNumpy":
+        with np.load(caminho, allow_pickle=False) as arquivo:
+            dados = json.loads(str(arquivo["dados"]))
+            return cls(arquivo["matriz"], dados["textos"], dados["metadados"], dados["origem"])
+
+    @classmethod
+    def do_chroma(cls, persist_directory: str, colecao: str, origem: Dict[str, Any]) -> Optional["IndiceNumpy"]:
+        """Exporta todos os embeddings e documentos de uma coleção persistente do Chroma."""
+        try:
+            import chromadb
+        except ImportError:
+            return None
+        if not Path(persist_directory).exists():
+            return None
+        cliente = chromadb.PersistentClient(path=persist_directory)
+        try:
+            dados = cliente.get_collection(colecao).get(include=["embeddings", "documents", "metadatas"])
+        except Exception as erro:
+            logger.warning(f"Índice NumPy: coleção {colecao} indisponível no Chroma ({erro})")
+            return None
+        if dados.get("embeddings") is None or not len(dados["embeddings"]):
+            return None
+        return cls(np.asarray(dados["embeddings"]), dados["documents"], dados["metadatas"], {**origem, "fonte": "chroma"})
+
+    @classmethod
+    def dos_json(cls, pasta: str, embeddings: Embeddings, origem: Dict[str, Any]) -> Optional["IndiceNumpy"]:
+        """Monta o índice a partir dos JSON da BNCC, calculando os embeddings em lotes."""
+        documentos = [documento_bncc(h) for h in ler_habilidades_bncc(pasta)]
+        if not documentos:
+            return None
+        textos = [d.page_content for d in documentos]
+        vetores: List[List[float]] = []
+        for i in range(0, len(textos), LOTE_EMBEDDINGS):
+            vetores.extend(embeddings.embed_documents(textos[i:i + LOTE_EMBEDDINGS]))
+        return cls(np.asarray(vetores), textos, [d.metadata for d in documentos], {**origem, "fonte": "json"})
+
+    @classmethod
+    def carregar(
+        cls,
+        caminho: str,
+        embeddings: Embeddings,
+        origem: Dict[str, Any],
+        persist_directory: str,
+        colecao: str,
+        pasta_json: str,
+    ) -> Optional["IndiceNumpy"]:
+        """
+        Abre o índice gravado ou o reconstrói (Chroma → JSON da BNCC) e grava o resultado.
+
+        O arquivo só é reaproveitado se tiver sido gerado com o mesmo provedor e
+        modelo de embeddings (vetores de modelos diferentes não são comparáveis).
+        """
+        t0 = time.perf_counter()
+        if Path(caminho).exists():
+            try:
+                indice = cls.abrir(caminho)
+                if all(indice.origem.get(c) == v for c, v in origem.items()):
+                    logger.info(f"Índice NumPy carregado de {caminho}: {len(indice)} habilidades "
+                                f"em {time.perf_counter() - t0:.3f}s")
+                    return indice
+                logger.info(f"Índice NumPy em {caminho} é de outro provedor/modelo; reconstruindo")
+            except Exception as erro:
+                logger.warning(f"Índice NumPy em {caminho} inválido ({erro}); reconstruindo")
+
+        indice = cls.do_chroma(persist_directory, colecao, origem)
+        if indice is None:
+            indice = cls.dos_json(pasta_json, embeddings, origem)
+        if indice is None:
+            return None
+        try:
+            indice.salvar(caminho)
+        except Exception as erro:
+            logger.warning(f"Índice NumPy não gravado em {caminho}: {erro}")
+        logger.info(f"Índice NumPy montado ({indice.origem['fonte']}): {len(indice)} habilidades "
+                    f"em {time.perf_counter() - t0:.3f}s")
+        return indice
@@ -0,0 +1,202 @@
+"""
+Serviço de jobs em segundo plano para geração de sessões e correções
+
+Permite que POST /session/start e POST /session/{id}/submit respondam 202 imediatamente
+e executem o pipeline multiagente fora da requisição HTTP. Dois backends
+(settings.JOBS_BACKEND):
+- "memoria": tarefas asyncio no próprio processo da API, estado em memória
+- "fila": trabalhos gravados na fila durável (fila_trabalhos) e executados pelos
+  workers de `python -m app.worker`
+Em ambos, o estado é consultado por GET /session/jobs/{job_id}.
+"""
+from typing import Dict, Any, Optional
+from datetime import datetime, timezone
+from app.core.config import settings
+from app.services.session_service import session_service
+from app.services.fila_service import fila_service
+from app.services.agent_service import EventoCallback
+from app.services.llm_scheduler import prioridade_llm
+import asyncio
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class JobService:
+    """
+    Executor de jobs em background com limite de concorrência.
+
+    Estados: pendente → executando → concluido | erro
+    Etapas (sessao_start): na_fila → interpretacao → geracao → persistencia → concluido
+    Etapas (correcao): na_fila → correcao → concluido
+    """
+
+    def __init__(self):
+        """Inicializa o registro de jobs"""
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._tarefas: Dict[str, asyncio.Task] = {}
+        self._limite: Optional[asyncio.Semaphore] = None
+
+    # ==== Execução (compartilhada com os workers da fila)
+    async def executar(
+        self,
+        tipo: str,
+        payload: Dict[str, Any],
+        on_evento: Optional[EventoCallback] = None,
+    ) -> Dict[str, Any]:
+        """
+        Executa um trabalho pelo tipo e retorna o resultado serializável.
+
+        Args:
+            tipo: "sessao_start" ou "correcao"
+            payload: Entrada do trabalho
+            on_evento: Callback de progresso (eventos do SessionService)
+        """
+        if tipo == "sessao_start":
+            return await session_service.criar_sessao(
+                payload["questao_texto"], on_evento=on_evento, prazo_s=payload.get("prazo_s")
+            )
+        if tipo == "correcao":
+            return await session_service.corrigir_sessao(
+                session_id=payload["session_id"],
+                respostas_texto=payload.get("respostas_texto", ""),
+                respostas_payload=payload.get("respostas_payload"),
+            )
+        raise ValueError(f"Tipo de job desconhecido: {tipo}")
+
+    def etapa_inicial(self, tipo: str) -> str:
+        """Etapa registrada quando o job começa a executar."""
+        return "correcao" if tipo == "correcao" else "interpretacao"
+
+    def aplicar_evento(self, parciais: Dict[str, Any], evento: str, dados: Dict[str, Any]) -> Optional[str]:
+        """
+        Incorpora um evento de progresso aos resultados parciais.
+
+        Returns:
+            Nova etapa do job, ou None se a etapa não mudou
+        """
+        if evento == "habilidades":
+            parciais["habilidades"] = dados
+            return "geracao"
+        if evento == "questao":
+            parciais.setdefault("questoes", []).append(dados)
+            return None
+        if evento == "sessao":
+            return "persistencia"
+        return None
+
+    # ==== Criação de jobs
+    def criar_job_sessao(self, questao_texto: str, prazo_s: Optional[float] = None) -> str:
+        """
+        Registra um job de criação de sessão.
+
+        Args:
+            questao_texto: Texto da questão original (já extraído)
+            prazo_s: Orçamento de latência do pipeline (contado quando o job começa a executar)
+
+        Returns:
+            job_id do job criado
+        """
+        payload: Dict[str, Any] = {"questao_texto": questao_texto}
+        if prazo_s is not None:
+            payload["prazo_s"] = prazo_s
+        return self._criar_job("sessao_start", payload)
+
+    def criar_job_correcao(
+        self,
+        session_id: str,
+        respostas_texto: str,
+        respostas_payload: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Registra um job de correção de respostas de uma sessão.
+
+        Returns:
+            job_id do job criado
+        """
+        return self._criar_job("correcao", {
+            "session_id": session_id,
+            "respostas_texto": respostas_texto,
+            "respostas_payload": respostas_payload,
+        })
+
+    def _criar_job(self, tipo: str, payload: Dict[str, Any]) -> str:
+        if settings.JOBS_BACKEND == "fila":
+            return fila_service.enfileirar(tipo, payload)
+
+        if self._limite is None:
+            self._limite = asyncio.Semaphore(max(1, settings.JOBS_MAX_CONCORRENTES))
+        self._limpar_antigos()
+
+        job_id = str(uuid.uuid4())
+        agora = self._agora()
+        self._jobs[job_id] = {
+            "job_id": job_id,
+            "tipo": tipo,
+            "status": "pendente",
+            "etapa": "na_fila",
+            "parciais": {},
+            "resultado": None,
+            "erro": None,
+            "criado_em": agora,
+            "atualizado_em": agora,
+        }
+        tarefa = asyncio.create_task(self._executar_em_memoria(job_id, tipo, payload))
+        self._tarefas[job_id] = tarefa
+        tarefa.add_done_callback(lambda _t: self._tarefas.pop(job_id, None))
+        logger.info(f"Job {job_id} criado ({tipo})")
+        return job_id
+
+    # ==== Backend em memória
+    def _agora(self) -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def _atualizar(self, job_id: str, **campos: Any) -> None:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        job.update(campos)
+        job["atualizado_em"] = self._agora()
+
+    def _limpar_antigos(self) -> None:
+        """Descarta jobs finalizados além do limite de retenção (mais antigos primeiro)."""
+        finalizados = [j for j in self._jobs.values() if j["status"] in ("concluido", "erro")]
+        excesso = len(finalizados) - settings.JOBS_MAX_RETIDOS
+        if excesso <= 0:
+            return
+        finalizados.sort(key=lambda j: j["atualizado_em"])
+        for job in finalizados[:excesso]:
+            self._jobs.pop(job["job_id"], None)
+
+    async def _executar_em_memoria(self, job_id: str, tipo: str, payload: Dict[str, Any]) -> None:
+        """Executa o job no processo da API atualizando o estado em memória."""
+        async def _on_evento(evento: str, dados: Dict[str, Any]) -> None:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            etapa = self.aplicar_evento(job["parciais"], evento, dados)
+            self._atualizar(job_id, **({"etapa": etapa} if etapa else {}))
+
+        # Jobs cedem a vez às requisições interativas no escalonador de LLM
+        prioridade_llm.set("lote")
+        async with self._limite:
+            self._atualizar(job_id, status="executando", etapa=self.etapa_inicial(tipo))
+            try:
+                resultado = await self.executar(tipo, payload, on_evento=_on_evento)
+                self._atualizar(job_id, status="concluido", etapa="concluido", resultado=resultado)
+                logger.info(f"Job {job_id} concluído")
+            except Exception as e:
+                logger.error(f"Job {job_id} falhou: {e}", exc_info=True)
+                self._atualizar(job_id, status="erro", erro=str(e))
+
+    def obter(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Retorna o estado atual de um job ou None se não existir."""
+        job = self._jobs.get(job_id)
+        if job is None and settings.JOBS_BACKEND == "fila":
+            job = fila_service.obter(job_id)
+        return job
+
+
+# Instância global do serviço de jobs
+job_service = JobService()
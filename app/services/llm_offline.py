@@ -0,0 +1,416 @@
+"""
+Provedores offline de LLM e embeddings (fake, record, replay)
+
+Selecionados por settings.DEFAULT_LLM_PROVIDER e settings.EMBEDDING_PROVIDER:
+- "fake": respostas fixas (fixtures) por agente, sem rede
+- "record": chama o provedor real (LLM_CASSETE_PROVEDOR) e grava cada
+  requisição/resposta no cassete (LLM_CASSETE_PATH)
+- "replay": responde apenas a partir do cassete gravado, sem rede
+Todos aceitam latência artificial (LLM_LATENCIA_SIMULADA_S) para benchmarks e
+testes de carga do pipeline.
+"""
+from typing import Dict, Any, List, Optional, Sequence
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.embeddings import Embeddings, DeterministicFakeEmbedding
+from langchain_core.messages import AIMessage, BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import ConfigDict
+from app.core.config import settings
+from app.prompts.prompt_loader import prompt_loader
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PROVEDORES_OFFLINE = ("fake", "record", "replay")
+
+AGENTES = ["interpretador", "criador", "resolucao", "correcao", "distratores"]
+
+# Schema de saída estruturada → chave da fixture
+FIXTURES_POR_SCHEMA = {
+    "AnaliseQuestao": "interpretador",
+    "QuestoesMC": "criador",
+    "GabaritoMestre": "resolucao",
+    "GabaritoItem": "resolucao_item",
+    "RelatorioDiagnostico": "correcao",
+    "Consistencia": "julgamento",
+    "DistratoresSaida": "distratores",
+    "RecomendacoesSaida": "recomendacoes",
+}
+
+_ITEM_PADRAO = {
+    "numero_questao": 1,
+    "questao": "Questão de escala e área",
+    "resposta_final": "418 cm²",
+    "passos_resolucao": [
+        "A razão entre áreas é o quadrado da escala: (1/200)² = 1/40000",
+        "1672 m² / 40000 = 0,0418 m²",
+        "0,0418 m² = 418 cm²",
+    ],
+    "conceitos_aplicados": ["escala", "área", "conversão de unidades"],
+    "erros_comuns": ["aplicar a escala linear à área", "erro na conversão de m² para cm²"],
+    "criterios_correcao": "Aceitar 418 cm².",
+    "alternativa_correta_letra": "A",
+}
+
+# Respostas padrão do provedor "fake" (podem ser sobrescritas por LLM_FAKE_FIXTURES)
+FIXTURES_PADRAO: Dict[str, Any] = {
+    "interpretador": {
+        "habilidades_identificadas": [
+            {
+                "codigo_bncc": "EF09MA07",
+                "habilidade": "Resolver problemas que envolvam a razão entre duas grandezas de espécies diferentes, como escalas.",
+                "ano": "9º",
+                "justificativa": "A questão usa a escala de uma maquete.",
+            },
+            {
+                "codigo_bncc": "EF07MA31",
+                "habilidade": "Estabelecer expressões de cálculo de área de triângulos e de quadriláteros.",
+                "ano": "7º",
+                "justificativa": "A questão pede a medida de uma área.",
+            },
+        ],
+        "conceitos_principais": ["escala", "área", "conversão de unidades"],
+        "ano_recomendado": "9º ano",
+        "analise_geral": "Questão de escala aplicada a áreas com conversão de unidades.",
+    },
+    "criador": {
+        "questoes": [
+            {
+                "numero": i,
+                "enunciado": (
+                    f"Questão {i}: uma maquete na escala 1:200 representa um vão de 1 672 m². "
+                    "Qual a área do vão na maquete, em centímetros quadrados?"
+                ),
+                "habilidades_combinadas": ["EF09MA07", "EF07MA31"],
+                "resposta_correta": "418 cm²",
+            }
+            for i in range(1, 4)
+        ]
+    },
+    "resolucao": {"gabarito": [_ITEM_PADRAO]},
+    "resolucao_item": _ITEM_PADRAO,
+    "julgamento": {"equivalentes": True, "justificativa": "Mesmo valor numérico."},
+    "distratores": {
+        "distratores": ["8,36 cm²", "836 cm²", "4 180 cm²", "41,8 cm²"],
+        "observacoes": "Erros de escala linear e de conversão de unidades.",
+    },
+    "correcao": {
+        "resumo": "Correção gerada pelo provedor fake.",
+        "total_questoes": 3,
+        "total_acertos": 3,
+        "percentual_acerto": 100.0,
+        "correcao_detalhada": [
+            {
+                "questao": f"Questão {i}",
+                "sua_resposta": "A",
+                "gabarito_correto": "A",
+                "feedback": "Resposta correta.",
+                "acertou": True,
+                "tipo_erro": "nenhum",
+            }
+            for i in range(1, 4)
+        ],
+        "habilidades_a_revisar": [],
+        "pontos_fortes": ["escala", "área"],
+        "recomendacoes": "Continue praticando problemas de escala.",
+    },
+    "recomendacoes": {
+        "pontos_fortes": ["escala"],
+        "recomendacoes": "Revise a razão entre áreas e a conversão de m² para cm² antes de novos problemas de escala.",
+    },
+}
+
+
+def carregar_fixtures() -> Dict[str, Any]:
+    """Fixtures padrão combinadas com o arquivo LLM_FAKE_FIXTURES (se configurado)."""
+    fixtures = copy.deepcopy(FIXTURES_PADRAO)
+    caminho = settings.LLM_FAKE_FIXTURES
+    if caminho:
+        with open(caminho, encoding="utf-8") as f:
+            fixtures.update(json.load(f))
+        logger.info(f"Fixtures do provedor fake carregadas de {caminho}")
+    return fixtures
+
+
+async def _latencia_simulada() -> None:
+    if settings.LLM_LATENCIA_SIMULADA_S > 0:
+        await asyncio.sleep(settings.LLM_LATENCIA_SIMULADA_S)
+
+
+def _latencia_simulada_sync() -> None:
+    if settings.LLM_LATENCIA_SIMULADA_S > 0:
+        time.sleep(settings.LLM_LATENCIA_SIMULADA_S)
+
+
+# =========================
+# Provedor "fake"
+# =========================
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model sem rede que responde com as fixtures do agente.
+
+    O agente é reconhecido pelo system prompt (grafos de create_agent) ou pelo
+    schema pedido em with_structured_output.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    fixtures: Dict[str, Any]
+    rotas: Dict[str, str]
+
+    @property
+    def _llm_type(self) -> str:
+        return "kora-fake"
+
+    def _agente_da_conversa(self, messages: List[BaseMessage]) -> Optional[str]:
+        for m in messages:
+            if m.type == "system":
+                return self.rotas.get(str(m.content).strip())
+        return None
+
+    def _resposta(self, messages: List[BaseMessage]) -> ChatResult:
+        agente = self._agente_da_conversa(messages)
+        fixture = self.fixtures.get(agente, {}) if agente else {}
+        texto = fixture if isinstance(fixture, str) else json.dumps(fixture, ensure_ascii=False)
+        # Uso estimado (~4 caracteres por token) para a contabilidade por sessão
+        entrada = sum(len(str(m.content)) for m in messages) // 4
+        saida = len(texto) // 4
+        uso = {"input_tokens": entrada, "output_tokens": saida, "total_tokens": entrada + saida}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=texto, usage_metadata=uso))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        _latencia_simulada_sync()
+        return self._resposta(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await _latencia_simulada()
+        return self._resposta(messages)
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "FakeChatModel":
+        """As fixtures já são a resposta final: nenhuma ferramenta é chamada."""
+        return self
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> RunnableLambda:
+        nome = getattr(schema, "__name__", str(schema))
+        fixture = self.fixtures.get(FIXTURES_POR_SCHEMA.get(nome, nome), {})
+
+        def _invocar(_entrada: Any) -> Any:
+            _latencia_simulada_sync()
+            return schema.model_validate(copy.deepcopy(fixture))
+
+        async def _ainvocar(_entrada: Any) -> Any:
+            await _latencia_simulada()
+            return schema.model_validate(copy.deepcopy(fixture))
+
+        return RunnableLambda(_invocar, afunc=_ainvocar, name=f"fake_{nome}")
+
+
+def criar_fake_chat_model() -> FakeChatModel:
+    """FakeChatModel com as rotas dos system prompts dos agentes."""
+    rotas = {prompt_loader.get_agent_prompts(a)['system'].strip(): a for a in AGENTES}
+    return FakeChatModel(fixtures=carregar_fixtures(), rotas=rotas)
+
+
+# =========================
+# Cassetes (record / replay)
+# =========================
+_UUID_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", re.IGNORECASE)
+
+
+class Cassete:
+    """
+    Arquivo JSONL com pares requisição → resposta.
+
+    A chave é um hash do tipo da chamada e das mensagens, com UUIDs normalizados
+    (os session_id mudam a cada execução).
+    """
+
+    def __init__(self, caminho: str):
+        """
+        Args:
+            caminho: Arquivo do cassete (criado na primeira gravação)
+        """
+        self.caminho = caminho
+        self._registros: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def chave(self, *partes: Any) -> str:
+        bruto = json.dumps(partes, sort_keys=True, ensure_ascii=False, default=str)
+        bruto = _UUID_RE.sub("<uuid>", bruto)
+        return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+    def _carregar(self) -> Dict[str, Any]:
+        if self._registros is None:
+            registros: Dict[str, Any] = {}
+            if os.path.exists(self.caminho):
+                with open(self.caminho, encoding="utf-8") as f:
+                    for linha in f:
+                        if linha.strip():
+                            reg = json.loads(linha)
+                            registros[reg["chave"]] = reg["resposta"]
+            self._registros = registros
+            logger.info(f"Cassete {self.caminho}: {len(registros)} registro(s)")
+        return self._registros
+
+    def obter(self, chave: str, descricao: str = "") -> Any:
+        """
+        Raises:
+            LookupError: Se a chamada não estiver no cassete
+        """
+        registros = self._carregar()
+        if chave not in registros:
+            raise LookupError(f"Chamada não gravada no cassete {self.caminho} ({descricao}, chave {chave[:12]})")
+        return copy.deepcopy(registros[chave])
+
+    def gravar(self, chave: str, resposta: Any, descricao: str = "") -> None:
+        with self._lock:
+            registros = self._carregar()
+            registros[chave] = resposta
+            pasta = os.path.dirname(self.caminho)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            with open(self.caminho, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"chave": chave, "descricao": descricao, "resposta": resposta}, ensure_ascii=False) + "\n")
+
+
+def _mensagens_para_chave(messages: Sequence[BaseMessage]) -> List[Any]:
+    return [
+        [m.type, m.content, getattr(m, "tool_calls", None) or None, getattr(m, "tool_call_id", None)]
+        for m in messages
+    ]
+
+
+def _mensagens_da_entrada(entrada: Any) -> List[BaseMessage]:
+    if hasattr(entrada, "to_messages"):
+        return entrada.to_messages()
+    if isinstance(entrada, list):
+        return entrada
+    return [AIMessage(content=str(entrada))] if entrada is not None else []
+
+
+class CasseteChatModel(BaseChatModel):
+    """
+    Chat model que grava (record) ou reproduz (replay) as chamadas em um cassete.
+
+    No modo record, `interno` é o modelo real; no replay, nenhuma chamada sai para a rede.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    cassete: Any
+    modo: str
+    interno: Optional[Any] = None
+    ferramentas: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return f"kora-cassete-{self.modo}"
+
+    def _chave(self, messages: Sequence[BaseMessage]) -> str:
+        return self.cassete.chave("chat", self.ferramentas, _mensagens_para_chave(messages))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        chave = self._chave(messages)
+        if self.modo == "replay":
+            _latencia_simulada_sync()
+            mensagem = messages_from_dict([self.cassete.obter(chave, "chat")])[0]
+        else:
+            mensagem = self.interno.invoke(messages)
+            self.cassete.gravar(chave, message_to_dict(mensagem), "chat")
+        return ChatResult(generations=[ChatGeneration(message=mensagem)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        chave = self._chave(messages)
+        if self.modo == "replay":
+            await _latencia_simulada()
+            mensagem = messages_from_dict([self.cassete.obter(chave, "chat")])[0]
+        else:
+            mensagem = await self.interno.ainvoke(messages)
+            self.cassete.gravar(chave, message_to_dict(mensagem), "chat")
+        return ChatResult(generations=[ChatGeneration(message=mensagem)])
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> "CasseteChatModel":
+        interno = self.interno.bind_tools(tools, **kwargs) if self.interno is not None else None
+        nomes = [getattr(t, "name", str(t)) for t in tools]
+        return self.model_copy(update={"interno": interno, "ferramentas": nomes})
+
+    def with_structured_output(self, schema: Any, **kwargs: Any) -> RunnableLambda:
+        nome = getattr(schema, "__name__", str(schema))
+        interno = self.interno.with_structured_output(schema, **kwargs) if self.interno is not None else None
+
+        def _chave(entrada: Any) -> str:
+            return self.cassete.chave("estruturado", nome, _mensagens_para_chave(_mensagens_da_entrada(entrada)))
+
+        def _para_json(data: Any) -> Any:
+            return data.model_dump() if hasattr(data, "model_dump") else data
+
+        def _invocar(entrada: Any) -> Any:
+            chave = _chave(entrada)
+            if self.modo == "replay":
+                _latencia_simulada_sync()
+                return schema.model_validate(self.cassete.obter(chave, nome))
+            data = interno.invoke(entrada)
+            self.cassete.gravar(chave, _para_json(data), nome)
+            return data
+
+        async def _ainvocar(entrada: Any) -> Any:
+            chave = _chave(entrada)
+            if self.modo == "replay":
+                await _latencia_simulada()
+                return schema.model_validate(self.cassete.obter(chave, nome))
+            data = await interno.ainvoke(entrada)
+            self.cassete.gravar(chave, _para_json(data), nome)
+            return data
+
+        return RunnableLambda(_invocar, afunc=_ainvocar, name=f"cassete_{nome}")
+
+
+class CasseteEmbeddings(Embeddings):
+    """Embeddings gravados (record) ou reproduzidos (replay) do cassete."""
+
+    def __init__(self, cassete: Cassete, modo: str, interno: Optional[Embeddings] = None):
+        self.cassete = cassete
+        self.modo = modo
+        self.interno = interno
+
+    def _um(self, tipo: str, texto: str, calcular) -> List[float]:
+        chave = self.cassete.chave("embedding", tipo, texto)
+        if self.modo == "replay":
+            return self.cassete.obter(chave, f"embedding {tipo}")
+        vetor = calcular()
+        self.cassete.gravar(chave, vetor, f"embedding {tipo}")
+        return vetor
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.modo == "replay":
+            return [self._um("documento", t, None) for t in texts]
+        vetores = self.interno.embed_documents(texts)
+        for t, v in zip(texts, vetores):
+            self.cassete.gravar(self.cassete.chave("embedding", "documento", t), v, "embedding documento")
+        return vetores
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._um("consulta", text, lambda: self.interno.embed_query(text))
+
+
+_cassetes: Dict[str, Cassete] = {}
+
+
+def obter_cassete(caminho: Optional[str] = None) -> Cassete:
+    """Cassete compartilhado por caminho (LLM e embeddings usam o mesmo arquivo)."""
+    caminho = caminho or settings.LLM_CASSETE_PATH
+    if caminho not in _cassetes:
+        _cassetes[caminho] = Cassete(caminho)
+    return _cassetes[caminho]
+
+
+def criar_fake_embeddings() -> Embeddings:
+    """Embeddings determinísticos (hash do texto) sem rede."""
+    return DeterministicFakeEmbedding(size=settings.EMBEDDING_FAKE_DIMENSAO)
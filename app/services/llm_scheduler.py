@@ -0,0 +1,262 @@
+"""
+Escalonador global das chamadas de LLM
+
+Todas as chamadas do AgentService (agentes e saídas estruturadas) passam por aqui
+antes de chegar ao provedor. O escalonador limita as requisições em voo, respeita
+orçamentos de requisições e tokens por minuto (janela deslizante de 60s) e atende
+a fila por prioridade: chamadas interativas (requisições HTTP) passam à frente das
+chamadas em lote (jobs e workers da fila). Ao receber um 429 do provedor, pausa os
+despachos por LLM_PAUSA_RATE_LIMIT_S.
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from app.core.config import settings
+from app.core import metrics
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+PRIORIDADES = {"interativo": 0, "lote": 1}
+
+# Prioridade das chamadas de LLM feitas no contexto atual (tarefas herdam o valor)
+prioridade_llm: ContextVar[str] = ContextVar("prioridade_llm", default="interativo")
+
+JANELA_S = 60.0
+
+
+def _eh_rate_limit(erro: BaseException) -> bool:
+    """Heurística para reconhecer erros de limite de taxa dos provedores (HTTP 429)."""
+    if getattr(erro, "status_code", None) == 429 or getattr(erro, "code", None) == 429:
+        return True
+    nome = type(erro).__name__
+    if nome in ("RateLimitError", "ResourceExhausted", "TooManyRequests"):
+        return True
+    texto = str(erro)
+    return "429" in texto or "RESOURCE_EXHAUSTED" in texto or "rate limit" in texto.lower()
+
+
+class Reserva:
+    """Vaga concedida pelo escalonador; permite registrar o uso real ao final da chamada."""
+
+    def __init__(self, escalonador: "LLMScheduler", agente: str, tokens_estimados: int, espera_s: float):
+        self._escalonador = escalonador
+        self.agente = agente
+        self.tokens_estimados = tokens_estimados
+        self.espera_s = espera_s
+
+    def registrar_uso(self, tokens: Optional[int] = None, requisicoes: int = 1) -> None:
+        """
+        Ajusta as janelas de RPM/TPM com o uso observado.
+
+        Args:
+            tokens: Tokens reais consumidos (None = mantém a estimativa)
+            requisicoes: Requisições efetivamente feitas ao provedor (agentes com
+                ferramentas fazem mais de uma)
+        """
+        extra_tokens = (tokens - self.tokens_estimados) if tokens is not None else 0
+        self._escalonador._registrar_extra(max(0, requisicoes - 1), max(0, extra_tokens))
+
+
+class LLMScheduler:
+    """
+    Controle de admissão das chamadas de LLM com prioridade.
+
+    Limites (0 = sem limite):
+    - LLM_MAX_EM_VOO: chamadas simultâneas ao provedor
+    - LLM_RPM: requisições por minuto
+    - LLM_TPM: tokens (estimados) por minuto
+    """
+
+    def __init__(
+        self,
+        max_em_voo: Optional[int] = None,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+    ):
+        """Inicializa o escalonador com os limites informados ou os das configurações"""
+        self.max_em_voo = settings.LLM_MAX_EM_VOO if max_em_voo is None else max_em_voo
+        self.rpm = settings.LLM_RPM if rpm is None else rpm
+        self.tpm = settings.LLM_TPM if tpm is None else tpm
+
+        self._fila: List[Tuple[int, int, asyncio.Future, int]] = []
+        self._seq = itertools.count()
+        self._em_voo = 0
+        self._janela_req: deque = deque()
+        self._janela_tok: deque = deque()
+        self._tokens_na_janela = 0
+        self._pausado_ate = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self._esperas: Dict[str, deque] = {p: deque(maxlen=1000) for p in PRIORIDADES}
+        self._totais: Dict[str, Dict[str, float]] = {
+            p: {"chamadas": 0, "espera_total_s": 0.0, "espera_max_s": 0.0} for p in PRIORIDADES
+        }
+        self._rate_limits = 0
+
+    # ==== Estimativa
+    def estimar_tokens(self, texto: str) -> int:
+        """Estimativa grosseira: ~4 caracteres por token de entrada + saída esperada."""
+        return len(texto or "") // 4 + settings.LLM_TOKENS_SAIDA_ESTIMADOS
+
+    # ==== Janelas deslizantes
+    def _expirar(self, agora: float) -> None:
+        limite = agora - JANELA_S
+        while self._janela_req and self._janela_req[0] <= limite:
+            self._janela_req.popleft()
+        while self._janela_tok and self._janela_tok[0][0] <= limite:
+            self._tokens_na_janela -= self._janela_tok.popleft()[1]
+
+    def _registrar_extra(self, requisicoes: int, tokens: int) -> None:
+        agora = time.monotonic()
+        for _ in range(requisicoes):
+            self._janela_req.append(agora)
+        if tokens:
+            self._janela_tok.append((agora, tokens))
+            self._tokens_na_janela += tokens
+
+    def _espera_orcamento(self, tokens: int, agora: float) -> float:
+        """Segundos até a próxima chamada caber nos orçamentos (0 = pode despachar)."""
+        espera = max(0.0, self._pausado_ate - agora)
+        if self.rpm and len(self._janela_req) >= self.rpm:
+            espera = max(espera, self._janela_req[0] + JANELA_S - agora)
+        # Uma chamada maior que o TPM inteiro é admitida com a janela vazia (evita bloqueio eterno)
+        if self.tpm and self._janela_tok and self._tokens_na_janela + tokens > self.tpm:
+            excesso = self._tokens_na_janela + tokens - self.tpm
+            liberados = 0
+            for ts, tok in self._janela_tok:
+                liberados += tok
+                if liberados >= excesso:
+                    espera = max(espera, ts + JANELA_S - agora)
+                    break
+        return espera
+
+    # ==== Despacho
+    def _despachar(self) -> None:
+        """Concede vagas aos primeiros da fila enquanto houver capacidade."""
+        self._timer = None
+        while self._fila:
+            _, _, fut, tokens = self._fila[0]
+            if fut.done():
+                heapq.heappop(self._fila)
+                continue
+            if self.max_em_voo and self._em_voo >= self.max_em_voo:
+                return
+            agora = time.monotonic()
+            self._expirar(agora)
+            espera = self._espera_orcamento(tokens, agora)
+            if espera > 0:
+                if self._timer is None:
+                    self._timer = fut.get_loop().call_later(espera, self._despachar)
+                return
+            heapq.heappop(self._fila)
+            self._em_voo += 1
+            self._janela_req.append(agora)
+            self._janela_tok.append((agora, tokens))
+            self._tokens_na_janela += tokens
+            fut.set_result(None)
+
+    async def _adquirir(self, prioridade: str, tokens: int) -> float:
+        inicio = time.monotonic()
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._fila, (PRIORIDADES.get(prioridade, 1), next(self._seq), fut, tokens))
+        self._despachar()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._liberar()
+            raise
+        espera = time.monotonic() - inicio
+        metrics.llm_espera_fila.observar(espera, prioridade=prioridade)
+        self._esperas[prioridade].append(espera)
+        totais = self._totais[prioridade]
+        totais["chamadas"] += 1
+        totais["espera_total_s"] += espera
+        totais["espera_max_s"] = max(totais["espera_max_s"], espera)
+        return espera
+
+    def _liberar(self) -> None:
+        self._em_voo = max(0, self._em_voo - 1)
+        self._despachar()
+
+    @asynccontextmanager
+    async def reservar(self, agente: str, tokens_estimados: int = 0, prioridade: Optional[str] = None):
+        """
+        Aguarda uma vaga para uma chamada de LLM e a mantém durante o bloco.
+
+        Args:
+            agente: Nome do agente/etapa (para logs)
+            tokens_estimados: Tokens previstos para a chamada (orçamento TPM)
+            prioridade: "interativo" ou "lote" (padrão: valor de prioridade_llm no contexto)
+
+        Yields:
+            Reserva, para registrar o uso real da chamada
+        """
+        prioridade = prioridade or prioridade_llm.get()
+        if prioridade not in PRIORIDADES:
+            prioridade = "lote"
+        espera = await self._adquirir(prioridade, tokens_estimados)
+        if espera > 1.0:
+            logger.info(f"Chamada de LLM ({agente}, {prioridade}) aguardou {espera:.2f}s na fila")
+        try:
+            yield Reserva(self, agente, tokens_estimados, espera)
+        except Exception as e:
+            if _eh_rate_limit(e):
+                self._rate_limits += 1
+                self._pausado_ate = max(self._pausado_ate, time.monotonic() + settings.LLM_PAUSA_RATE_LIMIT_S)
+                logger.warning(
+                    f"Limite de taxa do provedor atingido ({agente}); "
+                    f"pausando despachos por {settings.LLM_PAUSA_RATE_LIMIT_S}s"
+                )
+            raise
+        finally:
+            self._liberar()
+
+    # ==== Métricas
+    def metricas(self) -> Dict[str, Any]:
+        """Estado atual e tempos de espera na fila por prioridade."""
+        self._expirar(time.monotonic())
+        por_prioridade: Dict[str, Any] = {}
+        for p in PRIORIDADES:
+            totais = self._totais[p]
+            recentes = sorted(self._esperas[p])
+            p95 = recentes[min(len(recentes) - 1, int(len(recentes) * 0.95))] if recentes else 0.0
+            por_prioridade[p] = {
+                "aguardando": sum(1 for pr, _, f, _ in self._fila if pr == PRIORIDADES[p] and not f.done()),
+                "chamadas": int(totais["chamadas"]),
+                "espera_media_s": round(totais["espera_total_s"] / totais["chamadas"], 4) if totais["chamadas"] else 0.0,
+                "espera_p95_s": round(p95, 4),
+                "espera_max_s": round(totais["espera_max_s"], 4),
+            }
+        return {
+            "em_voo": self._em_voo,
+            "max_em_voo": self.max_em_voo,
+            "requisicoes_ultimo_minuto": len(self._janela_req),
+            "tokens_ultimo_minuto": self._tokens_na_janela,
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "rate_limits_recebidos": self._rate_limits,
+            "prioridades": por_prioridade,
+        }
+
+    def coletar_metricas(self) -> List[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]:
+        """Coletor do /metrics: chamadas em voo, fila por prioridade e 429 recebidos."""
+        m = self.metricas()
+        return [
+            ("kora_llm_em_voo", "gauge", "Chamadas de LLM em execução no provedor", [({}, m["em_voo"])]),
+            ("kora_llm_aguardando", "gauge", "Chamadas de LLM aguardando vaga no escalonador",
+             [({"prioridade": p}, d["aguardando"]) for p, d in m["prioridades"].items()]),
+            ("kora_llm_rate_limits_total", "counter", "Respostas 429 recebidas do provedor",
+             [({}, m["rate_limits_recebidos"])]),
+        ]
+
+
+# Instância global do escalonador
+llm_scheduler = LLMScheduler()
+metrics.registro.registrar_coletor(llm_scheduler.coletar_metricas)
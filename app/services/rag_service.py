@@ -1,12 +1,27 @@
 """
 Serviço RAG (Retrieval-Augmented Generation) para busca de habilidades BNCC
+
+Dois backends de busca (settings.RAG_INDICE): o vectorstore persistente do Chroma
+ou o índice NumPy em memória (app/services/indice_vetorial.py). Consultas exatas
+(por código, ano ou unidade temática) usam o catálogo (app/services/catalogo_bncc.py).
+O índice lexical BM25 (app/services/indice_lexical.py) é combinado à busca vetorial
+no modo hibrido e a substitui quando o provedor de embeddings não responde
+(settings.RAG_MODO).
 """
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple, Union
 from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from app.core.config import settings
+from app.core import metrics
+from app.services.llm_offline import CasseteEmbeddings, criar_fake_embeddings, obter_cassete
+from app.services.indice_vetorial import IndiceNumpy
+from app.services.catalogo_bncc import CatalogoBNCC
+from app.services.indice_lexical import IndiceBM25
+from app.services.cache import EmbeddingsComCache, embedding_cache
+from pathlib import Path
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,23 +34,44 @@ class RAGService:
 
     def __init__(self):
         """Inicializa o serviço RAG"""
-        # Seleciona o provedor de embeddings
-        if settings.EMBEDDING_PROVIDER == "google":
-            self.embeddings = GoogleGenerativeAIEmbeddings(
-                model=settings.EMBEDDING_MODEL,
-                google_api_key=settings.GOOGLE_API_KEY
-            )
-            logger.info(f"Usando Google Gemini Embeddings: {settings.EMBEDDING_MODEL}")
+        # Seleciona o provedor de embeddings (consultas repetidas saem do cache)
+        self.embeddings = self._criar_embeddings(settings.EMBEDDING_PROVIDER)
+        if settings.EMBEDDING_CACHE_ATIVO:
+            self.embeddings = EmbeddingsComCache(self.embeddings, embedding_cache)
+
+        self.vectorstore: Optional[Chroma] = None
+        self.indice: Optional[IndiceNumpy] = None
+        self._catalogo: Optional[CatalogoBNCC] = None
+        self._lexico: Optional[IndiceBM25] = None
+        if settings.RAG_INDICE == "numpy":
+            self._load_indice()
         else:
-            self.embeddings = OpenAIEmbeddings(
+            self._load_vectorstore()
+    
+    def _criar_embeddings(self, provedor: str) -> Embeddings:
+        """
+        Cria os embeddings do provedor: google, openai ou um dos modos offline
+        (fake, record, replay — ver app/services/llm_offline.py).
+        """
+        if provedor == "fake":
+            logger.info("Usando embeddings fake (determinísticos, sem rede)")
+            return criar_fake_embeddings()
+        if provedor in ("record", "replay"):
+            interno = self._criar_embeddings(settings.EMBEDDING_CASSETE_PROVEDOR) if provedor == "record" else None
+            logger.info(f"Usando cassete de embeddings ({provedor}): {settings.LLM_CASSETE_PATH}")
+            return CasseteEmbeddings(obter_cassete(), provedor, interno)
+        if provedor == "google":
+            logger.info(f"Usando Google Gemini Embeddings: {settings.EMBEDDING_MODEL}")
+            return GoogleGenerativeAIEmbeddings(
                 model=settings.EMBEDDING_MODEL,
-                openai_api_key=settings.OPENAI_API_KEY
+                google_api_key=settings.GOOGLE_API_KEY
             )
-            logger.info(f"Usando OpenAI Embeddings: {settings.EMBEDDING_MODEL}")
+        logger.info(f"Usando OpenAI Embeddings: {settings.EMBEDDING_MODEL}")
+        return OpenAIEmbeddings(
+            model=settings.EMBEDDING_MODEL,
+            openai_api_key=settings.OPENAI_API_KEY
+        )
 
-        self.vectorstore: Optional[Chroma] = None
-        self._load_vectorstore()
-    
     def _load_vectorstore(self):
         """Carrega o vectorstore do ChromaDB"""
         try:
@@ -50,6 +86,77 @@ class RAGService:
             logger.warning("Execute 'python scripts/ingest_bncc.py' para criar o banco vetorial")
             self.vectorstore = None
     
+    def _load_indice(self):
+        """Carrega o índice NumPy (do arquivo, exportado do Chroma ou montado dos JSON da BNCC)"""
+        try:
+            self.indice = IndiceNumpy.carregar(
+                settings.RAG_INDICE_ARQUIVO,
+                self.embeddings,
+                {"provedor": settings.EMBEDDING_PROVIDER, "modelo": settings.EMBEDDING_MODEL},
+                settings.CHROMA_PERSIST_DIRECTORY,
+                "bncc_matematica",
+                settings.BNCC_DATA_DIR,
+            )
+        except Exception as e:
+            logger.warning(f"Índice NumPy não carregado: {e}")
+            self.indice = None
+        if self.indice is None:
+            logger.warning("Índice NumPy indisponível; usando o ChromaDB")
+            self._load_vectorstore()
+
+    @property
+    def catalogo(self) -> CatalogoBNCC:
+        """Catálogo das habilidades ingeridas (montado no primeiro uso)."""
+        if self._catalogo is None:
+            self._catalogo = CatalogoBNCC.carregar(self.indice, self.vectorstore, settings.BNCC_DATA_DIR)
+        return self._catalogo
+
+    @property
+    def lexico(self) -> IndiceBM25:
+        """Índice BM25 (do arquivo gerado na ingestão ou montado do catálogo no primeiro uso)."""
+        if self._lexico is None:
+            caminho = settings.RAG_LEXICO_ARQUIVO
+            if Path(caminho).exists():
+                try:
+                    self._lexico = IndiceBM25.abrir(caminho)
+                except Exception as e:
+                    logger.warning(f"Índice lexical em {caminho} inválido ({e}); reconstruindo")
+            if self._lexico is None:
+                self._lexico = IndiceBM25(self.catalogo.textos, self.catalogo.metadados)
+                try:
+                    self._lexico.salvar(caminho)
+                except Exception as e:
+                    logger.warning(f"Índice lexical não gravado em {caminho}: {e}")
+            logger.info(f"Índice lexical BM25: {len(self._lexico)} habilidades")
+        return self._lexico
+
+    def _buscar_vetorial(self, query: str, k: int, filtros: Optional[Dict[str, Any]]) -> List[Document]:
+        if self.indice is not None:
+            vetor = self.embeddings.embed_query(query)
+            return [self.indice.documento(p) for p, _ in self.indice.buscar(vetor, k, filtros)]
+        if filtros:
+            return self.vectorstore.similarity_search(query, k=k, filter=filtros)
+        return self.vectorstore.similarity_search(query, k=k)
+
+    def _buscar_lexical(self, query: str, k: int, filtros: Optional[Dict[str, Any]]) -> List[Document]:
+        return [self.lexico.documento(p) for p, _ in self.lexico.buscar(query, k, filtros)]
+
+    @staticmethod
+    def _pontuar_rrf(listas: List[List[Document]], k: int) -> List[Tuple[Document, float]]:
+        """Fusão por posição recíproca: soma de 1/(RAG_RRF_K + posição) de cada lista."""
+        pontuacoes: Dict[str, float] = {}
+        documentos: Dict[str, Document] = {}
+        for lista in listas:
+            for posicao, doc in enumerate(lista, start=1):
+                pontuacoes[doc.page_content] = pontuacoes.get(doc.page_content, 0.0) + 1.0 / (settings.RAG_RRF_K + posicao)
+                documentos.setdefault(doc.page_content, doc)
+        ordem = sorted(pontuacoes, key=lambda chave: -pontuacoes[chave])
+        return [(documentos[chave], pontuacoes[chave]) for chave in ordem[:k]]
+
+    @classmethod
+    def _fundir_rrf(cls, listas: List[List[Document]], k: int) -> List[Document]:
+        return [doc for doc, _ in cls._pontuar_rrf(listas, k)]
+
     def buscar_habilidades(
         self,
         query: str,
@@ -57,7 +164,10 @@ class RAGService:
         filtros: Optional[Dict[str, Any]] = None
     ) -> List[Document]:
         """
-        Busca semântica por habilidades BNCC
+        Busca por habilidades BNCC (vetorial, lexical ou híbrida, conforme settings.RAG_MODO)
+        
+        Sem backend vetorial, ou se o provedor de embeddings falhar, a busca
+        segue só no índice lexical.
         
         Args:
             query: Texto da busca
@@ -67,30 +177,177 @@ class RAGService:
         Returns:
             Lista de documentos encontrados
         """
-        if self.vectorstore is None:
-            logger.error("Vectorstore não inicializado")
-            return []
-        
         if k is None:
             k = settings.TOP_K_RESULTS
+        modo = settings.RAG_MODO
+        candidatos = max(k, settings.RAG_HIBRIDO_CANDIDATOS) if modo == "hibrido" else k
         
         try:
-            if filtros:
-                results = self.vectorstore.similarity_search(
-                    query,
-                    k=k,
-                    filter=filtros
-                )
-            else:
-                results = self.vectorstore.similarity_search(query, k=k)
+            with metrics.rag_duracao.cronometrar(operacao="busca"):
+                vetoriais: Optional[List[Document]] = None
+                if modo != "lexical" and (self.indice is not None or self.vectorstore is not None):
+                    try:
+                        vetoriais = self._buscar_vetorial(query, candidatos, filtros)
+                    except Exception as e:
+                        logger.warning(f"Busca vetorial indisponível ({e}); usando o índice lexical")
+                if vetoriais is None:
+                    modo = "lexical" if modo == "lexical" else "lexical_sem_embeddings"
+                    results = self._buscar_lexical(query, k, filtros)
+                elif modo == "hibrido":
+                    results = self._fundir_rrf([vetoriais, self._buscar_lexical(query, candidatos, filtros)], k)
+                else:
+                    modo = "vetorial"
+                    results = vetoriais[:k]
+            metrics.rag_buscas.inc(modo=modo)
             
-            logger.info(f"Busca retornou {len(results)} resultados para: {query}")
+            logger.info(f"Busca ({modo}) retornou {len(results)} resultados para: {query}")
             return results
             
         except Exception as e:
             logger.error(f"Erro na busca: {e}")
             return []
     
+    @staticmethod
+    def _combinar_filtros(*partes: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Junta filtros de metadata com $and (ignora os vazios)."""
+        partes = [p for p in partes if p]
+        if not partes:
+            return None
+        return partes[0] if len(partes) == 1 else {"$and": list(partes)}
+
+    @staticmethod
+    def _filtro_anos(anos: Optional[List[str]]) -> Optional[Dict[str, Any]]:
+        anos = [a for a in anos or [] if a]
+        if not anos:
+            return None
+        return {"ano": anos[0]} if len(anos) == 1 else {"ano": {"$in": anos}}
+
+    def _embed_consultas(self, textos: List[str]) -> List[List[float]]:
+        """
+        Embeddings de várias consultas: o cache primeiro e as que faltam (sem repetição)
+        em uma única chamada embed_documents ao provedor.
+        """
+        cache = self.embeddings.cache if isinstance(self.embeddings, EmbeddingsComCache) else None
+        provedor = self.embeddings.interno if cache is not None else self.embeddings
+        chaves = [cache.chave_consulta(t) if cache is not None else t for t in textos]
+        vetores: List[Optional[List[float]]] = [
+            cache.obter(c, rotulo="consulta") if cache is not None else None for c in chaves
+        ]
+        faltam: Dict[str, List[int]] = {}
+        for i, v in enumerate(vetores):
+            if v is None:
+                faltam.setdefault(chaves[i], []).append(i)
+        if faltam:
+            unicos = [textos[idxs[0]] for idxs in faltam.values()]
+            if isinstance(provedor, GoogleGenerativeAIEmbeddings):
+                novos = provedor.embed_documents(unicos, task_type="RETRIEVAL_QUERY")
+            else:
+                novos = provedor.embed_documents(unicos)
+            for (chave, idxs), vetor in zip(faltam.items(), novos):
+                for i in idxs:
+                    vetores[i] = vetor
+                if cache is not None:
+                    cache.gravar(chave, [float(x) for x in vetor], rotulo="consulta")
+        return vetores
+
+    def _buscar_lote_vetorial(
+        self, textos: List[str], k: int, filtros_por_consulta: List[Optional[Dict[str, Any]]]
+    ) -> List[List[Any]]:
+        vetores = self._embed_consultas(textos)
+        if self.indice is not None:
+            return [
+                [(self.indice.documento(p), sim) for p, sim in r]
+                for r in self.indice.buscar_lote(vetores, k, filtros_por_consulta)
+            ]
+        # Distância L2 ao quadrado do Chroma → cosseno (embeddings normalizados)
+        return [
+            [(doc, 1.0 - dist / 2.0) for doc, dist in
+             self.vectorstore.similarity_search_by_vector_with_relevance_scores(v, k=k, filter=f)]
+            for v, f in zip(vetores, filtros_por_consulta)
+        ]
+
+    def buscar_lote(
+        self,
+        consultas: List[Union[str, Dict[str, Any]]],
+        k: int = None,
+        filtros: Optional[Dict[str, Any]] = None,
+        anos: Optional[List[str]] = None,
+    ) -> List[Document]:
+        """
+        Busca semântica de várias consultas de uma vez
+
+        Os embeddings saem de uma única chamada ao provedor e, no índice NumPy, as
+        consultas são respondidas por um único produto de matrizes. Os resultados
+        são deduplicados por código BNCC e ordenados pela maior similaridade. Com
+        RAG_MODO=hibrido, a lista de cada consulta é a fusão RRF da busca vetorial com
+        o BM25, como em buscar_habilidades. A metadata de cada documento traz
+        "similaridade" (pontuação RRF no modo híbrido, BM25 quando a busca cai no
+        índice lexical) e as "consultas" que o encontraram.
+
+        Args:
+            consultas: Textos ou dicionários {"query": ..., "filtros": {...}, "anos": [...]}
+            k: Resultados por consulta (padrão: settings.TOP_K_RESULTS)
+            filtros: Filtro de metadata aplicado a todas as consultas
+            anos: Anos aplicados a todas as consultas (vários anos viram um filtro $in)
+
+        Returns:
+            Lista de documentos sem repetição
+        """
+        if k is None:
+            k = settings.TOP_K_RESULTS
+
+        itens = [c if isinstance(c, dict) else {"query": c} for c in consultas]
+        itens = [c for c in itens if str(c.get("query") or "").strip()]
+        if not itens:
+            return []
+        textos = [str(c["query"]) for c in itens]
+        filtros_por_consulta = [
+            self._combinar_filtros(filtros, self._filtro_anos(anos), c.get("filtros"), self._filtro_anos(c.get("anos")))
+            for c in itens
+        ]
+
+        modo = settings.RAG_MODO
+        candidatos = max(k, settings.RAG_HIBRIDO_CANDIDATOS) if modo == "hibrido" else k
+
+        try:
+            with metrics.rag_duracao.cronometrar(operacao="busca_lote"):
+                por_consulta = None
+                if modo != "lexical" and (self.indice is not None or self.vectorstore is not None):
+                    try:
+                        por_consulta = self._buscar_lote_vetorial(textos, candidatos, filtros_por_consulta)
+                    except Exception as e:
+                        logger.warning(f"Busca vetorial em lote indisponível ({e}); usando o índice lexical")
+                if por_consulta is None:
+                    por_consulta = [
+                        [(self.lexico.documento(p), pontuacao) for p, pontuacao in self.lexico.buscar(t, k, f)]
+                        for t, f in zip(textos, filtros_por_consulta)
+                    ]
+                elif modo == "hibrido":
+                    por_consulta = [
+                        self._pontuar_rrf([[doc for doc, _ in vetoriais], self._buscar_lexical(t, candidatos, f)], k)
+                        for t, f, vetoriais in zip(textos, filtros_por_consulta, por_consulta)
+                    ]
+        except Exception as e:
+            logger.error(f"Erro na busca em lote: {e}")
+            return []
+
+        mesclados: Dict[str, Document] = {}
+        for texto, resultados in zip(textos, por_consulta):
+            for doc, similaridade in resultados:
+                chave = doc.metadata.get("codigo_bncc") or doc.page_content
+                atual = mesclados.get(chave)
+                if atual is None:
+                    atual = Document(page_content=doc.page_content, metadata={**doc.metadata, "similaridade": similaridade, "consultas": []})
+                    mesclados[chave] = atual
+                atual.metadata["similaridade"] = max(atual.metadata["similaridade"], similaridade)
+                if texto not in atual.metadata["consultas"]:
+                    atual.metadata["consultas"].append(texto)
+        documentos = sorted(mesclados.values(), key=lambda d: -d.metadata["similaridade"])
+        for d in documentos:
+            d.metadata["similaridade"] = round(float(d.metadata["similaridade"]), 4)
+        logger.info(f"Busca em lote: {len(textos)} consulta(s), {len(documentos)} habilidade(s) distintas")
+        return documentos
+
     def buscar_por_conceitos(
         self,
         conceitos: List[str],
@@ -118,7 +375,7 @@ class RAGService:
     
     def buscar_por_codigo(self, codigo_bncc: str) -> Optional[Document]:
         """
-        Busca uma habilidade específica pelo código BNCC
+        Busca uma habilidade específica pelo código BNCC (consulta no catálogo, sem embedding)
         
         Args:
             codigo_bncc: Código da habilidade (ex: "EF08MA01")
@@ -126,39 +383,48 @@ class RAGService:
         Returns:
             Documento encontrado ou None
         """
-        if self.vectorstore is None:
-            return None
-        
         try:
-            results = self.vectorstore.similarity_search(
-                codigo_bncc,
-                k=1,
-                filter={"codigo_bncc": codigo_bncc}
-            )
-            return results[0] if results else None
+            with metrics.rag_duracao.cronometrar(operacao="codigo"):
+                return self.catalogo.codigo(codigo_bncc)
         except Exception as e:
             logger.error(f"Erro ao buscar código {codigo_bncc}: {e}")
             return None
     
     def buscar_por_ano(self, ano: str, k: int = None) -> List[Document]:
         """
-        Busca todas as habilidades de um ano específico
+        Lista todas as habilidades de um ano específico (catálogo, sem embedding)
         
         Args:
-            ano: Ano escolar (ex: "8º", "1ª")
-            k: Número máximo de resultados
+            ano: Ano escolar (ex: "8º", "1ª"; "8°" também é aceito)
+            k: Número máximo de resultados (padrão: todas as habilidades do ano)
             
         Returns:
-            Lista de documentos
+            Lista de documentos, na ordem da ingestão
         """
-        if k is None:
-            k = 50  # Retorna mais resultados para listagem por ano
+        try:
+            with metrics.rag_duracao.cronometrar(operacao="ano"):
+                documentos = self.catalogo.ano(ano)
+        except Exception as e:
+            logger.error(f"Erro ao listar o ano {ano}: {e}")
+            return []
+        return documentos[:k] if k is not None else documentos
+
+    def buscar_por_unidade_tematica(self, unidade_tematica: str, ano: Optional[str] = None) -> List[Document]:
+        """
+        Lista todas as habilidades de uma unidade temática (catálogo, sem embedding)
         
-        return self.buscar_habilidades(
-            query=f"matemática {ano} ano",
-            k=k,
-            filtros={"ano": ano}
-        )
+        Args:
+            unidade_tematica: Unidade temática (ex: "Geometria"; caixa e espaços são ignorados)
+            ano: Filtro opcional por ano escolar
+            
+        Returns:
+            Lista de documentos, na ordem da ingestão
+        """
+        try:
+            return self.catalogo.unidade_tematica(unidade_tematica, ano)
+        except Exception as e:
+            logger.error(f"Erro ao listar a unidade temática {unidade_tematica}: {e}")
+            return []
     
     def formatar_habilidades(self, documentos: List[Document]) -> List[Dict[str, str]]:
         """
@@ -180,6 +446,10 @@ class RAGService:
                 "unidade_tematica": doc.metadata.get("unidade_tematica", ""),
                 "objeto_conhecimento": doc.metadata.get("objeto_conhecimento", "")
             }
+            # Resultados de buscar_lote
+            if "consultas" in doc.metadata:
+                habilidade["similaridade"] = doc.metadata.get("similaridade")
+                habilidade["consultas"] = doc.metadata["consultas"]
             habilidades.append(habilidade)
         
         return habilidades
@@ -0,0 +1,240 @@
+"""
+Roteamento adaptativo das cadeias de fallback
+
+resolver_questoes e corrigir_respostas têm caminhos alternativos (agente com
+ferramentas, saída estruturada, item a item) tentados em sequência; um caminho que
+costuma falhar custa uma ida e volta inteira ao provedor antes do próximo. O roteador
+registra tentativas e sucessos por etapa, provedor, modelo e caminho e ordena os
+caminhos pela taxa de sucesso observada (suavizada). Caminhos com poucas tentativas
+recebem uma taxa neutra (0,5), de modo que só um caminho comprovadamente ruim perde a
+vez, e uma fração das chamadas segue a ordem padrão para que um caminho rebaixado
+possa se recuperar. As estatísticas ficam na
+tabela estatisticas_roteamento e sobrevivem a restarts.
+
+As contagens são somadas em memória; os incrementos pendentes vão para o banco em
+uma única transação, fora do event loop (asyncio.to_thread) quando há um loop
+rodando, e no encerramento da aplicação (descarregar).
+"""
+from typing import Callable, Dict, Any, List, Optional, Set, Tuple
+from contextlib import contextmanager
+from app.core.config import settings
+from app.core import metrics
+from app.db.database import SessionLocal
+from app.db.models import EstatisticaRoteamento
+import asyncio
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+Chave = Tuple[str, str, str, str]
+
+
+class Tentativa:
+    """Resultado de uma tentativa de caminho (sucesso é marcado pelo chamador)."""
+
+    def __init__(self):
+        self.sucesso = False
+
+
+class RoteadorFallback:
+    """Estatísticas por (etapa, provedor, modelo, caminho) e ordenação dos caminhos."""
+
+    def __init__(self, fabrica_sessao: Callable = SessionLocal):
+        """
+        Inicializa o roteador (as estatísticas gravadas são carregadas no primeiro uso)
+
+        Args:
+            fabrica_sessao: Fábrica de sessões do SQLAlchemy onde ficam as estatísticas
+        """
+        self._fabrica_sessao = fabrica_sessao
+        self._stats: Dict[Chave, Dict[str, float]] = {}
+        self._pendentes: Dict[Chave, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self._lock_gravacao = threading.Lock()
+        self._carregado = False
+        self._gravacao: Optional[asyncio.Task] = None
+        self._tarefas: Set[asyncio.Task] = set()
+
+    def _chave(self, etapa: str, caminho: str) -> Chave:
+        return (etapa, settings.DEFAULT_LLM_PROVIDER, settings.DEFAULT_MODEL, caminho)
+
+    # ==== Persistência
+    def _carregar(self) -> None:
+        """Lê as estatísticas gravadas (uma vez; tenta de novo se o banco ainda não existir)."""
+        if self._carregado:
+            return
+        db = self._fabrica_sessao()
+        try:
+            linhas = db.query(EstatisticaRoteamento).all()
+        except Exception as erro:
+            logger.debug(f"Roteador de fallback: estatísticas indisponíveis ({erro})")
+            return
+        finally:
+            db.close()
+        with self._lock:
+            if self._carregado:
+                return
+            for e in linhas:
+                # Incrementos registrados antes da carga continuam somados
+                st = self._stats.setdefault((e.etapa, e.provedor, e.modelo, e.caminho), self._zeradas())
+                st["tentativas"] += e.tentativas or 0
+                st["sucessos"] += e.sucessos or 0
+                st["latencia_total_s"] += e.latencia_total_s or 0.0
+            self._carregado = True
+        if linhas:
+            logger.info(f"Roteador de fallback: {len(linhas)} estatística(s) carregada(s)")
+
+    @staticmethod
+    def _zeradas() -> Dict[str, float]:
+        return {"tentativas": 0, "sucessos": 0, "latencia_total_s": 0.0}
+
+    def descarregar(self) -> None:
+        """
+        Grava os incrementos pendentes em uma transação (UPDATE atômico; outros
+        processos somam na mesma linha). Em caso de erro, os incrementos voltam
+        para a fila e a próxima gravação tenta de novo.
+        """
+        with self._lock_gravacao:
+            with self._lock:
+                pendentes, self._pendentes = self._pendentes, {}
+            if not pendentes:
+                return
+            db = self._fabrica_sessao()
+            try:
+                for chave, delta in pendentes.items():
+                    linha = db.get(EstatisticaRoteamento, chave)
+                    if linha is None:
+                        etapa, provedor, modelo, caminho = chave
+                        db.add(EstatisticaRoteamento(
+                            etapa=etapa, provedor=provedor, modelo=modelo, caminho=caminho,
+                            tentativas=delta["tentativas"], sucessos=delta["sucessos"],
+                            latencia_total_s=delta["latencia_total_s"],
+                        ))
+                    else:
+                        linha.tentativas = EstatisticaRoteamento.tentativas + delta["tentativas"]
+                        linha.sucessos = EstatisticaRoteamento.sucessos + delta["sucessos"]
+                        linha.latencia_total_s = EstatisticaRoteamento.latencia_total_s + delta["latencia_total_s"]
+                db.commit()
+            except Exception as erro:
+                db.rollback()
+                with self._lock:
+                    for chave, delta in pendentes.items():
+                        st = self._pendentes.setdefault(chave, self._zeradas())
+                        for campo, valor in delta.items():
+                            st[campo] += valor
+                logger.warning(f"Roteador de fallback: estatísticas não gravadas, nova tentativa depois ({erro})")
+            finally:
+                db.close()
+
+    def _agendar_gravacao(self) -> None:
+        """Grava fora do event loop se houver um rodando; senão (scripts), na hora."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.descarregar()
+            return
+        if self._gravacao is not None and not self._gravacao.done():
+            return  # a gravação em andamento ou a próxima leva os novos incrementos
+        self._gravacao = loop.create_task(asyncio.to_thread(self.descarregar))
+        self._tarefas.add(self._gravacao)
+        self._gravacao.add_done_callback(self._tarefas.discard)
+
+    # ==== Registro
+    def registrar(self, etapa: str, caminho: str, sucesso: bool, duracao_s: float = 0.0) -> None:
+        """Registra o resultado de uma tentativa do caminho na etapa."""
+        self._carregar()
+        chave = self._chave(etapa, caminho)
+        with self._lock:
+            for destino in (self._stats, self._pendentes):
+                st = destino.setdefault(chave, self._zeradas())
+                st["tentativas"] += 1
+                st["sucessos"] += int(sucesso)
+                st["latencia_total_s"] += duracao_s
+        self._agendar_gravacao()
+
+    @contextmanager
+    def tentativa(self, etapa: str, caminho: str):
+        """
+        Mede uma tentativa do caminho; o chamador marca t.sucesso = True.
+
+        Exceções contam como falha e são propagadas.
+        """
+        t = Tentativa()
+        t0 = time.perf_counter()
+        try:
+            yield t
+        finally:
+            self.registrar(etapa, caminho, t.sucesso, time.perf_counter() - t0)
+
+    # ==== Roteamento
+    def taxa_sucesso(self, etapa: str, caminho: str) -> float:
+        """Taxa de sucesso suavizada (Laplace); 0,5 enquanto houver poucas tentativas."""
+        self._carregar()
+        st = self._stats.get(self._chave(etapa, caminho))
+        if not st or st["tentativas"] < settings.ROTEADOR_MIN_TENTATIVAS:
+            return 0.5
+        return (st["sucessos"] + 1) / (st["tentativas"] + 2)
+
+    def ordenar(self, etapa: str, caminhos: List[str]) -> List[str]:
+        """
+        Ordem em que os caminhos devem ser tentados.
+
+        Args:
+            etapa: Etapa com cadeia de fallback ("resolucao", "correcao")
+            caminhos: Caminhos disponíveis na ordem padrão
+
+        Returns:
+            Caminhos da maior para a menor taxa de sucesso (empates mantêm a ordem padrão)
+        """
+        if not settings.ROTEADOR_FALLBACK_ATIVO or random.random() < settings.ROTEADOR_EXPLORACAO:
+            return list(caminhos)
+        ordem = sorted(
+            enumerate(caminhos),
+            key=lambda ic: (-self.taxa_sucesso(etapa, ic[1]), ic[0]),
+        )
+        resultado = [c for _, c in ordem]
+        if resultado != list(caminhos):
+            logger.info(f"Roteador de fallback ({etapa}): ordem {' → '.join(resultado)}")
+        return resultado
+
+    # ==== Métricas
+    def metricas(self) -> Dict[str, Any]:
+        """Estatísticas por etapa/provedor/modelo/caminho."""
+        self._carregar()
+        with self._lock:
+            itens = [(k, dict(v)) for k, v in self._stats.items()]
+        return {
+            "gravacoes_pendentes": sum(int(p["tentativas"]) for p in self._pendentes.values()),
+            "caminhos": [
+                {
+                    "etapa": etapa,
+                    "provedor": provedor,
+                    "modelo": modelo,
+                    "caminho": caminho,
+                    "tentativas": int(st["tentativas"]),
+                    "sucessos": int(st["sucessos"]),
+                    "taxa_sucesso": round(st["sucessos"] / st["tentativas"], 4) if st["tentativas"] else None,
+                    "latencia_media_s": round(st["latencia_total_s"] / st["tentativas"], 4) if st["tentativas"] else None,
+                }
+                for (etapa, provedor, modelo, caminho), st in sorted(itens)
+            ],
+        }
+
+    def coletar_metricas(self) -> List[Tuple[str, str, str, List[Tuple[Dict[str, Any], float]]]]:
+        """Coletor do /metrics: tentativas e sucessos por caminho de fallback."""
+        caminhos = self.metricas()["caminhos"]
+        rotulos = [{k: c[k] for k in ("etapa", "provedor", "modelo", "caminho")} for c in caminhos]
+        return [
+            ("kora_roteador_tentativas_total", "counter", "Tentativas de cada caminho das cadeias de fallback",
+             [(r, c["tentativas"]) for r, c in zip(rotulos, caminhos)]),
+            ("kora_roteador_sucessos_total", "counter", "Tentativas bem-sucedidas de cada caminho das cadeias de fallback",
+             [(r, c["sucessos"]) for r, c in zip(rotulos, caminhos)]),
+        ]
+
+
+# Instância global do roteador de fallback
+roteador_fallback = RoteadorFallback()
+metrics.registro.registrar_coletor(roteador_fallback.coletar_metricas)
@@ -0,0 +1,690 @@
+"""
+Serviço de orquestração da criação de sessões de estudo
+
+Reúne as etapas do POST /session/start (Interpretador → pipeline de questões →
+persistência) e do POST /session/{id}/submit (correção → persistência) para que os
+endpoints síncronos, o modo streaming, os jobs e os workers da fila usem o mesmo fluxo.
+O uso de LLM de cada fase é contabilizado e gravado junto com a sessão.
+
+No modo prazo (prazo_s), a sessão pode ser criada com menos questões que o alvo; as
+que faltam são geradas em segundo plano (prioridade de lote) e anexadas à mesma sessão.
+
+Respostas por alternativa ({"respostas": {"1": "A"}}) são corrigidas localmente contra o
+gabarito mestre; o LLM fica só com as recomendações narrativas (CORRECAO_RECOMENDACOES).
+A correção de turma aplica o mesmo fluxo a vários alunos, preparando o gabarito uma vez
+e pedindo ao LLM uma única recomendação para a turma inteira.
+
+Questões já processadas são atendidas pelo banco de questões (app/services/banco_questoes.py)
+sem chamar o LLM; as sessões geradas pelo pipeline alimentam o banco.
+"""
+from typing import Dict, Any, List, Optional, Set, Tuple
+from collections import Counter
+from contextvars import ContextVar
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.db.models import SessaoEstudo, CorrecaoTurma
+from app.services.agent_service import agent_service, EventoCallback, Prazo
+from app.services.uso_llm_service import uso_llm_service, ContabilidadeLLM
+from app.services.llm_scheduler import prioridade_llm
+from app.services.banco_questoes import banco_questoes
+import asyncio
+import logging
+import re
+import statistics
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Linha de resposta por alternativa: "1: A", "Questão 2 - c", "3) E"
+RE_LINHA_ALTERNATIVA = re.compile(r"^\s*(?:quest[aã]o\s*)?(\d+)\s*[:\-–).]\s*([A-E])\s*\)?\s*$", re.IGNORECASE)
+
+# Tarefas em segundo plano do trabalho atual; o worker da fila as aguarda antes de concluir
+tarefas_do_trabalho: ContextVar[Optional[Set[asyncio.Task]]] = ContextVar("tarefas_do_trabalho", default=None)
+
+
+class SessionService:
+    """
+    Executa o pipeline completo de criação de uma sessão a partir do texto
+    da questão original (com eventos de progresso opcionais) e a correção
+    das respostas de uma sessão existente.
+    """
+
+    ALVO_QUESTOES = 3
+
+    def __init__(self):
+        """Inicializa o registro de tarefas em segundo plano"""
+        self._tarefas: Set[asyncio.Task] = set()
+
+    def _agendar(self, corrotina) -> None:
+        """Roda a corrotina em segundo plano mantendo a referência até o fim."""
+        tarefa = asyncio.create_task(corrotina)
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._tarefas.discard)
+        do_trabalho = tarefas_do_trabalho.get()
+        if do_trabalho is not None:
+            do_trabalho.add(tarefa)
+            tarefa.add_done_callback(do_trabalho.discard)
+
+    @staticmethod
+    def respostas_em_texto(mapa: Dict[str, Any]) -> str:
+        """Converte o mapa de alternativas para o texto lido pelo Agente Correção."""
+        return "\n".join(f"Questão {k}: {str(v).upper()}" for k, v in mapa.items())
+
+    @staticmethod
+    def extrair_mapa_alternativas(texto: str) -> Optional[Dict[str, str]]:
+        """Lê respostas no formato "1: A" (uma por linha); None se alguma linha não seguir o formato."""
+        mapa: Dict[str, str] = {}
+        for linha in (texto or "").splitlines():
+            if not linha.strip():
+                continue
+            m = RE_LINHA_ALTERNATIVA.match(linha)
+            if not m:
+                return None
+            mapa[m.group(1)] = m.group(2).upper()
+        return mapa or None
+
+    def formatar_lista_questoes(self, aprovadas: List[Any]) -> List[str]:
+        """Converte as questões aprovadas em strings "N. enunciado" para a resposta da API."""
+        questoes_strings = []
+        for i, q in enumerate(aprovadas, start=1):
+            if isinstance(q, dict):
+                num = q.get('numero', i)
+                enun = q.get('enunciado', '')
+                questoes_strings.append(f"{num}. {enun}")
+            else:
+                questoes_strings.append(str(q))
+        return questoes_strings
+
+    async def criar_sessao(
+        self,
+        questao_texto: str,
+        db: Optional[Session] = None,
+        on_evento: Optional[EventoCallback] = None,
+        prazo_s: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        Identifica habilidades, gera as questões validadas e persiste a sessão.
+
+        Args:
+            questao_texto: Texto da questão original (já extraído)
+            db: Sessão do banco; se omitida, uma sessão própria é aberta e fechada
+            on_evento: Callback opcional chamado a cada etapa concluída
+                ("habilidades", "questao", "sessao")
+            prazo_s: Orçamento de latência em segundos; o pipeline degrada para
+                cumpri-lo e as questões que faltarem são preenchidas em segundo plano
+
+        Returns:
+            Dicionário no formato de SessionStartResponse
+        """
+        db_proprio = db is None
+        if db_proprio:
+            db = SessionLocal()
+
+        async def _emitir(evento: str, dados: Dict[str, Any]) -> None:
+            if on_evento is not None:
+                await on_evento(evento, dados)
+
+        prazo = Prazo(prazo_s) if prazo_s else None
+        try:
+            # 1. Banco de questões: questão já processada é atendida sem LLM
+            servida = banco_questoes.servir(questao_texto, self.ALVO_QUESTOES)
+            if servida is not None:
+                return await self._criar_sessao_do_banco(db, questao_texto, *servida, emitir=_emitir)
+
+            with uso_llm_service.contabilizar() as contabilidade:
+                # 2. Agente Interpretador: Identifica habilidades BNCC
+                logger.info("Passo 2: Identificando habilidades BNCC")
+                analise = await agent_service.interpretar_questao(questao_texto)
+                logger.info(f"Habilidades identificadas: {len(analise.get('habilidades_identificadas', []))}")
+                await _emitir("habilidades", analise)
+
+                # 3. Pipeline Criador → Solver → Validação: gera 3 questões aprovadas
+                logger.info(f"Passo 3: Gerando e validando questões (alvo={self.ALVO_QUESTOES})")
+                kwargs: Dict[str, Any] = {}
+                if on_evento is not None:
+                    kwargs["on_evento"] = on_evento
+                if prazo is not None:
+                    kwargs["prazo"] = prazo
+                aprovadas, gabarito = await agent_service.gerar_questoes_validadas(
+                    questao_original=questao_texto,
+                    habilidades_identificadas=analise.get('habilidades_identificadas', []),
+                    conceitos_principais=analise.get('conceitos_principais', []),
+                    ano_escolar=analise.get('ano_recomendado', 'Não especificado'),
+                    alvo=self.ALVO_QUESTOES,
+                    max_tentativas=3,
+                    **kwargs,
+                )
+                logger.info(f"Questões aprovadas: {len(aprovadas)}")
+
+            faltam = self.ALVO_QUESTOES - len(aprovadas) if prazo is not None else 0
+            if faltam > 0:
+                gabarito["preenchimento"] = {"status": "em_andamento", "pendentes": faltam}
+
+            # Converte para lista de strings para resposta (mantém objetos no banco)
+            questoes_strings = self.formatar_lista_questoes(aprovadas)
+
+            # 4. Cria sessão no banco
+            logger.info("Passo 4: Criando sessão no banco")
+            sessao = SessaoEstudo(
+                questao_original=questao_texto,
+                habilidades_identificadas=analise,
+                lista_questoes=aprovadas,
+                gabarito_mestre=gabarito
+            )
+            db.add(sessao)
+            db.flush()
+            # O que as tarefas pendentes registrarem depois daqui vai para o preenchimento
+            marca = contabilidade.marca()
+            uso_llm_service.salvar(db, sessao.session_id, "start", contabilidade)
+            db.commit()
+            db.refresh(sessao)
+            logger.info(f"Sessão criada: {sessao.session_id}")
+
+            resposta = {
+                "session_id": sessao.session_id,
+                "lista_de_questoes": questoes_strings,
+                "questoes_geradas": aprovadas,  # Retorna objetos completos com alternativas
+                "questoes_pendentes": faltam,
+                "origem": "pipeline",
+            }
+            banco_questoes.guardar(questao_texto, analise, aprovadas, gabarito.get("gabarito") or [])
+            if faltam > 0:
+                logger.info(f"Prazo de {prazo_s}s: {faltam} questão(ões) serão preenchidas em segundo plano")
+                self._agendar(self._preencher_em_segundo_plano(
+                    sessao.session_id, questao_texto, analise, prazo.itens_pendentes, faltam,
+                    contabilidade, marca,
+                ))
+            await _emitir("sessao", resposta)
+            return resposta
+
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            if db_proprio:
+                db.close()
+
+    async def _criar_sessao_do_banco(
+        self,
+        db: Session,
+        questao_texto: str,
+        analise: Dict[str, Any],
+        questoes: List[Dict[str, Any]],
+        gabarito: Dict[str, Any],
+        emitir: EventoCallback,
+    ) -> Dict[str, Any]:
+        """Persiste uma sessão montada pelo banco de questões (mesmos eventos do pipeline)."""
+        await emitir("habilidades", analise)
+        for questao in questoes:
+            await emitir("questao", dict(questao))
+
+        with uso_llm_service.contabilizar() as contabilidade:
+            sessao = SessaoEstudo(
+                questao_original=questao_texto,
+                habilidades_identificadas=analise,
+                lista_questoes=questoes,
+                gabarito_mestre=gabarito,
+            )
+            db.add(sessao)
+            db.flush()
+            uso_llm_service.salvar(db, sessao.session_id, "start", contabilidade)
+            db.commit()
+            db.refresh(sessao)
+        logger.info(f"Sessão criada a partir do banco de questões: {sessao.session_id}")
+
+        resposta = {
+            "session_id": sessao.session_id,
+            "lista_de_questoes": self.formatar_lista_questoes(questoes),
+            "questoes_geradas": questoes,
+            "questoes_pendentes": 0,
+            "origem": "banco",
+        }
+        await emitir("sessao", resposta)
+        return resposta
+
+    async def _preencher_em_segundo_plano(
+        self,
+        session_id: str,
+        questao_texto: str,
+        analise: Dict[str, Any],
+        itens_pendentes: List[Tuple[Dict[str, Any], asyncio.Task]],
+        faltam: int,
+        contabilidade_start: ContabilidadeLLM,
+        marca: Tuple[int, int],
+    ) -> None:
+        """
+        Conclui as questões que não couberam no prazo e as anexa à sessão.
+
+        Primeiro aguarda as aprovadas que ainda estavam em andamento; se mesmo assim
+        faltarem questões, roda novas rodadas do pipeline sem prazo. As tarefas
+        pendentes nasceram na contabilidade do /start, já gravada: o que registraram
+        depois da marca é movido para a fase "preenchimento". Questão e item do
+        gabarito são pareados pelo número, e as falhas ficam em
+        gabarito["preenchimento"].
+        """
+        prioridade_llm.set("lote")
+        pares: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+        falhas = 0
+        erro: Optional[str] = None
+        with uso_llm_service.contabilizar() as contabilidade:
+            for questao, tarefa in itens_pendentes:
+                try:
+                    pares.append((questao, await tarefa))
+                except Exception as e:
+                    falhas += 1
+                    logger.warning(f"Sessão {session_id}: falha ao concluir questão pendente: {e}")
+            restantes = faltam - len(pares)
+            if restantes > 0:
+                try:
+                    extras, gabarito_extra = await agent_service.gerar_questoes_validadas(
+                        questao_original=questao_texto,
+                        habilidades_identificadas=analise.get('habilidades_identificadas', []),
+                        conceitos_principais=analise.get('conceitos_principais', []),
+                        ano_escolar=analise.get('ano_recomendado', 'Não especificado'),
+                        alvo=restantes,
+                        max_tentativas=3,
+                    )
+                    por_numero = {item.get("numero_questao"): item for item in gabarito_extra.get("gabarito", [])}
+                    for questao in extras:
+                        item = por_numero.get(questao.get("numero"))
+                        if item is None:
+                            falhas += 1
+                            logger.warning(
+                                f"Sessão {session_id}: questão extra {questao.get('numero')} sem item no gabarito"
+                            )
+                            continue
+                        pares.append((questao, item))
+                except Exception as e:
+                    erro = str(e)
+                    logger.error(f"Sessão {session_id}: falha no preenchimento em segundo plano: {e}", exc_info=True)
+        contabilidade_start.transferir_desde(marca, contabilidade)
+
+        db = SessionLocal()
+        try:
+            sessao = db.query(SessaoEstudo).filter(SessaoEstudo.session_id == session_id).first()
+            if not sessao:
+                logger.warning(f"Sessão {session_id} removida antes do preenchimento")
+                return
+            lista = list(sessao.lista_questoes or [])
+            gabarito = dict(sessao.gabarito_mestre or {})
+            itens_gabarito = list(gabarito.get("gabarito") or [])
+            for questao, item in pares:
+                numero = len(lista) + 1
+                questao["numero"] = numero
+                item["numero_questao"] = numero
+                lista.append(questao)
+                itens_gabarito.append(item)
+            gabarito["gabarito"] = itens_gabarito
+            pendentes = max(0, faltam - len(pares))
+            preenchimento: Dict[str, Any] = {
+                "status": "concluido" if pendentes == 0 else "incompleto",
+                "adicionadas": len(pares),
+                "pendentes": pendentes,
+                "falhas": falhas,
+            }
+            if erro is not None:
+                preenchimento["erro"] = erro
+            gabarito["preenchimento"] = preenchimento
+            sessao.lista_questoes = lista
+            sessao.gabarito_mestre = gabarito
+            sessao.updated_at = func.now()
+            uso_llm_service.salvar(db, session_id, "preenchimento", contabilidade)
+            db.commit()
+            logger.info(f"Sessão {session_id}: {len(pares)} questão(ões) anexadas em segundo plano")
+            banco_questoes.guardar(
+                questao_texto, analise, [q for q, _ in pares], [item for _, item in pares]
+            )
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Sessão {session_id}: falha ao gravar o preenchimento: {e}", exc_info=True)
+        finally:
+            db.close()
+
+    async def corrigir_sessao(
+        self,
+        session_id: str,
+        respostas_texto: str,
+        respostas_payload: Optional[Dict[str, Any]] = None,
+        db: Optional[Session] = None,
+    ) -> Dict[str, Any]:
+        """
+        Corrige as respostas de uma sessão existente e grava o relatório.
+
+        Args:
+            session_id: ID da sessão
+            respostas_texto: Respostas em texto (formato lido pelo Agente Correção)
+            respostas_payload: JSON original das respostas, se houver; um mapa
+                {"respostas": {"1": "A"}} é corrigido localmente, sem o Agente Correção
+            db: Sessão do banco; se omitida, uma sessão própria é aberta e fechada
+
+        Returns:
+            Dicionário no formato de SessionSubmitResponse
+
+        Raises:
+            LookupError: Se a sessão não existir
+        """
+        db_proprio = db is None
+        if db_proprio:
+            db = SessionLocal()
+        try:
+            sessao = db.query(SessaoEstudo).filter(
+                SessaoEstudo.session_id == session_id
+            ).first()
+            if not sessao:
+                raise LookupError(f"Sessão {session_id} não encontrada")
+
+            # 3. Correção: local para respostas por alternativa, Agente Correção para as demais
+            logger.info("Passo 3: Corrigindo respostas")
+            mapa = respostas_payload.get("respostas") if isinstance(respostas_payload, dict) else None
+            modo = settings.CORRECAO_RECOMENDACOES
+            with uso_llm_service.contabilizar() as contabilidade:
+                relatorio = None
+                if isinstance(mapa, dict) and mapa:
+                    relatorio = agent_service.corrigir_alternativas(
+                        sessao.lista_questoes or [], sessao.gabarito_mestre or {}, mapa
+                    )
+                if relatorio is None:
+                    relatorio = await agent_service.corrigir_respostas(
+                        session_id=session_id,
+                        respostas_aluno=respostas_texto or ""
+                    )
+                elif modo == "sincrono":
+                    await self._completar_recomendacoes(session_id, relatorio)
+                elif modo == "segundo_plano":
+                    relatorio["recomendacoes_status"] = "pendente"
+                    relatorio["submissao_id"] = str(uuid.uuid4())
+            logger.info(f"Relatório diagnóstico gerado (origem: {relatorio.get('origem_correcao', 'agente')})")
+
+            # 4. Atualiza sessão no banco
+            logger.info("Passo 4: Atualizando sessão no banco")
+            sessao.respostas_aluno = respostas_payload if respostas_payload else {"texto": respostas_texto}
+            sessao.relatorio_diagnostico = relatorio
+            sessao.submitted_at = func.now()
+            sessao.updated_at = func.now()
+            uso_llm_service.salvar(db, session_id, "submit", contabilidade)
+            db.commit()
+            logger.info("Sessão atualizada")
+
+            if relatorio.get("recomendacoes_status") == "pendente":
+                self._agendar(self._recomendar_em_segundo_plano(session_id, dict(relatorio)))
+            return {"session_id": session_id, "relatorio_diagnostico": relatorio}
+
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            if db_proprio:
+                db.close()
+
+    async def _completar_recomendacoes(self, session_id: str, relatorio: Dict[str, Any], turma: bool = False) -> None:
+        """Troca o texto padrão da correção local pelas recomendações do LLM (mantém o padrão se falhar)."""
+        try:
+            if turma:
+                narrativa = await agent_service.gerar_recomendacoes_turma(relatorio)
+            else:
+                narrativa = await agent_service.gerar_recomendacoes(relatorio)
+            relatorio["recomendacoes"] = narrativa["recomendacoes"]
+            relatorio["pontos_fortes"] = narrativa.get("pontos_fortes") or relatorio.get("pontos_fortes", [])
+            relatorio["recomendacoes_status"] = "concluido"
+        except Exception as e:
+            logger.warning(f"Sessão {session_id}: recomendações do LLM indisponíveis, mantendo texto padrão: {e}")
+            relatorio["recomendacoes_status"] = "local"
+
+    async def _recomendar_em_segundo_plano(self, session_id: str, relatorio: Dict[str, Any]) -> None:
+        """
+        Gera as recomendações narrativas depois de devolver a nota e atualiza o relatório gravado.
+
+        Só grava se o relatório da sessão ainda for o desta submissão (mesmo
+        submissao_id): uma nova submissão no meio do caminho tem prioridade, mesmo
+        que as recomendações dela ainda estejam pendentes.
+        """
+        prioridade_llm.set("lote")
+        with uso_llm_service.contabilizar() as contabilidade:
+            await self._completar_recomendacoes(session_id, relatorio)
+
+        db = SessionLocal()
+        try:
+            sessao = db.query(SessaoEstudo).filter(SessaoEstudo.session_id == session_id).first()
+            if not sessao:
+                return
+            atual = dict(sessao.relatorio_diagnostico or {})
+            if atual.get("submissao_id") != relatorio.get("submissao_id"):
+                logger.info(f"Sessão {session_id}: recomendações descartadas, relatório substituído por nova submissão")
+                uso_llm_service.salvar(db, session_id, "recomendacoes", contabilidade)
+                db.commit()
+                return
+            for campo in ("recomendacoes", "pontos_fortes", "recomendacoes_status"):
+                atual[campo] = relatorio.get(campo)
+            sessao.relatorio_diagnostico = atual
+            sessao.updated_at = func.now()
+            uso_llm_service.salvar(db, session_id, "recomendacoes", contabilidade)
+            db.commit()
+            logger.info(f"Sessão {session_id}: recomendações gravadas ({relatorio['recomendacoes_status']})")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Sessão {session_id}: falha ao gravar as recomendações: {e}", exc_info=True)
+        finally:
+            db.close()
+
+    # ==== Correção de turma
+    def resumir_turma(self, preparadas: List[Dict[str, Any]], registros: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Agrega os relatórios de uma turma.
+
+        Acerto e alternativas escolhidas por questão vêm dos alunos corrigidos
+        localmente; médias e habilidades a revisar consideram todos os corrigidos.
+        Uma habilidade entra em habilidades_a_revisar quando metade ou mais da
+        turma errou alguma questão que a envolve.
+        """
+        relatorios = [r["relatorio_diagnostico"] for r in registros if r.get("relatorio_diagnostico")]
+        locais = [
+            {c.get("numero"): c for c in r.get("correcao_detalhada") or []}
+            for r in relatorios if r.get("origem_correcao") == "local"
+        ]
+
+        por_questao: List[Dict[str, Any]] = []
+        for q in preparadas:
+            escolhas: Dict[str, int] = {letra: 0 for letra in sorted(q["alternativas"]) or "ABCDE"}
+            escolhas["em_branco"] = 0
+            acertos = respondentes = 0
+            for itens in locais:
+                item = itens.get(q["numero"])
+                if item is None:
+                    continue
+                respondentes += 1
+                chave = item.get("alternativa_escolhida") or "em_branco"
+                escolhas[chave] = escolhas.get(chave, 0) + 1
+                acertos += bool(item.get("acertou"))
+            erradas = {k: v for k, v in escolhas.items() if k not in (q["correta"], "em_branco") and v}
+            por_questao.append({
+                "numero": q["numero"],
+                "alternativa_correta": q["correta"],
+                "percentual_acerto": round(acertos / respondentes * 100, 1) if respondentes else None,
+                "escolhas": escolhas,
+                "erro_mais_frequente": max(erradas, key=erradas.get) if erradas else None,
+            })
+
+        contagem = Counter(h for r in relatorios for h in set(r.get("habilidades_a_revisar") or []))
+        habilidades = [
+            {"codigo": h, "alunos": n, "percentual_alunos": round(n / len(relatorios) * 100, 1)}
+            for h, n in contagem.most_common()
+        ]
+        a_revisar = [h["codigo"] for h in habilidades if h["percentual_alunos"] >= 50]
+
+        if a_revisar:
+            recomendacoes = f"Retome em aula as habilidades {', '.join(a_revisar)}."
+            criticas = [q for q in por_questao if q["percentual_acerto"] is not None and q["erro_mais_frequente"]]
+            if criticas:
+                pior = min(criticas, key=lambda q: q["percentual_acerto"])
+                recomendacoes += (
+                    f" A questão {pior['numero']} teve {pior['percentual_acerto']:.1f}% de acerto e a alternativa "
+                    f"{pior['erro_mais_frequente']} foi o erro mais frequente: discuta o raciocínio que leva a ela."
+                )
+        else:
+            recomendacoes = "A maior parte da turma domina as habilidades avaliadas; avance para problemas mais desafiadores."
+
+        percentuais = [float(r.get("percentual_acerto") or 0.0) for r in relatorios]
+        return {
+            "total_alunos": len(registros),
+            "alunos_corrigidos": len(relatorios),
+            "falhas": len(registros) - len(relatorios),
+            "media_percentual": round(statistics.fmean(percentuais), 1) if percentuais else None,
+            "mediana_percentual": round(statistics.median(percentuais), 1) if percentuais else None,
+            "menor_percentual": min(percentuais) if percentuais else None,
+            "maior_percentual": max(percentuais) if percentuais else None,
+            "por_questao": por_questao,
+            "habilidades": habilidades,
+            "habilidades_a_revisar": a_revisar,
+            "recomendacoes": recomendacoes,
+            "recomendacoes_status": "local",
+        }
+
+    async def corrigir_turma(
+        self,
+        session_id: str,
+        alunos: List[Dict[str, Any]],
+        db: Optional[Session] = None,
+    ) -> Dict[str, Any]:
+        """
+        Corrige as respostas de vários alunos para a mesma sessão e grava o resultado.
+
+        O gabarito é carregado e preparado uma vez; respostas por alternativa são
+        corrigidas localmente e as demais pelo Agente Correção (até
+        TURMA_CONCORRENCIA_AGENTE simultâneas). As recomendações narrativas são
+        pedidas ao LLM uma vez para a turma, conforme CORRECAO_RECOMENDACOES.
+
+        Args:
+            session_id: ID da sessão
+            alunos: [{"aluno": "...", "respostas": {"1": "A"}}] ou [{"aluno": "...", "texto": "..."}]
+            db: Sessão do banco; se omitida, uma sessão própria é aberta e fechada
+
+        Returns:
+            Dicionário no formato de TurmaSubmitResponse
+
+        Raises:
+            LookupError: Se a sessão não existir
+        """
+        db_proprio = db is None
+        if db_proprio:
+            db = SessionLocal()
+        try:
+            sessao = db.query(SessaoEstudo).filter(
+                SessaoEstudo.session_id == session_id
+            ).first()
+            if not sessao:
+                raise LookupError(f"Sessão {session_id} não encontrada")
+
+            lista = sessao.lista_questoes or []
+            gabarito = sessao.gabarito_mestre or {}
+            preparadas = agent_service.preparar_correcao_alternativas(lista, gabarito)
+            semaforo = asyncio.Semaphore(max(1, settings.TURMA_CONCORRENCIA_AGENTE))
+
+            async def _corrigir_aluno(entrada: Dict[str, Any]) -> Dict[str, Any]:
+                mapa = entrada.get("respostas")
+                if not isinstance(mapa, dict):
+                    mapa = self.extrair_mapa_alternativas(entrada.get("texto") or "")
+                relatorio = None
+                if mapa and preparadas:
+                    relatorio = agent_service.corrigir_alternativas(lista, gabarito, mapa, preparadas=preparadas)
+                if relatorio is None:
+                    async with semaforo:
+                        relatorio = await agent_service.corrigir_respostas(
+                            session_id=session_id,
+                            respostas_aluno=entrada.get("texto") or self.respostas_em_texto(mapa or {}),
+                        )
+                return relatorio
+
+            logger.info(f"Corrigindo turma de {len(alunos)} aluno(s) da sessão {session_id}")
+            with uso_llm_service.contabilizar() as contabilidade:
+                resultados = await asyncio.gather(*(_corrigir_aluno(a) for a in alunos), return_exceptions=True)
+                registros: List[Dict[str, Any]] = []
+                for entrada, resultado in zip(alunos, resultados):
+                    registro = {
+                        "aluno": entrada["aluno"],
+                        "respostas": entrada.get("respostas") or {"texto": entrada.get("texto")},
+                        "relatorio_diagnostico": None,
+                        "erro": None,
+                    }
+                    if isinstance(resultado, Exception):
+                        logger.warning(f"Turma da sessão {session_id}: falha ao corrigir {entrada['aluno']}: {resultado}")
+                        registro["erro"] = str(resultado)
+                    else:
+                        registro["relatorio_diagnostico"] = resultado
+                    registros.append(registro)
+
+                resumo = self.resumir_turma(preparadas or [], registros)
+                modo = settings.CORRECAO_RECOMENDACOES
+                if resumo["alunos_corrigidos"] and modo == "sincrono":
+                    await self._completar_recomendacoes(session_id, resumo, turma=True)
+                elif resumo["alunos_corrigidos"] and modo == "segundo_plano":
+                    resumo["recomendacoes_status"] = "pendente"
+
+            correcao = CorrecaoTurma(session_id=session_id, alunos=registros, resumo_turma=resumo)
+            db.add(correcao)
+            db.flush()
+            uso_llm_service.salvar(db, session_id, "turma", contabilidade)
+            db.commit()
+            logger.info(
+                f"Turma corrigida ({correcao.correcao_id}): {resumo['alunos_corrigidos']}/{len(alunos)} "
+                f"aluno(s), média {resumo['media_percentual']}%"
+            )
+
+            if resumo["recomendacoes_status"] == "pendente":
+                self._agendar(self._recomendar_turma_em_segundo_plano(correcao.correcao_id, session_id, dict(resumo)))
+            return self.formatar_correcao_turma(correcao.correcao_id, session_id, registros, resumo)
+
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            if db_proprio:
+                db.close()
+
+    @staticmethod
+    def formatar_correcao_turma(
+        correcao_id: str,
+        session_id: str,
+        registros: List[Dict[str, Any]],
+        resumo: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        """Monta a resposta da correção de turma (sem as respostas brutas dos alunos)."""
+        return {
+            "correcao_id": correcao_id,
+            "session_id": session_id,
+            "alunos": [
+                {"aluno": r["aluno"], "relatorio_diagnostico": r["relatorio_diagnostico"], "erro": r["erro"]}
+                for r in registros
+            ],
+            "resumo_turma": resumo,
+        }
+
+    async def _recomendar_turma_em_segundo_plano(self, correcao_id: str, session_id: str, resumo: Dict[str, Any]) -> None:
+        """Gera as recomendações da turma depois de devolver as notas e atualiza o resumo gravado."""
+        prioridade_llm.set("lote")
+        with uso_llm_service.contabilizar() as contabilidade:
+            await self._completar_recomendacoes(session_id, resumo, turma=True)
+
+        db = SessionLocal()
+        try:
+            correcao = db.query(CorrecaoTurma).filter(CorrecaoTurma.correcao_id == correcao_id).first()
+            if not correcao:
+                return
+            atual = dict(correcao.resumo_turma or {})
+            for campo in ("recomendacoes", "pontos_fortes", "recomendacoes_status"):
+                atual[campo] = resumo.get(campo)
+            correcao.resumo_turma = atual
+            correcao.updated_at = func.now()
+            uso_llm_service.salvar(db, session_id, "recomendacoes_turma", contabilidade)
+            db.commit()
+            logger.info(f"Turma {correcao_id}: recomendações gravadas ({resumo['recomendacoes_status']})")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Turma {correcao_id}: falha ao gravar as recomendações: {e}", exc_info=True)
+        finally:
+            db.close()
+
+
+# Instância global do serviço de sessões
+session_service = SessionService()
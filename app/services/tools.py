@@ -68,6 +68,35 @@ def buscar_por_conceitos(conceitos: List[str], ano_escolar: Optional[str] = None
         return json.dumps({"erro": str(e)})
 
 
+@tool
+def buscar_habilidades_bncc_lote(consultas: List[str], anos_escolares: Optional[List[str]] = None) -> str:
+    """
+    Busca várias consultas na BNCC de Matemática em uma única chamada.
+
+    Use no lugar de várias chamadas a buscar_habilidades_bncc (um conceito ou um
+    ano por vez). Os resultados vêm sem repetição, com a similaridade e as
+    consultas que encontraram cada habilidade.
+
+    Args:
+        consultas: Lista de textos de busca (ex: ["função quadrática", "vértice da parábola"])
+        anos_escolares: Filtro opcional por um ou mais anos (ex: ["8º", "9º"])
+
+    Returns:
+        JSON string com lista de habilidades encontradas
+
+    Exemplo de uso:
+        buscar_habilidades_bncc_lote(["escala", "área", "conversão de unidades"], ["7º", "8º", "9º"])
+    """
+    try:
+        documentos = rag_service.buscar_lote(consultas, anos=anos_escolares)
+        habilidades = rag_service.formatar_habilidades(documentos)
+
+        return json.dumps(habilidades, ensure_ascii=False, indent=2)
+    except Exception as e:
+        logger.error(f"Erro em buscar_habilidades_bncc_lote: {e}")
+        return json.dumps({"erro": str(e)})
+
+
 # ============================================================================
 # Tools para Gabarito (Agente Resolução e Correção)
 # ============================================================================
@@ -167,12 +196,14 @@ def recuperar_gabarito_sessao(session_id: str) -> str:
 # Tools para Agente Interpretador
 INTERPRETADOR_TOOLS = [
     buscar_habilidades_bncc,
-    buscar_por_conceitos
+    buscar_por_conceitos,
+    buscar_habilidades_bncc_lote
 ]
 
 # Tools para Agente Criador
 CRIADOR_TOOLS = [
-    buscar_habilidades_bncc
+    buscar_habilidades_bncc,
+    buscar_habilidades_bncc_lote
 ]
 
 # Tools para Agente Resolução
@@ -189,6 +220,7 @@ CORRECAO_TOOLS = [
 ALL_TOOLS = [
     buscar_habilidades_bncc,
     buscar_por_conceitos,
+    buscar_habilidades_bncc_lote,
     salvar_gabarito_sessao,
     recuperar_gabarito_sessao
 ]
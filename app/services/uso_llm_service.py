@@ -0,0 +1,235 @@
+"""
+Contabilidade de uso de LLM por sessão de estudo
+
+O SessionService abre uma contabilidade no início de /start e /submit; toda chamada
+de LLM do AgentService feita nesse contexto (inclusive em tarefas filhas) registra
+tokens de entrada/saída, latência, espera na fila do escalonador e resultado
+(ok, erro, cache), e cada etapa com cadeia de fallback registra o caminho usado.
+Ao final, o resumo é gravado em uso_llm_sessoes e devolvido por GET /session/{id}.
+"""
+from typing import Dict, Any, List, Optional, Tuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from langchain_core.callbacks import BaseCallbackHandler
+from sqlalchemy.orm import Session
+from app.db.models import UsoLLMSessao
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ContadorTokens(BaseCallbackHandler):
+    """Callback que soma o usage_metadata das respostas do modelo em uma chamada."""
+
+    def __init__(self):
+        self.tokens_entrada = 0
+        self.tokens_saida = 0
+        self.respostas = 0
+
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        for geracoes in getattr(response, "generations", None) or []:
+            for g in geracoes:
+                uso = getattr(getattr(g, "message", None), "usage_metadata", None) or {}
+                if uso:
+                    self.respostas += 1
+                    self.tokens_entrada += int(uso.get("input_tokens", 0) or 0)
+                    self.tokens_saida += int(uso.get("output_tokens", 0) or 0)
+
+
+class ContabilidadeLLM:
+    """Chamadas de LLM e caminhos de fallback registrados durante uma etapa da sessão."""
+
+    def __init__(self):
+        self.chamadas: List[Dict[str, Any]] = []
+        self.fallbacks: List[Dict[str, str]] = []
+        self._lock = threading.Lock()
+
+    def registrar_chamada(
+        self,
+        agente: str,
+        tipo: str,
+        resultado: str,
+        tokens_entrada: int = 0,
+        tokens_saida: int = 0,
+        latencia_s: float = 0.0,
+        espera_fila_s: float = 0.0,
+        tokens_estimados: bool = False,
+    ) -> None:
+        with self._lock:
+            self.chamadas.append({
+                "agente": agente,
+                "tipo": tipo,
+                "resultado": resultado,
+                "tokens_entrada": tokens_entrada,
+                "tokens_saida": tokens_saida,
+                "latencia_s": round(latencia_s, 4),
+                "espera_fila_s": round(espera_fila_s, 4),
+                "tokens_estimados": tokens_estimados,
+            })
+
+    def registrar_fallback(self, etapa: str, caminho: str) -> None:
+        with self._lock:
+            self.fallbacks.append({"etapa": etapa, "caminho": caminho})
+
+    def marca(self) -> Tuple[int, int]:
+        """Posição atual dos registros, para separar o que for registrado depois."""
+        with self._lock:
+            return len(self.chamadas), len(self.fallbacks)
+
+    def transferir_desde(self, marca: Tuple[int, int], destino: "ContabilidadeLLM") -> None:
+        """
+        Move para outra contabilidade o que foi registrado depois da marca (ex.:
+        tarefas criadas no /start que terminam depois de a fase ter sido gravada).
+        """
+        chamadas_marca, fallbacks_marca = marca
+        with self._lock:
+            chamadas = self.chamadas[chamadas_marca:]
+            fallbacks = self.fallbacks[fallbacks_marca:]
+            del self.chamadas[chamadas_marca:]
+            del self.fallbacks[fallbacks_marca:]
+        with destino._lock:
+            destino.chamadas.extend(chamadas)
+            destino.fallbacks.extend(fallbacks)
+
+    def resumo(self) -> Dict[str, Any]:
+        """Totais, agregados por agente e contagem de caminhos de fallback por etapa."""
+        por_agente: Dict[str, Dict[str, Any]] = {}
+        for c in self.chamadas:
+            a = por_agente.setdefault(c["agente"], {
+                "chamadas": 0, "cache": 0, "erros": 0,
+                "tokens_entrada": 0, "tokens_saida": 0, "latencia_s": 0.0,
+            })
+            a["chamadas"] += 1
+            a["cache"] += c["resultado"] == "cache"
+            a["erros"] += c["resultado"] == "erro"
+            a["tokens_entrada"] += c["tokens_entrada"]
+            a["tokens_saida"] += c["tokens_saida"]
+            a["latencia_s"] = round(a["latencia_s"] + c["latencia_s"], 4)
+        fallbacks: Dict[str, Dict[str, int]] = {}
+        for f in self.fallbacks:
+            caminhos = fallbacks.setdefault(f["etapa"], {})
+            caminhos[f["caminho"]] = caminhos.get(f["caminho"], 0) + 1
+        return {
+            "chamadas": len(self.chamadas),
+            "tokens_entrada": sum(c["tokens_entrada"] for c in self.chamadas),
+            "tokens_saida": sum(c["tokens_saida"] for c in self.chamadas),
+            "latencia_llm_s": round(sum(c["latencia_s"] for c in self.chamadas), 4),
+            "espera_fila_s": round(sum(c["espera_fila_s"] for c in self.chamadas), 4),
+            "tokens_estimados": any(c["tokens_estimados"] for c in self.chamadas),
+            "por_agente": por_agente,
+            "fallbacks": fallbacks,
+        }
+
+
+# Contabilidade ativa no contexto atual (None = chamadas fora de uma sessão)
+contabilidade_llm: ContextVar[Optional[ContabilidadeLLM]] = ContextVar("contabilidade_llm", default=None)
+
+
+class UsoLLMService:
+    """Registro das chamadas de LLM na contabilidade ativa e persistência por sessão."""
+
+    @contextmanager
+    def contabilizar(self):
+        """Abre uma contabilidade para o bloco (herdada pelas tarefas criadas nele)."""
+        contabilidade = ContabilidadeLLM()
+        token = contabilidade_llm.set(contabilidade)
+        try:
+            yield contabilidade
+        finally:
+            contabilidade_llm.reset(token)
+
+    def registrar_chamada(self, agente: str, tipo: str, resultado: str, **dados: Any) -> None:
+        """Registra uma chamada na contabilidade ativa (sem efeito fora de uma sessão)."""
+        contabilidade = contabilidade_llm.get()
+        if contabilidade is not None:
+            contabilidade.registrar_chamada(agente, tipo, resultado, **dados)
+
+    def registrar_fallback(self, etapa: str, caminho: str) -> None:
+        """Registra o caminho de fallback usado por uma etapa na contabilidade ativa."""
+        contabilidade = contabilidade_llm.get()
+        if contabilidade is not None:
+            contabilidade.registrar_fallback(etapa, caminho)
+
+    def salvar(self, db: Session, session_id: str, fase: str, contabilidade: ContabilidadeLLM) -> None:
+        """
+        Grava (ou acumula) o uso de uma fase da sessão.
+
+        Args:
+            db: Sessão do banco (o commit fica com o chamador)
+            session_id: ID da sessão de estudo
+            fase: "start" ou "submit"
+            contabilidade: Chamadas registradas durante a fase
+        """
+        resumo = contabilidade.resumo()
+        uso = db.query(UsoLLMSessao).filter(UsoLLMSessao.session_id == session_id).first()
+        if uso is None:
+            uso = UsoLLMSessao(session_id=session_id, chamadas=0, tokens_entrada=0, tokens_saida=0, latencia_llm_s=0.0)
+            db.add(uso)
+        uso.chamadas = (uso.chamadas or 0) + resumo["chamadas"]
+        uso.tokens_entrada = (uso.tokens_entrada or 0) + resumo["tokens_entrada"]
+        uso.tokens_saida = (uso.tokens_saida or 0) + resumo["tokens_saida"]
+        uso.latencia_llm_s = round((uso.latencia_llm_s or 0.0) + resumo["latencia_llm_s"], 4)
+        # Reatribui o dict para o SQLAlchemy detectar a alteração da coluna JSON
+        fases = dict(uso.fases or {})
+        fases[fase] = self._mesclar_fase(fases.get(fase), resumo, contabilidade.chamadas)
+        uso.fases = fases
+        logger.info(
+            f"Uso de LLM da sessão {session_id} ({fase}): {resumo['chamadas']} chamada(s), "
+            f"{resumo['tokens_entrada']}+{resumo['tokens_saida']} tokens"
+        )
+
+    @staticmethod
+    def _mesclar_fase(
+        anterior: Optional[Dict[str, Any]], resumo: Dict[str, Any], detalhes: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Soma o resumo a uma fase já gravada (ex.: correção de uma segunda turma,
+        recomendações em segundo plano), para os totais da sessão continuarem
+        iguais à soma das fases.
+        """
+        if not anterior:
+            return {**resumo, "detalhes": list(detalhes)}
+        fase = dict(anterior)
+        for campo in ("chamadas", "tokens_entrada", "tokens_saida"):
+            fase[campo] = (fase.get(campo) or 0) + resumo[campo]
+        for campo in ("latencia_llm_s", "espera_fila_s"):
+            fase[campo] = round((fase.get(campo) or 0.0) + resumo[campo], 4)
+        fase["tokens_estimados"] = bool(fase.get("tokens_estimados")) or resumo["tokens_estimados"]
+
+        por_agente = {agente: dict(dados) for agente, dados in (fase.get("por_agente") or {}).items()}
+        for agente, dados in resumo["por_agente"].items():
+            atual = por_agente.setdefault(agente, {k: 0 for k in dados})
+            for campo, valor in dados.items():
+                atual[campo] = round((atual.get(campo) or 0) + valor, 4) if campo == "latencia_s" else (atual.get(campo) or 0) + valor
+        fase["por_agente"] = por_agente
+
+        fallbacks = {etapa: dict(caminhos) for etapa, caminhos in (fase.get("fallbacks") or {}).items()}
+        for etapa, caminhos in resumo["fallbacks"].items():
+            atual = fallbacks.setdefault(etapa, {})
+            for caminho, n in caminhos.items():
+                atual[caminho] = atual.get(caminho, 0) + n
+        fase["fallbacks"] = fallbacks
+        fase["detalhes"] = list(fase.get("detalhes") or []) + list(detalhes)
+        return fase
+
+    def obter(self, db: Session, session_id: str) -> Optional[Dict[str, Any]]:
+        """Uso agregado da sessão (totais e resumo por fase, sem o detalhe das chamadas)."""
+        uso = db.query(UsoLLMSessao).filter(UsoLLMSessao.session_id == session_id).first()
+        if uso is None:
+            return None
+        return {
+            "chamadas": uso.chamadas,
+            "tokens_entrada": uso.tokens_entrada,
+            "tokens_saida": uso.tokens_saida,
+            "tokens_total": (uso.tokens_entrada or 0) + (uso.tokens_saida or 0),
+            "latencia_llm_s": uso.latencia_llm_s,
+            "fases": {
+                fase: {k: v for k, v in dados.items() if k != "detalhes"}
+                for fase, dados in (uso.fases or {}).items()
+            },
+        }
+
+
+# Instância global do serviço de uso de LLM
+uso_llm_service = UsoLLMService()
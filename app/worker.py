@@ -0,0 +1,194 @@
+"""
+Worker da fila durável (kora-worker)
+
+Executa os trabalhos gravados em fila_trabalhos (JOBS_BACKEND=fila) em N processos,
+cada um com até WORKER_JOBS_POR_PROCESSO trabalhos simultâneos. Os trabalhos são
+reivindicados com lease e o lease é renovado enquanto executam; se um worker morrer,
+o lease expira e outro worker retoma o trabalho.
+
+Uso:
+    python -m app.worker --processos 4
+    python -m app.worker --processos 2 --tipos sessao_start
+"""
+from typing import Dict, Any, List, Optional, Set
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from app.core.config import settings
+
+logger = logging.getLogger("app.worker")
+
+TIPOS_SUPORTADOS = ["sessao_start", "correcao"]
+
+
+def _configurar_logging() -> None:
+    logging.basicConfig(
+        level=logging.INFO if settings.DEBUG else logging.WARNING,
+        format='%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    logger.setLevel(logging.INFO)
+
+
+async def _executar_trabalho(worker_id: str, trabalho: Dict[str, Any]) -> None:
+    """Executa um trabalho reivindicado, renovando o lease e gravando progresso e resultado."""
+    from fastapi.encoders import jsonable_encoder
+    from app.services.fila_service import fila_service
+    from app.services.job_service import job_service
+    from app.services.llm_scheduler import prioridade_llm
+    from app.services.session_service import tarefas_do_trabalho
+
+    prioridade_llm.set("lote")
+    segundo_plano: Set[asyncio.Task] = set()
+    tarefas_do_trabalho.set(segundo_plano)
+    job_id = trabalho["job_id"]
+    tipo = trabalho["tipo"]
+    parciais: Dict[str, Any] = {}
+    estado = {"etapa": job_service.etapa_inicial(tipo)}
+    logger.info(f"[{worker_id}] executando trabalho {job_id} ({tipo}, tentativa {trabalho['tentativas']})")
+
+    async def _heartbeat() -> None:
+        intervalo = max(1.0, settings.FILA_LEASE_S / 3)
+        while True:
+            await asyncio.sleep(intervalo)
+            await asyncio.to_thread(fila_service.renovar_lease, job_id, worker_id)
+
+    async def _on_evento(evento: str, dados: Dict[str, Any]) -> None:
+        etapa = job_service.aplicar_evento(parciais, evento, dados)
+        if etapa:
+            estado["etapa"] = etapa
+        await asyncio.to_thread(
+            fila_service.registrar_progresso, job_id, worker_id, estado["etapa"], jsonable_encoder(parciais)
+        )
+
+    await asyncio.to_thread(fila_service.registrar_progresso, job_id, worker_id, estado["etapa"], parciais)
+    heartbeat = asyncio.create_task(_heartbeat())
+    try:
+        resultado = await job_service.executar(tipo, trabalho["payload"], on_evento=_on_evento)
+        # Preenchimento do prazo e recomendações terminam ainda sob o lease do trabalho
+        while segundo_plano:
+            await asyncio.gather(*list(segundo_plano), return_exceptions=True)
+        await asyncio.to_thread(fila_service.concluir, job_id, worker_id, jsonable_encoder(resultado))
+        logger.info(f"[{worker_id}] trabalho {job_id} concluído")
+    except Exception as e:
+        logger.error(f"[{worker_id}] trabalho {job_id} falhou: {e}", exc_info=True)
+        await asyncio.to_thread(fila_service.falhar, job_id, worker_id, str(e))
+    finally:
+        heartbeat.cancel()
+
+
+async def _loop_worker(worker_id: str, tipos: List[str], jobs_por_processo: int) -> None:
+    """Reivindica e executa trabalhos até receber SIGTERM/SIGINT."""
+    from app.services.fila_service import fila_service
+
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, parar.set)
+        except (NotImplementedError, RuntimeError):
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(parar.set))
+
+    em_execucao: set = set()
+    logger.info(f"[{worker_id}] aguardando trabalhos ({', '.join(tipos)})")
+    while not parar.is_set():
+        if len(em_execucao) >= jobs_por_processo:
+            await asyncio.wait(em_execucao, return_when=asyncio.FIRST_COMPLETED)
+            continue
+        try:
+            trabalho = await asyncio.to_thread(fila_service.reivindicar, worker_id, tipos)
+        except Exception as e:
+            logger.warning(f"[{worker_id}] falha ao consultar a fila: {e}")
+            trabalho = None
+        if trabalho is None:
+            try:
+                await asyncio.wait_for(parar.wait(), timeout=settings.WORKER_INTERVALO_POLL_S)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        tarefa = asyncio.create_task(_executar_trabalho(worker_id, trabalho))
+        em_execucao.add(tarefa)
+        tarefa.add_done_callback(em_execucao.discard)
+
+    if em_execucao:
+        logger.info(f"[{worker_id}] encerrando: aguardando {len(em_execucao)} trabalho(s) em execução")
+        await asyncio.gather(*em_execucao, return_exceptions=True)
+
+    from app.services.roteador_fallback import roteador_fallback
+    await asyncio.to_thread(roteador_fallback.descarregar)
+
+
+def _processo_worker(indice: int, tipos: List[str], jobs_por_processo: int) -> None:
+    """Ponto de entrada de cada processo filho."""
+    _configurar_logging()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{indice}"
+    asyncio.run(_loop_worker(worker_id, tipos, jobs_por_processo))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Inicia e supervisiona os processos do worker (reinicia os que morrerem)."""
+    parser = argparse.ArgumentParser(
+        prog="kora-worker",
+        description="Executa os trabalhos da fila durável do KORA (JOBS_BACKEND=fila)"
+    )
+    parser.add_argument("--processos", type=int, default=settings.WORKER_PROCESSOS,
+                        help="Número de processos worker")
+    parser.add_argument("--jobs-por-processo", type=int, default=settings.WORKER_JOBS_POR_PROCESSO,
+                        help="Trabalhos simultâneos por processo")
+    parser.add_argument("--tipos", default=",".join(TIPOS_SUPORTADOS),
+                        help="Tipos de trabalho aceitos, separados por vírgula")
+    args = parser.parse_args(argv)
+
+    _configurar_logging()
+    tipos = [t.strip() for t in args.tipos.split(",") if t.strip() in TIPOS_SUPORTADOS]
+    if not tipos:
+        parser.error(f"Nenhum tipo válido em --tipos (suportados: {', '.join(TIPOS_SUPORTADOS)})")
+
+    # Cria as tabelas uma única vez, antes dos processos filhos
+    from app.db.database import init_db
+    init_db()
+
+    ctx = multiprocessing.get_context("spawn")
+    encerrando = False
+
+    def _iniciar(indice: int):
+        p = ctx.Process(
+            target=_processo_worker,
+            args=(indice, tipos, max(1, args.jobs_por_processo)),
+            name=f"kora-worker-{indice}",
+        )
+        p.start()
+        return p
+
+    def _encerrar(*_):
+        nonlocal encerrando
+        encerrando = True
+
+    signal.signal(signal.SIGTERM, _encerrar)
+    signal.signal(signal.SIGINT, _encerrar)
+
+    processos = {i: _iniciar(i) for i in range(max(1, args.processos))}
+    logger.info(f"kora-worker iniciado com {len(processos)} processo(s)")
+
+    while not encerrando:
+        time.sleep(1.0)
+        for i, p in list(processos.items()):
+            if not p.is_alive() and not encerrando:
+                logger.warning(f"Processo {p.name} terminou (exitcode={p.exitcode}); reiniciando")
+                processos[i] = _iniciar(i)
+
+    logger.info("Encerrando kora-worker...")
+    for p in processos.values():
+        if p.is_alive():
+            p.terminate()
+    for p in processos.values():
+        p.join(timeout=settings.FILA_LEASE_S)
+
+
+if __name__ == "__main__":
+    main()
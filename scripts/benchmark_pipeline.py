@@ -0,0 +1,305 @@
+"""
+Benchmark de latência ponta a ponta do pipeline de sessões
+
+Executa POST /api/v1/session/start e POST /api/v1/session/{id}/submit via TestClient
+com o provedor de LLM fake (ou replay de um cassete gravado) e reporta:
+- percentis de latência por etapa (interpretação, criação, validação, gabarito,
+  distratores, correção local das alternativas, correção pelo Agente Correção e
+  escrita no banco) e dos endpoints
+- chamadas de LLM por questão aprovada
+- pico de memória (tracemalloc)
+O resultado é gravado em JSON para comparar execuções entre commits.
+
+Cada ciclo submete as respostas duas vezes: por alternativa (JSON, corrigidas
+localmente contra o gabarito) e em texto livre (arquivo text/plain, que passa pelo
+Agente Correção).
+
+Uso:
+    python scripts/benchmark_pipeline.py --iteracoes 20 --latencia 0.2
+    python scripts/benchmark_pipeline.py --provedor replay --cassete cassetes/kora.jsonl --saida bench.json
+"""
+import argparse
+import inspect
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Any, List
+
+# Garante que o diretório raiz do repo esteja no sys.path para importar 'app'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+QUESTION_TEXT = (
+    "O arquiteto Renzo Piano exibiu a maquete da nova\n"
+    "sede do Museu Whitney de Arte Americana, um prédio\n"
+    "assimétrico que tem um vão aberto para a galeria principal,\n"
+    "cuja medida da área é 1 672 m 2 .\n"
+    "Considere que a escala da maquete exibida é 1 : 200.\n"
+    "Época, n. 682, jun. 2011 (adaptado).\n"
+    "A medida da área do vão aberto nessa maquete, em\n"
+    "centímetro quadrado, é"
+)
+
+# Respostas discursivas: não seguem o formato "1: A" e vão para o Agente Correção
+RESPOSTAS_TEXTO = (
+    "Questão 1: dividi a área por 200 e achei 8,36 m², que dá 83 600 cm².\n"
+    "Questão 2: a escala vale para o comprimento, então a área fica dividida por 40 000.\n"
+    "Questão 3: não sei."
+)
+
+ETAPAS = [
+    "interpretacao",
+    "criacao",
+    "validacao",
+    "gabarito",
+    "distratores",
+    "correcao_local",
+    "correcao",
+    "escrita_db",
+    "endpoint_start",
+    "endpoint_submit",
+    "endpoint_submit_texto",
+]
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark de latência do pipeline de sessões do KORA")
+    parser.add_argument("--iteracoes", type=int, default=10, help="Ciclos /start + /submit medidos")
+    parser.add_argument("--aquecimento", type=int, default=1, help="Ciclos iniciais descartados")
+    parser.add_argument("--provedor", choices=["fake", "replay"], default="fake", help="Provedor de LLM offline")
+    parser.add_argument("--cassete", default=None, help="Cassete para o modo replay (LLM_CASSETE_PATH)")
+    parser.add_argument("--fixtures", default=None, help="Fixtures do provedor fake (LLM_FAKE_FIXTURES)")
+    parser.add_argument("--latencia", type=float, default=0.0, help="Latência artificial por chamada de LLM (s)")
+    parser.add_argument("--com-cache", action="store_true", help="Mantém o cache de respostas de LLM ativo")
+    parser.add_argument("--saida", default=None, help="Arquivo JSON de resultado (padrão: apenas imprime)")
+    return parser.parse_args()
+
+
+def _configurar_ambiente(args: argparse.Namespace, banco: str) -> None:
+    """Define as variáveis lidas por app.core.config antes de importar a aplicação."""
+    os.environ["DEFAULT_LLM_PROVIDER"] = args.provedor
+    os.environ["EMBEDDING_PROVIDER"] = args.provedor
+    os.environ["LLM_LATENCIA_SIMULADA_S"] = str(args.latencia)
+    os.environ["DATABASE_URL"] = f"sqlite:///{banco}"
+    os.environ["JOBS_BACKEND"] = "memoria"
+    if args.cassete:
+        os.environ["LLM_CASSETE_PATH"] = args.cassete
+    if args.fixtures:
+        os.environ["LLM_FAKE_FIXTURES"] = args.fixtures
+    if not args.com_cache:
+        os.environ["LLM_CACHE_AGENTES"] = ""
+        os.environ["INTERPRETACAO_CACHE_ATIVO"] = "false"
+    # Cada ciclo repete a mesma questão: sem o banco de questões, todos passam pelo pipeline
+    os.environ["BANCO_QUESTOES_ATIVO"] = "false"
+
+
+def _percentis(amostras: List[float]) -> Dict[str, Any]:
+    """Resumo de uma série de durações (segundos): n, média, mín, máx e percentis."""
+    if not amostras:
+        return {"n": 0}
+    ordenadas = sorted(amostras)
+
+    def _p(q: float) -> float:
+        # Nearest-rank
+        idx = max(0, min(len(ordenadas) - 1, int(round(q * len(ordenadas) + 0.5)) - 1))
+        return round(ordenadas[idx], 4)
+
+    return {
+        "n": len(ordenadas),
+        "media": round(sum(ordenadas) / len(ordenadas), 4),
+        "min": round(ordenadas[0], 4),
+        "p50": _p(0.50),
+        "p90": _p(0.90),
+        "p95": _p(0.95),
+        "p99": _p(0.99),
+        "max": round(ordenadas[-1], 4),
+    }
+
+
+def _commit_atual() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "desconhecido"
+
+
+def _cronometrar(obj: Any, metodo: str, etapa: str, amostras: Dict[str, List[float]]) -> None:
+    """Substitui um método (síncrono ou assíncrono) da instância por uma versão que mede a duração."""
+    original = getattr(obj, metodo)
+
+    if not inspect.iscoroutinefunction(original):
+        def _medido_sincrono(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                amostras[etapa].append(time.perf_counter() - t0)
+
+        setattr(obj, metodo, _medido_sincrono)
+        return
+
+    async def _medido(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await original(*args, **kwargs)
+        finally:
+            amostras[etapa].append(time.perf_counter() - t0)
+
+    setattr(obj, metodo, _medido)
+
+
+def _instrumentar_commits(amostras: Dict[str, List[float]]) -> None:
+    """Mede a duração de cada commit do SQLAlchemy (escrita no banco)."""
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    @event.listens_for(Session, "before_commit")
+    def _antes(session):
+        session.info["_bench_t0"] = time.perf_counter()
+
+    @event.listens_for(Session, "after_commit")
+    def _depois(session):
+        t0 = session.info.pop("_bench_t0", None)
+        if t0 is not None:
+            amostras["escrita_db"].append(time.perf_counter() - t0)
+
+
+def _total_chamadas_llm(llm_scheduler: Any) -> int:
+    return sum(p["chamadas"] for p in llm_scheduler.metricas()["prioridades"].values())
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.services.agent_service import agent_service
+    from app.services.llm_scheduler import llm_scheduler
+
+    amostras: Dict[str, List[float]] = defaultdict(list)
+    _cronometrar(agent_service, "interpretar_questao", "interpretacao", amostras)
+    _cronometrar(agent_service, "criar_questoes", "criacao", amostras)
+    _cronometrar(agent_service, "_validar_candidata", "validacao", amostras)
+    _cronometrar(agent_service, "gerar_distratores", "distratores", amostras)
+    _cronometrar(agent_service, "corrigir_alternativas", "correcao_local", amostras)
+    _cronometrar(agent_service, "corrigir_respostas", "correcao", amostras)
+    _instrumentar_commits(amostras)
+
+    chamadas_por_questao: List[float] = []
+    aprovadas_por_ciclo: List[int] = []
+    erros = 0
+
+    with TestClient(app) as client:
+        for i in range(args.aquecimento + args.iteracoes):
+            medindo = i >= args.aquecimento
+            chamadas_antes = _total_chamadas_llm(llm_scheduler)
+
+            files = {"file": ("questao.txt", QUESTION_TEXT.encode("utf-8"), "text/plain")}
+            t0 = time.perf_counter()
+            r = client.post("/api/v1/session/start", files=files)
+            dt_start = time.perf_counter() - t0
+            if r.status_code != 200:
+                print(f"[ERRO] /start ({r.status_code}): {r.text[:200]}")
+                erros += 1
+                continue
+            data = r.json()
+            sid = data["session_id"]
+            n_aprovadas = len(data.get("questoes_geradas") or [])
+
+            respostas = {"respostas": {str(n): "A" for n in range(1, n_aprovadas + 1)}}
+            t0 = time.perf_counter()
+            r2 = client.post(f"/api/v1/session/{sid}/submit", json=respostas)
+            dt_submit = time.perf_counter() - t0
+            if r2.status_code != 200:
+                print(f"[ERRO] /submit ({r2.status_code}): {r2.text[:200]}")
+                erros += 1
+
+            arquivo = {"file": ("respostas.txt", RESPOSTAS_TEXTO.encode("utf-8"), "text/plain")}
+            t0 = time.perf_counter()
+            r3 = client.post(f"/api/v1/session/{sid}/submit", files=arquivo)
+            dt_submit_texto = time.perf_counter() - t0
+            if r3.status_code != 200:
+                print(f"[ERRO] /submit texto ({r3.status_code}): {r3.text[:200]}")
+                erros += 1
+
+            if not medindo:
+                # Descarta as amostras do aquecimento
+                amostras.clear()
+                continue
+
+            amostras["endpoint_start"].append(dt_start)
+            amostras["endpoint_submit"].append(dt_submit)
+            amostras["endpoint_submit_texto"].append(dt_submit_texto)
+            sessao = client.get(f"/api/v1/session/{sid}").json()
+            tempos = ((sessao.get("gabarito_mestre") or {}).get("tempos_pipeline") or {}).get("itens") or []
+            for t in tempos:
+                if "gabarito_s" in t:
+                    amostras["gabarito"].append(float(t["gabarito_s"]))
+
+            chamadas = _total_chamadas_llm(llm_scheduler) - chamadas_antes
+            aprovadas_por_ciclo.append(n_aprovadas)
+            if n_aprovadas:
+                chamadas_por_questao.append(chamadas / n_aprovadas)
+            print(f"Ciclo {i - args.aquecimento + 1}/{args.iteracoes}: start {dt_start:.3f}s | "
+                  f"submit {dt_submit:.3f}s | submit texto {dt_submit_texto:.3f}s | "
+                  f"{n_aprovadas} aprovadas | {chamadas} chamadas de LLM")
+
+    return {
+        "etapas": {etapa: _percentis(amostras.get(etapa, [])) for etapa in ETAPAS},
+        "chamadas_llm_por_questao_aprovada": _percentis(chamadas_por_questao),
+        "questoes_aprovadas_por_ciclo": _percentis([float(n) for n in aprovadas_por_ciclo]),
+        "erros": erros,
+    }
+
+
+def main() -> None:
+    args = _parse_args()
+    with tempfile.TemporaryDirectory(prefix="kora-bench-") as pasta:
+        _configurar_ambiente(args, os.path.join(pasta, "bench.db"))
+
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        resultado = run_benchmark(args)
+        duracao = time.perf_counter() - t0
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    resultado = {
+        "commit": _commit_atual(),
+        "executado_em": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "provedor": args.provedor,
+            "iteracoes": args.iteracoes,
+            "aquecimento": args.aquecimento,
+            "latencia_simulada_s": args.latencia,
+            "cache_llm": args.com_cache,
+        },
+        "duracao_total_s": round(duracao, 3),
+        "memoria_pico_mb": round(pico / (1024 * 1024), 2),
+        **resultado,
+    }
+
+    print("\n" + "=" * 80)
+    print(f"{'Etapa':<22}{'n':>5}{'p50':>10}{'p90':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for etapa, p in resultado["etapas"].items():
+        if p.get("n"):
+            print(f"{etapa:<22}{p['n']:>5}{p['p50']:>10.4f}{p['p90']:>10.4f}{p['p95']:>10.4f}{p['p99']:>10.4f}{p['max']:>10.4f}")
+    print(f"Chamadas de LLM por questão aprovada (média): {resultado['chamadas_llm_por_questao_aprovada'].get('media', 0)}")
+    print(f"Pico de memória: {resultado['memoria_pico_mb']} MB")
+    print("=" * 80)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"Resultado gravado em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
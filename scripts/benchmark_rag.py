@@ -0,0 +1,274 @@
+"""
+Benchmark dos backends e modos de busca do RAG BNCC
+
+Backends vetoriais (Chroma × índice NumPy): para um conjunto de consultas típicas dos
+agentes (com e sem filtros de metadata), calcula os embeddings uma única vez e mede
+só a busca em cada backend, e reporta:
+- tempo de carga do índice NumPy e do índice lexical BM25
+- percentis de latência da busca por backend (e do embedding da consulta, à parte)
+- concordância do top-k entre os backends (Jaccard dos códigos BNCC)
+
+Modos (vetorial, lexical, hibrido): mede RAGService.buscar_habilidades de ponta a
+ponta (embedding da consulta incluído, sem cache) e o recall@k em consultas com
+habilidades relevantes rotuladas.
+O resultado é gravado em JSON para comparar execuções entre commits.
+
+Uso:
+    python scripts/benchmark_rag.py --repeticoes 200
+    python scripts/benchmark_rag.py --provedor atual --backends chroma,numpy --saida rag.json
+
+Com --provedor fake (padrão), o índice NumPy é montado dos JSON da BNCC com embeddings
+determinísticos (o recall vetorial só é significativo com --provedor atual); o Chroma
+só é medido se o chromadb estiver instalado e a coleção tiver sido ingerida com o
+mesmo provedor (scripts/ingest_bncc.py).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+# Garante que o diretório raiz do repo esteja no sys.path para importar 'app'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from scripts.benchmark_pipeline import _percentis, _commit_atual  # noqa: E402
+
+# (consulta, filtros) no formato usado pelos agentes e pelo RAGService
+CONSULTAS: List[Dict[str, Any]] = [
+    {"query": "função quadrática vértice", "filtros": None},
+    {"query": "escala área maquete proporcionalidade", "filtros": None},
+    {"query": "porcentagem juros simples e compostos", "filtros": None},
+    {"query": "teorema de Pitágoras", "filtros": {"ano": "9º"}},
+    {"query": "equação do primeiro grau", "filtros": {"ano": "7º"}},
+    {"query": "probabilidade de eventos", "filtros": {"unidade_tematica": "Probabilidade e estatística"}},
+    {"query": "notação científica potências", "filtros": {"ano": {"$in": ["8º", "9º"]}}},
+    {"query": "área de figuras planas", "filtros": {"$and": [{"ano": "6º"}, {"unidade_tematica": "Grandezas e medidas"}]}},
+    {"query": "EF09MA06", "filtros": {"codigo_bncc": "EF09MA06"}},
+]
+
+# (consulta, códigos relevantes) para o recall@k de cada modo; rótulos conferidos no texto das habilidades
+RELEVANTES: List[Dict[str, Any]] = [
+    {"query": "EF09MA06", "codigos": ["EF09MA06"]},
+    {"query": "EM13MAT314", "codigos": ["EM13MAT314"]},
+    {"query": "relações métricas no triângulo retângulo e teorema de Pitágoras", "codigos": ["EF09MA13", "EF09MA14"]},
+    {"query": "juros simples e compostos", "codigos": ["EM13MAT203", "EM13MAT303"]},
+    {"query": "notação científica", "codigos": ["EF08MA01", "EF09MA04", "EM13MAT313"]},
+    {"query": "escalas em mapas e plantas", "codigos": ["EF05MA12", "EF09MA08", "EF09MA21", "EM13MAT102"]},
+    {"query": "função quadrática e vértice da parábola", "codigos": ["EF09MA09", "EM13MAT302", "EM13MAT402", "EM13MAT502", "EM13MAT503"]},
+    {"query": "problemas com porcentagens", "codigos": ["EF05MA06", "EF06MA13", "EF06MA30", "EF07MA02", "EF08MA04", "EF09MA05"]},
+    {"query": "média, moda e mediana", "codigos": ["EF08MA25", "EM13MAT316"]},
+    {"query": "equação polinomial do primeiro grau", "codigos": ["EF07MA18", "EF08MA07", "EF08MA08", "EM13MAT401", "EM13MAT501"]},
+]
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Latência e concordância dos backends de busca do RAG")
+    parser.add_argument("--backends", default="chroma,numpy", help="Backends a medir (separados por vírgula)")
+    parser.add_argument("--modos", default="vetorial,lexical,hibrido", help="Modos de busca a medir (RAG_MODO)")
+    parser.add_argument("--repeticoes", type=int, default=100, help="Execuções de cada consulta por backend")
+    parser.add_argument("--k", type=int, default=5, help="Resultados por consulta")
+    parser.add_argument(
+        "--provedor", choices=["atual", "fake"], default="fake",
+        help="atual = provedor de embeddings do .env; fake = embeddings determinísticos offline"
+    )
+    parser.add_argument("--saida", default=None, help="Arquivo JSON de resultado (padrão: apenas imprime)")
+    return parser.parse_args()
+
+
+def _configurar_ambiente(args: argparse.Namespace, pasta: str) -> None:
+    """Define as variáveis lidas por app.core.config antes de importar a aplicação."""
+    if args.provedor == "fake":
+        os.environ["EMBEDDING_PROVIDER"] = "fake"
+        os.environ["DEFAULT_LLM_PROVIDER"] = "fake"
+        os.environ["RAG_INDICE_ARQUIVO"] = os.path.join(pasta, "indice_bncc.npz")
+        os.environ["RAG_LEXICO_ARQUIVO"] = os.path.join(pasta, "indice_bncc_bm25.json")
+    # O índice NumPy é montado pelo script (para medir a carga); o RAGService global fica no Chroma
+    os.environ["RAG_INDICE"] = "chroma"
+    # O embedding das consultas é medido no provedor, sem o cache de embeddings
+    os.environ["EMBEDDING_CACHE_ATIVO"] = "false"
+
+
+def _codigos(documentos) -> List[str]:
+    return [d.metadata.get("codigo_bncc", "") for d in documentos]
+
+
+def _jaccard(a: List[str], b: List[str]) -> float:
+    sa, sb = set(a), set(b)
+    if not sa and not sb:
+        return 1.0
+    return len(sa & sb) / len(sa | sb)
+
+
+def _recall(codigos: List[str], relevantes: List[str]) -> float:
+    return len({c.strip() for c in codigos} & set(relevantes)) / len(relevantes)
+
+
+def _medir_modos(rag, modos: List[str], args: argparse.Namespace) -> Dict[str, Any]:
+    """Latência de ponta a ponta e recall@k de buscar_habilidades em cada RAG_MODO."""
+    from app.core.config import settings
+
+    resultado: Dict[str, Any] = {}
+    for modo in modos:
+        settings.RAG_MODO = modo
+        latencias: List[float] = []
+        por_consulta = []
+        for c in RELEVANTES:
+            codigos = _codigos(rag.buscar_habilidades(c["query"], k=args.k))
+            por_consulta.append({"query": c["query"], "recall": round(_recall(codigos, c["codigos"]), 4), "codigos": codigos})
+            for _ in range(max(1, args.repeticoes // 10)):
+                t0 = time.perf_counter()
+                rag.buscar_habilidades(c["query"], k=args.k)
+                latencias.append(time.perf_counter() - t0)
+        resultado[modo] = {
+            "latencia_ms": _percentis([x * 1e3 for x in latencias]),
+            f"recall_{args.k}": round(sum(p["recall"] for p in por_consulta) / len(por_consulta), 4),
+            "consultas": por_consulta,
+        }
+    return resultado
+
+
+def _montar_numpy(rag) -> Optional[Any]:
+    from app.core.config import settings
+    from app.services.indice_vetorial import IndiceNumpy
+    return IndiceNumpy.carregar(
+        settings.RAG_INDICE_ARQUIVO,
+        rag.embeddings,
+        {"provedor": settings.EMBEDDING_PROVIDER, "modelo": settings.EMBEDDING_MODEL},
+        settings.CHROMA_PERSIST_DIRECTORY,
+        "bncc_matematica",
+        settings.BNCC_DATA_DIR,
+    )
+
+
+def _executar(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.services.rag_service import rag_service
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    buscas: Dict[str, Any] = {}
+    carga_s: Dict[str, float] = {}
+
+    if "numpy" in backends:
+        t0 = time.perf_counter()
+        indice = _montar_numpy(rag_service)
+        carga_s["numpy"] = round(time.perf_counter() - t0, 4)
+        if indice is None:
+            print("[AVISO] índice NumPy indisponível")
+        else:
+            buscas["numpy"] = lambda q, v, k, f: [indice.documento(p) for p, _ in indice.buscar(v, k, f)]
+            # Os modos vetorial e hibrido usam o índice NumPy
+            rag_service.indice = indice
+    if "chroma" in backends:
+        t0 = time.perf_counter()
+        rag_service._load_vectorstore()
+        vectorstore = rag_service.vectorstore
+        carga_s["chroma"] = round(time.perf_counter() - t0, 4)
+        try:
+            vazio = vectorstore is None or not vectorstore.get(limit=1).get("ids")
+        except Exception:
+            vazio = True
+        if vazio:
+            print("[AVISO] Chroma indisponível (chromadb não instalado ou coleção não ingerida); backend ignorado")
+        else:
+            buscas["chroma"] = lambda q, v, k, f: (
+                vectorstore.similarity_search_by_vector(v, k=k, filter=f) if f
+                else vectorstore.similarity_search_by_vector(v, k=k)
+            )
+
+    t0 = time.perf_counter()
+    lexico = rag_service.lexico
+    carga_s["lexical"] = round(time.perf_counter() - t0, 4)
+    # O BM25 recebe o texto da consulta em vez do embedding
+    buscas["lexical"] = lambda q, v, k, f: [lexico.documento(p) for p, _ in lexico.buscar(q, k, f)]
+
+    # Embeddings calculados uma vez: a busca de cada backend é medida sem a chamada ao provedor
+    embedding_s: List[float] = []
+    vetores = []
+    for c in CONSULTAS:
+        t0 = time.perf_counter()
+        vetores.append(rag_service.embeddings.embed_query(c["query"]))
+        embedding_s.append(time.perf_counter() - t0)
+
+    latencias: Dict[str, List[float]] = {b: [] for b in buscas}
+    resultados: Dict[str, List[List[str]]] = {b: [] for b in buscas}
+    for nome, buscar in buscas.items():
+        for c, vetor in zip(CONSULTAS, vetores):
+            resultados[nome].append(_codigos(buscar(c["query"], vetor, args.k, c["filtros"])))
+            for _ in range(args.repeticoes):
+                t0 = time.perf_counter()
+                buscar(c["query"], vetor, args.k, c["filtros"])
+                latencias[nome].append(time.perf_counter() - t0)
+
+    concordancia = None
+    if {"numpy", "chroma"} <= set(buscas):
+        por_consulta = [
+            {"query": c["query"], "filtros": c["filtros"], "jaccard_codigos": round(_jaccard(a, b), 4),
+             "numpy": a, "chroma": b}
+            for c, a, b in zip(CONSULTAS, resultados["numpy"], resultados["chroma"])
+        ]
+        concordancia = {
+            "jaccard_medio": round(sum(p["jaccard_codigos"] for p in por_consulta) / len(por_consulta), 4),
+            "consultas": por_consulta,
+        }
+
+    modos = [m.strip() for m in args.modos.split(",") if m.strip()]
+
+    return {
+        "carga_s": carga_s,
+        "modos": _medir_modos(rag_service, modos, args),
+        "embedding_consulta_ms": _percentis([x * 1e3 for x in embedding_s]),
+        "busca_us": {b: _percentis([x * 1e6 for x in v]) for b, v in latencias.items()},
+        "concordancia": concordancia,
+        "resultados": {b: [{"query": c["query"], "codigos": r} for c, r in zip(CONSULTAS, rs)] for b, rs in resultados.items()},
+    }
+
+
+def main() -> None:
+    args = _parse_args()
+    with tempfile.TemporaryDirectory(prefix="kora-rag-") as pasta:
+        _configurar_ambiente(args, pasta)
+        resultado = _executar(args)
+
+    resultado = {
+        "commit": _commit_atual(),
+        "executado_em": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "provedor": args.provedor,
+            "backends": args.backends,
+            "modos": args.modos,
+            "consultas": len(CONSULTAS),
+            "repeticoes": args.repeticoes,
+            "k": args.k,
+        },
+        **resultado,
+    }
+
+    print("\n" + "=" * 80)
+    print(f"{'Backend':<10}{'carga (s)':>12}{'n':>8}{'p50 (µs)':>12}{'p95 (µs)':>12}{'p99 (µs)':>12}")
+    for nome, p in resultado["busca_us"].items():
+        if p.get("n"):
+            print(f"{nome:<10}{resultado['carga_s'].get(nome, 0):>12.4f}{p['n']:>8}"
+                  f"{p['p50']:>12.1f}{p['p95']:>12.1f}{p['p99']:>12.1f}")
+    e = resultado["embedding_consulta_ms"]
+    if e.get("n"):
+        print(f"Embedding da consulta ({args.provedor}): p50 {e['p50']:.2f} ms | p95 {e['p95']:.2f} ms")
+    print(f"\n{'Modo':<10}{'recall@' + str(args.k):>12}{'p50 (ms)':>12}{'p95 (ms)':>12}")
+    for nome, m in resultado["modos"].items():
+        p = m["latencia_ms"]
+        print(f"{nome:<10}{m[f'recall_{args.k}']:>12.3f}{p['p50']:>12.3f}{p['p95']:>12.3f}")
+    if resultado["concordancia"]:
+        print(f"Concordância NumPy × Chroma (Jaccard médio dos códigos): {resultado['concordancia']['jaccard_medio']}")
+    print("=" * 80)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"Resultado gravado em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
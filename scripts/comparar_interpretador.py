@@ -0,0 +1,206 @@
+"""
+Comparação dos modos do Agente Interpretador (agente com ferramentas × direto)
+
+Executa interpretar_questao nos dois modos (INTERPRETADOR_MODO=agente e =direto)
+sobre o mesmo conjunto de questões e reporta:
+- percentis de latência e chamadas/tokens de LLM por modo
+- concordância do modo direto com o agente: Jaccard dos códigos BNCC, ano
+  recomendado igual e Jaccard dos conceitos principais
+- quantas vezes o modo direto voltou ao agente (fallback)
+O resultado é gravado em JSON para comparar execuções entre commits.
+
+Uso:
+    python scripts/comparar_interpretador.py --provedor atual --questoes questoes.jsonl --repeticoes 3
+    python scripts/comparar_interpretador.py --latencia 0.2 --saida interpretador.json
+
+O arquivo de questões pode ser JSONL ({"questao": "..."} por linha) ou texto com as
+questões separadas por linhas contendo apenas "---".
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Set
+
+# Garante que o diretório raiz do repo esteja no sys.path para importar 'app'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from scripts.benchmark_pipeline import QUESTION_TEXT, _percentis, _commit_atual  # noqa: E402
+
+MODOS = ["agente", "direto"]
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Latência e concordância dos modos do Agente Interpretador")
+    parser.add_argument("--questoes", default=None, help="Arquivo de questões (JSONL ou texto separado por ---)")
+    parser.add_argument("--repeticoes", type=int, default=1, help="Execuções de cada questão em cada modo")
+    parser.add_argument(
+        "--provedor", choices=["atual", "fake", "replay"], default="fake",
+        help="atual = provedor do .env (chamadas reais); fake/replay = offline"
+    )
+    parser.add_argument("--cassete", default=None, help="Cassete para o modo replay (LLM_CASSETE_PATH)")
+    parser.add_argument("--latencia", type=float, default=0.0, help="Latência artificial por chamada de LLM (s, offline)")
+    parser.add_argument("--saida", default=None, help="Arquivo JSON de resultado (padrão: apenas imprime)")
+    return parser.parse_args()
+
+
+def _configurar_ambiente(args: argparse.Namespace, banco: str) -> None:
+    """Define as variáveis lidas por app.core.config antes de importar a aplicação."""
+    if args.provedor != "atual":
+        os.environ["DEFAULT_LLM_PROVIDER"] = args.provedor
+        os.environ["EMBEDDING_PROVIDER"] = args.provedor
+        os.environ["LLM_LATENCIA_SIMULADA_S"] = str(args.latencia)
+        os.environ["DATABASE_URL"] = f"sqlite:///{banco}"
+    if args.cassete:
+        os.environ["LLM_CASSETE_PATH"] = args.cassete
+    # Sem cache: cada execução mede a chamada real
+    os.environ["LLM_CACHE_AGENTES"] = ""
+    os.environ["INTERPRETACAO_CACHE_ATIVO"] = "false"
+
+
+def _carregar_questoes(caminho: Optional[str]) -> List[str]:
+    if not caminho:
+        return [QUESTION_TEXT]
+    with open(caminho, encoding="utf-8") as f:
+        conteudo = f.read()
+    if caminho.endswith(".jsonl"):
+        return [json.loads(ln)["questao"] for ln in conteudo.splitlines() if ln.strip()]
+    return [bloco.strip() for bloco in conteudo.split("\n---\n") if bloco.strip()]
+
+
+def _codigos(analise: Dict[str, Any]) -> Set[str]:
+    return {
+        str(h.get("codigo_bncc") or h.get("codigo") or "").strip().upper()
+        for h in analise.get("habilidades_identificadas") or []
+        if isinstance(h, dict)
+    } - {""}
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _concordancia(agente: Dict[str, Any], direto: Dict[str, Any]) -> Dict[str, Any]:
+    conceitos_a = {c.strip().lower() for c in agente.get("conceitos_principais") or []}
+    conceitos_d = {c.strip().lower() for c in direto.get("conceitos_principais") or []}
+    return {
+        "jaccard_codigos": round(_jaccard(_codigos(agente), _codigos(direto)), 4),
+        "mesmo_ano": str(agente.get("ano_recomendado", "")).strip().lower()
+        == str(direto.get("ano_recomendado", "")).strip().lower(),
+        "jaccard_conceitos": round(_jaccard(conceitos_a, conceitos_d), 4),
+        "codigos_agente": sorted(_codigos(agente)),
+        "codigos_direto": sorted(_codigos(direto)),
+    }
+
+
+async def _executar(args: argparse.Namespace, questoes: List[str]) -> Dict[str, Any]:
+    from app.core.config import settings
+    from app.services.agent_service import agent_service
+    from app.services.uso_llm_service import uso_llm_service
+
+    latencias: Dict[str, List[float]] = {m: [] for m in MODOS}
+    chamadas: Dict[str, List[float]] = {m: [] for m in MODOS}
+    tokens: Dict[str, List[float]] = {m: [] for m in MODOS}
+    fallbacks_direto = 0
+    erros = 0
+    comparacoes: List[Dict[str, Any]] = []
+
+    for i, questao in enumerate(questoes, start=1):
+        for rep in range(args.repeticoes):
+            analises: Dict[str, Dict[str, Any]] = {}
+            for modo in MODOS:
+                settings.INTERPRETADOR_MODO = modo
+                with uso_llm_service.contabilizar() as contabilidade:
+                    t0 = time.perf_counter()
+                    try:
+                        analises[modo] = await agent_service.interpretar_questao(questao)
+                    except Exception as e:
+                        print(f"[ERRO] questão {i} ({modo}): {e}")
+                        erros += 1
+                        continue
+                    dt = time.perf_counter() - t0
+                resumo = contabilidade.resumo()
+                latencias[modo].append(dt)
+                chamadas[modo].append(float(resumo["chamadas"]))
+                tokens[modo].append(float(resumo["tokens_entrada"] + resumo["tokens_saida"]))
+                if modo == "direto" and "agente" in resumo["fallbacks"].get("interpretador", {}):
+                    fallbacks_direto += 1
+            if len(analises) == len(MODOS):
+                c = _concordancia(analises["agente"], analises["direto"])
+                comparacoes.append({"questao": i, "repeticao": rep + 1, **c})
+                print(f"Questão {i} ({rep + 1}/{args.repeticoes}): agente {latencias['agente'][-1]:.3f}s | "
+                      f"direto {latencias['direto'][-1]:.3f}s | Jaccard códigos {c['jaccard_codigos']:.2f}")
+
+    n = len(comparacoes)
+    return {
+        "modos": {
+            m: {
+                "latencia_s": _percentis(latencias[m]),
+                "chamadas_llm": _percentis(chamadas[m]),
+                "tokens": _percentis(tokens[m]),
+            }
+            for m in MODOS
+        },
+        "concordancia": {
+            "comparacoes": n,
+            "jaccard_codigos_medio": round(sum(c["jaccard_codigos"] for c in comparacoes) / n, 4) if n else None,
+            "codigos_identicos": sum(c["jaccard_codigos"] == 1.0 for c in comparacoes),
+            "mesmo_ano": sum(c["mesmo_ano"] for c in comparacoes),
+            "jaccard_conceitos_medio": round(sum(c["jaccard_conceitos"] for c in comparacoes) / n, 4) if n else None,
+        },
+        "fallbacks_direto_para_agente": fallbacks_direto,
+        "erros": erros,
+        "detalhes": comparacoes,
+    }
+
+
+def main() -> None:
+    args = _parse_args()
+    questoes = _carregar_questoes(args.questoes)
+    with tempfile.TemporaryDirectory(prefix="kora-interp-") as pasta:
+        _configurar_ambiente(args, os.path.join(pasta, "interp.db"))
+        t0 = time.perf_counter()
+        resultado = asyncio.run(_executar(args, questoes))
+        duracao = time.perf_counter() - t0
+
+    resultado = {
+        "commit": _commit_atual(),
+        "executado_em": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "provedor": args.provedor,
+            "questoes": len(questoes),
+            "repeticoes": args.repeticoes,
+            "latencia_simulada_s": args.latencia,
+        },
+        "duracao_total_s": round(duracao, 3),
+        **resultado,
+    }
+
+    print("\n" + "=" * 80)
+    print(f"{'Modo':<10}{'n':>5}{'p50 (s)':>10}{'p95 (s)':>10}{'chamadas':>10}{'tokens':>10}")
+    for modo, m in resultado["modos"].items():
+        if m["latencia_s"].get("n"):
+            print(f"{modo:<10}{m['latencia_s']['n']:>5}{m['latencia_s']['p50']:>10.4f}{m['latencia_s']['p95']:>10.4f}"
+                  f"{m['chamadas_llm']['media']:>10.2f}{m['tokens']['media']:>10.0f}")
+    c = resultado["concordancia"]
+    print(f"Concordância: Jaccard médio dos códigos {c['jaccard_codigos_medio']} | "
+          f"códigos idênticos {c['codigos_identicos']}/{c['comparacoes']} | mesmo ano {c['mesmo_ano']}/{c['comparacoes']}")
+    print(f"Modo direto voltou ao agente: {resultado['fallbacks_direto_para_agente']}")
+    print("=" * 80)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"Resultado gravado em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,13 @@
 Script para ingestão dos dados da BNCC no ChromaDB
 
 Executa UMA ÚNICA VEZ para popular o banco vetorial com as habilidades de Matemática.
+Também gera o índice lexical BM25 (local, sem embeddings) usado pelos modos
+lexical e hibrido do RAG, e remove o índice NumPy gravado (a API o remonta a
+partir da coleção nova no próximo startup).
 """
 import json
 import os
+import sys
 from pathlib import Path
 from typing import List, Dict
 from langchain.schema import Document
@@ -13,6 +17,13 @@ from langchain_openai import OpenAIEmbeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from dotenv import load_dotenv
 
+# Garante que o diretório raiz do repo esteja no sys.path para importar 'app'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from app.services.indice_lexical import IndiceBM25  # noqa: E402
+
 # Carrega variáveis de ambiente
 load_dotenv()
 
@@ -22,6 +33,8 @@ CHROMA_DIR = "./chroma_db"
 COLLECTION_NAME = "bncc_matematica"
 EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "google")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/embedding-001")
+LEXICO_ARQUIVO = os.getenv("RAG_LEXICO_ARQUIVO", "./indice_bncc_bm25.json")
+INDICE_ARQUIVO = os.getenv("RAG_INDICE_ARQUIVO", "./indice_bncc.npz")
 
 
 def carregar_arquivos_bncc() -> List[Dict]:
@@ -101,6 +114,19 @@ Habilidade: {hab.get('habilidade_bncc', 'N/A')}
     return documentos
 
 
+def criar_indice_lexical(documentos: List[Document]):
+    """
+    Gera o índice lexical BM25 (sem acentos, com stemming) e grava em LEXICO_ARQUIVO
+
+    Args:
+        documentos: Lista de documentos LangChain
+    """
+    print("\n🔤 Criando índice lexical BM25...")
+    indice = IndiceBM25([d.page_content for d in documentos], [d.metadata for d in documentos])
+    indice.salvar(LEXICO_ARQUIVO)
+    print(f"✓ Índice lexical criado em: {LEXICO_ARQUIVO} ({len(indice)} habilidades)")
+
+
 def criar_vectorstore(documentos: List[Document]):
     """
     Cria o vectorstore ChromaDB com os documentos
@@ -139,6 +165,11 @@ def criar_vectorstore(documentos: List[Document]):
         )
         print(f"   Modelo: {EMBEDDING_MODEL}")
 
+    # O índice NumPy é cópia da coleção antiga: sem ele, a API remonta a partir da nova
+    if os.path.exists(INDICE_ARQUIVO):
+        os.remove(INDICE_ARQUIVO)
+        print(f"✓ Índice NumPy anterior removido: {INDICE_ARQUIVO}")
+
     # Cria o vectorstore
     vectorstore = Chroma.from_documents(
         documents=documentos,
@@ -175,18 +206,6 @@ def main():
         print("   Certifique-se de que os arquivos JSON da BNCC estão no local correto.")
         return
     
-    # Verifica se a API key está configurada
-    if EMBEDDING_PROVIDER == "google":
-        if not os.getenv("GOOGLE_API_KEY"):
-            print("❌ Erro: GOOGLE_API_KEY não encontrada!")
-            print("   Configure a variável de ambiente no arquivo .env")
-            return
-    else:
-        if not os.getenv("OPENAI_API_KEY"):
-            print("❌ Erro: OPENAI_API_KEY não encontrada!")
-            print("   Configure a variável de ambiente no arquivo .env")
-            return
-    
     try:
         # 1. Carrega arquivos
         habilidades = carregar_arquivos_bncc()
@@ -194,7 +213,18 @@ def main():
         # 2. Cria documentos
         documentos = criar_documentos(habilidades)
         
-        # 3. Cria vectorstore
+        # 3. Cria o índice lexical (não depende do provedor de embeddings)
+        criar_indice_lexical(documentos)
+        
+        # Verifica se a API key está configurada
+        chave_api = "GOOGLE_API_KEY" if EMBEDDING_PROVIDER == "google" else "OPENAI_API_KEY"
+        if not os.getenv(chave_api):
+            print(f"❌ Erro: {chave_api} não encontrada!")
+            print("   Configure a variável de ambiente no arquivo .env")
+            print("   (o índice lexical já foi gerado: RAG_MODO=lexical funciona sem embeddings)")
+            return
+        
+        # 4. Cria vectorstore
         criar_vectorstore(documentos)
         
         print("\n" + "=" * 70)
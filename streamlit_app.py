@@ -27,10 +27,30 @@ def reset_session():
 
 def iniciar_sessao(questao_texto: str) -> Optional[Dict]:
     try:
-        with st.spinner("Gerando questoes..."):
+        with st.status("Gerando questoes...", expanded=True) as status:
             files = {"file": ("questao.txt", questao_texto.encode("utf-8"), "text/plain")}
-            response = requests.post(f"{BACKEND_URL}/api/v1/session/start", files=files, timeout=600)
-            return response.json() if response.status_code == 200 else None
+            with requests.post(f"{BACKEND_URL}/api/v1/session/start/stream", files=files, stream=True, timeout=600) as response:
+                if response.status_code != 200:
+                    return None
+                for linha in response.iter_lines(decode_unicode=True):
+                    if not linha:
+                        continue
+                    evento = json.loads(linha)
+                    nome, dados = evento.get("evento"), evento.get("dados", {})
+                    if nome == "texto_extraido":
+                        st.write("Texto da questao recebido")
+                    elif nome == "habilidades":
+                        st.write(f"Habilidades identificadas: {len(dados.get('habilidades_identificadas', []))}")
+                    elif nome == "questao":
+                        st.write(f"Questao {dados.get('numero')} aprovada: {dados.get('enunciado', '')[:80]}...")
+                    elif nome == "erro":
+                        status.update(label="Erro ao gerar questoes", state="error")
+                        st.error(dados.get("detail", ""))
+                        return None
+                    elif nome == "sessao":
+                        status.update(label="Questoes geradas", state="complete")
+                        return dados
+            return None
     except Exception as e:
         st.error(f"Erro: {str(e)}")
         return None
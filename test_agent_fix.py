@@ -1,11 +1,22 @@
 
 from typing import Dict, Any, List
+import os
+import shutil
+import tempfile
 
+import pytest
 
-from fastapi.testclient import TestClient
+# Cada execução usa um banco (e índices) em pasta temporária: o engine do SQLAlchemy
+# e os caminhos dos índices são lidos das variáveis na importação de app.*
+_PASTA_TESTES = tempfile.mkdtemp(prefix="kora-testes-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_PASTA_TESTES, 'kora.db')}"
+os.environ["RAG_INDICE_ARQUIVO"] = os.path.join(_PASTA_TESTES, "indice_bncc.npz")
+os.environ["RAG_LEXICO_ARQUIVO"] = os.path.join(_PASTA_TESTES, "indice_bncc_bm25.json")
 
-from app.main import app
-from app.services.agent_service import agent_service
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.services.agent_service import agent_service  # noqa: E402
 
 QUESTION_TEXT = (
     "O arquiteto Renzo Piano exibiu a maquete da nova\n"
@@ -19,6 +30,38 @@ QUESTION_TEXT = (
 )
 
 
+@pytest.fixture(scope="session", autouse=True)
+def _banco_temporario():
+    """Cria as tabelas no banco temporário da execução e o remove no final."""
+    from app.db.database import init_db
+    init_db()
+    yield
+    shutil.rmtree(_PASTA_TESTES, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def _sem_reaproveitamento(monkeypatch):
+    """Os testes repetem a mesma questão: banco de questões e cache semântico só ficam ativos onde são testados."""
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "BANCO_QUESTOES_ATIVO", False)
+    monkeypatch.setattr(settings, "INTERPRETACAO_CACHE_ATIVO", False)
+
+
+@pytest.fixture
+def servico_fake(monkeypatch):
+    """AgentService novo com o provedor fake (sem rede nem cache de agentes), usado pelas sessões."""
+    from app.core.config import settings
+    from app.services import agent_service as agent_module
+    from app.services import session_service as session_module
+
+    monkeypatch.setattr(settings, "DEFAULT_LLM_PROVIDER", "fake")
+    monkeypatch.setattr(settings, "LLM_CACHE_AGENTES", "")
+    servico = agent_module.AgentService()
+    monkeypatch.setattr(session_module, "agent_service", servico)
+    monkeypatch.setattr(agent_module, "agent_service", servico)
+    return servico
+
+
 def test_backend_flow_e2e_with_patched_agents(monkeypatch):
     """Fluxo backend: /start -> /session -> /submit (mock dos agentes para não chamar LLM)."""
     habilidades_id = {
@@ -105,6 +148,8 @@ def test_backend_flow_e2e_with_patched_agents(monkeypatch):
     monkeypatch.setattr(agent_service, "interpretar_questao", fake_interpretar_questao, raising=True)
     monkeypatch.setattr(agent_service, "gerar_questoes_validadas", fake_gerar_questoes_validadas, raising=True)
     monkeypatch.setattr(agent_service, "corrigir_respostas", fake_corrigir_respostas, raising=True)
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "CORRECAO_RECOMENDACOES", "local")
 
     with TestClient(app) as client:
         files = {"file": ("questao.txt", QUESTION_TEXT.encode("utf-8"), "text/plain")}
@@ -129,3 +174,1024 @@ def test_backend_flow_e2e_with_patched_agents(monkeypatch):
         assert rel and rel.get("total_questoes") == 3
         assert rel.get("total_acertos") == 1
         assert isinstance(rel.get("correcao_detalhada"), list) and len(rel["correcao_detalhada"]) == 3
+        assert rel.get("origem_correcao") == "local" and rel.get("recomendacoes_status") == "local"
+        assert rel["habilidades_a_revisar"] == ["EM13MAT101", "EM13MAT201"]
+
+
+def test_start_stream_emite_eventos_ndjson(monkeypatch):
+    """Modo streaming: /start/stream envia habilidades, cada questão e a sessão final em NDJSON."""
+    import json
+
+    analise = {
+        "habilidades_identificadas": [{"codigo": "EM13MAT101", "descricao": "Escalas e proporcionalidade"}],
+        "conceitos_principais": ["escala", "área"],
+        "ano_recomendado": "9º ano",
+    }
+    alternativas = {"A": "418 cm²", "B": "400 cm²", "C": "500 cm²", "D": "318 cm²", "E": "450 cm²"}
+
+    async def fake_interpretar_questao(txt: str):
+        return analise
+
+    async def fake_gerar_questoes_validadas(questao_original: str, habilidades_identificadas, conceitos_principais, ano_escolar, alvo: int = 3, max_tentativas: int = 3, on_evento=None):
+        aprovadas = []
+        for i in range(1, alvo + 1):
+            q = {"numero": i, "enunciado": f"Questão {i}", "habilidades_combinadas": ["EM13MAT101"], "alternativas": alternativas}
+            aprovadas.append(q)
+            if on_evento is not None:
+                await on_evento("questao", q)
+        gabarito = {"gabarito": [{"numero_questao": i, "resposta_final": "418 cm²", "alternativa_correta_letra": "A", "alternativas": alternativas} for i in range(1, alvo + 1)]}
+        return aprovadas, gabarito
+
+    monkeypatch.setattr(agent_service, "interpretar_questao", fake_interpretar_questao, raising=True)
+    monkeypatch.setattr(agent_service, "gerar_questoes_validadas", fake_gerar_questoes_validadas, raising=True)
+
+    with TestClient(app) as client:
+        files = {"file": ("questao.txt", QUESTION_TEXT.encode("utf-8"), "text/plain")}
+        with client.stream("POST", "/api/v1/session/start/stream", files=files) as r:
+            assert r.status_code == 200
+            assert r.headers["content-type"].startswith("application/x-ndjson")
+            eventos = [json.loads(linha) for linha in r.iter_lines() if linha]
+
+        nomes = [e["evento"] for e in eventos]
+        assert nomes == ["texto_extraido", "habilidades", "questao", "questao", "questao", "sessao"]
+        final = eventos[-1]["dados"]
+        assert final["session_id"] and len(final["questoes_geradas"]) == 3
+
+        r2 = client.get(f"/api/v1/session/{final['session_id']}")
+        assert r2.status_code == 200, r2.text
+
+
+def test_start_assincrono_cria_job_e_persiste_sessao(monkeypatch):
+    """Modo job: /start?assincrono=true responde 202 e o status do job termina com a sessão criada."""
+    import time
+
+    async def fake_interpretar_questao(txt: str):
+        return {"habilidades_identificadas": [], "conceitos_principais": ["escala"], "ano_recomendado": "9º ano"}
+
+    async def fake_gerar_questoes_validadas(questao_original: str, habilidades_identificadas, conceitos_principais, ano_escolar, alvo: int = 3, max_tentativas: int = 3, on_evento=None, prazo=None):
+        aprovadas = [{"numero": i, "enunciado": f"Questão {i}", "habilidades_combinadas": []} for i in range(1, alvo + 1)]
+        for q in aprovadas:
+            if on_evento is not None:
+                await on_evento("questao", q)
+        return aprovadas, {"gabarito": []}
+
+    monkeypatch.setattr(agent_service, "interpretar_questao", fake_interpretar_questao, raising=True)
+    monkeypatch.setattr(agent_service, "gerar_questoes_validadas", fake_gerar_questoes_validadas, raising=True)
+    from app.services.session_service import session_service
+
+    prazos = []
+    criar_sessao = session_service.criar_sessao
+
+    async def criar_sessao_registrando(*args, **kwargs):
+        prazos.append(kwargs.get("prazo_s"))
+        return await criar_sessao(*args, **kwargs)
+
+    monkeypatch.setattr(session_service, "criar_sessao", criar_sessao_registrando)
+
+    with TestClient(app) as client:
+        files = {"file": ("questao.txt", QUESTION_TEXT.encode("utf-8"), "text/plain")}
+        r = client.post("/api/v1/session/start?assincrono=true&prazo_s=30", files=files)
+        assert r.status_code == 202, r.text
+        status_url = r.json()["status_url"]
+
+        job = {}
+        for _ in range(50):
+            job = client.get(status_url).json()
+            if job["status"] in ("concluido", "erro"):
+                break
+            time.sleep(0.05)
+        assert job["status"] == "concluido", job
+        assert len(job["parciais"]["questoes"]) == 3
+        sid = job["resultado"]["session_id"]
+        assert client.get(f"/api/v1/session/{sid}").status_code == 200
+        assert client.get("/api/v1/session/jobs/inexistente").status_code == 404
+        assert prazos == [30.0]
+
+
+def test_fila_duravel_lease_retomada_e_descarte(monkeypatch):
+    """Fila durável: lease exclusivo, retomada após expirar, erro definitivo pelo max_tentativas do trabalho."""
+    import asyncio
+    import uuid
+    from datetime import datetime
+    from app import worker
+    from app.core.config import settings
+    from app.db.database import SessionLocal
+    from app.db.models import TrabalhoFila
+    from app.services.fila_service import fila_service
+    from app.services.job_service import job_service
+    from app.services.session_service import session_service
+
+    def expirar_lease(job_id: str) -> None:
+        db = SessionLocal()
+        db.query(TrabalhoFila).filter(TrabalhoFila.job_id == job_id).update(
+            {TrabalhoFila.lease_expira_em: datetime(2000, 1, 1)}, synchronize_session=False
+        )
+        db.commit()
+        db.close()
+
+    tipos = [f"teste_{uuid.uuid4().hex[:8]}"]
+    monkeypatch.setattr(settings, "FILA_LEASE_S", 60)
+    monkeypatch.setattr(settings, "FILA_MAX_TENTATIVAS", 2)
+    job_id = fila_service.enfileirar(tipos[0], {"n": 1})
+    monkeypatch.setattr(settings, "FILA_MAX_TENTATIVAS", 5)
+
+    trabalho = fila_service.reivindicar("w1", tipos)
+    assert (trabalho["job_id"], trabalho["tentativas"]) == (job_id, 1)
+    assert fila_service.reivindicar("w2", tipos) is None
+
+    expirar_lease(job_id)
+    trabalho = fila_service.reivindicar("w2", tipos)
+    assert (trabalho["job_id"], trabalho["tentativas"]) == (job_id, 2)
+    assert not fila_service.renovar_lease(job_id, "w1")
+    assert not fila_service.concluir(job_id, "w1", {})
+
+    # max_tentativas gravado no trabalho (2) vale, não o FILA_MAX_TENTATIVAS atual (5)
+    assert fila_service.falhar(job_id, "w2", "falha 2")
+    estado = fila_service.obter(job_id)
+    assert (estado["status"], estado["erro"]) == ("erro", "falha 2")
+    assert fila_service.reivindicar("w3", tipos) is None
+
+    # Falha com tentativas sobrando volta para a fila
+    outro = fila_service.enfileirar(tipos[0], {"n": 2})
+    fila_service.reivindicar("w1", tipos)
+    assert fila_service.falhar(outro, "w1", "passageira")
+    assert (fila_service.obter(outro)["status"], fila_service.obter(outro)["etapa"]) == ("pendente", "na_fila")
+
+    # Worker morto em todas as tentativas: o lease expirado esgotado é descartado
+    monkeypatch.setattr(settings, "FILA_MAX_TENTATIVAS", 1)
+    morto = fila_service.enfileirar(tipos[0], {"n": 3})
+    while (t := fila_service.reivindicar("w1", tipos))["job_id"] != morto:
+        fila_service.concluir(t["job_id"], "w1", {})
+    expirar_lease(morto)
+    assert fila_service.reivindicar("w2", tipos) is None
+    assert fila_service.obter(morto)["status"] == "erro"
+
+    # O worker só conclui depois das tarefas em segundo plano do próprio trabalho
+    ordem = []
+
+    async def segundo_plano():
+        await asyncio.sleep(0.05)
+        ordem.append("segundo_plano")
+
+    async def fake_executar(tipo, payload, on_evento=None):
+        session_service._agendar(segundo_plano())
+        return {"ok": True}
+
+    concluir = fila_service.concluir
+
+    def concluir_registrando(*args):
+        ordem.append("concluir")
+        return concluir(*args)
+
+    monkeypatch.setattr(job_service, "executar", fake_executar)
+    monkeypatch.setattr(fila_service, "concluir", concluir_registrando)
+    ultimo = fila_service.enfileirar(tipos[0], {"n": 4})
+    trabalho = fila_service.reivindicar("w1", tipos)
+    assert trabalho["job_id"] == ultimo
+    asyncio.run(worker._executar_trabalho("w1", trabalho))
+    assert ordem == ["segundo_plano", "concluir"]
+    assert fila_service.obter(ultimo)["resultado"] == {"ok": True}
+
+
+def test_escalonador_llm_prioridade_vagas_e_cancelamento():
+    """Escalonador: vaga única, interativo passa à frente do lote e espera cancelada libera a vaga."""
+    import asyncio
+    from app.services.llm_scheduler import LLMScheduler
+
+    async def _executar():
+        escalonador = LLMScheduler(max_em_voo=1, rpm=0, tpm=0)
+        ordem: List[str] = []
+        liberar = {nome: asyncio.Event() for nome in ("a", "lote", "interativo", "b", "c")}
+
+        async def chamada(nome: str, prioridade: str) -> None:
+            async with escalonador.reservar(nome, prioridade=prioridade):
+                ordem.append(nome)
+                await liberar[nome].wait()
+
+        # "a" ocupa a única vaga; "lote" chega antes de "interativo", mas é atendido depois
+        a = asyncio.create_task(chamada("a", "interativo"))
+        await asyncio.sleep(0)
+        lote = asyncio.create_task(chamada("lote", "lote"))
+        interativo = asyncio.create_task(chamada("interativo", "interativo"))
+        await asyncio.sleep(0.01)
+        assert ordem == ["a"] and escalonador.metricas()["em_voo"] == 1
+        assert escalonador.metricas()["prioridades"]["lote"]["aguardando"] == 1
+
+        liberar["a"].set()
+        await asyncio.sleep(0.01)
+        assert ordem == ["a", "interativo"]
+        liberar["interativo"].set()
+        await asyncio.sleep(0.01)
+        assert ordem == ["a", "interativo", "lote"]
+
+        # Espera cancelada na fila não ocupa vaga
+        b = asyncio.create_task(chamada("b", "interativo"))
+        await asyncio.sleep(0.01)
+        b.cancel()
+        # Vaga concedida a uma espera cancelada antes de rodar volta para o escalonador
+        c = asyncio.create_task(chamada("c", "interativo"))
+        await asyncio.sleep(0.01)
+        liberar["lote"].set()
+        await asyncio.sleep(0)
+        c.cancel()
+        await asyncio.gather(a, lote, interativo, b, c, return_exceptions=True)
+        assert ordem == ["a", "interativo", "lote"]
+        assert escalonador.metricas()["em_voo"] == 0
+
+    asyncio.run(_executar())
+
+
+def test_escalonador_llm_janelas_rpm_tpm_e_pausa_por_429(monkeypatch):
+    """Escalonador com relógio falso: RPM/TPM por janela de 60s e pausa dos despachos após um 429."""
+    import asyncio
+    import types
+    from app.core.config import settings
+    from app.services import llm_scheduler as modulo
+
+    relogio = [1000.0]
+    monkeypatch.setattr(modulo, "time", types.SimpleNamespace(monotonic=lambda: relogio[0]))
+    monkeypatch.setattr(settings, "LLM_PAUSA_RATE_LIMIT_S", 30.0)
+
+    class Erro429(Exception):
+        status_code = 429
+
+    async def _executar():
+        escalonador = modulo.LLMScheduler(max_em_voo=0, rpm=2, tpm=100)
+        atendidas: List[str] = []
+
+        async def chamada(nome: str, tokens: int = 10) -> None:
+            async with escalonador.reservar(nome, tokens_estimados=tokens, prioridade="interativo"):
+                atendidas.append(nome)
+
+        async def avancar(segundos: float) -> None:
+            relogio[0] += segundos
+            if escalonador._timer is not None:
+                escalonador._timer.cancel()
+            escalonador._despachar()
+            await asyncio.sleep(0.01)
+
+        # RPM: a terceira requisição do minuto espera a primeira sair da janela
+        await chamada("r1")
+        await chamada("r2")
+        r3 = asyncio.create_task(chamada("r3"))
+        await asyncio.sleep(0.01)
+        assert atendidas == ["r1", "r2"]
+        await avancar(59.0)
+        assert atendidas == ["r1", "r2"]
+        await avancar(1.5)
+        assert atendidas == ["r1", "r2", "r3"]
+        await r3
+
+        # TPM: 80 + 30 tokens passam de 100 até os 80 saírem da janela
+        await avancar(61.0)
+        await chamada("t80", tokens=80)
+        t30 = asyncio.create_task(chamada("t30", tokens=30))
+        await asyncio.sleep(0.01)
+        assert atendidas[-1] == "t80"
+        await avancar(61.0)
+        await t30
+        assert atendidas[-1] == "t30"
+
+        # 429: nenhum despacho novo até o fim da pausa
+        await avancar(61.0)
+        try:
+            async with escalonador.reservar("limitada", prioridade="interativo"):
+                raise Erro429("Too Many Requests")
+        except Erro429:
+            pass
+        assert escalonador.metricas()["rate_limits_recebidos"] == 1
+        depois = asyncio.create_task(chamada("depois_do_429"))
+        await asyncio.sleep(0.01)
+        await avancar(29.0)
+        assert "depois_do_429" not in atendidas
+        await avancar(2.0)
+        await depois
+        assert atendidas[-1] == "depois_do_429"
+
+    asyncio.run(_executar())
+
+
+def test_validacao_concorrente_mantem_ordem_e_cancela_pendentes(monkeypatch):
+    """Validação em paralelo: ordem das candidatas, candidata com erro não derruba a rodada, pendentes cancelados."""
+    import asyncio
+    from app.core.config import settings
+    from app.services.agent_service import AgentService
+
+    monkeypatch.setattr(settings, "VALIDACAO_CONCORRENCIA", 5)
+    servico = AgentService.__new__(AgentService)
+    # Latência do resolvedor por candidata (fora de ordem); 2 falha e 5 nunca termina a tempo
+    latencias = {1: 0.06, 2: 0.01, 3: 0.03, 4: 0.02, 5: 5.0}
+    validadas: List[int] = []
+    canceladas: List[int] = []
+
+    async def fake_criar_questoes(**kwargs):
+        return [{"numero": n, "enunciado": f"Candidata {n}", "habilidades_combinadas": []} for n in latencias]
+
+    async def fake_validar_candidata(q, prazo=None):
+        validadas.append(q["numero"])
+        try:
+            await asyncio.sleep(latencias[q["numero"]])
+        except asyncio.CancelledError:
+            canceladas.append(q["numero"])
+            raise
+        if q["numero"] == 2:
+            raise RuntimeError("resolvedor fora do ar")
+        return True, {"resposta": q["numero"]}
+
+    async def fake_processar_aprovada(questao, item_validado, limites, tempos, t_inicio, on_evento, prazo=None):
+        return {"numero_questao": questao["numero"], "origem": item_validado["resposta"]}
+
+    monkeypatch.setattr(servico, "criar_questoes", fake_criar_questoes, raising=False)
+    monkeypatch.setattr(servico, "_validar_candidata", fake_validar_candidata, raising=False)
+    monkeypatch.setattr(servico, "_processar_aprovada", fake_processar_aprovada, raising=False)
+
+    aprovadas, gabarito = asyncio.run(servico.gerar_questoes_validadas(
+        questao_original=QUESTION_TEXT, habilidades_identificadas=[], conceitos_principais=[],
+        ano_escolar="7º ano", alvo=3, max_tentativas=1,
+    ))
+
+    assert [q["enunciado"] for q in aprovadas] == ["Candidata 1", "Candidata 3", "Candidata 4"]
+    assert [q["numero"] for q in aprovadas] == [1, 2, 3]
+    assert [(i["numero_questao"], i["origem"]) for i in gabarito["gabarito"]] == [(1, 1), (2, 3), (3, 4)]
+    assert sorted(validadas) == [1, 2, 3, 4, 5]
+    assert canceladas == [5]
+    assert gabarito["tempos_pipeline"]["rodadas"] == 1
+
+
+def test_interpretador_direto_e_fallback_para_o_agente(monkeypatch):
+    """Modo direto: uma chamada estruturada sem o agente; erro ou análise sem habilidades caem no agente."""
+    import asyncio
+    import json
+    from langchain_core.messages import AIMessage
+    from app.core import metrics
+    from app.core.config import settings
+    from app.services.agent_service import AgentService
+    from app.services.rag_service import rag_service
+
+    monkeypatch.setattr(settings, "INTERPRETADOR_MODO", "direto")
+    monkeypatch.setattr(rag_service, "buscar_habilidades", lambda query, k=None, filtros=None: [])
+    servico = AgentService.__new__(AgentService)
+    servico.llm_interpretador_json = object()
+    servico.agente_interpretador = object()
+    servico.prompts = {"interpretador": {"system": "", "human": "{questao_texto}", "direto": "{questao_texto} {habilidades_candidatas}"}}
+
+    analise_direta = {"habilidades_identificadas": [{"codigo_bncc": "EF07MA17"}], "conceitos_principais": ["escala"], "ano_recomendado": "7º ano"}
+    analise_agente = {"habilidades_identificadas": [{"codigo_bncc": "EF08MA19"}], "conceitos_principais": ["área"], "ano_recomendado": "8º ano"}
+    respostas_estruturadas: List[Any] = []
+    chamadas = {"estruturado": 0, "agente": 0}
+
+    async def fake_invocar_estruturado(agente, prompt, llm, variaveis):
+        chamadas["estruturado"] += 1
+        resposta = respostas_estruturadas.pop(0)
+        if isinstance(resposta, Exception):
+            raise resposta
+        return resposta
+
+    async def fake_run_agent(agent, human_template, variables):
+        chamadas["agente"] += 1
+        return {"messages": [AIMessage(content=json.dumps(analise_agente))]}
+
+    monkeypatch.setattr(servico, "_invocar_estruturado", fake_invocar_estruturado, raising=False)
+    monkeypatch.setattr(servico, "_run_agent", fake_run_agent, raising=False)
+
+    def caminhos():
+        return {c: metrics.fallbacks.valor(etapa="interpretador", caminho=c) for c in ("direto", "agente")}
+
+    antes = caminhos()
+    respostas_estruturadas.append(analise_direta)
+    assert asyncio.run(servico._interpretar(QUESTION_TEXT)) == analise_direta
+    assert chamadas == {"estruturado": 1, "agente": 0}
+    assert caminhos()["direto"] == antes["direto"] + 1
+
+    # Chamada estruturada com erro e com análise fora do schema (sem habilidades): agente com ferramentas
+    respostas_estruturadas.extend([RuntimeError("saída estruturada inválida"), {"conceitos_principais": ["área"]}])
+    for _ in range(2):
+        assert asyncio.run(servico._interpretar(QUESTION_TEXT)) == analise_agente
+    assert chamadas == {"estruturado": 3, "agente": 2}
+    assert caminhos() == {"direto": antes["direto"] + 1, "agente": antes["agente"] + 2}
+
+
+def test_fluxo_completo_com_provedor_fake(monkeypatch, servico_fake):
+    """Provedor fake: /start e /submit rodam o pipeline real de agentes sem rede."""
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "CORRECAO_RECOMENDACOES", "sincrono")
+
+    with TestClient(app) as client:
+        files = {"file": ("questao.txt", QUESTION_TEXT.encode("utf-8"), "text/plain")}
+        r = client.post("/api/v1/session/start", files=files)
+        assert r.status_code == 200, r.text
+        data = r.json()
+        assert len(data["questoes_geradas"]) == 3
+        assert all(q.get("alternativas") for q in data["questoes_geradas"])
+
+        r2 = client.post(f"/api/v1/session/{data['session_id']}/submit", json={"respostas": {"1": "A", "2": "B", "3": "C"}})
+        assert r2.status_code == 200, r2.text
+        assert r2.json()["relatorio_diagnostico"]["total_questoes"] == 3
+        assert r2.json()["relatorio_diagnostico"]["recomendacoes_status"] == "concluido"
+
+        uso = client.get(f"/api/v1/session/{data['session_id']}").json()["uso_llm"]
+        assert set(uso["fases"]) == {"start", "submit"}
+        assert uso["tokens_entrada"] > 0 and uso["chamadas"] == sum(f["chamadas"] for f in uso["fases"].values())
+        assert "criador" in uso["fases"]["start"]["fallbacks"]
+        # Correção por alternativa é local: no submit só as recomendações passam pelo LLM
+        assert uso["fases"]["submit"]["fallbacks"] == {"correcao": {"local": 1}}
+        assert set(uso["fases"]["submit"]["por_agente"]) == {"recomendacoes"}
+
+        metricas = client.get("/metrics").text
+        assert 'kora_http_requisicoes_total{metodo="POST",rota="/api/v1/session/start",status="200"}' in metricas
+        assert 'kora_llm_chamadas_total{agente="interpretador",tipo="grafo",resultado="ok"}' in metricas
+        assert "kora_validacao_total" in metricas
+
+
+def test_start_com_prazo_preenche_questoes_em_segundo_plano(monkeypatch, servico_fake):
+    """prazo_s esgotado: /start responde com menos questões e o restante é anexado à sessão depois."""
+    import time
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "LLM_LATENCIA_SIMULADA_S", 0.05)
+
+    with TestClient(app) as client:
+        files = {"file": ("questao.txt", QUESTION_TEXT.encode("utf-8"), "text/plain")}
+        r = client.post("/api/v1/session/start?prazo_s=0.01", files=files)
+        assert r.status_code == 200, r.text
+        data = r.json()
+        assert len(data["questoes_geradas"]) + data["questoes_pendentes"] == 3
+        assert data["questoes_pendentes"] > 0
+
+        for _ in range(200):
+            sessao = client.get(f"/api/v1/session/{data['session_id']}").json()
+            if sessao["gabarito_mestre"]["preenchimento"]["status"] == "concluido":
+                break
+            time.sleep(0.05)
+        assert sessao["gabarito_mestre"]["preenchimento"]["status"] == "concluido"
+        assert [q["numero"] for q in sessao["lista_questoes"]] == [1, 2, 3]
+        assert all(q.get("alternativas") for q in sessao["lista_questoes"])
+
+
+def test_preenchimento_contabiliza_pendentes_e_pareia_por_numero(monkeypatch, servico_fake):
+    """Preenchimento: chamadas das pendentes vão para a fase certa, falhas são relatadas e o gabarito é pareado pelo número."""
+    import asyncio
+    from app.db.database import SessionLocal
+    from app.db.models import SessaoEstudo, UsoLLMSessao
+    from app.services import session_service as session_module
+    from app.services.uso_llm_service import uso_llm_service
+
+    async def _extras(**kwargs):
+        uso_llm_service.registrar_chamada("criador", "texto", "ok")
+        questoes = [{"numero": 1, "enunciado": "extra 1"}, {"numero": 2, "enunciado": "extra 2"}]
+        # Gabarito fora de ordem e sem o item da questão 1
+        return questoes, {"gabarito": [{"numero_questao": 2, "resposta_final": "B"}]}
+
+    monkeypatch.setattr(servico_fake, "gerar_questoes_validadas", _extras)
+
+    async def _cenario():
+        db = SessionLocal()
+        try:
+            with uso_llm_service.contabilizar() as contabilidade:
+                uso_llm_service.registrar_chamada("interpretador", "estruturado", "ok")
+                liberar = asyncio.Event()
+
+                async def _pendente(resposta):
+                    await liberar.wait()
+                    uso_llm_service.registrar_chamada("solver", "texto", "ok")
+                    if resposta is None:
+                        raise RuntimeError("solver indisponível")
+                    return {"numero_questao": 9, "resposta_final": resposta}
+
+                pendentes = [
+                    ({"numero": 9, "enunciado": "pendente ok"}, asyncio.create_task(_pendente("A"))),
+                    ({"numero": 9, "enunciado": "pendente com falha"}, asyncio.create_task(_pendente(None))),
+                ]
+            sessao = SessaoEstudo(questao_original="q", habilidades_identificadas={}, lista_questoes=[], gabarito_mestre={})
+            db.add(sessao)
+            db.flush()
+            marca = contabilidade.marca()
+            uso_llm_service.salvar(db, sessao.session_id, "start", contabilidade)
+            db.commit()
+            liberar.set()
+            await session_module.session_service._preencher_em_segundo_plano(
+                sessao.session_id, "q", {}, pendentes, 3, contabilidade, marca
+            )
+            db.expire_all()
+            sessao = db.query(SessaoEstudo).filter(SessaoEstudo.session_id == sessao.session_id).first()
+            uso = db.query(UsoLLMSessao).filter(UsoLLMSessao.session_id == sessao.session_id).first()
+            return sessao.lista_questoes, sessao.gabarito_mestre, uso.fases, uso.chamadas
+        finally:
+            db.close()
+
+    questoes, gabarito, fases, chamadas = asyncio.run(_cenario())
+    assert [(q["numero"], q["enunciado"]) for q in questoes] == [(1, "pendente ok"), (2, "extra 2")]
+    assert [(i["numero_questao"], i["resposta_final"]) for i in gabarito["gabarito"]] == [(1, "A"), (2, "B")]
+    assert gabarito["preenchimento"] == {"status": "incompleto", "adicionadas": 2, "pendentes": 1, "falhas": 2}
+    assert fases["start"]["chamadas"] == 1
+    assert fases["preenchimento"]["chamadas"] == 3
+    assert chamadas == 4
+
+
+def test_recomendacoes_atrasadas_nao_sobrescrevem_submissao_nova(monkeypatch, servico_fake):
+    """Recomendações em segundo plano só gravam no relatório da submissão que as pediu."""
+    import asyncio
+    from app.db.database import SessionLocal
+    from app.db.models import SessaoEstudo
+    from app.services import session_service as session_module
+
+    async def _recomendacoes(relatorio):
+        return {"recomendacoes": f"texto da {relatorio['submissao_id']}", "pontos_fortes": []}
+
+    monkeypatch.setattr(servico_fake, "gerar_recomendacoes", _recomendacoes)
+
+    db = SessionLocal()
+    try:
+        sessao = SessaoEstudo(
+            questao_original="q",
+            habilidades_identificadas={},
+            lista_questoes=[],
+            gabarito_mestre={},
+            relatorio_diagnostico={"recomendacoes": "padrão", "recomendacoes_status": "pendente", "submissao_id": "nova"},
+        )
+        db.add(sessao)
+        db.commit()
+        sid = sessao.session_id
+
+        def _relatorio():
+            db.expire_all()
+            return db.query(SessaoEstudo).filter(SessaoEstudo.session_id == sid).first().relatorio_diagnostico
+
+        pendente = {"recomendacoes": "padrão", "recomendacoes_status": "pendente"}
+        asyncio.run(session_module.session_service._recomendar_em_segundo_plano(sid, {**pendente, "submissao_id": "antiga"}))
+        assert _relatorio()["recomendacoes_status"] == "pendente"
+        assert _relatorio()["recomendacoes"] == "padrão"
+
+        asyncio.run(session_module.session_service._recomendar_em_segundo_plano(sid, {**pendente, "submissao_id": "nova"}))
+        assert _relatorio()["recomendacoes_status"] == "concluido"
+        assert _relatorio()["recomendacoes"] == "texto da nova"
+    finally:
+        db.close()
+
+
+def test_correcao_de_turma_local_com_resumo(monkeypatch, servico_fake):
+    """/submit/turma: alternativas corrigidas localmente, texto livre vai ao agente, resumo por questão."""
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "CORRECAO_RECOMENDACOES", "local")
+
+    with TestClient(app) as client:
+        files = {"file": ("questao.txt", QUESTION_TEXT.encode("utf-8"), "text/plain")}
+        sid = client.post("/api/v1/session/start", files=files).json()["session_id"]
+        corretas = {
+            str(item["numero_questao"]): item["alternativa_correta_letra"]
+            for item in client.get(f"/api/v1/session/{sid}").json()["gabarito_mestre"]["gabarito"]
+        }
+        errada = "A" if corretas["1"] != "A" else "B"
+        alunos = [
+            {"aluno": "ana", "respostas": corretas},
+            {"aluno": "bia", "respostas": {**corretas, "1": errada}},
+            {"aluno": "caio", "texto": "1: " + corretas["1"] + "\n2: " + corretas["2"]},
+            {"aluno": "davi", "texto": "Na questão 1 achei 418 cm²"},
+        ]
+        r = client.post(f"/api/v1/session/{sid}/submit/turma", json={"alunos": alunos})
+        assert r.status_code == 200, r.text
+        data = r.json()
+        origens = [a["relatorio_diagnostico"]["origem_correcao"] for a in data["alunos"]]
+        assert origens == ["local", "local", "local", "agente"]
+        assert [a["relatorio_diagnostico"]["total_acertos"] for a in data["alunos"][:3]] == [3, 2, 2]
+
+        resumo = data["resumo_turma"]
+        assert resumo["total_alunos"] == 4 and resumo["falhas"] == 0
+        q1, q3 = resumo["por_questao"][0], resumo["por_questao"][2]
+        assert q1["escolhas"][errada] == 1 and q1["erro_mais_frequente"] == errada
+        assert q3["escolhas"]["em_branco"] == 1
+        assert resumo["recomendacoes_status"] == "local"
+
+        salva = client.get(f"/api/v1/session/{sid}/turma/{data['correcao_id']}").json()
+        assert salva["resumo_turma"] == resumo
+        uso = client.get(f"/api/v1/session/{sid}").json()["uso_llm"]["fases"]["turma"]
+        assert set(uso["por_agente"]) == {"correcao"}
+
+        # Segunda turma: a fase acumula em vez de substituir, e os totais seguem a soma das fases
+        r = client.post(f"/api/v1/session/{sid}/submit/turma", json={"alunos": alunos[3:]})
+        assert r.status_code == 200, r.text
+        uso_total = client.get(f"/api/v1/session/{sid}").json()["uso_llm"]
+        turma = uso_total["fases"]["turma"]
+        assert turma["chamadas"] > uso["chamadas"]
+        assert turma["por_agente"]["correcao"]["chamadas"] == turma["chamadas"]
+        assert uso_total["chamadas"] == sum(f["chamadas"] for f in uso_total["fases"].values())
+
+
+def test_roteador_fallback_prioriza_caminho_que_funciona(monkeypatch, tmp_path):
+    """Caminho que falha perde a vez para o que funciona; estatísticas sobrevivem a um novo roteador."""
+    import asyncio
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.core.config import settings
+    from app.db.database import Base
+    from app.db import models  # noqa: F401
+    from app.services.roteador_fallback import RoteadorFallback
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'roteador.db'}")
+    Base.metadata.create_all(bind=engine)
+    Sessao = sessionmaker(bind=engine)
+    monkeypatch.setattr(settings, "DEFAULT_LLM_PROVIDER", "teste_roteador")
+    monkeypatch.setattr(settings, "ROTEADOR_MIN_TENTATIVAS", 3)
+    monkeypatch.setattr(settings, "ROTEADOR_EXPLORACAO", 0.0)
+
+    roteador = RoteadorFallback(fabrica_sessao=Sessao)
+    assert roteador.ordenar("resolucao", ["agente", "estruturado", "item_a_item"]) == ["agente", "estruturado", "item_a_item"]
+
+    async def _registrar_no_loop():
+        # Dentro do event loop a gravação vai para uma thread; os incrementos se acumulam
+        for _ in range(4):
+            roteador.registrar("resolucao", "agente", sucesso=False)
+            roteador.registrar("resolucao", "estruturado", sucesso=True)
+        await asyncio.gather(*roteador._tarefas)
+
+    asyncio.run(_registrar_no_loop())
+    roteador.descarregar()
+    assert roteador.metricas()["gravacoes_pendentes"] == 0
+    assert roteador.ordenar("resolucao", ["agente", "estruturado", "item_a_item"])[:2] == ["estruturado", "item_a_item"]
+
+    recarregado = RoteadorFallback(fabrica_sessao=Sessao)
+    assert recarregado.ordenar("resolucao", ["agente", "estruturado"]) == ["estruturado", "agente"]
+    caminhos = {c["caminho"]: c for c in recarregado.metricas()["caminhos"] if c["provedor"] == "teste_roteador"}
+    assert caminhos["agente"]["tentativas"] == 4 and caminhos["estruturado"]["taxa_sucesso"] == 1.0
+
+
+def test_banco_de_questoes_atende_questao_repetida_sem_llm(monkeypatch, servico_fake):
+    """Segundo /start da mesma questão (com outro OCR) vem do banco: sem LLM e alternativas reembaralhadas."""
+    import uuid
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "CORRECAO_RECOMENDACOES", "local")
+    monkeypatch.setattr(settings, "BANCO_QUESTOES_ATIVO", True)
+
+    questao = f"{QUESTION_TEXT}\n(teste {uuid.uuid4()})"
+    with TestClient(app) as client:
+        r1 = client.post("/api/v1/session/start", files={"file": ("q.txt", questao.encode("utf-8"), "text/plain")})
+        assert r1.status_code == 200, r1.text
+        assert r1.json()["origem"] == "pipeline"
+
+        repetida = "  " + questao.replace("\n", " \n ").upper()
+        r2 = client.post("/api/v1/session/start", files={"file": ("q.txt", repetida.encode("utf-8"), "text/plain")})
+        assert r2.status_code == 200, r2.text
+        data = r2.json()
+        assert data["origem"] == "banco" and len(data["questoes_geradas"]) == 3
+        sessao = client.get(f"/api/v1/session/{data['session_id']}").json()
+        assert sessao["uso_llm"]["chamadas"] == 0
+        itens = sessao["gabarito_mestre"]["gabarito"]
+        assert [it["numero_questao"] for it in itens] == [1, 2, 3]
+        for q, it in zip(data["questoes_geradas"], itens):
+            assert q["alternativa_correta_letra"] == it["alternativa_correta_letra"]
+            assert it["alternativas"][it["alternativa_correta_letra"]] == it["resposta_final"]
+
+        corretas = {str(it["numero_questao"]): it["alternativa_correta_letra"] for it in itens}
+        r3 = client.post(f"/api/v1/session/{data['session_id']}/submit", json={"respostas": corretas})
+        assert r3.status_code == 200, r3.text
+        assert r3.json()["relatorio_diagnostico"]["total_acertos"] == 3
+
+
+def test_cache_semantico_reaproveita_interpretacao_de_questao_proxima(monkeypatch, servico_fake):
+    """Questão com ruído de OCR e outro número reaproveita a análise; auditoria compara os códigos."""
+    import asyncio
+    import uuid
+    from langchain_core.embeddings import Embeddings
+    from app.core.config import settings
+    from app.services import agent_service as agent_module
+    from app.services.cache_interpretacao import CacheInterpretacao
+    from app.services.rag_service import rag_service
+
+    class EmbeddingsTrigramas(Embeddings):
+        def _vetor(self, texto: str) -> List[float]:
+            v = [0.0] * 256
+            t = texto.lower()
+            for i in range(len(t) - 2):
+                v[hash(t[i:i + 3]) % 256] += 1.0
+            return v
+
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            return [self._vetor(t) for t in texts]
+
+        def embed_query(self, text: str) -> List[float]:
+            return self._vetor(text)
+
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL", f"trigramas-{uuid.uuid4()}")
+    monkeypatch.setattr(settings, "INTERPRETACAO_CACHE_ATIVO", True)
+    monkeypatch.setattr(settings, "INTERPRETACAO_CACHE_LIMIAR", 0.9)
+    monkeypatch.setattr(settings, "INTERPRETACAO_CACHE_AUDITORIA", 1.0)
+    monkeypatch.setattr(rag_service, "embeddings", EmbeddingsTrigramas())
+    cache = CacheInterpretacao()
+    monkeypatch.setattr(agent_module, "cache_interpretacao", cache)
+
+    async def _executar():
+        original = await servico_fake.interpretar_questao(QUESTION_TEXT)
+        ruidosa = QUESTION_TEXT.replace("1 672 m 2", "1 762 m2").replace("\n", "  \n")
+        reaproveitada = await servico_fake.interpretar_questao(ruidosa)
+        diferente = await servico_fake.interpretar_questao("Resolva a equação 2x + 5 = 17 e indique o valor de x.")
+        await asyncio.gather(*list(cache._tarefas))
+        return original, reaproveitada, diferente
+
+    with TestClient(app):
+        original, reaproveitada, diferente = asyncio.run(_executar())
+    assert "reaproveitamento" not in original
+    assert reaproveitada["reaproveitamento"]["similaridade"] >= 0.9
+    assert reaproveitada["habilidades_identificadas"] == original["habilidades_identificadas"]
+    assert "reaproveitamento" not in diferente
+    m = cache.metricas()
+    assert (m["acertos"], m["faltas"]) == (1, 2)
+    assert m["auditoria"]["auditadas"] == 1 and m["auditoria"]["divergentes"] == 0
+
+    # Falha passageira do banco não desliga a persistência: a gravação seguinte tenta de novo
+    from sqlalchemy.exc import OperationalError
+    from app.db.database import SessionLocal
+    from app.services import cache_interpretacao as modulo_cache
+
+    falhas = []
+
+    def sessao_instavel():
+        db = SessionLocal()
+        if not falhas:
+            falhas.append(db)
+
+            def commit():
+                raise OperationalError("INSERT", {}, Exception("database is locked"))
+            db.commit = commit
+        return db
+
+    monkeypatch.setattr(modulo_cache, "SessionLocal", sessao_instavel)
+    vetor = rag_service.embeddings.embed_query("Calcule 15% de 240.")
+    asyncio.run(cache.guardar("Calcule 15% de 240.", vetor, original))
+    asyncio.run(cache.guardar("Calcule 15% de 240.", vetor, original))
+    assert cache._ids[-2] is None and cache._ids[-1] is not None
+    assert cache.metricas()["falhas_persistencia"] == 1
+
+
+def test_indice_numpy_busca_por_cosseno_com_filtros_do_chroma():
+    """Índice NumPy: top-k por cosseno e filtros de metadata no formato do Chroma ($in, $and)."""
+    from app.services.indice_vetorial import IndiceNumpy
+
+    metadados = [
+        {"codigo_bncc": "EF08MA01", "ano": "8º", "unidade_tematica": "Números"},
+        {"codigo_bncc": "EF08MA02", "ano": "8º", "unidade_tematica": "Álgebra"},
+        {"codigo_bncc": "EF09MA01", "ano": "9º", "unidade_tematica": "Números"},
+        {"codigo_bncc": "EF07MA01", "ano": "7º", "unidade_tematica": "Números"},
+    ]
+    vetores = [[1.0, 0.0, 0.0], [0.9, 0.1, 0.0], [0.0, 1.0, 0.0], [0.7, 0.0, 0.7]]
+    indice = IndiceNumpy(vetores, [m["codigo_bncc"] for m in metadados], metadados, {"provedor": "teste"})
+
+    def codigos(resultado):
+        return [metadados[p]["codigo_bncc"] for p, _ in resultado]
+
+    assert codigos(indice.buscar([2.0, 0.0, 0.0], k=2)) == ["EF08MA01", "EF08MA02"]
+    assert codigos(indice.buscar([1.0, 0.0, 0.0], k=5, filtros={"ano": {"$in": ["7º", "9º"]}})) == ["EF07MA01", "EF09MA01"]
+    filtro = {"$and": [{"ano": "8º"}, {"unidade_tematica": "Álgebra"}]}
+    assert codigos(indice.buscar([1.0, 0.0, 0.0], k=5, filtros=filtro)) == ["EF08MA02"]
+    assert indice.buscar([1.0, 0.0, 0.0], k=5, filtros={"ano": "1ª"}) == []
+    assert indice.documento(2).metadata["codigo_bncc"] == "EF09MA01"
+
+
+def test_busca_em_lote_uma_chamada_de_embedding_e_resultados_sem_repeticao(monkeypatch):
+    """buscar_lote: um embed_documents para todas as consultas, filtros por consulta e dedup por código."""
+    from langchain_core.embeddings import Embeddings
+    from app.core.config import settings
+    from app.services.indice_vetorial import IndiceNumpy
+    from app.services.rag_service import RAGService
+
+    class EmbeddingsContados(Embeddings):
+        chamadas: List[List[str]] = []
+        eixos = {"números": [1.0, 0.0, 0.0], "álgebra": [0.0, 1.0, 0.0], "geometria": [0.0, 0.0, 1.0]}
+
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            EmbeddingsContados.chamadas.append(list(texts))
+            return [self.eixos[t] for t in texts]
+
+        def embed_query(self, text: str) -> List[float]:
+            raise AssertionError("buscar_lote não deve embutir consulta a consulta")
+
+    metadados = [
+        {"codigo_bncc": "EF07MA01", "ano": "7º"},
+        {"codigo_bncc": "EF08MA01", "ano": "8º"},
+        {"codigo_bncc": "EF08MA06", "ano": "8º"},
+        {"codigo_bncc": "EF09MA01", "ano": "9º"},
+    ]
+    vetores = [[1.0, 0.0, 0.0], [0.9, 0.3, 0.0], [0.3, 0.9, 0.0], [0.0, 0.2, 1.0]]
+    rag = RAGService.__new__(RAGService)
+    rag.embeddings = EmbeddingsContados()
+    rag.vectorstore = None
+    rag.indice = IndiceNumpy(vetores, [m["codigo_bncc"] for m in metadados], metadados, {"provedor": "teste"})
+    monkeypatch.setattr(settings, "RAG_MODO", "vetorial")
+
+    documentos = rag.buscar_lote(
+        ["números", "álgebra", {"query": "números", "anos": ["9º"]}, {"query": "geometria", "filtros": {"ano": "9º"}}],
+        k=2, anos=["8º", "9º"],
+    )
+
+    assert EmbeddingsContados.chamadas == [["números", "álgebra", "geometria"]]
+    codigos = [d.metadata["codigo_bncc"] for d in documentos]
+    assert sorted(codigos) == ["EF08MA01", "EF08MA06", "EF09MA01"]
+    assert codigos[0] == "EF09MA01"  # maior similaridade: "geometria"
+    por_codigo = {d.metadata["codigo_bncc"]: d.metadata for d in documentos}
+    assert por_codigo["EF08MA01"]["consultas"] == ["números", "álgebra"]
+    assert por_codigo["EF09MA01"]["consultas"] == ["números", "geometria"]
+    habilidades = rag.formatar_habilidades(documentos)
+    assert habilidades[0]["similaridade"] == 0.9806 and "consultas" in habilidades[0]
+
+
+def test_catalogo_bncc_codigo_e_ano_sem_embedding():
+    """Código e ano saem do catálogo: sem chamada de embeddings e sem corte em k."""
+    from langchain_core.embeddings import Embeddings
+    from app.services.rag_service import RAGService
+
+    class SemEmbeddings(Embeddings):
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            raise AssertionError("consulta exata não deve calcular embeddings")
+
+        def embed_query(self, text: str) -> List[float]:
+            raise AssertionError("consulta exata não deve calcular embeddings")
+
+    rag = RAGService.__new__(RAGService)
+    rag.embeddings = SemEmbeddings()
+    rag.vectorstore = None
+    rag.indice = None
+    rag._catalogo = None
+
+    doc = rag.buscar_por_codigo(" ef08ma01")
+    assert doc is not None and doc.metadata["codigo_bncc"] == "EF08MA01" and doc.metadata["ano"] == "8º"
+    assert rag.buscar_por_codigo("EF99MA99") is None
+    assert rag.catalogo.fonte == "json"
+    primeira_serie = rag.buscar_por_ano("1ª")
+    assert len(primeira_serie) == 52 and {d.metadata["ano"] for d in primeira_serie} == {"1ª"}
+    assert len(rag.buscar_por_ano("1°")) == len(rag.buscar_por_ano("1º")) == 25
+    assert len(rag.buscar_por_ano("1ª", k=5)) == 5
+    geometria_8 = rag.buscar_por_unidade_tematica("geometria", ano="8º")
+    assert geometria_8 and all(d.metadata["ano"] == "8º" for d in geometria_8)
+
+
+def test_busca_lexical_bm25_sem_embeddings_e_fusao_hibrida(monkeypatch, tmp_path):
+    """BM25 local: acentos/plurais/códigos, modo offline quando o provedor falha e fusão RRF no modo hibrido."""
+    from langchain_core.embeddings import Embeddings
+    from app.core.config import settings
+    from app.services.indice_lexical import IndiceBM25, tokenizar
+    from app.services.indice_vetorial import IndiceNumpy
+    from app.services.rag_service import RAGService
+
+    assert tokenizar("Vértices das parábolas") == tokenizar("vertice da parabola")
+    assert tokenizar("EF09MA06") == ["ef09ma06"]
+
+    class ProvedorForaDoAr(Embeddings):
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            raise ConnectionError("provedor de embeddings inacessível")
+
+        def embed_query(self, text: str) -> List[float]:
+            raise ConnectionError("provedor de embeddings inacessível")
+
+    monkeypatch.setattr(settings, "RAG_LEXICO_ARQUIVO", str(tmp_path / "bm25.json"))
+    rag = RAGService.__new__(RAGService)
+    rag.embeddings = ProvedorForaDoAr()
+    rag.vectorstore = None
+    rag._catalogo = None
+    rag._lexico = None
+    textos = ["Habilidade: teorema de Pitágoras", "Habilidade: escalas em mapas", "Código BNCC: EF09MA06 funções"]
+    metadados = [{"codigo_bncc": "EF09MA13", "ano": "9º"}, {"codigo_bncc": "EF07MA01", "ano": "7º"}, {"codigo_bncc": "EF09MA06", "ano": "9º"}]
+    rag.indice = IndiceNumpy([[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]], textos, metadados, {"provedor": "teste"})
+
+    # Provedor fora do ar: a busca segue só no BM25 (montado do catálogo e gravado)
+    assert [d.metadata["codigo_bncc"] for d in rag.buscar_habilidades("ef09ma06")] == ["EF09MA06"]
+    assert [d.metadata["codigo_bncc"] for d in rag.buscar_habilidades("escala", filtros={"ano": "9º"})] == []
+    assert len(IndiceBM25.abrir(settings.RAG_LEXICO_ARQUIVO)) == 3
+
+    # Híbrido: o vetor prefere EF09MA13 (EF07MA01 em 3º), o BM25 só encontra EF07MA01; a fusão sobe EF07MA01
+    class Vetor(Embeddings):
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            return [[1.0, 0.0] for _ in texts]
+
+        def embed_query(self, text: str) -> List[float]:
+            return [1.0, 0.0]
+
+    rag.embeddings = Vetor()
+    monkeypatch.setattr(settings, "RAG_MODO", "hibrido")
+    hibrido = [d.metadata["codigo_bncc"] for d in rag.buscar_habilidades("escalas", k=2)]
+    assert hibrido == ["EF07MA01", "EF09MA13"]
+    lote = rag.buscar_lote(["escalas"], k=2)
+    assert [d.metadata["codigo_bncc"] for d in lote] == hibrido
+    assert lote[0].metadata["similaridade"] == round(1 / (settings.RAG_RRF_K + 1) + 1 / (settings.RAG_RRF_K + 3), 4)
+    monkeypatch.setattr(settings, "RAG_MODO", "vetorial")
+    assert [d.metadata["codigo_bncc"] for d in rag.buscar_habilidades("escalas", k=1)] == ["EF09MA13"]
+    monkeypatch.setattr(settings, "RAG_MODO", "lexical")
+    assert [d.metadata["codigo_bncc"] for d in rag.buscar_habilidades("escalas", k=1)] == ["EF07MA01"]
+
+
+def test_cache_llm_opt_in_por_agente_lido_a_cada_chamada(monkeypatch):
+    """LLM_CACHE_AGENTES vale na hora (padrão vazio) e a camada em disco assíncrona é lida por outro processo."""
+    import asyncio
+    import uuid
+    from app.core.config import settings
+    from app.services.cache import CacheLLM, llm_cache
+
+    assert not llm_cache.habilitado("interpretador") and not llm_cache.habilitado("distratores")
+    monkeypatch.setattr(settings, "LLM_CACHE_AGENTES", "interpretador, julgamento")
+    assert llm_cache.habilitado("interpretador") and not llm_cache.habilitado("distratores")
+
+    cache = CacheLLM()
+    chave = cache.chave_chamada("interpretador", f"prompt {uuid.uuid4()}")
+    assert asyncio.run(cache.obter_async(chave, rotulo="interpretador")) is None
+    asyncio.run(cache.gravar_async(chave, {"ok": True}, rotulo="interpretador"))
+    assert asyncio.run(CacheLLM().obter_async(chave, rotulo="interpretador")) == {"ok": True}
+
+    # Falha passageira do banco (leitura ou gravação) não desliga a camada em disco
+    from sqlalchemy.exc import OperationalError
+    from app.db.database import SessionLocal
+    from app.services import cache as modulo_cache
+
+    falhar = {"commit": 1, "query": 1}
+
+    def sessao_instavel():
+        db = SessionLocal()
+        for metodo in [m for m, n in falhar.items() if n]:
+            falhar[metodo] -= 1
+
+            def quebrado(*args, **kwargs):
+                raise OperationalError("SQL", {}, Exception("database is locked"))
+            setattr(db, metodo, quebrado)
+            break
+        return db
+
+    monkeypatch.setattr(modulo_cache, "SessionLocal", sessao_instavel)
+    instavel = CacheLLM()
+    outra = cache.chave_chamada("interpretador", f"prompt {uuid.uuid4()}")
+    asyncio.run(instavel.gravar_async(outra, {"n": 1}, rotulo="interpretador"))
+    assert asyncio.run(CacheLLM().obter_async(outra, rotulo="interpretador")) is None
+    asyncio.run(instavel.gravar_async(outra, {"n": 2}, rotulo="interpretador"))
+    assert asyncio.run(CacheLLM().obter_async(outra, rotulo="interpretador")) == {"n": 2}
+    assert instavel.metricas()["disco_ativo"] and instavel.metricas()["falhas_disco"] == 1
+
+
+def test_cache_de_embeddings_de_consulta_em_memoria_e_disco(monkeypatch):
+    """Consulta repetida (outra caixa/espaços) não chama o provedor; o disco sobrevive a um novo processo."""
+    import uuid
+    from langchain_core.embeddings import Embeddings
+    from app.core.config import settings
+    from app.db.database import init_db
+    from app.services.cache import CacheEmbeddings, EmbeddingsComCache
+
+    class EmbeddingsContados(Embeddings):
+        chamadas = 0
+
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            return [self.embed_query(t) for t in texts]
+
+        def embed_query(self, text: str) -> List[float]:
+            EmbeddingsContados.chamadas += 1
+            return [float(len(text)), 1.0]
+
+    init_db()
+    monkeypatch.setattr(settings, "EMBEDDING_MODEL", f"contados-{uuid.uuid4()}")
+    embeddings = EmbeddingsComCache(EmbeddingsContados(), CacheEmbeddings())
+    v1 = embeddings.embed_query("função quadrática vértice")
+    assert embeddings.embed_query("  Função  quadrática\nvértice ") == v1
+    assert EmbeddingsContados.chamadas == 1
+
+    outro_processo = EmbeddingsComCache(EmbeddingsContados(), CacheEmbeddings())
+    assert outro_processo.embed_query("função quadrática vértice") == v1
+    assert EmbeddingsContados.chamadas == 1
+    assert outro_processo.cache.metricas()["por_rotulo"]["consulta"]["acertos_disco"] == 1
+    assert embeddings.cache.metricas()["por_rotulo"]["consulta"]["taxa_acerto"] == 0.5
+
+
+def test_motor_equivalencia_decide_sem_llm():
+    """Formatos comuns de resposta são decididos localmente; texto livre fica para o juiz LLM."""
+    from app.services.equivalencia import MotorEquivalencia
+
+    motor = MotorEquivalencia()
+    casos = [
+        ("x₁ = 1 e x₂ = 3", "S = {3, 1}", True),
+        ("1/2", "50%", True),
+        ("V(2, -1)", "(2; -1)", True),
+        ("4,18 cm²", "0,000418 m²", True),
+        ("4,18 cm²", "4,18 cm", False),
+        ("R$ 1.250,50", "1250,5", True),
+        ("(x+1)(x-1)", "x^2 - 1", True),
+        ("x = 2 e y = 3", "x = 3 e y = 2", False),
+        ("a área do vão", "418", None),
+        # Tolerância relativa na unidade base (não absoluta na unidade da primeira resposta)
+        ("0,000418 m²", "0,001 m²", False),
+        ("0,001", "0,009", False),
+        ("3,14", "3,1416", True),
+        ("0,00836 m²", "83,6 cm²", True),
+        # Literal ambíguo contra um não ambíguo: vale a leitura pt-BR
+        ("1,000", "1", True),
+        ("1,000", "1000", False),
+        ("1.000", "1000", True),
+        # Texto livre e sinônimos ficam para o juiz (palavras não viram produto de letras)
+        ("sim", "verdadeiro", None),
+        ("crescente", "a funcao cresce", None),
+        ("alternativa c", "c", None),
+        ("ab", "ba", None),
+        # Tolerância pela precisão escrita: inteiros e valores monetários batem exatamente
+        ("1672", "1673", False),
+        ("12000", "12010", False),
+        ("250", "250,2", False),
+        ("250", "250,00", True),
+        ("1/3", "0,33", True),
+    ]
+    for a, b, esperado in casos:
+        assert motor.comparar(a, b)[0] is esperado, (a, b)